@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import os
+import sys
 import logging
+from pathlib import Path
 from celery import Celery
+from celery.signals import celeryd_after_setup, worker_process_init
 
 # ---------------------------------------------------------------------------
 # Config básica de broker / backend
@@ -73,8 +76,52 @@ celery_app.conf.update(
     # Custom Log Format to remove prefixes
     worker_log_format="%(message)s",
     worker_task_log_format="%(message)s",
+
+    # El warm-up de cada proceso (ver _warm_up_worker_process) tarda varios
+    # segundos; por defecto Celery mata hijos que no arrancan en 4 s.
+    worker_proc_alive_timeout=float(os.getenv("CELERY_WORKER_PROC_ALIVE_TIMEOUT", "120")),
 )
 
+# ---------------------------------------------------------------------------
+# Warm-up de procesos worker
+# ---------------------------------------------------------------------------
+
+
+@celeryd_after_setup.connect
+def _size_stem_executor(sender=None, instance=None, conf=None, **_kwargs) -> None:
+    """
+    Reparte las CPUs entre los hijos del pool con la concurrencia real del
+    worker (-c / worker_concurrency / nº de CPUs), no solo la de las variables
+    de entorno. Se ejecuta antes del fork de los hijos, que la heredan.
+    """
+    try:
+        concurrency = getattr(instance, "concurrency", None) or getattr(conf, "worker_concurrency", None)
+        if not concurrency:
+            return
+        # Mismo módulo (utils.*) que importan los stages
+        src_dir = Path(__file__).resolve().parent / "src"
+        if str(src_dir) not in sys.path:
+            sys.path.insert(0, str(src_dir))
+        from utils.stem_executor import set_worker_processes
+
+        set_worker_processes(int(concurrency))
+    except Exception as exc:
+        logger.warning("No se pudo ajustar el executor de stems a la concurrencia del worker: %s", exc)
+
+
+@worker_process_init.connect
+def _warm_up_worker_process(**_kwargs) -> None:
+    """
+    Precarga scripts de contratos, librerías DSP y kernels FFT/resample en cada
+    proceso hijo para que el primer job tenga la misma latencia que los siguientes.
+    """
+    try:
+        from src.warmup import warm_up_worker
+
+        warm_up_worker()
+    except Exception as exc:
+        logger.warning("Warm-up del worker fallido (se continúa sin él): %s", exc)
+
 # ---------------------------------------------------------------------------
 # Registro de tasks
 # ---------------------------------------------------------------------------
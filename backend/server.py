@@ -2024,6 +2024,33 @@ async def cleanup_temp(_: None = Depends(_guard_heavy_endpoint)):
     return {"status": "ok"}
 
 
+def _is_stage_preview_mix(temp_root: Path, target_path: Path) -> bool:
+    """
+    True si target_path es el full_song.wav de una carpeta de contrato
+    (previewMixRelPath de /pipeline/stages).
+    """
+    return (
+        target_path.name == "full_song.wav"
+        and target_path.parent.parent == temp_root.resolve()
+        and target_path.parent.is_dir()
+    )
+
+
+def _render_stage_preview_mix(job_id: str, temp_root: Path, stage_dir: Path) -> None:
+    """
+    El pipeline solo renderiza full_song.wav cuando el siguiente contrato lee
+    el mixbus; el preview de los demás contratos se mezcla aquí al pedirlo.
+    """
+    from src.utils import mixdown_stems
+    from src.context import PipelineContext
+
+    context = PipelineContext(stage_id=stage_dir.name, job_id=job_id, temp_root=temp_root)
+    try:
+        mixdown_stems.ensure_mixdown(context, stage_dir.name)
+    except Exception as e:
+        logger.error(f"Preview mixdown failed for {job_id}/{stage_dir.name}: {e}")
+
+
 @app.get("/files/{job_id}/{file_path:path}")
 async def get_job_file(
     job_id: str,
@@ -2050,6 +2077,10 @@ async def get_job_file(
 
     target_path = (temp_root / file_path).resolve()
     _ensure_dest_inside(temp_root, target_path)
+    if not target_path.exists() and _is_stage_preview_mix(temp_root, target_path):
+        from fastapi.concurrency import run_in_threadpool
+
+        await run_in_threadpool(_render_stage_preview_mix, job_id, temp_root, target_path.parent)
     if not target_path.exists() or not target_path.is_file():
         raise HTTPException(status_code=404, detail="File not found")
 
@@ -23,11 +23,18 @@ from utils.analysis_utils import (  # noqa: E402
     load_audio_mono,
     compute_peak_dbfs,
 )
+from utils.stem_feature_cache import analyze_stem_cached  # noqa: E402
+from utils.stem_bus import stem_info as stem_file_info  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 from utils.session_utils import (  # noqa: E402
     load_session_config,
     infer_bus_target,
 )
 
+# Lee los stems con load_audio_mono / stem_file_info: el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
+
 SUPPORTED_AUDIO_EXTS = {".wav", ".aif", ".aiff", ".mp3"}
 
 
@@ -124,7 +131,7 @@ def analyze_stem(stem_path: Path) -> Dict[str, Any]:
         silence_head_sec = duration_sec
         silence_tail_sec = 0.0
 
-    info = sf.info(stem_path)
+    info = stem_file_info(stem_path)
     samplerate_hz = info.samplerate
     channels = info.channels
     subtype = info.subtype or ""
@@ -218,7 +225,7 @@ def main() -> None:
     samplerates_present = set()
 
     # Análisis de stems en serie (manteniendo el orden)
-    results = [analyze_stem(p) for p in stem_files] if stem_files else []
+    results = map_stems(lambda p: analyze_stem_cached(contract_id, analyze_stem, p), stem_files) if stem_files else []
 
     for stem_info in results:
         file_name = stem_info["file_name"]
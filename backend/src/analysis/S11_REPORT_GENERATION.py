@@ -29,6 +29,7 @@ from utils.analysis_utils import (  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
 from utils.loudness_utils import compute_lufs_and_lra  # noqa: E402
 from utils.color_utils import compute_true_peak_dbfs  # noqa: E402
+from utils.phase_metrics import sum_phases  # noqa: E402
 
 
 PIPELINE_VERSION = "v1.0.0"
@@ -204,10 +205,13 @@ def _load_pipeline_timings(contract_id: str) -> Dict[str, Any]:
             data = json.load(f)
         stages = data.get("stages", [])
         total = data.get("total_duration_sec")
+        stages = stages if isinstance(stages, list) else []
         return {
-            "stages": stages if isinstance(stages, list) else [],
+            "stages": stages,
             "total_duration_sec": total if isinstance(total, (int, float)) else None,
             "generated_at_utc": data.get("generated_at_utc"),
+            # Desglose por fase (pre_analysis, processing, mixdown, copy, ...) para bisectar regresiones
+            "phase_totals": sum_phases(stages),
         }
     except Exception as exc:
         logger.logger.info(f"[S11_REPORT_GENERATION] Aviso: no se pudo leer timings: {exc}")
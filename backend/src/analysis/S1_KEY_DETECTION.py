@@ -17,18 +17,21 @@ import json  # noqa: E402
 import os  # noqa: E402
 
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 import essentia.standard as es  # noqa: E402
 
 from utils.analysis_utils import (  # noqa: E402
     load_contract,
     get_temp_dir,
-    sf_read_limited,
 )
+from utils.mono_mixbus import get_mono_mixbus, mixbus_fingerprint  # noqa: E402
 from utils.session_utils import (  # noqa: E402
     load_session_config,
 )
 
+# Lee los stems con get_mono_mixbus (stem bus): el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
+
 # Nota: mantenemos solo los nombres de nota para mapear a pitch class
 _NOTE_NAMES = [
     "C", "C#", "D", "D#", "E", "F",
@@ -37,65 +40,49 @@ _NOTE_NAMES = [
 
 
 # ---------------------------------------------------------------------------
-# Carga de stems y mezcla a mono
+# Mixbus mono y resultado persistido
 # ---------------------------------------------------------------------------
 
-def _load_mono_for_mix(path_str: str) -> tuple[np.ndarray, int]:
-    """
-    Lee un stem desde disco y lo devuelve como (mono_float32, sr).
-    Esta función está pensada para ser ejecutada en procesos separados.
-    """
-    p = Path(path_str)
-    y, sr = sf_read_limited(p, always_2d=False)
-
-    if isinstance(y, np.ndarray) and y.ndim > 1:
-        y_mono = np.mean(y, axis=1).astype(np.float32)
-    else:
-        y_mono = np.asarray(y, dtype=np.float32)
-
-    return y_mono, sr
-
-
 def _mix_stems_mono(stem_files: List[Path]) -> tuple[np.ndarray, int]:
     """
-    Hace un mix sencillo de todos los stems a mono, para análisis de tonalidad.
-    Asume que todos tienen mismo samplerate (garantizado por S0_SESSION_FORMAT).
+    Mix mono de todos los stems para análisis de tonalidad, desde el mixbus
+    mono compartido por los análisis de sesión (los stems solo se leen una
+    vez mientras no cambien).
     """
     if not stem_files:
         return np.zeros(1, dtype=np.float32), 44100
 
-    path_strs = [str(p) for p in stem_files]
-
-    # Cargar stems en serie (si quieres paralelizar, aquí pondrías ProcessPool)
-    results = list(map(_load_mono_for_mix, path_strs))
-
-    data_list: List[np.ndarray] = []
-    sr_ref: int | None = None
-
-    for y_mono, sr in results:
-        if sr_ref is None:
-            sr_ref = sr
-        # Asumimos samplerate consistente; si no lo fuera, aquí se podría
-        # introducir un resample a sr_ref.
-        data_list.append(y_mono)
-
-    if sr_ref is None:
-        # Algo raro ha pasado; devolvemos un buffer vacío
-        return np.zeros(1, dtype=np.float32), 44100
-
-    max_len = max(len(y) for y in data_list)
-    mix = np.zeros(max_len, dtype=np.float32)
-
-    for y in data_list:
-        n = len(y)
-        mix[:n] += y
+    mix, sr, _ = get_mono_mixbus(stem_files)
 
     # Normalizar para evitar saturación y estabilizar la detección de tonalidad
     peak = float(np.max(np.abs(mix))) if mix.size > 0 else 0.0
     if peak > 0.0:
-        mix /= peak
+        return (mix / peak).astype(np.float32), sr
+    return mix, sr
 
-    return mix, sr_ref
+
+def _load_previous_key(output_path: Path, fingerprint: str) -> Dict[str, Any] | None:
+    """
+    Resultado de tonalidad del análisis anterior si se calculó sobre el mismo
+    mixbus (misma huella de stems). S1_KEY_DETECTION no modifica audio, así
+    que el post-análisis (y un re-análisis posterior) lo reutiliza sin leer
+    stems ni volver a pasar Essentia.
+    """
+    if not fingerprint or not output_path.exists():
+        return None
+    try:
+        with output_path.open("r", encoding="utf-8") as f:
+            session = (json.load(f) or {}).get("session", {}) or {}
+    except Exception:
+        return None
+    if session.get("key_mixbus_fingerprint") != fingerprint:
+        return None
+    return {
+        "key_root_pc": session.get("key_root_pc"),
+        "key_mode": session.get("key_mode"),
+        "key_name": session.get("key_name"),
+        "confidence": session.get("key_detection_confidence"),
+    }
 
 
 # ---------------------------------------------------------------------------
@@ -225,9 +212,16 @@ def main() -> None:
         if p.name.lower() != "full_song.wav"
     )
 
-    # 4) Mix de stems para análisis de tonalidad
-    mix_mono, sr = _mix_stems_mono(stem_files)
-    key_info = _detect_key_from_mix(mix_mono, sr)
+    # 4) Mix de stems para análisis de tonalidad (o resultado previo sobre
+    #    los mismos stems)
+    output_path = temp_dir / f"analysis_{contract_id}.json"
+    fingerprint = mixbus_fingerprint(stem_files) if stem_files else ""
+    key_info = _load_previous_key(output_path, fingerprint)
+    if key_info is not None:
+        logger.logger.info("[S1_KEY_DETECTION] Stems sin cambios: se reutiliza la tonalidad detectada.")
+    else:
+        mix_mono, sr = _mix_stems_mono(stem_files)
+        key_info = _detect_key_from_mix(mix_mono, sr)
 
     key_root_pc = key_info["key_root_pc"]
     key_mode = key_info["key_mode"]
@@ -262,11 +256,11 @@ def main() -> None:
             "key_name": key_info["key_name"],
             "key_detection_confidence": key_info["confidence"],
             "scale_pitch_classes": scale_pcs,  # 0-11, C=0
+            "key_mixbus_fingerprint": fingerprint,
         },
         "stems": stems_info,
     }
 
-    output_path = temp_dir / f"analysis_{contract_id}.json"
     with output_path.open("w", encoding="utf-8") as f:
         json.dump(session_state, f, indent=2, ensure_ascii=False)
 
@@ -23,6 +23,12 @@ from utils.analysis_utils import (
     compute_dc_offset,
     compute_peak_dbfs,
 )
+from utils.stem_feature_cache import analyze_stem_cached
+from utils.stem_executor import map_stems
+
+# Lee los stems con sf_read_limited (stem bus): el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
 
 
 def analyze_stem(stem_path: Path) -> Dict[str, Any]:
@@ -82,7 +88,7 @@ def main() -> None:
     peaks_dbfs: List[float] = []
 
     # Análisis por stem en serie
-    results = [analyze_stem(p) for p in stem_files] if stem_files else []
+    results = map_stems(lambda p: analyze_stem_cached(contract_id, analyze_stem, p), stem_files) if stem_files else []
 
     # Recorremos resultados y calculamos agregados
     for stem_info in results:
@@ -14,13 +14,15 @@ if str(SRC_DIR) not in sys.path:
 
 import json  # noqa: E402
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import (  # noqa: E402
     load_contract,
     get_temp_dir,
     sf_read_limited,
 )
+from utils.stem_bus import open_stem  # noqa: E402
+from utils.stem_feature_cache import analyze_stem_cached  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
 from utils.profiles_utils import get_instrument_profile  # noqa: E402
 
@@ -37,6 +39,11 @@ except Exception:  # pragma: no cover
     measure_sample_peak_dbfs = None  # type: ignore
 
 
+# Lee los stems con sf_read_limited / open_stem: el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
+
+
 # ------------------------------------------------------------
 # Helpers
 # ------------------------------------------------------------
@@ -81,10 +88,10 @@ def _mixbus_sample_peak_stream(
     if not stem_paths:
         return float("-inf"), None
 
-    files: List[sf.SoundFile] = []
+    files: List[Any] = []
     try:
         for p in stem_paths:
-            files.append(sf.SoundFile(str(p), mode="r"))
+            files.append(open_stem(p))
 
         sr_ref = int(files[0].samplerate)
         ch_ref = int(files[0].channels)
@@ -349,7 +356,7 @@ def main() -> None:
 
         tasks.append((p, str(req), resolved))
 
-    stems_analysis = list(map(_analyze_stem, tasks)) if tasks else []
+    stems_analysis = map_stems(lambda t: analyze_stem_cached(contract_id, _analyze_stem, t), tasks) if tasks else []
 
     # Mixbus peaks
     mix_peak_dbfs_stream, sr_ref_stream = _mixbus_sample_peak_stream(stem_files)
@@ -15,16 +15,17 @@ if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
 import json  # noqa: E402
-import numpy as np  # noqa: E402
 
 from utils.analysis_utils import (  # noqa: E402
     load_contract,
     get_temp_dir,
-    sf_read_limited,
 )
+from utils.f0_track_store import get_f0_track  # noqa: E402
+from utils.stem_feature_cache import analyze_stem_cached  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
 from utils.vocal_utils import is_vocal_profile  # noqa: E402
-from utils.pitch_utils import estimate_pitch_deviation  # noqa: E402
+from utils.pitch_utils import pitch_deviation_from_f0  # noqa: E402
 
 
 def _sanitize_scale_pcs(pcs: Any) -> Optional[List[int]]:
@@ -116,13 +117,9 @@ def analyze_stem(args: Tuple[Path, str, bool]) -> Dict[str, Any]:
     recommended_shift_semitones = 0.0
 
     if is_vocal:
-        y, sr = sf_read_limited(stem_path, always_2d=False)
-        if isinstance(y, np.ndarray) and y.ndim > 1:
-            y_mono = np.mean(y, axis=1).astype(np.float32)
-        else:
-            y_mono = np.asarray(y, dtype=np.float32)
-
-        pitch_stats = estimate_pitch_deviation(y_mono, sr)
+        # Curva f0 del stem completo desde el almacén: la reutiliza el stage y,
+        # tras afinar, el post-análisis sólo recalcula las regiones tocadas
+        pitch_stats = pitch_deviation_from_f0(get_f0_track(stem_path).f0)
         max_abs_dev_cents = pitch_stats.get("max_abs_deviation_cents")
         median_dev_cents = pitch_stats.get("median_deviation_cents")
         recommended_shift_semitones = pitch_stats.get("recommended_global_shift_semitones", 0.0)
@@ -193,7 +190,7 @@ def main() -> None:
         stem_tasks.append((stem_path, inst, is_vocal))
 
     if stem_tasks:
-        results = list(map(analyze_stem, stem_tasks))
+        results = map_stems(lambda t: analyze_stem_cached(contract_id, analyze_stem, t), stem_tasks)
     else:
         results = []
 
@@ -23,7 +23,17 @@ from utils.analysis_utils import (  # noqa: E402
     sf_read_limited,
 )
 from utils.session_utils import load_session_config  # noqa: E402
-from utils.phase_utils import estimate_best_lag_and_corr  # noqa: E402
+from utils.phase_utils import (  # noqa: E402
+    bandlimit_signal,
+    best_lag_from_corr,
+    estimate_best_lags_batched,
+    normalized_xcorr,
+)
+from utils.stem_executor import map_stems  # noqa: E402
+
+# Lee los stems con sf_read_limited (stem bus): el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
 
 
 def _is_in_family(instrument_profile: str | None, target_family: str) -> bool:
@@ -61,6 +71,71 @@ def _normalize_audio(x: np.ndarray) -> np.ndarray:
     return x
 
 
+def _lag_curve_geometry(
+    min_len: int,
+    sr: int,
+    num_points: int,
+    window_sec: float,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Anclajes (s), inicio de cada ventana (samples) y longitud de ventana de la
+    curva de lag: sólo dependen de la duración analizada, así que la
+    referencia se puede trocear (y bandlimitar) una vez para todos los stems.
+    """
+    dur_sec = float(min_len / sr)
+
+    # Ajustes robustos de ventana
+    window_sec = float(window_sec)
+    window_sec = max(0.5, min(window_sec, 6.0, max(0.5, dur_sec * 0.25)))
+    win_len = int(round(window_sec * sr))
+    win_len = max(2048, min(win_len, min_len))
+
+    if num_points < 2:
+        num_points = 2
+
+    # Evitar anclajes justo en 0/fin (suele haber silencios/fades)
+    anchors = np.linspace(0.1, 0.9, num_points, dtype=np.float64) * dur_sec
+
+    starts = np.empty(anchors.shape[0], dtype=np.int64)
+    for i, t_sec in enumerate(anchors.tolist()):
+        center = int(round(t_sec * sr))
+        start = int(center - win_len // 2)
+        starts[i] = max(0, min(start, min_len - win_len))
+    return anchors, starts, int(win_len)
+
+
+def _windows(x: np.ndarray, starts: np.ndarray, win_len: int) -> np.ndarray:
+    """Ventanas (K, win_len) de x que empiezan en starts."""
+    return x[starts[:, None] + np.arange(win_len, dtype=np.int64)[None, :]]
+
+
+def _prepare_reference(
+    ref_mono: np.ndarray,
+    sr: int,
+    fmin: float,
+    fmax: float,
+    num_points: int,
+    window_sec: float,
+    with_curve: bool,
+) -> Dict[str, Any]:
+    """
+    Referencia normalizada y bandlimitada (señal completa y, si with_curve,
+    ventanas de la curva de deriva en una sola FFT por lotes), compartida por
+    todos los stems candidatos de la misma longitud.
+    """
+    ref_norm = _normalize_audio(np.asarray(ref_mono, dtype=np.float32))
+    n = int(ref_norm.shape[0])
+    prepared: Dict[str, Any] = {
+        "n": n,
+        "band": bandlimit_signal(ref_norm, sr, fmin=fmin, fmax=fmax),
+        "curve_windows": None,
+    }
+    if with_curve and n > 0 and sr > 0:
+        _, starts, win_len = _lag_curve_geometry(n, sr, num_points, window_sec)
+        prepared["curve_windows"] = bandlimit_signal(_windows(ref_norm, starts, win_len), sr, fmin=fmin, fmax=fmax)
+    return prepared
+
+
 def _compute_lag_curve(
     ref_norm: np.ndarray,
     cand_norm: np.ndarray,
@@ -71,10 +146,15 @@ def _compute_lag_curve(
     num_points: int,
     window_sec: float,
     correlation_min: float,
+    ref_windows_band: np.ndarray | None = None,
 ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
     """
     Estima el lag en varios anclajes temporales para detectar deriva.
 
+    Todas las ventanas se bandlimitan y correlan por lotes (una FFT por
+    lado); ref_windows_band son las ventanas de la referencia ya
+    bandlimitadas (_prepare_reference), si se tienen.
+
     Devuelve:
       - lag_curve: lista de dicts con anchor_sample, anchor_sec, lag_samples, lag_ms, correlation, valid
       - summary: dict con drift_range_ms, valid_points, etc.
@@ -90,48 +170,30 @@ def _compute_lag_curve(
         }
 
     dur_sec = float(min_len / sr)
-
-    # Ajustes robustos de ventana
-    window_sec = float(window_sec)
-    window_sec = max(0.5, min(window_sec, 6.0, max(0.5, dur_sec * 0.25)))
-    win_len = int(round(window_sec * sr))
-    win_len = max(2048, min(win_len, min_len))
-
-    if num_points < 2:
-        num_points = 2
-
-    # Evitar anclajes justo en 0/fin (suele haber silencios/fades)
-    anchors = np.linspace(0.1, 0.9, num_points, dtype=np.float64) * dur_sec
+    anchors, starts, win_len = _lag_curve_geometry(min_len, sr, num_points, window_sec)
+    num_points = int(anchors.shape[0])
+
+    try:
+        if ref_windows_band is None or ref_windows_band.shape != (num_points, win_len):
+            ref_windows_band = bandlimit_signal(_windows(ref_norm, starts, win_len), sr, fmin=fmin, fmax=fmax)
+        cand_windows_band = bandlimit_signal(_windows(cand_norm, starts, win_len), sr, fmin=fmin, fmax=fmax)
+        results = estimate_best_lags_batched(
+            ref=ref_windows_band,
+            cand=cand_windows_band,
+            sr=sr,
+            max_time_shift_ms=max_time_shift_ms_curve,
+        )
+    except Exception as e:
+        results = [{"lag_samples": 0.0, "lag_ms": 0.0, "correlation": float("-inf")}] * num_points
+        logger.logger.info(
+            f"[S2_GROUP_PHASE_DRUMS] Aviso: fallo al estimar lag_curve: {e}"
+        )
 
     curve: List[Dict[str, Any]] = []
-    for t_sec in anchors.tolist():
-        center = int(round(t_sec * sr))
-        start = int(center - win_len // 2)
-        start = max(0, min(start, min_len - win_len))
-        end = start + win_len
-
-        ref_seg = ref_norm[start:end]
-        cand_seg = cand_norm[start:end]
-
-        try:
-            res = estimate_best_lag_and_corr(
-                ref=ref_seg,
-                cand=cand_seg,
-                sr=sr,
-                max_time_shift_ms=max_time_shift_ms_curve,
-                fmin=fmin,
-                fmax=fmax,
-            )
-            lag_s = float(res["lag_samples"])
-            lag_ms = float(res["lag_ms"])
-            corr = float(res["correlation"])
-        except Exception as e:
-            lag_s = 0.0
-            lag_ms = 0.0
-            corr = float("-inf")
-            logger.logger.info(
-                f"[S2_GROUP_PHASE_DRUMS] Aviso: fallo al estimar lag_curve en t={t_sec:.2f}s: {e}"
-            )
+    for start, res in zip(starts.tolist(), results):
+        lag_s = float(res["lag_samples"])
+        lag_ms = float(res["lag_ms"])
+        corr = float(res["correlation"])
 
         valid = bool(np.isfinite(corr) and corr >= correlation_min)
 
@@ -190,12 +252,16 @@ def _analyze_drum_stem(
         float,
         float,
         float,
+        Dict[str, Any],
     ]
 ) -> Tuple[int, Dict[str, Any]]:
     """
     Analiza un stem candidato vs referencia:
       - lag global + correlación (y flip de polaridad opcional)
       - curva de lag a lo largo del tiempo para detectar deriva
+
+    ref_prepared (_prepare_reference) evita repetir el bandlimit de la
+    referencia en cada stem cuando las longitudes coinciden.
     """
     (
         idx,
@@ -213,6 +279,7 @@ def _analyze_drum_stem(
         drift_window_sec,
         max_time_shift_ms_curve,
         drift_min_range_ms,
+        ref_prepared,
     ) = args
 
     info = dict(base_info)
@@ -257,28 +324,23 @@ def _analyze_drum_stem(
 
     sr = int(ref_sr)
 
+    if not ref_prepared or int(ref_prepared.get("n", -1)) != min_len:
+        ref_prepared = _prepare_reference(
+            ref_local, sr, band_fmin, band_fmax, drift_num_points, drift_window_sec, enable_time_varying
+        )
+
     # -----------------------
     # 1) Lag global (como antes)
     # -----------------------
-    res_norm = estimate_best_lag_and_corr(
-        ref=ref_norm,
-        cand=cand_norm,
-        sr=sr,
-        max_time_shift_ms=max_time_shift_ms,
-        fmin=band_fmin,
-        fmax=band_fmax,
-    )
+    # La correlación con el candidato invertido es exactamente -corr: una
+    # sola cross-correlation sirve para las dos polaridades.
+    cand_band = bandlimit_signal(cand_norm, sr, fmin=band_fmin, fmax=band_fmax)
+    lags, corr = normalized_xcorr(ref_prepared["band"], cand_band, sr, max_time_shift_ms)
+    res_norm = best_lag_from_corr(lags, corr, sr)
     corr_norm = float(res_norm["correlation"])
 
     if allow_polarity_flip:
-        res_flip = estimate_best_lag_and_corr(
-            ref=ref_norm,
-            cand=-cand_norm,
-            sr=sr,
-            max_time_shift_ms=max_time_shift_ms,
-            fmin=band_fmin,
-            fmax=band_fmax,
-        )
+        res_flip = best_lag_from_corr(lags, -corr, sr)
         corr_flip = float(res_flip["correlation"])
     else:
         res_flip = None
@@ -315,6 +377,7 @@ def _analyze_drum_stem(
             num_points=drift_num_points,
             window_sec=drift_window_sec,
             correlation_min=correlation_min,
+            ref_windows_band=ref_prepared.get("curve_windows"),
         )
 
     drift_range_ms = float(drift_summary.get("drift_range_ms", 0.0)) if drift_summary else 0.0
@@ -524,8 +587,16 @@ def main() -> None:
             stems_analysis[idx] = info
 
     # 6) Tareas de drums que NO son referencia
+    # Referencia bandlimitada (y troceada para la curva) una sola vez
+    ref_prepared = _prepare_reference(
+        ref_mono, int(ref_sr), BAND_FMIN, BAND_FMAX, drift_num_points, drift_window_sec, enable_time_varying
+    )
+
     tasks: List[
-        Tuple[int, Dict[str, Any], Path, np.ndarray, int, float, float, float, bool, float, bool, int, float, float, float]
+        Tuple[
+            int, Dict[str, Any], Path, np.ndarray, int, float, float, float, bool, float, bool, int, float, float, float,
+            Dict[str, Any],
+        ]
     ] = []
 
     for idx, base_info in enumerate(stems_info_raw):
@@ -552,12 +623,13 @@ def main() -> None:
                 drift_window_sec,
                 max_time_shift_ms_curve,
                 drift_min_range_ms,
+                ref_prepared,
             )
         )
 
-    # 7) Ejecutar análisis en serie
+    # 7) Ejecutar análisis (executor de stems)
     if tasks:
-        for idx_res, info_res in map(_analyze_drum_stem, tasks):
+        for idx_res, info_res in map_stems(_analyze_drum_stem, tasks):
             stems_analysis[idx_res] = info_res
 
     for idx, val in enumerate(stems_analysis):
@@ -23,7 +23,11 @@ from utils.analysis_utils import (  # noqa: E402
     sf_read_limited,
 )
 from utils.session_utils import load_session_config  # noqa: E402
-from utils.loudness_utils import measure_integrated_lufs  # noqa: E402
+from utils.loudness_utils import ShortTermLoudness  # noqa: E402
+
+# Lee los stems con sf_read_limited (stem bus): el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
 
 
 # ---------------------------------------------------------------------
@@ -160,6 +164,20 @@ def _percentile(x: np.ndarray, p: float) -> Optional[float]:
         return None
 
 
+def _empty_offsets_series(num_total: int = 0, num_used: int = 0) -> Dict[str, Any]:
+    return {
+        "num_windows_total": num_total,
+        "num_windows_used": num_used,
+        "offsets_db": [],
+        "window_starts_sec": [],
+        "offset_mean_db": None,
+        "offset_median_db": None,
+        "offset_p95_db": None,
+        "offset_min_db": None,
+        "offset_max_db": None,
+    }
+
+
 def _compute_short_term_offsets_series(
     y_lead: np.ndarray,
     y_ref: np.ndarray,
@@ -167,6 +185,7 @@ def _compute_short_term_offsets_series(
     window_sec: float = 3.0,
     hop_sec: float = 1.0,
     rms_threshold_db: float = -40.0,
+    ref_loudness: Optional[ShortTermLoudness] = None,
 ) -> Dict[str, Any]:
     """
     Calcula offsets de LUFS por ventanas entre lead y referencia (bed).
@@ -174,6 +193,14 @@ def _compute_short_term_offsets_series(
     offset_db = LUFS_lead - LUFS_ref en cada ventana donde:
       - RMS_lead > rms_threshold_db
 
+    Cada señal se K-pondera una sola vez (ShortTermLoudness) y el LUFS
+    integrado de todas las ventanas sale de sus bloques de 400 ms en una
+    pasada vectorizada. Frente a medir cada ventana con
+    measure_integrated_lufs los valores difieren del orden de 0.05 dB (el
+    filtro K no se reinicia en cada ventana y usa otros coeficientes).
+    ref_loudness: motor ya construido sobre y_ref (el BED se comparte
+    entre todos los leads).
+
     Devuelve:
       - num_windows_total / used
       - offsets_db: lista
@@ -185,85 +212,39 @@ def _compute_short_term_offsets_series(
 
     n = min(y_lead.shape[0], y_ref.shape[0])
     if n <= 0:
-        return {
-            "num_windows_total": 0,
-            "num_windows_used": 0,
-            "offsets_db": [],
-            "window_starts_sec": [],
-            "offset_mean_db": None,
-            "offset_median_db": None,
-            "offset_p95_db": None,
-            "offset_min_db": None,
-            "offset_max_db": None,
-        }
+        return _empty_offsets_series()
 
     y_lead = y_lead[:n]
-    y_ref = y_ref[:n]
 
     win_samples = int(round(window_sec * sr))
     hop_samples = int(round(hop_sec * sr))
 
     if win_samples <= 0 or hop_samples <= 0 or n < win_samples:
-        return {
-            "num_windows_total": 0,
-            "num_windows_used": 0,
-            "offsets_db": [],
-            "window_starts_sec": [],
-            "offset_mean_db": None,
-            "offset_median_db": None,
-            "offset_p95_db": None,
-            "offset_min_db": None,
-            "offset_max_db": None,
-        }
+        return _empty_offsets_series()
 
-    rms_thr_lin = 10.0 ** (rms_threshold_db / 20.0)
-
-    offsets: List[float] = []
-    starts_sec: List[float] = []
-    num_total = 0
-    num_used = 0
-
-    for start in range(0, n - win_samples + 1, hop_samples):
-        end = start + win_samples
-        num_total += 1
+    if ref_loudness is None:
+        ref_loudness = ShortTermLoudness(y_ref[:n], sr)
 
-        seg_lead = y_lead[start:end]
-        seg_ref = y_ref[start:end]
-
-        # Actividad vocal básica
-        rms_lead = float(np.sqrt(np.mean(seg_lead**2))) if seg_lead.size > 0 else 0.0
-        if rms_lead <= rms_thr_lin:
-            continue
+    starts, lufs_lead = ShortTermLoudness(y_lead, sr).window_lufs(window_sec, hop_sec)
+    _, lufs_ref = ref_loudness.window_lufs(window_sec, hop_sec, n_samples=n)
 
-        lufs_lead = measure_integrated_lufs(seg_lead, sr)
-        lufs_ref = measure_integrated_lufs(seg_ref, sr)
-        if lufs_lead == float("-inf") or lufs_ref == float("-inf"):
-            continue
+    # Actividad vocal básica (RMS sin ponderar)
+    _, power_lead = ShortTermLoudness(y_lead, sr, k_weighting=False).window_powers(window_sec, hop_sec)
+    rms_thr_lin = 10.0 ** (rms_threshold_db / 20.0)
+    used = (np.sqrt(power_lead) > rms_thr_lin) & np.isfinite(lufs_lead) & np.isfinite(lufs_ref)
 
-        offsets.append(float(lufs_lead - lufs_ref))
-        starts_sec.append(float(start) / float(sr))
-        num_used += 1
-
-    if not offsets:
-        return {
-            "num_windows_total": num_total,
-            "num_windows_used": num_used,
-            "offsets_db": [],
-            "window_starts_sec": [],
-            "offset_mean_db": None,
-            "offset_median_db": None,
-            "offset_p95_db": None,
-            "offset_min_db": None,
-            "offset_max_db": None,
-        }
+    num_total = int(starts.size)
+    num_used = int(np.count_nonzero(used))
+    if not num_used:
+        return _empty_offsets_series(num_total, num_used)
 
-    arr = np.array(offsets, dtype=np.float32)
+    arr = (lufs_lead[used] - lufs_ref[used]).astype(np.float32)
 
     return {
         "num_windows_total": num_total,
         "num_windows_used": num_used,
         "offsets_db": [float(x) for x in arr.tolist()],
-        "window_starts_sec": starts_sec,
+        "window_starts_sec": [float(x) for x in (starts[used] / float(sr)).tolist()],
         "offset_mean_db": float(np.mean(arr)),
         "offset_median_db": float(np.median(arr)),
         "offset_p95_db": _percentile(arr, 95.0),
@@ -282,6 +263,7 @@ def _analyze_stem_summary(
     hop_sec: float,
     rms_threshold_db: float,
     include_series: bool = True,
+    bed_loudness: Optional[ShortTermLoudness] = None,
 ) -> Dict[str, Any]:
     """
     Analiza un stem (si es lead) vs BED: devuelve resumen + (opcional) series.
@@ -323,6 +305,7 @@ def _analyze_stem_summary(
         window_sec=window_sec,
         hop_sec=hop_sec,
         rms_threshold_db=rms_threshold_db,
+        ref_loudness=bed_loudness,
     )
 
     out.update(
@@ -383,6 +366,9 @@ def main() -> None:
     HOP_SEC = float(metrics.get("short_term_hop_sec", 1.0))
     RMS_THR_DB = float(metrics.get("rms_threshold_db", -40.0))
 
+    # BED K-ponderado una sola vez para la serie global y todos los leads
+    bed_loudness = ShortTermLoudness(bed_mono, sr_ref)
+
     # --- Series global basada en SUMA de leads vs BED (mejor perceptual que mean-of-means) ---
     lead_sum_series = _compute_short_term_offsets_series(
         y_lead=lead_sum_mono,
@@ -391,6 +377,7 @@ def main() -> None:
         window_sec=WINDOW_SEC,
         hop_sec=HOP_SEC,
         rms_threshold_db=RMS_THR_DB,
+        ref_loudness=bed_loudness,
     )
 
     # --- Análisis por stem (solo resumen + series opcional) ---
@@ -415,6 +402,7 @@ def main() -> None:
                 hop_sec=HOP_SEC,
                 rms_threshold_db=RMS_THR_DB,
                 include_series=True,  # útil para debug/front
+                bed_loudness=bed_loudness,
             )
         )
 
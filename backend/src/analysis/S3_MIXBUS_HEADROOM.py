@@ -13,7 +13,6 @@ if str(SRC_DIR) not in sys.path:
 
 import json  # noqa: E402
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import (  # noqa: E402
     load_contract,
@@ -21,6 +20,11 @@ from utils.analysis_utils import (  # noqa: E402
     sf_read_limited,
 )
 from utils.session_utils import load_session_config  # noqa: E402
+from utils.stem_bus import open_stem  # noqa: E402
+
+# Lee los stems con sf_read_limited / open_stem: el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
 
 try:
     from utils.loudness_utils import (  # type: ignore  # noqa: E402
@@ -50,10 +54,10 @@ def _mixbus_sample_peak_stream(stem_files: List[Path], block_size: int = 65536)
     if not stem_files:
         return float("-inf"), None
 
-    files: List[sf.SoundFile] = []
+    files: List[Any] = []
     try:
         for p in stem_files:
-            files.append(sf.SoundFile(str(p), mode="r"))
+            files.append(open_stem(p))
 
         sr_ref = int(files[0].samplerate)
         ch_ref = int(files[0].channels)
@@ -23,9 +23,15 @@ from utils.analysis_utils import (  # noqa: E402
     get_temp_dir,
     sf_read_limited,
 )
+from utils.stem_feature_cache import analyze_stem_cached  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
 from utils.profiles_utils import get_hpf_lpf_targets  # noqa: E402
 
+# Lee los stems con sf_read_limited (stem bus): el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
+
 
 def _analyze_spectrum(
     y: np.ndarray,
@@ -223,7 +229,7 @@ def main() -> None:
 
     stems_analysis: List[Dict[str, Any]] = []
     if tasks:
-        stems_analysis = list(map(_analyze_stem, tasks))
+        stems_analysis = map_stems(lambda t: analyze_stem_cached(contract_id, _analyze_stem, t), tasks)
     else:
         stems_analysis = []
 
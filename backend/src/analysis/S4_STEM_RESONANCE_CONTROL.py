@@ -22,12 +22,18 @@ from utils.analysis_utils import (  # noqa: E402
     get_temp_dir,
     sf_read_limited,
 )
+from utils.stem_feature_cache import analyze_stem_cached  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
 from utils.resonance_utils import (  # noqa: E402
     compute_magnitude_spectrum,
     detect_resonances,
 )
 
+# Lee los stems con sf_read_limited (stem bus): el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
+
 
 def _to_mono(y: np.ndarray) -> np.ndarray:
     arr = np.asarray(y, dtype=np.float32)
@@ -167,7 +173,7 @@ def main() -> None:
             )
         )
 
-    stems_analysis: List[Dict[str, Any]] = list(map(_analyze_stem, tasks)) if tasks else []
+    stems_analysis: List[Dict[str, Any]] = map_stems(lambda t: analyze_stem_cached(contract_id, _analyze_stem, t), tasks) if tasks else []
 
     total_resonances = sum(int(s.get("num_resonances_detected", 0) or 0) for s in stems_analysis)
 
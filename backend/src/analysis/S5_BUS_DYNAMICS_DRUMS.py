@@ -15,7 +15,6 @@ if str(SRC_DIR) not in sys.path:
 
 import json  # noqa: E402
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import (  # noqa: E402
     load_contract,
@@ -25,6 +24,7 @@ from utils.analysis_utils import (  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
 from utils.profiles_utils import get_instrument_family  # noqa: E402
 from utils.dynamics_utils import compute_crest_factor_db  # noqa: E402
+from utils.tempo_utils import bpm_from_session  # noqa: E402
 
 
 def _load_drum_mono(stem_path: Path) -> Dict[str, Any]:
@@ -61,115 +61,10 @@ def _load_drum_mono(stem_path: Path) -> Dict[str, Any]:
     return {"file_name": fname, "data": y_mono, "sr": sr, "error": None}
 
 
-def _read_mono_limited(path: Path, max_seconds: float = 90.0) -> tuple[np.ndarray | None, int | None, str | None]:
-    """Lectura limitada y mono para estimación de BPM."""
-    try:
-        with sf.SoundFile(str(path)) as f:
-            sr = int(f.samplerate)
-            max_frames = int(max_seconds * sr)
-            frames = min(max_frames, len(f))
-            y = f.read(frames=frames, dtype="float32", always_2d=False)
-        if y is None:
-            return None, None, "lectura None"
-        if not isinstance(y, np.ndarray):
-            y = np.asarray(y, dtype=np.float32)
-        if y.size == 0:
-            return None, None, "archivo vacío"
-        if y.ndim > 1:
-            y = np.mean(y, axis=1).astype(np.float32)
-        return y.astype(np.float32), sr, None
-    except Exception as e:
-        return None, None, str(e)
-
-
-def _estimate_bpm_from_audio(y: np.ndarray, sr: int, bpm_min: float = 60.0, bpm_max: float = 200.0) -> tuple[float | None, float]:
-    """
-    Estimación ligera de BPM basada en envolvente de energía + autocorrelación FFT.
-    Devuelve (bpm_est, confidence[0..1 aprox]).
-    """
-    if y is None or sr is None:
-        return None, 0.0
-    if y.size < sr * 5:
-        # demasiado corto
-        return None, 0.0
-
-    y = y.astype(np.float32)
-    y = y - float(np.mean(y))
-
-    # Envolvente de energía (RMS) por frames
-    frame = 2048
-    hop = 512
-    n = int((len(y) - frame) / hop) + 1
-    if n < 256:
-        return None, 0.0
-
-    # RMS por frame
-    idx = np.arange(frame, dtype=np.int32)[None, :] + (np.arange(n, dtype=np.int32) * hop)[:, None]
-    frames = y[idx]
-    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12).astype(np.float32)
-
-    # Resaltar onsets: derivada positiva
-    env = np.diff(rms, prepend=rms[:1])
-    env = np.maximum(env, 0.0)
-
-    # Suavizado rápido
-    k = 5
-    if env.size > k:
-        env = np.convolve(env, np.ones(k, dtype=np.float32) / k, mode="same")
-
-    # Normalizar
-    env = env - float(np.mean(env))
-    std = float(np.std(env) + 1e-12)
-    env = (env / std).astype(np.float32)
-
-    fe = sr / float(hop)  # "sample rate" de la envolvente
-
-    # Autocorrelación vía FFT
-    m = int(env.size)
-    nfft = 1 << ((2 * m - 1).bit_length())
-    F = np.fft.rfft(env, n=nfft)
-    ac = np.fft.irfft(F * np.conj(F), n=nfft)[:m].real
-    ac[0] = 0.0
-
-    lag_min = int(round((60.0 * fe) / bpm_max))
-    lag_max = int(round((60.0 * fe) / bpm_min))
-    if lag_max <= lag_min + 2 or lag_max >= ac.size:
-        return None, 0.0
-
-    window = ac[lag_min : lag_max + 1]
-    if window.size < 4:
-        return None, 0.0
-
-    peak_i = int(np.argmax(window))
-    peak_lag = lag_min + peak_i
-    bpm0 = 60.0 * fe / float(peak_lag)
-
-    # Corrección de octava (bpm, bpm*2, bpm/2) eligiendo el que maximiza la ac
-    candidates: List[tuple[float, float]] = []
-    for mult in (0.5, 1.0, 2.0):
-        bpm_c = bpm0 * mult
-        if bpm_c < bpm_min or bpm_c > bpm_max:
-            continue
-        lag_c = int(round((60.0 * fe) / bpm_c))
-        if lag_c <= 1 or lag_c >= ac.size:
-            continue
-        candidates.append((bpm_c, float(ac[lag_c])))
-
-    if not candidates:
-        return None, 0.0
-
-    bpm_best, score_best = max(candidates, key=lambda t: t[1])
-
-    # Confianza: peak vs mediana del rango
-    med = float(np.median(window) + 1e-12)
-    conf = float(np.clip((score_best / med - 1.0) / 10.0, 0.0, 1.0))  # heurística
-    return float(bpm_best), conf
-
-
 def _get_bpm(cfg: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float, str]:
     """
     Devuelve (bpm, confidence, source):
-      - source: session_config | estimated_full_song | none
+      - source: session_config | session_drum_bus | session_full_song | none
     """
     for k in ("bpm", "tempo_bpm", "bpm_estimate", "tempo"):
         v = cfg.get(k)
@@ -181,15 +76,8 @@ def _get_bpm(cfg: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float,
         except (TypeError, ValueError):
             pass
 
-    full_song = temp_dir / "full_song.wav"
-    if full_song.exists():
-        y, sr, err = _read_mono_limited(full_song, max_seconds=90.0)
-        if err is None and y is not None and sr is not None:
-            bpm, conf = _estimate_bpm_from_audio(y, sr)
-            if bpm is not None:
-                return bpm, conf, "estimated_full_song"
-
-    return None, 0.0, "none"
+    # Tempo de sesión (calculado una vez tras S0 sobre el bus de Drums o la mezcla)
+    return bpm_from_session(temp_dir)
 
 
 def main() -> None:
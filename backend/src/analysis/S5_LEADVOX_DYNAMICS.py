@@ -7,7 +7,6 @@ from pathlib import Path
 from typing import Dict, Any, List, Tuple, Optional
 import json
 import numpy as np
-import soundfile as sf
 
 # --- hack para importar utils ---
 THIS_DIR = Path(__file__).resolve().parent
@@ -20,8 +19,18 @@ from utils.analysis_utils import (  # noqa: E402
     get_temp_dir,
     sf_read_limited,
 )
+from utils.stem_feature_cache import analyze_stem_cached  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
 from utils.dynamics_utils import compute_crest_factor_db  # noqa: E402
+from utils.loudness_utils import ShortTermLoudness  # noqa: E402
+from utils.stft_engine import band_energy, iter_stft  # noqa: E402
+from utils.tempo_utils import bpm_from_session  # noqa: E402
+from utils.stem_bus import open_stem  # noqa: E402
+
+# Lee los stems con sf_read_limited / open_stem: el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
 
 
 # -----------------------------
@@ -53,7 +62,7 @@ def _read_audio_limited(
       - y en float32, shape (n, ch) si always_2d=True; si no, puede ser 1D.
     """
     try:
-        with sf.SoundFile(str(path)) as f:
+        with open_stem(path) as f:
             sr = int(f.samplerate)
             max_frames = int(max_seconds * sr)
             frames = min(max_frames, len(f))
@@ -90,18 +99,14 @@ def _short_term_rms_db_series(
         return np.zeros((0,), dtype=np.float32), np.zeros((0,), dtype=np.float32)
 
     win = max(int(round(win_s * sr)), 1)
-    hop = max(int(round(hop_s * sr)), 1)
 
     if y.size < win:
         t = np.array([0.0], dtype=np.float32)
         return t, np.array([_rms_dbfs(y)], dtype=np.float32)
 
-    y2 = (y * y).astype(np.float64)
-    c = np.concatenate([np.zeros((1,), dtype=np.float64), np.cumsum(y2, dtype=np.float64)])
-
-    starts = np.arange(0, y.size - win + 1, hop, dtype=np.int64)
-    sums = c[starts + win] - c[starts]
-    rms = np.sqrt(sums / float(win) + EPS).astype(np.float32)
+    # Mismo motor de ventanas que S3_LEADVOX_AUDIBILITY, sin K-weighting (dBFS)
+    starts, powers = ShortTermLoudness(y, sr, k_weighting=False).window_powers(win_s, hop_s)
+    rms = np.sqrt(powers + EPS).astype(np.float32)
     dbs = (20.0 * np.log10(np.maximum(rms, EPS))).astype(np.float32)
 
     t_centers = (starts.astype(np.float32) + 0.5 * float(win)) / float(sr)
@@ -203,23 +208,17 @@ def _band_energy_ratio_db_p95(
     hi_mask = (freqs >= band_hi[0]) & (freqs < band_hi[1])
     mid_mask = (freqs >= band_mid[0]) & (freqs < band_mid[1])
 
-    ratios: List[float] = []
-    n_frames = 1 + (y.size - frame) // hop
-
-    for k in range(n_frames):
-        i0 = k * hop
-        x = y[i0 : i0 + frame]
-        X = np.fft.rfft(x * win)
-        mag2 = (np.abs(X) ** 2).astype(np.float64)
-        e_hi = float(np.sum(mag2[hi_mask]) + EPS)
-        e_mid = float(np.sum(mag2[mid_mask]) + EPS)
-        r_db = float(10.0 * np.log10(e_hi / e_mid))
-        ratios.append(r_db)
+    # STFT por lotes (sin resíntesis)
+    ratios: List[np.ndarray] = []
+    for _f0, X in iter_stft(y, frame, hop, win):
+        e_hi = band_energy(X, hi_mask) + EPS
+        e_mid = band_energy(X, mid_mask) + EPS
+        ratios.append(10.0 * np.log10(e_hi / e_mid))
 
     if not ratios:
         return {"p50_db": float("nan"), "p95_db": float("nan")}
 
-    arr = np.array(ratios, dtype=np.float32)
+    arr = np.concatenate(ratios).astype(np.float32)
     return {
         "p50_db": float(np.percentile(arr, 50.0)),
         "p95_db": float(np.percentile(arr, 95.0)),
@@ -294,84 +293,6 @@ def _analyze_stem(args: Tuple[Path, str, bool]) -> Dict[str, Any]:
     }
 
 
-def _read_mono_limited(path: Path, max_seconds: float = 90.0) -> tuple[np.ndarray | None, int | None, str | None]:
-    """Lectura limitada y mono para estimación de BPM."""
-    y, sr, err = _read_audio_limited(path, max_seconds=max_seconds, always_2d=True)
-    if err is not None or y is None or sr is None:
-        return None, None, err
-    return _to_mono(y), sr, None
-
-
-def _estimate_bpm_from_audio(
-    y: np.ndarray, sr: int, bpm_min: float = 60.0, bpm_max: float = 200.0
-) -> tuple[float | None, float]:
-    """Idéntico criterio que en drums: energía + autocorrelación FFT."""
-    if y is None or sr is None:
-        return None, 0.0
-    if y.size < sr * 5:
-        return None, 0.0
-
-    y = y.astype(np.float32)
-    y = y - float(np.mean(y))
-
-    frame = 2048
-    hop = 512
-    n = int((len(y) - frame) / hop) + 1
-    if n < 256:
-        return None, 0.0
-
-    idx = np.arange(frame, dtype=np.int32)[None, :] + (np.arange(n, dtype=np.int32) * hop)[:, None]
-    frames = y[idx]
-    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12).astype(np.float32)
-
-    env = np.diff(rms, prepend=rms[:1])
-    env = np.maximum(env, 0.0)
-
-    k = 5
-    if env.size > k:
-        env = np.convolve(env, np.ones(k, dtype=np.float32) / k, mode="same")
-
-    env = env - float(np.mean(env))
-    std = float(np.std(env) + 1e-12)
-    env = (env / std).astype(np.float32)
-
-    fe = sr / float(hop)
-
-    m = int(env.size)
-    nfft = 1 << ((2 * m - 1).bit_length())
-    F = np.fft.rfft(env, n=nfft)
-    ac = np.fft.irfft(F * np.conj(F), n=nfft)[:m].real
-    ac[0] = 0.0
-
-    lag_min = int(round((60.0 * fe) / bpm_max))
-    lag_max = int(round((60.0 * fe) / bpm_min))
-    if lag_max <= lag_min + 2 or lag_max >= ac.size:
-        return None, 0.0
-
-    window = ac[lag_min : lag_max + 1]
-    peak_i = int(np.argmax(window))
-    peak_lag = lag_min + peak_i
-    bpm0 = 60.0 * fe / float(peak_lag)
-
-    candidates: List[tuple[float, float]] = []
-    for mult in (0.5, 1.0, 2.0):
-        bpm_c = bpm0 * mult
-        if bpm_c < bpm_min or bpm_c > bpm_max:
-            continue
-        lag_c = int(round((60.0 * fe) / bpm_c))
-        if lag_c <= 1 or lag_c >= ac.size:
-            continue
-        candidates.append((bpm_c, float(ac[lag_c])))
-
-    if not candidates:
-        return None, 0.0
-
-    bpm_best, score_best = max(candidates, key=lambda t: t[1])
-    med = float(np.median(window) + 1e-12)
-    conf = float(np.clip((score_best / med - 1.0) / 10.0, 0.0, 1.0))
-    return float(bpm_best), conf
-
-
 def _get_bpm(cfg: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float, str]:
     for k in ("bpm", "tempo_bpm", "bpm_estimate", "tempo"):
         v = cfg.get(k)
@@ -383,15 +304,8 @@ def _get_bpm(cfg: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float,
         except (TypeError, ValueError):
             pass
 
-    full_song = temp_dir / "full_song.wav"
-    if full_song.exists():
-        y, sr, err = _read_mono_limited(full_song, max_seconds=90.0)
-        if err is None and y is not None and sr is not None:
-            bpm, conf = _estimate_bpm_from_audio(y, sr)
-            if bpm is not None:
-                return bpm, conf, "estimated_full_song"
-
-    return None, 0.0, "none"
+    # Tempo de sesión (calculado una vez tras S0 sobre el bus de Drums o la mezcla)
+    return bpm_from_session(temp_dir)
 
 
 def _build_bed_mix_limited(
@@ -506,7 +420,7 @@ def main() -> None:
         tasks.append((p, inst_prof, is_lead))
 
     # 5) Ejecutar análisis base (crest/rms/peak)
-    stems_analysis: List[Dict[str, Any]] = [_analyze_stem(t) for t in tasks] if tasks else []
+    stems_analysis: List[Dict[str, Any]] = map_stems(lambda t: analyze_stem_cached(contract_id, _analyze_stem, t), tasks) if tasks else []
 
     # 6) Construir BED (para targets relativos)
     bed_mono, bed_sr, bed_reason = _build_bed_mix_limited(
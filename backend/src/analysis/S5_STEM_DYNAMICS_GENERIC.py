@@ -14,16 +14,21 @@ if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
 import json  # noqa: E402
-import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import (  # noqa: E402
     load_contract,
     get_temp_dir,
     sf_read_limited,
 )
+from utils.stem_feature_cache import analyze_stem_cached  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
 from utils.dynamics_utils import compute_crest_factor_db  # noqa: E402
+from utils.tempo_utils import bpm_from_session  # noqa: E402
+
+# Lee los stems con sf_read_limited (stem bus): el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
 
 
 def _analyze_stem(args: Tuple[Path, str]) -> Dict[str, Any]:
@@ -63,93 +68,6 @@ def _analyze_stem(args: Tuple[Path, str]) -> Dict[str, Any]:
     }
 
 
-def _read_mono_limited(path: Path, max_seconds: float = 90.0) -> tuple[np.ndarray | None, int | None, str | None]:
-    try:
-        with sf.SoundFile(str(path)) as f:
-            sr = int(f.samplerate)
-            max_frames = int(max_seconds * sr)
-            frames = min(max_frames, len(f))
-            y = f.read(frames=frames, dtype="float32", always_2d=False)
-        if y is None:
-            return None, None, "lectura None"
-        if not isinstance(y, np.ndarray):
-            y = np.asarray(y, dtype=np.float32)
-        if y.size == 0:
-            return None, None, "archivo vacío"
-        if y.ndim > 1:
-            y = np.mean(y, axis=1).astype(np.float32)
-        return y.astype(np.float32), sr, None
-    except Exception as e:
-        return None, None, str(e)
-
-
-def _estimate_bpm_from_audio(y: np.ndarray, sr: int, bpm_min: float = 60.0, bpm_max: float = 200.0) -> tuple[float | None, float]:
-    if y is None or sr is None:
-        return None, 0.0
-    if y.size < sr * 5:
-        return None, 0.0
-
-    y = y.astype(np.float32)
-    y = y - float(np.mean(y))
-
-    frame = 2048
-    hop = 512
-    n = int((len(y) - frame) / hop) + 1
-    if n < 256:
-        return None, 0.0
-
-    idx = np.arange(frame, dtype=np.int32)[None, :] + (np.arange(n, dtype=np.int32) * hop)[:, None]
-    frames = y[idx]
-    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12).astype(np.float32)
-
-    env = np.diff(rms, prepend=rms[:1])
-    env = np.maximum(env, 0.0)
-
-    k = 5
-    if env.size > k:
-        env = np.convolve(env, np.ones(k, dtype=np.float32) / k, mode="same")
-
-    env = env - float(np.mean(env))
-    std = float(np.std(env) + 1e-12)
-    env = (env / std).astype(np.float32)
-
-    fe = sr / float(hop)
-
-    m = int(env.size)
-    nfft = 1 << ((2 * m - 1).bit_length())
-    F = np.fft.rfft(env, n=nfft)
-    ac = np.fft.irfft(F * np.conj(F), n=nfft)[:m].real
-    ac[0] = 0.0
-
-    lag_min = int(round((60.0 * fe) / bpm_max))
-    lag_max = int(round((60.0 * fe) / bpm_min))
-    if lag_max <= lag_min + 2 or lag_max >= ac.size:
-        return None, 0.0
-
-    window = ac[lag_min : lag_max + 1]
-    peak_i = int(np.argmax(window))
-    peak_lag = lag_min + peak_i
-    bpm0 = 60.0 * fe / float(peak_lag)
-
-    candidates: List[tuple[float, float]] = []
-    for mult in (0.5, 1.0, 2.0):
-        bpm_c = bpm0 * mult
-        if bpm_c < bpm_min or bpm_c > bpm_max:
-            continue
-        lag_c = int(round((60.0 * fe) / bpm_c))
-        if lag_c <= 1 or lag_c >= ac.size:
-            continue
-        candidates.append((bpm_c, float(ac[lag_c])))
-
-    if not candidates:
-        return None, 0.0
-
-    bpm_best, score_best = max(candidates, key=lambda t: t[1])
-    med = float(np.median(window) + 1e-12)
-    conf = float(np.clip((score_best / med - 1.0) / 10.0, 0.0, 1.0))
-    return float(bpm_best), conf
-
-
 def _get_bpm(cfg: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float, str]:
     for k in ("bpm", "tempo_bpm", "bpm_estimate", "tempo"):
         v = cfg.get(k)
@@ -161,15 +79,8 @@ def _get_bpm(cfg: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float,
         except (TypeError, ValueError):
             pass
 
-    full_song = temp_dir / "full_song.wav"
-    if full_song.exists():
-        y, sr, err = _read_mono_limited(full_song, max_seconds=90.0)
-        if err is None and y is not None and sr is not None:
-            bpm, conf = _estimate_bpm_from_audio(y, sr)
-            if bpm is not None:
-                return bpm, conf, "estimated_full_song"
-
-    return None, 0.0, "none"
+    # Tempo de sesión (calculado una vez tras S0 sobre el bus de Drums o la mezcla)
+    return bpm_from_session(temp_dir)
 
 
 def main() -> None:
@@ -219,7 +130,7 @@ def main() -> None:
         tasks.append((p, inst_prof))
 
     # 5) Ejecutar análisis en serie
-    results: List[Dict[str, Any]] = [_analyze_stem(t) for t in tasks] if tasks else []
+    results: List[Dict[str, Any]] = map_stems(lambda t: analyze_stem_cached(contract_id, _analyze_stem, t), tasks) if tasks else []
 
     stems_analysis: List[Dict[str, Any]] = []
 
@@ -13,6 +13,7 @@ if str(SRC_DIR) not in sys.path:
 
 from utils.logger import logger
 from utils.analysis_utils import load_contract, get_temp_dir
+from utils.stem_bus import stem_info as stem_file_info
 
 try:
     import soundfile as sf
@@ -26,6 +27,10 @@ except ImportError:  # pragma: no cover
 
 STAGE_ID = "S6_MANUAL_CORRECTION"
 
+# Lee los metadatos de los stems con stem_file_info: el runner no vuelca el
+# stem bus antes de este análisis.
+USES_STEM_BUS = True
+
 
 def _resolve_stage_dir(context: Optional["PipelineContext"]) -> Path:
     if context and getattr(context, "temp_root", None):
@@ -42,8 +47,9 @@ def _safe_read_json(path: Path) -> Any:
 
 def _gather_stem_summary(stage_dir: Path) -> List[Dict[str, Any]]:
     """
-    Lightweight stem summary (no full audio decode). We rely on soundfile.info
-    when available; otherwise, we fall back to file listing only.
+    Lightweight stem summary (no full audio decode). We rely on stem_info
+    (stem bus buffer or soundfile.info) when available; otherwise, we fall
+    back to file listing only.
     """
     stems_data: List[Dict[str, Any]] = []
 
@@ -55,7 +61,7 @@ def _gather_stem_summary(stage_dir: Path) -> List[Dict[str, Any]]:
 
         if sf is not None:
             try:
-                meta = sf.info(str(wav_path))
+                meta = stem_file_info(wav_path)
                 info["channels"] = int(meta.channels)
                 info["frames"] = int(meta.frames)
                 info["sample_rate"] = int(meta.samplerate)
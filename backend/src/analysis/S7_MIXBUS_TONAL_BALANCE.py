@@ -17,14 +17,11 @@ if str(PROJECT_ROOT) not in sys.path:
 if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
-from utils.analysis_utils import (  # noqa: E402
-    load_contract,
-    sf_read_limited,
-)
+from utils.analysis_utils import load_contract  # noqa: E402
 from utils.session_utils import load_session_config  # noqa: E402
+from utils.spectral_cache import get_spectral_features  # noqa: E402
 from utils.tonal_balance_utils import (  # noqa: E402
     get_freq_bands,
-    compute_band_energies,
     get_style_tonal_profile,
 )
 
@@ -114,13 +111,13 @@ def compute_error_by_band_rel(
 
 
 def _analyze_mixbus(full_song_path: Path) -> Dict[str, Any]:
+    # Features de la canción completa (las reutiliza el stage vía sidecar/caché)
     try:
-        y, sr = sf_read_limited(full_song_path, always_2d=False)
+        feats = get_spectral_features(full_song_path)
     except Exception as e:
         return {"band_current_db_abs": None, "sr_mix": None, "error": str(e)}
 
-    band_current_db_abs = compute_band_energies(y, sr)
-    return {"band_current_db_abs": band_current_db_abs, "sr_mix": sr, "error": None}
+    return {"band_current_db_abs": feats.band_energies(), "sr_mix": feats.sr, "error": None}
 
 
 def process(context: PipelineContext, *args) -> bool:
@@ -1,6 +1,19 @@
-from dataclasses import dataclass
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from utils.stem_bus import StemBus
+
+# Los scripts importan este módulo como "context" y el pipeline/tasks como
+# "src.context": registramos ambos nombres para que exista un único módulo
+# (una sola clase PipelineContext y un solo contexto activo).
+for _alias in ("context", "src.context"):
+    sys.modules.setdefault(_alias, sys.modules[__name__])
+
 
 @dataclass
 class PipelineContext:
@@ -12,6 +25,19 @@ class PipelineContext:
     job_id: Optional[str] = None
     temp_root: Optional[Path] = None
 
+    # Bus de stems en memoria (opcional). Si está presente, run_stage lo pasa de
+    # contrato en contrato; los stems modificados solo se vuelcan a disco en
+    # los checkpoints (checkpoint_stems) o antes de un script que lee disco.
+    stem_bus: Optional["StemBus"] = None
+
+    # Estado compartido entre stages con process(context) (p.ej. S6).
+    sample_rate: Optional[int] = None
+    audio_stems: Dict[str, Any] = field(default_factory=dict)
+
+    # Secuencia efectiva de contratos del job (los stems se copian siempre al
+    # siguiente contrato HABILITADO). None => orden completo de contracts.json.
+    contract_sequence: Optional[List[str]] = None
+
     # Puedes agregar más campos si es necesario, como configuración global,
     # logger configurado, etc.
 
@@ -29,3 +55,35 @@ class PipelineContext:
         # o get_temp_dir en analysis_utils.py si se quiere mantener compatibilidad total,
         # pero idealmente el temp_root debe venir seteado.
         raise ValueError("temp_root no está definido en PipelineContext")
+
+    def checkpoint_stems(self) -> None:
+        """
+        Vuelca a disco los stems pendientes del bus (si lo hay).
+        """
+        if self.stem_bus is not None:
+            self.stem_bus.flush()
+
+
+# Contexto activo del hilo/tarea actual. Los helpers legacy (get_temp_dir,
+# load_session_config, main() de los scripts) resuelven rutas desde aquí en
+# lugar de os.environ, de modo que varios jobs pueden convivir en un proceso.
+_ACTIVE_CONTEXT: ContextVar[Optional[PipelineContext]] = ContextVar(
+    "mix_active_pipeline_context", default=None
+)
+
+
+def get_active_context() -> Optional[PipelineContext]:
+    return _ACTIVE_CONTEXT.get()
+
+
+@contextmanager
+def activate_context(context: PipelineContext) -> Iterator[PipelineContext]:
+    """
+    Marca context como el contexto activo mientras dure el bloque.
+    Es local al hilo/tarea asyncio (contextvars), no al proceso.
+    """
+    token = _ACTIVE_CONTEXT.set(context)
+    try:
+        yield context
+    finally:
+        _ACTIVE_CONTEXT.reset(token)
@@ -9,16 +9,20 @@ from typing import Callable, Dict, Any, List, Optional
 import numpy as np
 import soundfile as sf
 
-from .utils import mixdown_stems, copy_stems
-from .stages.stage import run_stage, set_active_contract_sequence
+from .utils import mixdown_stems, copy_stems, tempo_utils
+from .stages.stage import run_stage
 from .utils.analysis_utils import get_temp_dir
 from .context import PipelineContext
 from .utils.job_store import update_job_status
 from .utils.logger import logger as pipeline_logger
 from .utils.waveform import compute_and_cache_peaks, ensure_preview_wav
+from .utils.stem_bus import StemBus
+from .utils.audio_utils import write_audio_atomic
+from .scheduler import plan_contract_waves, run_contract_wave
 
 logger = logging.getLogger(__name__)
 
+
 def _mark_job_failure(temp_root: Optional[Path], message: str, job_id: Optional[str] = None) -> None:
     """
     Actualiza job_status a failure con un mensaje claro si hay temp_root disponible.
@@ -134,6 +138,16 @@ def _run_copy_and_mixdown(src_stage: str, dst_stage: str) -> None:
         temp_root=temp_root,
     )
 
+    # 3) Tempo de sesión (bus de Drums o mezcla), una vez para todo el job
+    _run_processing_step(
+        f"Tempo de sesión de {src_stage}",
+        tempo_utils.process,
+        context=context,
+        args=[src_stage],
+        job_id=job_id,
+        temp_root=temp_root,
+    )
+
 
 def _write_session_config(stage_dir: Path, profiles_by_name: Optional[Dict[str, str]]) -> None:
     """
@@ -345,7 +359,7 @@ def _normalize_wav_channels_in_dir(stage_dir: Path) -> None:
             if normalized.shape == data.shape:
                 continue
             subtype = info.subtype or None
-            sf.write(wav_path, normalized, sr, subtype=subtype)
+            write_audio_atomic(wav_path, normalized, sr, subtype=subtype)
             logger.info("[pipeline] Normalized channels to stereo for %s", wav_path.name)
         except Exception as exc:
             logger.warning("[pipeline] No se pudo normalizar canales en %s: %s", wav_path.name, exc)
@@ -368,12 +382,18 @@ def _run_contracts_global(enabled_stage_keys: Optional[List[str]] = None) -> Non
     else:
         contract_ids = all_contract_ids
 
-    # Propagamos la secuencia efectiva al módulo stage.py para que
-    # _get_next_contract_id pueda copiar siempre al siguiente contrato habilitado.
-    set_active_contract_sequence(contract_ids)
+    # La secuencia efectiva viaja en el contexto para que _get_next_contract_id
+    # copie siempre al siguiente contrato habilitado.
+    temp_root = get_temp_dir("S0_SESSION_FORMAT", create=True).parent
+    context = PipelineContext(
+        stage_id="",
+        job_id=temp_root.name,
+        temp_root=temp_root,
+        contract_sequence=contract_ids,
+    )
 
     for contract_id in contract_ids:
-        run_stage(contract_id)
+        run_stage(contract_id, context=context)
 
 
 def run_pipeline(
@@ -424,6 +444,10 @@ def run_pipeline_for_job(
       - Antes de ejecutar cada contrato llama a progress_cb(stage_index, total_stages, stage_key, message)
         indicando el stage que está EN PROGRESO.
     """
+    # Todas las rutas del job salen de temp_root (no de os.environ): varios
+    # jobs pueden ejecutarse a la vez en el mismo proceso.
+    temp_root = Path(temp_root)
+
     logger.info(
         "[pipeline] run_pipeline_for_job: job_id=%s media_dir=%s temp_root=%s enabled_stage_keys=%s",
         job_id,
@@ -453,8 +477,8 @@ def run_pipeline_for_job(
     # ------------------------------------------------------------------
     # 0) Preparar S0_MIX_ORIGINAL para este job
     # ------------------------------------------------------------------
-    # get_temp_dir usa MIX_JOB_ID para resolver temp/<job_id>/S0_MIX_ORIGINAL
-    s0_original_dir = get_temp_dir("S0_MIX_ORIGINAL", create=True)
+    s0_original_dir = temp_root / "S0_MIX_ORIGINAL"
+    s0_original_dir.mkdir(parents=True, exist_ok=True)
 
     # Limpiar cualquier resto previo dentro de S0_MIX_ORIGINAL
     for p in s0_original_dir.glob("*"):
@@ -543,6 +567,17 @@ def run_pipeline_for_job(
         temp_root=temp_root,
     )
 
+    # Tempo/beat grid de la sesión: se calcula aquí una sola vez y lo leen
+    # todos los consumidores (S5_*, métricas finales) desde work/session_tempo.json
+    _run_processing_step(
+        "Tempo de sesión de S0_MIX_ORIGINAL",
+        tempo_utils.process,
+        context=context,
+        args=["S0_MIX_ORIGINAL"],
+        job_id=job_id,
+        temp_root=temp_root,
+    )
+
     # ------------------------------------------------------------------
     # 2) Copiar stems a S0_SESSION_FORMAT
     # ------------------------------------------------------------------
@@ -557,7 +592,7 @@ def run_pipeline_for_job(
     )
 
     # Generar peaks para S0_SESSION_FORMAT, así si el usuario abre Studio antes de S6, ya están listos.
-    s0_format_dir = get_temp_dir("S0_SESSION_FORMAT", create=False)
+    s0_format_dir = temp_root / "S0_SESSION_FORMAT"
     if s0_format_dir.exists():
         logger.info("[pipeline] Pre-calculating peaks for S0_SESSION_FORMAT...")
         for stem_path in s0_format_dir.glob("*.wav"):
@@ -604,17 +639,13 @@ def run_pipeline_for_job(
         )
         return
 
-    # Propagar la secuencia efectiva a stage.py para que las copias
-    # de stems vayan siempre al siguiente contrato HABILITADO y no a
-    # cualquier contrato del pipeline completo.
-    set_active_contract_sequence(contract_ids)
-
     # Si la primera stage no es S0_SESSION_FORMAT (ej. empezamos en S7),
     # debemos copiar manualmente los datos de S0_SESSION_FORMAT a esa primera stage
     # para "arrancar" la cadena.
     if contract_ids and contract_ids[0] != "S0_SESSION_FORMAT":
         first_stage = contract_ids[0]
-        first_stage_dir = get_temp_dir(first_stage, create=True)
+        first_stage_dir = temp_root / first_stage
+        first_stage_dir.mkdir(parents=True, exist_ok=True)
 
         # Si ya hay stems en la carpeta destino (p.ej. del pipeline previo),
         # no los sobreescribimos para poder reanudar donde se quedo el Mix Tool.
@@ -635,7 +666,7 @@ def run_pipeline_for_job(
                 idx_first = all_contract_ids.index(first_stage)
                 if idx_first > 0:
                     prev_stage = all_contract_ids[idx_first - 1]
-                    prev_dir = get_temp_dir(prev_stage, create=False)
+                    prev_dir = temp_root / prev_stage
                     prev_has_audio = prev_dir.exists() and any(
                         p.suffix.lower() == ".wav" and p.name.lower() != "full_song.wav"
                         for p in prev_dir.glob("*")
@@ -679,15 +710,35 @@ def run_pipeline_for_job(
         # ------------------------------------------------------------------
         # 4) Ejecutar cada contrato en orden
         # ------------------------------------------------------------------
+        # Waves de contratos independientes (io de contracts.json). El orden de
+        # ejecución (y de traspaso de carpetas) es el de las waves aplanadas.
+        waves = plan_contract_waves(contracts, contract_ids)
+        contract_ids = [cid for wave in waves for cid in wave]
+        waves_by_head: Dict[str, List[str]] = {}
+        wave_followers: set = set()
+        for wave in waves:
+            if len(wave) > 1:
+                waves_by_head[wave[0]] = wave
+                wave_followers.update(wave[1:])
+        if waves_by_head:
+            logger.info("[pipeline] Waves paralelas: %s", list(waves_by_head.values()))
+
         # Crear contexto único para todo el job
         context = PipelineContext(
             stage_id="", # Se actualizará en cada iteración
             job_id=job_id,
-            temp_root=temp_root
+            temp_root=temp_root,
+            stem_bus=StemBus(),
+            # Las copias de stems van siempre al siguiente contrato HABILITADO
+            # y no a cualquier contrato del pipeline completo.
+            contract_sequence=contract_ids,
         )
 
         for idx, contract_id in enumerate(contract_ids, start=1):
             current_stage_index = resume_stage_index_offset + idx
+            if contract_id in wave_followers:
+                # Ya ejecutado dentro de la wave de su cabeza.
+                continue
             # Check for mandatory pause before S6 if we just finished S5
             # The contract_id logic: we iterate. S5 finishes, loop continues to S6.
             # But we want to PAUSE BEFORE S6 starts if manual correction is enabled.
@@ -712,9 +763,12 @@ def run_pipeline_for_job(
                 if not has_corrections:
                     logger.info("[pipeline] Pausing pipeline for Manual Correction (S6)...")
 
+                    # Checkpoint: Studio lee los stems de disco.
+                    context.checkpoint_stems()
+
                     # Antes de pausar, asegurarnos de que S6 tenga peaks generados.
                     # Como aún no corrió S6, los stems en S6_MANUAL_CORRECTION son la copia de S5.
-                    s6_dir = get_temp_dir("S6_MANUAL_CORRECTION", create=False)
+                    s6_dir = temp_root / "S6_MANUAL_CORRECTION"
                     if s6_dir.exists():
                         logger.info("[pipeline] Pre-calculating peaks for S6_MANUAL_CORRECTION (before pause)...")
                         for stem_path in s6_dir.glob("*.wav"):
@@ -757,8 +811,22 @@ def run_pipeline_for_job(
                 f"Running stage {contract_id}...",
             )
 
+            wave = waves_by_head.get(contract_id)
+            if wave:
+                _emit_progress(
+                    resume_stage_index_offset + idx + len(wave) - 1,
+                    effective_total_stages,
+                    wave[-1],
+                    f"Running stages {', '.join(wave)}...",
+                )
+                run_contract_wave(wave, context)
+                continue
+
             # Ejecuta análisis, stage y check con reintentos, copia al siguiente contrato, etc.
             run_stage(contract_id, context=context)
+
+        # Checkpoint final: todo lo que quede en memoria pasa a disco.
+        context.checkpoint_stems()
     finally:
         logger.removeHandler(file_handler)
         pipeline_logger.remove_file_handler(file_handler)
@@ -0,0 +1,236 @@
+"""
+Planificación y ejecución en waves de los contratos de contracts.json.
+
+Los contratos de una wave se ejecutan en hilos del mismo proceso, cada uno con
+su propio PipelineContext. Eso solo es seguro porque run_stage no depende de
+estado global del proceso: sys.argv de los scripts legacy es local al hilo
+(_ContextArgv en stages/stage.py, importaciones bajo _IMPORT_LOCK) y las rutas
+del job salen del contexto activo, no de os.environ. Un contrato que pueda ir
+en una wave no debe tocar globales del proceso (os.environ, os.chdir,
+sys.argv, sys.path, estado mutable a nivel de módulo sin lock): si lo
+necesita, hay que declararlo como barrera completa (sin bloque "io").
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+from .context import PipelineContext
+from .stages.stage import MIXDOWN_STAGES, run_stage, _get_next_contract_id, _stem_fingerprints
+from .utils import copy_stems, mixdown_stems
+from .utils.copy_stems import link_or_copy
+from .utils.logger import logger as pipeline_logger
+
+SRC_DIR = Path(__file__).resolve().parent
+
+# Recursos que un contrato puede declarar en "io": {"reads": [...], "writes": [...]}:
+#   "stems:*", "stems:<familia>" (vocals, drums, ...), "mixbus", "session:<clave>", "report", "*"
+_FULL_BARRIER = {"*"}
+
+# Contratos que pausan el job (Studio): siempre en una wave propia
+_PAUSE_CONTRACTS = {"S6_MANUAL_CORRECTION"}
+
+
+# -------------------------------------------------------------------
+# Declaraciones y grafo
+# -------------------------------------------------------------------
+
+def contract_io(contract: Dict[str, Any]) -> Tuple[Set[str], Set[str], Set[str]]:
+    """
+    Devuelve (reads, writes, derived_writes) efectivos de un contrato.
+
+    - Sin bloque "io" el contrato es una barrera completa ("*").
+    - Escribir implica leer (nadie reescribe un stem sin leerlo).
+    - Un contrato que escribe stems (y no es de mixbus) también regenera el
+      mixbus: es una escritura derivada (el mixdown sale de los stems), que
+      cuenta para quien lee el mixbus pero no entre dos escritores de stems.
+    """
+    io = contract.get("io")
+    if not isinstance(io, dict):
+        return set(_FULL_BARRIER), set(_FULL_BARRIER), set()
+
+    writes = {str(w) for w in io.get("writes", []) or []}
+    reads = {str(r) for r in io.get("reads", []) or []} | writes
+
+    derived: Set[str] = set()
+    if contract.get("id") not in MIXDOWN_STAGES and any(w.startswith("stems:") for w in writes):
+        derived.add("mixbus")
+
+    return reads, writes, derived
+
+
+def _resources_overlap(a: str, b: str) -> bool:
+    if a == "*" or b == "*":
+        return True
+    a_kind, _, a_sub = a.partition(":")
+    b_kind, _, b_sub = b.partition(":")
+    if a_kind != b_kind:
+        return False
+    return a_sub == b_sub or a_sub in ("", "*") or b_sub in ("", "*")
+
+
+def _sets_overlap(a: Set[str], b: Set[str]) -> bool:
+    return any(_resources_overlap(x, y) for x in a for y in b)
+
+
+def plan_contract_waves(contracts: Dict[str, Any], contract_ids: List[str]) -> List[List[str]]:
+    """
+    Agrupa los contratos en "waves" de contratos independientes a partir de
+    sus declaraciones io en contracts.json.
+
+    Todos los contratos de una wave parten de la misma instantánea de stems y
+    sus cambios se fusionan en orden de contracts.json, así que para cada par
+    anterior -> posterior (i -> j):
+
+      - lectura-tras-escritura (j lee lo que i escribe): j va en una wave
+        posterior a la de i;
+      - escritura-tras-lectura o escritura-tras-escritura: j puede compartir
+        wave con i pero no adelantarse a ella.
+
+    Las waves salen del grafo, no de tramos contiguos de contracts.json: cada
+    contrato va a la última wave posible antes de los que dependen de él, de
+    modo que los contratos independientes que preceden a un mismo consumidor
+    (p.ej. S1_VOX_TUNING y S2_GROUP_PHASE_DRUMS antes de S3) coinciden en la
+    misma wave. Devuelve las waves
+    en orden de ejecución (cada una en orden de contracts.json); la secuencia
+    aplanada es el orden de traspaso de carpetas del job.
+    S6_MANUAL_CORRECTION va siempre solo (pausa de Studio) y hace de barrera.
+    """
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for stage_data in contracts.get("stages", {}).values():
+        for c in stage_data.get("contracts", []) or []:
+            if c.get("id"):
+                by_id[c["id"]] = c
+
+    io = {cid: contract_io(by_id.get(cid, {"id": cid})) for cid in contract_ids}
+
+    def _conflict(a: str, b: str) -> int:
+        """2 si b lee lo que escribe a, 1 si solo comparten escritura o a lee
+        lo que escribe b, 0 si son independientes (a anterior a b)."""
+        reads_a, writes_a, derived_a = io[a]
+        reads_b, writes_b, derived_b = io[b]
+        if a in _PAUSE_CONTRACTS or b in _PAUSE_CONTRACTS:
+            return 2
+        if _sets_overlap(writes_a | derived_a, reads_b):
+            return 2
+        if _sets_overlap(reads_a, writes_b | derived_b) or _sets_overlap(writes_a, writes_b):
+            return 1
+        return 0
+
+    # Primera wave posible de cada contrato...
+    level: Dict[str, int] = {}
+    for i, cid in enumerate(contract_ids):
+        lv = 0
+        for prev in contract_ids[:i]:
+            kind = _conflict(prev, cid)
+            if kind:
+                lv = max(lv, level[prev] + (1 if kind == 2 else 0))
+        level[cid] = lv
+
+    # ... y se retrasa hasta justo antes de sus consumidores.
+    last_level = max(level.values(), default=0)
+    for i in range(len(contract_ids) - 1, -1, -1):
+        cid = contract_ids[i]
+        lv = last_level
+        for nxt in contract_ids[i + 1:]:
+            kind = _conflict(cid, nxt)
+            if kind:
+                lv = min(lv, level[nxt] - (1 if kind == 2 else 0))
+        level[cid] = max(level[cid], lv)
+
+    waves: List[List[str]] = []
+    for lv in sorted(set(level.values())):
+        waves.append([cid for cid in contract_ids if level[cid] == lv])
+    return waves
+
+
+# -------------------------------------------------------------------
+# Ejecución de una wave
+# -------------------------------------------------------------------
+
+def _run_stage_in_wave(contract_id: str, context: PipelineContext) -> None:
+    """
+    Ejecuta run_stage(contract_id) en este proceso (sin traspaso al siguiente
+    contrato) con su propio PipelineContext: mismo job, misma secuencia de
+    contratos y sin stem bus (los contratos de la wave leen y escriben disco).
+    Comparte el warm-up y las cachés del proceso con el resto del job.
+    """
+    wave_ctx = PipelineContext(
+        stage_id=contract_id,
+        job_id=context.job_id,
+        temp_root=context.temp_root,
+        contract_sequence=context.contract_sequence,
+    )
+    run_stage(contract_id, context=wave_ctx, handoff=False)
+
+
+def run_contract_wave(
+    wave: List[str],
+    context: PipelineContext,
+) -> None:
+    """
+    Ejecuta una wave de contratos independientes.
+
+    1) Todos parten de la misma instantánea: la carpeta del primer contrato
+       (ya sembrada por el contrato anterior) se enlaza en las demás.
+    2) Se ejecutan en paralelo (un hilo por contrato, cada uno con su contexto).
+    3) Merge en orden: los stems modificados por cada contrato se enlazan en la
+       carpeta del último, se rehace su mixdown y se traspasa al siguiente contrato.
+
+    Las carpetas intermedias de la wave solo contienen sus propios cambios
+    (el resto de stems es el de la instantánea); los JSON de análisis son idénticos.
+    """
+    if len(wave) == 1:
+        run_stage(wave[0], context=context)
+        return
+
+    temp_root = Path(context.temp_root)
+    job_id = context.job_id or temp_root.name
+    first, last = wave[0], wave[-1]
+
+    # Los contratos de la wave leen disco: nada pendiente en memoria.
+    context.checkpoint_stems()
+    if context.stem_bus is not None:
+        context.stem_bus.discard()
+
+    snapshot_ctx = PipelineContext(stage_id=first, job_id=job_id, temp_root=temp_root)
+    for cid in wave[1:]:
+        copy_stems.process(snapshot_ctx, first, cid)
+
+    before = {cid: _stem_fingerprints(temp_root / cid) for cid in wave}
+
+    pipeline_logger.logger.info(f"[scheduler] Ejecutando en paralelo: {', '.join(wave)}")
+    with ThreadPoolExecutor(max_workers=len(wave)) as pool:
+        futures = {cid: pool.submit(_run_stage_in_wave, cid, context) for cid in wave}
+        for cid, fut in futures.items():
+            try:
+                fut.result()
+            except Exception as exc:
+                raise RuntimeError(f"Contrato {cid} falló: {exc}") from exc
+
+    # Merge ordenado de los cambios de la wave en la carpeta del último contrato
+    last_dir = temp_root / last
+    merged = 0
+    for cid in wave[:-1]:
+        after = _stem_fingerprints(temp_root / cid)
+        for name, fp in after.items():
+            if before[cid].get(name) == fp:
+                continue
+            link_or_copy(temp_root / cid / name, last_dir / name)
+            merged += 1
+
+    merge_ctx = PipelineContext(stage_id=last, job_id=job_id, temp_root=temp_root)
+    # Con mixdown perezoso solo hay full_song.wav si el siguiente contrato lo necesita.
+    if merged and last not in MIXDOWN_STAGES and (last_dir / "full_song.wav").exists():
+        mixdown_stems.process(merge_ctx, last)
+
+    next_contract_id = _get_next_contract_id(SRC_DIR, last, context.contract_sequence)
+    if next_contract_id is not None:
+        copy_stems.process(merge_ctx, last, next_contract_id)
+
+    pipeline_logger.logger.info(
+        f"[scheduler] Wave {', '.join(wave)} completada ({merged} stems fusionados en {last})."
+    )
+
@@ -6,7 +6,6 @@ from pathlib import Path
 from typing import Dict, Any, Tuple
 
 import numpy as np
-import soundfile as sf
 
 try:
     # Resample de buena calidad si SciPy está disponible
@@ -15,19 +14,12 @@ except ImportError:
     resample_poly = None
 
 from utils.analysis_utils import get_temp_dir
+from utils.stem_bus import read_stem, write_stem
+from utils.stem_executor import map_stems
 
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
 
-def _using_daemonic_process() -> bool:
-    """
-    Devuelve True si el proceso actual es daemon (por ejemplo, worker prefork de Celery).
-    Los procesos daemon no pueden crear nuevos procesos hijos, por lo que
-    deberiamos evitar ProcessPoolExecutor en ese contexto.
-    """
-    try:
-        import multiprocessing
-        return bool(multiprocessing.current_process().daemon)
-    except Exception:
-        return False
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
     """Carga el JSON de análisis de analysis\\S0_SESSION_FORMAT.py en temp/<contract_id>."""
@@ -149,7 +141,7 @@ def process_stem(stem_info: Dict[str, Any], metrics: Dict[str, Any]) -> None:
     max_peak_dbfs = metrics.get("max_peak_dbfs")
 
     # 1) Leer audio
-    data, sr = sf.read(file_path, always_2d=False)
+    data, sr = read_stem(file_path, always_2d=False)
 
     # 2) Convertir a float32 interno
     if data.dtype != np.float32:
@@ -168,7 +160,7 @@ def process_stem(stem_info: Dict[str, Any], metrics: Dict[str, Any]) -> None:
     #    Bit depth interno -> usamos FLOAT (32-bit float)
     subtype = "FLOAT" if target_bit_depth == 32 else None
     # soundfile seleccionará un subtype por defecto si subtype es None
-    sf.write(file_path, data, sr, subtype=subtype)
+    write_stem(file_path, data, sr, subtype=subtype)
 
 
 # -------------------------------------------------------------------
@@ -207,24 +199,9 @@ def main() -> None:
     # Procesar stems en paralelo
     args_list = [(stem_info, metrics) for stem_info in stems]
 
-    # Usar ProcessPoolExecutor para paralelizar el re-muestreo y conversión
-    import concurrent.futures
-    import os
-
-    max_workers = min(len(stems), os.cpu_count() or 1)
-    if max_workers < 1:
-        max_workers = 1
-
-    logger.logger.info(f"[S0_SESSION_FORMAT] Procesando {len(stems)} stems con {max_workers} workers.")
-
-    use_process_pool = not _using_daemonic_process()
-    executor_cls = concurrent.futures.ProcessPoolExecutor if use_process_pool else concurrent.futures.ThreadPoolExecutor
-
-    if not use_process_pool:
-        logger.logger.info("[S0_SESSION_FORMAT] Proceso daemon detectado; usando ThreadPoolExecutor en lugar de procesos.")
-
-    with executor_cls(max_workers=max_workers) as executor:
-        list(executor.map(_process_stem_worker, args_list))
+    # Executor de stems compartido (hilos; válido dentro de workers daemon de Celery)
+    logger.logger.info(f"[S0_SESSION_FORMAT] Procesando {len(stems)} stems con el executor de stems.")
+    map_stems(_process_stem_worker, args_list)
 
     logger.logger.info(f"[S0_SESSION_FORMAT] Conversión de formato completada para {len(stems)} stems.")
 
@@ -5,7 +5,7 @@ from utils.logger import logger
 
 import sys
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 
 # --- hack sys.path para ejecutar como script suelto desde stage.py ---
 THIS_DIR = Path(__file__).resolve().parent
@@ -19,7 +19,8 @@ import numpy as np  # noqa: E402
 import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir
-from utils.loudness_utils import compute_lufs_and_lra  # noqa: E402
+from utils.audio_utils import write_audio_atomic
+from utils.loudness_utils import LoudnessEngine, compute_lufs_and_lra  # noqa: E402
 from utils.color_utils import compute_true_peak_dbfs, compute_sample_peak_dbfs  # noqa: E402
 from utils.mastering_profiles_utils import get_mastering_profile  # noqa: E402
 
@@ -82,6 +83,41 @@ def _compute_channel_lufs_diff(y: np.ndarray, sr: int) -> Dict[str, float]:
     }
 
 
+def _loudness_after_trim(
+    y: np.ndarray,
+    sr: int,
+    trim_db: float,
+    pre_lufs_lra: Tuple[float, float],
+    ch_info_pre: Dict[str, float],
+) -> Tuple[float, float, Dict[str, float]]:
+    """
+    LUFS/LRA y loudness por canal de y tras un trim lineal de -trim_db, sin
+    re-medir: motor de loudness paramétrico en ganancia anclado a las
+    medidas pre-QC.
+    """
+    if trim_db == 0.0:
+        return float(pre_lufs_lra[0]), float(pre_lufs_lra[1]), dict(ch_info_pre)
+
+    engine = LoudnessEngine(y, sr)
+    post_lufs, post_lra = engine.lufs_and_lra(-trim_db, reference=pre_lufs_lra)
+
+    lufs_L = engine.predict_lufs(ch_info_pre["lufs_L"], -trim_db, channel=0)
+    if engine.channels >= 2:
+        lufs_R = engine.predict_lufs(ch_info_pre["lufs_R"], -trim_db, channel=1)
+    else:
+        lufs_R = lufs_L
+    if lufs_L == float("-inf") or lufs_R == float("-inf"):
+        diff = 0.0
+    else:
+        diff = abs(lufs_L - lufs_R)
+
+    return post_lufs, post_lra, {
+        "lufs_L": lufs_L,
+        "lufs_R": lufs_R,
+        "channel_loudness_diff_db": diff,
+    }
+
+
 def _compute_stereo_correlation(y: np.ndarray) -> float:
     arr = np.asarray(y, dtype=np.float32)
     if arr.ndim == 1:
@@ -174,17 +210,28 @@ def _process_final_limits_worker(
         )
 
     # Clamp final por seguridad
+    clamped = bool(y_post.size) and float(np.max(np.abs(y_post))) > 1.0
     y_post = np.clip(y_post, -1.0, 1.0).astype(np.float32)
 
     # Métricas post-QC
-    post_true_peak = compute_true_peak_dbfs(y_post, oversample_factor=4)
+    if clamped:
+        post_true_peak = compute_true_peak_dbfs(y_post, oversample_factor=4)
+    else:
+        # Solo trim lineal: el true-peak baja exactamente trim_db
+        post_true_peak = pre_true_peak - trim_db
     post_sample_peak = compute_sample_peak_dbfs(y_post)
-    post_lufs, post_lra = compute_lufs_and_lra(y_post, sr)
-    ch_info_post = _compute_channel_lufs_diff(y_post, sr)
+    if clamped:
+        post_lufs, post_lra = compute_lufs_and_lra(y_post, sr)
+        ch_info_post = _compute_channel_lufs_diff(y_post, sr)
+        post_corr = _compute_stereo_correlation(y_post)
+    else:
+        post_lufs, post_lra, ch_info_post = _loudness_after_trim(
+            y, sr, trim_db, (pre_lufs, pre_lra), ch_info_pre
+        )
+        post_corr = pre_corr
     post_lufs_L = ch_info_post["lufs_L"]
     post_lufs_R = ch_info_post["lufs_R"]
     post_channel_diff = ch_info_post["channel_loudness_diff_db"]
-    post_corr = _compute_stereo_correlation(y_post)
 
     post_lufs_within_style = (
         post_lufs != float("-inf")
@@ -198,7 +245,7 @@ def _process_final_limits_worker(
     )
 
     # Escribir master QC final (sobrescribe full_song.wav)
-    sf.write(full_song_path, y_post, sr)
+    write_audio_atomic(full_song_path, y_post, sr)
     logger.logger.info(f"[S10_MASTER_FINAL_LIMITS] Master QC reescrito en {full_song_path}.")
 
     return {
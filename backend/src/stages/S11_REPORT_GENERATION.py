@@ -24,6 +24,7 @@ except ImportError:
 
 from utils.analysis_utils import get_temp_dir, sanitize_json_floats, compute_interactive_data
 from utils.loudness_utils import measure_true_peak_dbtp, compute_lufs_and_lra
+from utils.spectral_cache import get_spectral_features
 import soundfile as sf
 
 # --- Metric Mapping for Report ---
@@ -62,9 +63,12 @@ METRIC_MAPPING = {
     "limiter_gr_db": "limiterReduction"
 }
 
-def _load_mix_audio_for_report(context: PipelineContext, stage_ids: List[str]) -> tuple[Optional[np.ndarray], Optional[int]]:
+def _load_mix_audio_for_report(
+    context: PipelineContext, stage_ids: List[str]
+) -> tuple[Optional[np.ndarray], Optional[int], Optional[Path]]:
     """
     Loads audio from the first matching stage in stage_ids.
+    Also returns the wav path (for the spectral feature cache).
     """
     job_root: Optional[Path] = None
     try:
@@ -76,7 +80,7 @@ def _load_mix_audio_for_report(context: PipelineContext, stage_ids: List[str]) -
         job_root = None
 
     if not job_root:
-        return None, None
+        return None, None, None
 
     for stage in stage_ids:
         wav_path = job_root / stage / "full_song.wav"
@@ -86,12 +90,26 @@ def _load_mix_audio_for_report(context: PipelineContext, stage_ids: List[str]) -
             audio, sr = sf.read(str(wav_path), dtype="float32", always_2d=True)
             if audio.size == 0:
                 continue
-            return audio, sr
+            return audio, sr, wav_path
         except Exception as exc:
             logger.logger.warning(f"[S11] Could not read mix audio from {wav_path}: {exc}")
             continue
 
-    return None, None
+    return None, None, None
+
+def _spectral_features_for(path: Optional[Path], audio: Optional[np.ndarray], sr: int) -> Optional[Any]:
+    """
+    Features espectrales (caché por contenido + sidecar) del wav del que se ha
+    cargado audio; None si el audio no viene de disco.
+    """
+    if path is None or audio is None:
+        return None
+    try:
+        return get_spectral_features(path, y=audio, sr=sr)
+    except Exception as exc:
+        logger.logger.warning(f"[S11] Spectral features unavailable for {path}: {exc}")
+        return None
+
 
 def _load_stage_json(job_root: Path, stage_id: str, filename: str) -> Optional[Dict[str, Any]]:
     """Helper to safely load a JSON file from a specific stage directory."""
@@ -416,6 +434,9 @@ def process(context: PipelineContext, *args) -> bool:
     try:
         audio_arr = getattr(context, "audio_mixdown", None)
         sample_rate = getattr(context, "sample_rate", None)
+        mix_path: Optional[Path] = None
+        original_path: Optional[Path] = None
+        original_sr: Optional[int] = None
 
         # Also try to get original audio
         audio_original = getattr(context, "audio_original", None)
@@ -423,13 +444,13 @@ def process(context: PipelineContext, *args) -> bool:
         if audio_arr is None or not sample_rate:
             # Fallback to load from disk
             # Try S10 or S9 first
-            audio_arr, sample_rate = _load_mix_audio_for_report(context, ["S11_REPORT_GENERATION", "S10_MASTER_FINAL_LIMITS", "S9_MASTER_GENERIC", "S6_MANUAL_CORRECTION"])
+            audio_arr, sample_rate, mix_path = _load_mix_audio_for_report(context, ["S11_REPORT_GENERATION", "S10_MASTER_FINAL_LIMITS", "S9_MASTER_GENERIC", "S6_MANUAL_CORRECTION"])
             if audio_arr is not None and sample_rate:
                 logger.logger.info(f"[S11] Loaded mix audio from disk (sr={sample_rate})")
 
         if audio_original is None:
              # Load S0 or S0_MIX_ORIGINAL
-             audio_original, original_sr = _load_mix_audio_for_report(context, ["S0_MIX_ORIGINAL", "S0_SESSION_FORMAT"])
+             audio_original, original_sr, original_path = _load_mix_audio_for_report(context, ["S0_MIX_ORIGINAL", "S0_SESSION_FORMAT"])
              if audio_original is not None:
                  logger.logger.info(f"[S11] Loaded original audio from disk (sr={original_sr})")
 
@@ -448,7 +469,13 @@ def process(context: PipelineContext, *args) -> bool:
                      logger.logger.warning(f"[S11] Failed to compute original metrics: {e}")
 
         if audio_arr is not None and sample_rate:
-            chart_data = compute_interactive_data(audio_arr, int(sample_rate), audio_original=audio_original)
+            chart_data = compute_interactive_data(
+                audio_arr,
+                int(sample_rate),
+                audio_original=audio_original,
+                spectral=_spectral_features_for(mix_path, audio_arr, int(sample_rate)),
+                spectral_original=_spectral_features_for(original_path, audio_original, int(original_sr or sample_rate)),
+            )
             report["interactive_charts"] = chart_data
         else:
             logger.logger.warning("[S11] No mix audio available; interactive charts will be empty.")
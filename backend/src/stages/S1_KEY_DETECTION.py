@@ -18,6 +18,9 @@ import os  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir
 
+# Solo lee el JSON de análisis; no toca stems (el runner no vuelca el stem bus).
+USES_STEM_BUS = True
+
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
     """
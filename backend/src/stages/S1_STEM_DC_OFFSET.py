@@ -13,9 +13,13 @@ import json
 import os
 
 import numpy as np
-import soundfile as sf
 
 from utils.analysis_utils import get_temp_dir
+from utils.stem_bus import read_stem, write_stem
+from utils.stem_executor import map_stems
+
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
 
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
@@ -66,7 +70,7 @@ def process_stem(
         return
 
     # Leer el audio completo en multicanal
-    data, sr = sf.read(file_path, always_2d=True)
+    data, sr = read_stem(file_path, always_2d=True)
 
     if not isinstance(data, np.ndarray):
         data = np.array(data, dtype=np.float32)
@@ -80,7 +84,7 @@ def process_stem(
     data_corrected = data - dc_linear
 
     # Sobrescribir el archivo (manteniendo samplerate, formato por defecto)
-    sf.write(file_path, data_corrected, sr)
+    write_stem(file_path, data_corrected, sr)
 
 
 # -------------------------------------------------------------------
@@ -115,8 +119,7 @@ def main() -> None:
 
     if stems:
         args_list = [(stem_info, dc_offset_max_db_target) for stem_info in stems]
-        for args in args_list:
-            _process_stem_worker(args)
+        map_stems(_process_stem_worker, args_list)
 
     logger.logger.info(f"[S1_STEM_DC_OFFSET] Corrección de DC offset completada para {len(stems)} stems.")
 
@@ -10,7 +10,6 @@ from collections.abc import Mapping
 
 import json  # noqa: E402
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 # --- hack sys.path para ejecutar como script suelto desde stage.py ---
 THIS_DIR = Path(__file__).resolve().parent
@@ -19,6 +18,7 @@ if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
 from utils.analysis_utils import get_temp_dir, sf_read_limited  # noqa: E402
+from utils.stem_bus import read_stem, write_stem  # noqa: E402
 from utils.profiles_utils import get_instrument_profile  # noqa: E402
 
 try:
@@ -28,6 +28,9 @@ try:
 except Exception:  # pragma: no cover
     measure_true_peak_dbtp = None  # type: ignore
 
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
+
 
 def _coerce_contract_id(obj: Any) -> Optional[str]:
     if obj is None:
@@ -267,14 +270,18 @@ def _compute_stem_cut_db(
 
 
 def _apply_gain_inplace(path: Path, gain_db: float) -> bool:
+    """
+    Aplica gain_db al stem (FLOAT). Con stem bus ligado a la carpeta se lee y
+    se queda en memoria (read_stem/write_stem) hasta el siguiente checkpoint.
+    """
     try:
-        data, sr = sf.read(path, always_2d=False)
+        g_lin = float(10.0 ** (float(gain_db) / 20.0))
+        data, sr = read_stem(path, always_2d=False)
         x = np.asarray(data, dtype=np.float32)
         if x.size == 0:
             return False
-        g_lin = float(10.0 ** (float(gain_db) / 20.0))
         y = (x * g_lin).astype(np.float32)
-        sf.write(path, y, int(sr), subtype="FLOAT")
+        write_stem(path, y, int(sr), subtype="FLOAT")
         return True
     except Exception as e:
         logger.logger.info(f"[S1_STEM_WORKING_LOUDNESS] Error aplicando gain a {path.name}: {e}")
@@ -411,6 +418,11 @@ def process(*args) -> bool:
 
     stem_paths = sorted(p for p in temp_dir.glob("*.wav") if p.name.lower() != "full_song.wav")
 
+    # Stems en memoria: la predicción de mixbus y los gains leen del bus.
+    stem_bus = getattr(args[0], "stem_bus", None) if args else None
+    if stem_bus is not None and stem_bus.stage_dir == temp_dir:
+        stem_bus.load([p.name for p in stem_paths])
+
     # Predicción de mixbus TP tras gains (primaria)
     pred_mix_tp, pred_kind = _mixbus_true_peak_sum_with_gains_limited(stem_paths, gain_by_file)
 
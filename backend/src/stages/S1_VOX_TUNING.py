@@ -19,7 +19,10 @@ import numpy as np  # noqa: E402
 import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
+from utils.audio_utils import write_audio_atomic  # noqa: E402
+from utils.f0_track_store import get_f0_track, update_f0_track  # noqa: E402
 from utils.pitch_utils import tune_vocal_time_varying  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
@@ -68,6 +71,7 @@ def apply_vocal_tuning_to_stem(
         tuning_strength = 1.0
 
     try:
+        subtype = sf.info(str(file_path)).subtype
         data, sr = sf.read(file_path, always_2d=False)
     except Exception as e:
         logger.logger.info(f"[S1_VOX_TUNING] {stem_name}: no se pudo leer: {e}")
@@ -85,38 +89,43 @@ def apply_vocal_tuning_to_stem(
     used_scale = scale_pcs if (isinstance(scale_pcs, list) and len(scale_pcs) > 0) else None
     mode_str = "SCALE" if used_scale is not None else "CHROMATIC"
 
-    # Afinar canal por canal si es estéreo (para no colapsar imagen)
-    if data.ndim == 2 and data.shape[1] > 1:
-        chans = []
-        for ch in range(data.shape[1]):
-            y_tuned = tune_vocal_time_varying(
-                y=data[:, ch],
-                sr=sr,
-                tuning_strength=float(tuning_strength),
-                max_shift_semitones=float(max_pitch_shift_semitones) if max_pitch_shift_semitones is not None else None,
-                pitch_cents_max_deviation=float(pitch_cents_max_deviation) if pitch_cents_max_deviation is not None else None,
-                allowed_scale_pcs=used_scale,
-            )
-            chans.append(np.asarray(y_tuned, dtype=np.float32))
-        y_out = np.stack(chans, axis=1)
-    else:
-        y_in = data[:, 0] if (data.ndim == 2 and data.shape[1] == 1) else data
-        y_out = tune_vocal_time_varying(
-            y=y_in,
-            sr=sr,
-            tuning_strength=float(tuning_strength),
-            max_shift_semitones=float(max_pitch_shift_semitones) if max_pitch_shift_semitones is not None else None,
-            pitch_cents_max_deviation=float(pitch_cents_max_deviation) if pitch_cents_max_deviation is not None else None,
-            allowed_scale_pcs=used_scale,
-        )
-        y_out = np.asarray(y_out, dtype=np.float32)
-        if data.ndim == 2 and data.shape[1] == 1:
-            y_out = y_out.reshape(-1, 1)
+    # Curva f0 de la mezcla mono (la del análisis, desde el almacén). Las
+    # regiones y shifts se deciden sobre ella y se aplican a todos los canales
+    # por igual, así que la imagen estéreo no se descompensa.
+    y_in = data[:, 0] if (data.ndim == 2 and data.shape[1] == 1) else data
+    y_mono = np.mean(y_in, axis=1, dtype=np.float32) if y_in.ndim == 2 else y_in
+    track = get_f0_track(file_path, y_mono=y_mono, sr=sr)
+
+    y_out, retuned = tune_vocal_time_varying(
+        y=y_in,
+        sr=sr,
+        tuning_strength=float(tuning_strength),
+        max_shift_semitones=float(max_pitch_shift_semitones) if max_pitch_shift_semitones is not None else None,
+        pitch_cents_max_deviation=float(pitch_cents_max_deviation) if pitch_cents_max_deviation is not None else None,
+        fmin_note=track.params.fmin_note,
+        fmax_note=track.params.fmax_note,
+        frame_length=track.params.frame_length,
+        hop_length=track.params.hop_length,
+        allowed_scale_pcs=used_scale,
+        f0=track.f0,
+        return_regions=True,
+    )
+
+    if not retuned:
+        logger.logger.info(f"[S1_VOX_TUNING] {stem_name}: ninguna región fuera de tolerancia; no-op.")
+        return False
+
+    y_out = np.asarray(y_out, dtype=np.float32)
+    if data.ndim == 2 and data.shape[1] == 1:
+        y_out = y_out.reshape(-1, 1)
 
-    sf.write(file_path, y_out, sr)
+    # Mismo formato que el original: fuera de las regiones reafinadas el audio
+    # queda idéntico y la curva f0 del resultado sólo se recalcula en ellas
+    write_audio_atomic(file_path, y_out, sr, subtype=subtype)
+    update_f0_track(file_path, track, retuned)
 
     logger.logger.info(
-        f"[S1_VOX_TUNING] {stem_name}: tuning aplicado "
+        f"[S1_VOX_TUNING] {stem_name}: tuning aplicado en {len(retuned)} regiones "
         f"(mode={mode_str}, strength={float(tuning_strength):.2f}, "
         f"max_shift={max_pitch_shift_semitones}, scale_pcs={used_scale})."
     )
@@ -185,7 +194,7 @@ def main() -> None:
     ]
 
     touched = 0
-    for ok in map(_tune_stem_worker, args_list):
+    for ok in map_stems(_tune_stem_worker, args_list):
         if ok:
             touched += 1
 
@@ -15,10 +15,14 @@ if str(SRC_DIR) not in sys.path:
 
 import json  # noqa: E402
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir
+from utils.stem_bus import read_stem, write_stem
 from utils.phase_utils import apply_time_shift_samples  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
+
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
 
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
@@ -39,16 +43,17 @@ def load_analysis(contract_id: str) -> Dict[str, Any]:
 # Interpolación para retardo variable (Lagrange 4 puntos, vectorizada)
 # -------------------------------------------------------------------
 
-def _interp_lagrange4_1d(y: np.ndarray, t: np.ndarray) -> np.ndarray:
+def _interp_lagrange4(y: np.ndarray, t: np.ndarray) -> np.ndarray:
     """
     Interpola y(t) para t real (float) usando Lagrange 4 puntos (cúbico),
-    vectorizado. Fuera de rango -> 0.
+    vectorizado. y puede ser (N,) o (N, C): los coeficientes se calculan una
+    vez y se aplican a todos los canales. Fuera de rango -> 0.
     """
     y = np.asarray(y, dtype=np.float32)
     t = np.asarray(t, dtype=np.float32)
 
     n = y.shape[0]
-    out = np.zeros_like(t, dtype=np.float32)
+    out = np.zeros(t.shape + y.shape[1:], dtype=np.float32)
 
     if n < 4 or t.size == 0:
         return out
@@ -61,28 +66,32 @@ def _interp_lagrange4_1d(y: np.ndarray, t: np.ndarray) -> np.ndarray:
     if not np.any(valid):
         return out
 
-    iv = i[valid]
-    fv = f[valid]
-
-    y0 = y[iv - 1]
-    y1 = y[iv]
-    y2 = y[iv + 1]
-    y3 = y[iv + 2]
+    # Índices recortados a rango: se calcula todo el bloque de una vez y los
+    # puntos fuera de rango se ponen a 0 al final
+    i = np.clip(i, 1, n - 3)
 
     # Coefs Lagrange 4-tap
     # p(f) = y0 * (-f*(f-1)*(f-2)/6)
     #      + y1 * ((f+1)*(f-1)*(f-2)/2)
     #      + y2 * (-(f+1)*f*(f-2)/2)
     #      + y3 * ((f+1)*f*(f-1)/6)
-    f0 = fv
+    f0 = f
     c0 = (-f0 * (f0 - 1.0) * (f0 - 2.0)) / 6.0
     c1 = ((f0 + 1.0) * (f0 - 1.0) * (f0 - 2.0)) / 2.0
     c2 = (-(f0 + 1.0) * f0 * (f0 - 2.0)) / 2.0
     c3 = ((f0 + 1.0) * f0 * (f0 - 1.0)) / 6.0
 
-    out_valid = (y0 * c0 + y1 * c1 + y2 * c2 + y3 * c3).astype(np.float32)
-    out[valid] = out_valid
-    return out
+    if y.ndim > 1:
+        c0, c1, c2, c3 = c0[:, None], c1[:, None], c2[:, None], c3[:, None]
+
+    out = np.take(y, i - 1, axis=0) * c0
+    out += np.take(y, i, axis=0) * c1
+    out += np.take(y, i + 1, axis=0) * c2
+    out += np.take(y, i + 2, axis=0) * c3
+
+    if not np.all(valid):
+        out[~valid] = 0.0
+    return out.astype(np.float32, copy=False)
 
 
 def _apply_time_varying_shift(
@@ -100,19 +109,11 @@ def _apply_time_varying_shift(
     anchor_samples: posiciones (en samples) donde se define shift
     anchor_shifts: shift en samples (float), mismo tamaño que anchor_samples
     """
-    x = np.asarray(data, dtype=np.float32)
+    x = np.ascontiguousarray(data, dtype=np.float32)
     if x.size == 0:
         return x
 
-    if x.ndim == 1:
-        x2 = x.reshape(-1, 1)
-        mono = True
-    else:
-        x2 = x
-        mono = False
-
-    N = x2.shape[0]
-    C = x2.shape[1]
+    N = x.shape[0]
 
     a_s = np.asarray(anchor_samples, dtype=np.float32)
     a_sh = np.asarray(anchor_shifts, dtype=np.float32)
@@ -137,7 +138,7 @@ def _apply_time_varying_shift(
         a_s = np.concatenate([a_s, np.array([float(N - 1)], dtype=np.float32)])
         a_sh = np.concatenate([a_sh, np.array([a_sh[-1]], dtype=np.float32)])
 
-    y_out = np.zeros_like(x2, dtype=np.float32)
+    y_out = np.zeros_like(x, dtype=np.float32)
 
     for start in range(0, N, chunk_size):
         end = min(N, start + chunk_size)
@@ -149,13 +150,10 @@ def _apply_time_varying_shift(
         # índice de lectura en el original
         t = idx - shift  # y_out[n] = y_in[n - shift(n)]
 
-        # Interpolar por canal con Lagrange 4-puntos
-        for ch in range(C):
-            y_out[start:end, ch] = _interp_lagrange4_1d(x2[:, ch], t)
+        # Lagrange 4-puntos con todos los canales a la vez
+        y_out[start:end] = _interp_lagrange4(x, t)
 
-    if mono:
-        return y_out[:, 0].astype(np.float32)
-    return y_out.astype(np.float32)
+    return y_out
 
 
 # -------------------------------------------------------------------
@@ -190,7 +188,7 @@ def _process_stem_worker(
     use_flip = bool(stem_info.get("use_polarity_flip", False))
 
     # Leer audio
-    data, sr = sf.read(file_path, always_2d=False)
+    data, sr = read_stem(file_path, always_2d=False)
     data = np.asarray(data, dtype=np.float32)
     if data.size == 0 or sr <= 0:
         return False
@@ -265,7 +263,7 @@ def _process_stem_worker(
     if use_flip:
         y_out = -np.asarray(y_out, dtype=np.float32)
 
-    sf.write(file_path, y_out, sr)
+    write_stem(file_path, y_out, sr)
 
     if processed_mode == "time_varying":
         logger.logger.info(
@@ -330,8 +328,8 @@ def main() -> None:
             for stem_info in candidate_stems
         ]
 
-        for args in args_list:
-            if _process_stem_worker(args):
+        for ok in map_stems(_process_stem_worker, args_list):
+            if ok:
                 processed += 1
 
     logger.logger.info(
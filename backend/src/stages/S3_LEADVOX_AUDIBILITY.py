@@ -9,7 +9,6 @@ from pathlib import Path
 from typing import Dict, Any, List, Tuple, Optional
 
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 # --- hack sys.path para ejecutar como script suelto desde stage.py ---
 THIS_DIR = Path(__file__).resolve().parent
@@ -18,6 +17,10 @@ if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
+from utils.stem_bus import read_stem, write_stem  # noqa: E402
+
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
 
 try:
     # True peak oversampled (mismo enfoque que tu mastering)
@@ -403,7 +406,7 @@ def main() -> None:
         if not p.exists():
             continue
 
-        y, sr = sf.read(p, always_2d=False)
+        y, sr = read_stem(p, always_2d=False)
         x = np.asarray(y, dtype=np.float32)
         if x.size == 0:
             continue
@@ -434,7 +437,7 @@ def main() -> None:
             y_out = np.stack(chans, axis=1).astype(np.float32)
 
         # Escritura segura
-        sf.write(p, y_out.astype(np.float32), int(sr), subtype="FLOAT")
+        write_stem(p, y_out.astype(np.float32), int(sr), subtype="FLOAT")
         processed += 1
 
         # Predicción simple TP post: tp_pre + max_pos_gain (capped)
@@ -13,9 +13,12 @@ if str(SRC_DIR) not in sys.path:
 
 import json  # noqa: E402
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
+from utils.stem_bus import open_stem, read_stem, write_stem  # noqa: E402
+
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
 
 try:
     from utils.loudness_utils import (  # type: ignore  # noqa: E402
@@ -51,10 +54,10 @@ def _mixbus_sample_peak_stream(stem_files: List[Path], block_size: int = 65536)
     if not stem_files:
         return float("-inf")
 
-    files: List[sf.SoundFile] = []
+    files: List[Any] = []
     try:
         for p in stem_files:
-            files.append(sf.SoundFile(str(p), mode="r"))
+            files.append(open_stem(p))
 
         ch_ref = int(files[0].channels)
         peak_lin = 0.0
@@ -109,7 +112,7 @@ def _apply_gain_inplace(path: Path, gain_db: float) -> bool:
     Aplica ganancia y reescribe el stem en FLOAT para evitar clips por PCM.
     """
     try:
-        x, sr = sf.read(path, always_2d=True)
+        x, sr = read_stem(path, always_2d=True)
         arr = np.asarray(x, dtype=np.float32)
         if arr.size == 0:
             return False
@@ -117,7 +120,7 @@ def _apply_gain_inplace(path: Path, gain_db: float) -> bool:
         g_lin = float(10.0 ** (float(gain_db) / 20.0))
         y = (arr * g_lin).astype(np.float32)
 
-        sf.write(path, y, int(sr), subtype="FLOAT")
+        write_stem(path, y, int(sr), subtype="FLOAT")
         return True
     except Exception as e:
         logger.logger.info(f"[S3_MIXBUS_HEADROOM] Error aplicando gain a {path.name}: {e}")
@@ -246,7 +249,7 @@ def main() -> None:
         # Mezcla rápida en memoria para LUFS/TP (solo si tu pipeline lo tolera)
         ys = []
         for p in stem_paths:
-            y, sr = sf.read(p, always_2d=False)
+            y, sr = read_stem(p, always_2d=False)
             arr = np.asarray(y, dtype=np.float32)
             if sr_ref is None:
                 sr_ref = int(sr)
@@ -18,10 +18,14 @@ import json  # noqa: E402
 import numpy as np  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
+from utils.stem_bus import read_stem, write_stem  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
 
 # Pedalboard
 from pedalboard import Pedalboard, HighpassFilter, LowpassFilter  # noqa: E402
-from pedalboard.io import AudioFile  # noqa: E402
+
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
 
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
@@ -83,11 +87,9 @@ def _process_stem_worker(args: Tuple[str, Dict[str, Any], float, float]) -> Tupl
         lpf = 2000.0
 
     try:
-        # Leer el audio con Pedalboard
-        with AudioFile(str(path)) as f:
-            audio = f.read(f.frames)
-            samplerate = f.samplerate
-            num_channels = f.num_channels
+        # Leer el audio en (channels, samples), como AudioFile de Pedalboard
+        data, samplerate = read_stem(path, dtype="float32", always_2d=True)
+        audio = data.T
 
         if not isinstance(audio, np.ndarray):
             audio = np.array(audio, dtype=np.float32)
@@ -113,14 +115,10 @@ def _process_stem_worker(args: Tuple[str, Dict[str, Any], float, float]) -> Tupl
         else:
             processed = processed.astype(np.float32)
 
-        # Guardar sobrescribiendo el archivo original
-        with AudioFile(
-            str(path),
-            "w",
-            samplerate=samplerate,
-            num_channels=num_channels,
-        ) as f:
-            f.write(processed)
+        # Guardar sustituyendo el archivo original (temp + os.replace: el stem
+        # puede compartir inodo con el stage anterior). PCM_16 = bit depth por
+        # defecto de AudioFile en escritura.
+        write_stem(path, processed.T, int(samplerate), subtype="PCM_16")
 
         logger.logger.info(
             f"[S4_STEM_HPF_LPF] {fname}: aplicado HPF={hpf:.1f} Hz, LPF={lpf:.1f} Hz."
@@ -167,7 +165,7 @@ def main() -> None:
 
     processed = 0
 
-    for fname, ok in map(_process_stem_worker, tasks):
+    for fname, ok in map_stems(_process_stem_worker, tasks):
         if ok:
             processed += 1
 
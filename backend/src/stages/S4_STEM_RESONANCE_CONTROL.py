@@ -15,12 +15,21 @@ if str(SRC_DIR) not in sys.path:
 
 import json  # noqa: E402
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
-
-from pedalboard import Pedalboard, PeakFilter  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
-from utils.resonance_utils import compute_magnitude_spectrum, detect_resonances  # noqa: E402
+from utils.stem_bus import read_stem, write_stem  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
+from utils.resonance_utils import (  # noqa: E402
+    apply_notch_sos,
+    compute_magnitude_spectrum,
+    design_notch_sos,
+    detect_resonances,
+    sos_magnitude_response,
+)
+from utils.envelope_kernels import envelope_follower, hold_release_gate  # noqa: E402
+
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
 
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
@@ -50,6 +59,18 @@ def _detect_on_audio(
 ) -> List[Dict[str, Any]]:
     y_mono = _to_mono(audio)
     freqs, mag_lin = compute_magnitude_spectrum(y_mono, int(sr))
+    return _detect_on_spectrum(freqs, mag_lin, fmin, fmax, threshold_db, local_window_hz, max_res)
+
+
+def _detect_on_spectrum(
+    freqs: np.ndarray,
+    mag_lin: np.ndarray,
+    fmin: float,
+    fmax: float,
+    threshold_db: float,
+    local_window_hz: float,
+    max_res: int,
+) -> List[Dict[str, Any]]:
     return detect_resonances(
         freqs=freqs,
         mag_lin=mag_lin,
@@ -146,6 +167,41 @@ def _choose_notch_from_res(
     }
 
 
+def _pick_notch(
+    cur_res: List[Dict[str, Any]],
+    used_freqs: List[float],
+    max_res_peak_db: float,
+    max_cuts_db: float,
+    instrument_profile: str,
+) -> Dict[str, float] | None:
+    """
+    Notch para la resonancia más severa que no esté a menos de ~6% (o 25 Hz)
+    de una frecuencia ya tratada.
+    """
+    try:
+        cur_res_sorted = sorted(
+            cur_res,
+            key=lambda r: float(r.get("gain_above_local_db", 0.0)),
+            reverse=True
+        )
+    except Exception:
+        cur_res_sorted = cur_res
+
+    for r in cur_res_sorted:
+        notch = _choose_notch_from_res(r, max_res_peak_db, max_cuts_db, instrument_profile)
+        if notch is None:
+            continue
+
+        f0 = float(notch["freq_hz"])
+        min_spacing = max(25.0, f0 * 0.06)  # ~6% ó 25 Hz
+        if any(abs(f0 - fu) < min_spacing for fu in used_freqs):
+            continue
+
+        return notch
+
+    return None
+
+
 # ------------------------------------------------------------
 # NUEVO: Detector de transitorios (rápido, frame-based)
 # ------------------------------------------------------------
@@ -206,33 +262,14 @@ def _compute_transient_bypass_envelope(
     xf = x_pad.reshape(n_frames, frame_len)
     rms = np.sqrt(np.mean(xf.astype(np.float64) ** 2, axis=1) + 1e-18).astype(np.float32)
 
-    # Envolventes fast/slow con ataque/release (loop en frames: típico 10k–40k, OK)
+    # Envolventes fast/slow con ataque/release (kernel compartido)
     a_f_att = _ms_to_alpha(fast_attack_ms, hop_sec)
     a_f_rel = _ms_to_alpha(fast_release_ms, hop_sec)
     a_s_att = _ms_to_alpha(slow_attack_ms, hop_sec)
     a_s_rel = _ms_to_alpha(slow_release_ms, hop_sec)
 
-    fast = np.zeros_like(rms, dtype=np.float32)
-    slow = np.zeros_like(rms, dtype=np.float32)
-
-    f = 0.0
-    s = 0.0
-    for i in range(n_frames):
-        xi = float(rms[i])
-
-        # fast
-        if xi > f:
-            f = a_f_att * f + (1.0 - a_f_att) * xi
-        else:
-            f = a_f_rel * f + (1.0 - a_f_rel) * xi
-        fast[i] = f
-
-        # slow
-        if xi > s:
-            s = a_s_att * s + (1.0 - a_s_att) * xi
-        else:
-            s = a_s_rel * s + (1.0 - a_s_rel) * xi
-        slow[i] = s
+    fast = envelope_follower(rms, a_f_att, a_f_rel).astype(np.float32)
+    slow = envelope_follower(rms, a_s_att, a_s_rel).astype(np.float32)
 
     eps = 1e-12
     score = (fast - slow) / (slow + eps)
@@ -247,25 +284,8 @@ def _compute_transient_bypass_envelope(
     release_alpha = _ms_to_alpha(bypass_release_ms, hop_sec)  # decaimiento
     strength = float(np.clip(bypass_strength, 0.0, 1.0))
 
-    bypass_f = np.zeros((n_frames,), dtype=np.float32)
-
-    state = 0.0
-    hold = 0
-    trans_count = 0
-
-    for i in range(n_frames):
-        if bool(gate[i]):
-            state = 1.0
-            hold = hold_frames
-            trans_count += 1
-        else:
-            if hold > 0:
-                hold -= 1
-                state = 1.0
-            else:
-                state = float(state) * float(release_alpha)
-
-        bypass_f[i] = float(state) * strength
+    gate_state, trans_count = hold_release_gate(gate, hold_frames, release_alpha)
+    bypass_f = (gate_state * strength).astype(np.float32)
 
     # Expand a samples
     bypass_s = np.repeat(bypass_f, frame_len)[:N].astype(np.float32)
@@ -285,25 +305,29 @@ def _compute_transient_bypass_envelope(
     return bypass_s, stats
 
 
-def _apply_one_notch(
+def _apply_notches_single_pass(
     audio: np.ndarray,
     sr: int,
-    freq_hz: float,
-    cut_db: float,
-    q: float,
+    notches: List[Dict[str, float]],
     transient_bypass_env: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """
-    Aplica un notch (PeakFilter con ganancia negativa) y, opcionalmente,
-    protege transitorios con bypass milimétrico por crossfade dry/notched.
+    Aplica todos los notches como una cascada SOS en un único pase y hace el
+    crossfade dry/notched de protección de transitorios una sola vez.
     """
     x = np.asarray(audio, dtype=np.float32)
+    y_notched = apply_notch_sos(x, design_notch_sos(notches, int(sr)))
+    return _crossfade_transient_bypass(x, y_notched, transient_bypass_env)
 
-    board = Pedalboard(
-        [PeakFilter(cutoff_frequency_hz=float(freq_hz), gain_db=-float(cut_db), q=float(q))]
-    )
-    y_notched = np.asarray(board(x, int(sr)), dtype=np.float32)
 
+def _crossfade_transient_bypass(
+    x: np.ndarray,
+    y_notched: np.ndarray,
+    transient_bypass_env: Optional[np.ndarray],
+) -> np.ndarray:
+    """
+    dry * env + notched * (1 - env) (env=1 => bypass del notch en el golpe).
+    """
     if transient_bypass_env is None:
         return y_notched
 
@@ -341,16 +365,19 @@ def _process_stem_iterative(
     transient_cfg: Dict[str, Any],
 ) -> Dict[str, Any]:
     """
-    Aplica notches de forma iterativa:
-      detectar -> aplicar 1 notch -> re-detectar -> ...
+    Elige notches de forma iterativa:
+      detectar -> elegir 1 notch -> re-detectar -> ...
+    La re-detección se hace sobre la magnitud predicha (espectro pre * |H| de
+    los notches elegidos) y todos se aplican al final en un único pase SOS.
     Con protección de transitorios (bypass del notch durante golpes).
     """
-    audio, sr = sf.read(stem_path, always_2d=True)
+    audio, sr = read_stem(stem_path, always_2d=True)
     audio = np.asarray(audio, dtype=np.float32)
     sr = int(sr)
 
     # --- Pre-detección resonancias ---
-    pre_res = _detect_on_audio(audio, sr, fmin, fmax, max_res_peak_db, local_window_hz, max_filters_per_band)
+    freqs, mag_cur = compute_magnitude_spectrum(_to_mono(audio), sr)
+    pre_res = _detect_on_spectrum(freqs, mag_cur, fmin, fmax, max_res_peak_db, local_window_hz, max_filters_per_band)
     pre_worst = _worst_gain(pre_res)
 
     # ------------------------------------------------------------
@@ -380,61 +407,57 @@ def _process_stem_iterative(
     applied: List[Dict[str, float]] = []
     used_freqs: List[float] = []
 
-    y = audio
+    cur_res = pre_res
+
+    # Modelo de la salida: dry * env + notched * (1 - env) reparte el stem
+    # en tramos (casi) disjuntos en el tiempo, así que su PSD es
+    # PSD(x*env) + |H|² * PSD(x*(1-env)).
+    psd_total = mag_cur.astype(np.float64) ** 2
+    psd_dry = np.zeros_like(psd_total)
+    if enable_tp and transient_env is not None and np.any(transient_env > 0.0):
+        # Mismo recorte/decimación que compute_magnitude_spectrum: mismo grid de bins
+        _, mag_dry = compute_magnitude_spectrum(_to_mono(audio) * transient_env, sr)
+        psd_dry = mag_dry.astype(np.float64) ** 2
+        psd_dry = np.minimum(psd_dry, psd_total)
+    psd_wet = psd_total - psd_dry
+    notch_power = np.ones_like(psd_total)
 
     for _ in range(int(max_filters_per_band)):
-        cur_res = _detect_on_audio(y, sr, fmin, fmax, max_res_peak_db, local_window_hz, max_filters_per_band)
         if not cur_res:
             break
 
-        try:
-            cur_res_sorted = sorted(
-                cur_res,
-                key=lambda r: float(r.get("gain_above_local_db", 0.0)),
-                reverse=True
-            )
-        except Exception:
-            cur_res_sorted = cur_res
-
-        chosen = None
-        for r in cur_res_sorted:
-            notch = _choose_notch_from_res(r, max_res_peak_db, max_cuts_db, instrument_profile)
-            if notch is None:
-                continue
-
-            f0 = float(notch["freq_hz"])
-            min_spacing = max(25.0, f0 * 0.06)  # ~6% ó 25 Hz
-            if any(abs(f0 - fu) < min_spacing for fu in used_freqs):
-                continue
-
-            chosen = notch
-            break
-
+        chosen = _pick_notch(cur_res, used_freqs, max_res_peak_db, max_cuts_db, instrument_profile)
         if chosen is None:
             break
 
-        # --- Aplicar notch con protección de transitorios ---
-        y = _apply_one_notch(
-            y,
-            sr,
-            chosen["freq_hz"],
-            chosen["cut_db"],
-            chosen["q"],
-            transient_bypass_env=transient_env if enable_tp else None,
-        )
-
         used_freqs.append(float(chosen["freq_hz"]))
         applied.append(chosen)
 
+        # Magnitud tras el notch, sin tocar el audio
+        notch_power *= sos_magnitude_response(design_notch_sos([chosen], sr), freqs, sr) ** 2
+        mag_cur = np.sqrt(psd_dry + notch_power * psd_wet)
+        cur_res = _detect_on_spectrum(
+            freqs, mag_cur, fmin, fmax, max_res_peak_db, local_window_hz, max_filters_per_band
+        )
+
         # Early stop: si ya bajamos lo suficiente
-        post_res_tmp = _detect_on_audio(y, sr, fmin, fmax, max_res_peak_db, local_window_hz, max_filters_per_band)
-        post_worst_tmp = _worst_gain(post_res_tmp)
+        post_worst_tmp = _worst_gain(cur_res)
         if post_worst_tmp <= max_res_peak_db + 1.0:
             break
 
+    predicted_worst = _worst_gain(cur_res)
+    y = audio
+    if applied:
+        y = _apply_notches_single_pass(
+            audio,
+            sr,
+            applied,
+            transient_bypass_env=transient_env if enable_tp else None,
+        )
+
     # Escritura FLOAT
     y = np.clip(y, -1.5, 1.5).astype(np.float32)
-    sf.write(stem_path, y, sr, subtype="FLOAT")
+    write_stem(stem_path, y, sr, subtype="FLOAT")
 
     post_res = _detect_on_audio(y, sr, fmin, fmax, max_res_peak_db, local_window_hz, max_filters_per_band)
     post_worst = _worst_gain(post_res)
@@ -445,7 +468,12 @@ def _process_stem_iterative(
         "instrument_profile": instrument_profile,
         "samplerate_hz": sr,
         "pre": {"worst_resonance_db": float(pre_worst), "resonances": pre_res},
-        "post": {"worst_resonance_db": float(post_worst), "resonances": post_res},
+        "post": {
+            "worst_resonance_db": float(post_worst),
+            "predicted_worst_resonance_db": float(predicted_worst),
+            "resonances": post_res,
+        },
+        "render_mode": "single_pass_sos",
         "applied_notches": applied,
         "total_cut_db_sum": float(sum(float(n.get("cut_db", 0.0)) for n in applied)),
         "num_notches_applied": int(len(applied)),
@@ -520,9 +548,9 @@ def main() -> None:
         _save_metrics(temp_dir, contract_id, {"contract_id": contract_id, "stems": [], "summary": {"stems_processed": 0}})
         return
 
-    per_stem: List[Dict[str, Any]] = []
-    for p, inst in stem_paths:
-        r = _process_stem_iterative(
+    def _process(item: Tuple[Path, str]) -> Dict[str, Any]:
+        p, inst = item
+        return _process_stem_iterative(
             stem_path=p,
             instrument_profile=inst,
             max_res_peak_db=max_res_peak_db,
@@ -533,7 +561,9 @@ def main() -> None:
             local_window_hz=local_window_hz,
             transient_cfg=transient_cfg,
         )
-        per_stem.append(r)
+
+    per_stem: List[Dict[str, Any]] = map_stems(_process, stem_paths)
+    for (p, _inst), r in zip(stem_paths, per_stem):
 
         tp = r.get("transient_protection", {}) or {}
         tp_note = ""
@@ -18,6 +18,9 @@ import numpy as np  # noqa: E402
 import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir
+from utils.audio_utils import write_audio_atomic
+from utils.stem_executor import map_stems
+from utils.tempo_utils import bpm_from_session  # noqa: E402
 from utils.dynamics_utils import (  # noqa: E402
     compress_peak_detector,
     compute_crest_factor_db,
@@ -77,95 +80,6 @@ def _compute_bus_threshold(
     return float(threshold_db)
 
 
-def _read_mono_limited(path: Path, max_seconds: float = 90.0) -> tuple[np.ndarray | None, int | None, str | None]:
-    """Lectura limitada y mono para estimación BPM en stage (evita cargar el tema entero)."""
-    try:
-        with sf.SoundFile(str(path)) as f:
-            sr = int(f.samplerate)
-            max_frames = int(max_seconds * sr)
-            frames = min(max_frames, len(f))
-            y = f.read(frames=frames, dtype="float32", always_2d=False)
-        if y is None:
-            return None, None, "lectura None"
-        if not isinstance(y, np.ndarray):
-            y = np.asarray(y, dtype=np.float32)
-        if y.size == 0:
-            return None, None, "archivo vacío"
-        if y.ndim > 1:
-            y = np.mean(y, axis=1).astype(np.float32)
-        return y.astype(np.float32), sr, None
-    except Exception as e:
-        return None, None, str(e)
-
-
-def _estimate_bpm_from_audio(y: np.ndarray, sr: int, bpm_min: float = 60.0, bpm_max: float = 200.0) -> tuple[float | None, float]:
-    """Energía + autocorrelación FFT (ligero)."""
-    if y is None or sr is None:
-        return None, 0.0
-    if y.size < sr * 5:
-        return None, 0.0
-
-    y = y.astype(np.float32)
-    y = y - float(np.mean(y))
-
-    frame = 2048
-    hop = 512
-    n = int((len(y) - frame) / hop) + 1
-    if n < 256:
-        return None, 0.0
-
-    idx = np.arange(frame, dtype=np.int32)[None, :] + (np.arange(n, dtype=np.int32) * hop)[:, None]
-    frames = y[idx]
-    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12).astype(np.float32)
-
-    env = np.diff(rms, prepend=rms[:1])
-    env = np.maximum(env, 0.0)
-
-    k = 5
-    if env.size > k:
-        env = np.convolve(env, np.ones(k, dtype=np.float32) / k, mode="same")
-
-    env = env - float(np.mean(env))
-    std = float(np.std(env) + 1e-12)
-    env = (env / std).astype(np.float32)
-
-    fe = sr / float(hop)
-
-    m = int(env.size)
-    nfft = 1 << ((2 * m - 1).bit_length())
-    F = np.fft.rfft(env, n=nfft)
-    ac = np.fft.irfft(F * np.conj(F), n=nfft)[:m].real
-    ac[0] = 0.0
-
-    lag_min = int(round((60.0 * fe) / bpm_max))
-    lag_max = int(round((60.0 * fe) / bpm_min))
-    if lag_max <= lag_min + 2 or lag_max >= ac.size:
-        return None, 0.0
-
-    window = ac[lag_min : lag_max + 1]
-    peak_i = int(np.argmax(window))
-    peak_lag = lag_min + peak_i
-    bpm0 = 60.0 * fe / float(peak_lag)
-
-    candidates: List[tuple[float, float]] = []
-    for mult in (0.5, 1.0, 2.0):
-        bpm_c = bpm0 * mult
-        if bpm_c < bpm_min or bpm_c > bpm_max:
-            continue
-        lag_c = int(round((60.0 * fe) / bpm_c))
-        if lag_c <= 1 or lag_c >= ac.size:
-            continue
-        candidates.append((bpm_c, float(ac[lag_c])))
-
-    if not candidates:
-        return None, 0.0
-
-    bpm_best, score_best = max(candidates, key=lambda t: t[1])
-    med = float(np.median(window) + 1e-12)
-    conf = float(np.clip((score_best / med - 1.0) / 10.0, 0.0, 1.0))
-    return float(bpm_best), conf
-
-
 def _get_bpm_from_analysis_or_audio(analysis: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float, str]:
     session = analysis.get("session", {}) or {}
     bpm = session.get("bpm")
@@ -180,15 +94,8 @@ def _get_bpm_from_analysis_or_audio(analysis: Dict[str, Any], temp_dir: Path) ->
     except (TypeError, ValueError):
         pass
 
-    full_song = temp_dir / "full_song.wav"
-    if full_song.exists():
-        y, sr, err = _read_mono_limited(full_song, max_seconds=90.0)
-        if err is None and y is not None and sr is not None:
-            bpm2, conf2 = _estimate_bpm_from_audio(y, sr)
-            if bpm2 is not None:
-                return bpm2, conf2, "estimated_full_song_stage"
-
-    return None, 0.0, "none"
+    # Sin BPM en el análisis: tempo de sesión (no se vuelve a leer audio)
+    return bpm_from_session(temp_dir)
 
 
 def _tempo_synced_release_ms_for_drums(bpm: float, style_preset: str) -> float:
@@ -339,8 +246,8 @@ def main() -> None:
     max_len = 0
     total_channels = 0
 
-    # 3) Leer stems de Drums en serie
-    for fname, path_str, data, sr, err in map(_load_drum_stem_worker, load_tasks):
+    # 3) Leer stems de Drums (executor de stems)
+    for fname, path_str, data, sr, err in map_stems(_load_drum_stem_worker, load_tasks):
         if err is not None or data is None or sr is None:
             logger.logger.info(f"[S5_BUS_DYNAMICS_DRUMS] Aviso: no se puede leer '{fname}': {err}.")
             continue
@@ -441,7 +348,7 @@ def main() -> None:
             if c == 1:
                 stem_data_out = stem_data_out.reshape(-1)
 
-            sf.write(path, stem_data_out, sr_ref)
+            write_audio_atomic(path, stem_data_out, sr_ref)
             logger.logger.info(f"[S5_BUS_DYNAMICS_DRUMS] {fname}: reescrito con compresión de bus aplicada.")
 
     # 10) Guardar métricas de bus para el futuro check
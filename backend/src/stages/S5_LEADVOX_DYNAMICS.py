@@ -7,7 +7,6 @@ from pathlib import Path
 from typing import Dict, Any, List, Tuple, Optional
 import json
 import numpy as np
-import soundfile as sf
 
 # --- hack sys.path para ejecutar como script suelto desde stage.py ---
 THIS_DIR = Path(__file__).resolve().parent
@@ -16,11 +15,19 @@ if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
+from utils.stem_bus import read_stem, write_stem  # noqa: E402
+from utils.envelope_kernels import envelope_follower, gain_reduction_db  # noqa: E402
+from utils.stft_engine import band_energy, stft_process  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
+from utils.tempo_utils import bpm_from_session  # noqa: E402
 from utils.dynamics_utils import (  # noqa: E402
     compress_peak_detector,
     compute_crest_factor_db,
 )
 
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
+
 EPS = 1e-12
 
 
@@ -49,94 +56,6 @@ def _to_mono(y: np.ndarray) -> np.ndarray:
     return np.mean(y, axis=1).astype(np.float32)
 
 
-def _read_mono_limited(path: Path, max_seconds: float = 90.0) -> tuple[np.ndarray | None, int | None, str | None]:
-    try:
-        with sf.SoundFile(str(path)) as f:
-            sr = int(f.samplerate)
-            max_frames = int(max_seconds * sr)
-            frames = min(max_frames, len(f))
-            y = f.read(frames=frames, dtype="float32", always_2d=True)
-        if y is None:
-            return None, None, "lectura None"
-        if not isinstance(y, np.ndarray):
-            y = np.asarray(y, dtype=np.float32)
-        if y.size == 0:
-            return None, None, "archivo vacío"
-        y_m = _to_mono(y)
-        return y_m.astype(np.float32), sr, None
-    except Exception as e:
-        return None, None, str(e)
-
-
-def _estimate_bpm_from_audio(
-    y: np.ndarray, sr: int, bpm_min: float = 60.0, bpm_max: float = 200.0
-) -> tuple[float | None, float]:
-    if y is None or sr is None:
-        return None, 0.0
-    if y.size < sr * 5:
-        return None, 0.0
-
-    y = y.astype(np.float32)
-    y = y - float(np.mean(y))
-
-    frame = 2048
-    hop = 512
-    n = int((len(y) - frame) / hop) + 1
-    if n < 256:
-        return None, 0.0
-
-    idx = np.arange(frame, dtype=np.int32)[None, :] + (np.arange(n, dtype=np.int32) * hop)[:, None]
-    frames = y[idx]
-    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12).astype(np.float32)
-
-    env = np.diff(rms, prepend=rms[:1])
-    env = np.maximum(env, 0.0)
-
-    k = 5
-    if env.size > k:
-        env = np.convolve(env, np.ones(k, dtype=np.float32) / k, mode="same")
-
-    env = env - float(np.mean(env))
-    std = float(np.std(env) + 1e-12)
-    env = (env / std).astype(np.float32)
-
-    fe = sr / float(hop)
-
-    m = int(env.size)
-    nfft = 1 << ((2 * m - 1).bit_length())
-    F = np.fft.rfft(env, n=nfft)
-    ac = np.fft.irfft(F * np.conj(F), n=nfft)[:m].real
-    ac[0] = 0.0
-
-    lag_min = int(round((60.0 * fe) / bpm_max))
-    lag_max = int(round((60.0 * fe) / bpm_min))
-    if lag_max <= lag_min + 2 or lag_max >= ac.size:
-        return None, 0.0
-
-    window = ac[lag_min : lag_max + 1]
-    peak_i = int(np.argmax(window))
-    peak_lag = lag_min + peak_i
-    bpm0 = 60.0 * fe / float(peak_lag)
-
-    candidates: List[tuple[float, float]] = []
-    for mult in (0.5, 1.0, 2.0):
-        bpm_c = bpm0 * mult
-        if bpm_c < bpm_min or bpm_c > bpm_max:
-            continue
-        lag_c = int(round((60.0 * fe) / bpm_c))
-        if lag_c <= 1 or lag_c >= ac.size:
-            continue
-        candidates.append((bpm_c, float(ac[lag_c])))
-
-    if not candidates:
-        return None, 0.0
-
-    bpm_best, score_best = max(candidates, key=lambda t: t[1])
-    med = float(np.median(window) + 1e-12)
-    conf = float(np.clip((score_best / med - 1.0) / 10.0, 0.0, 1.0))
-    return float(bpm_best), conf
-
-
 def _get_bpm_from_analysis_or_audio(analysis: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float, str]:
     session = analysis.get("session", {}) or {}
     bpm = session.get("bpm")
@@ -151,15 +70,8 @@ def _get_bpm_from_analysis_or_audio(analysis: Dict[str, Any], temp_dir: Path) ->
     except (TypeError, ValueError):
         pass
 
-    full_song = temp_dir / "full_song.wav"
-    if full_song.exists():
-        y, sr, err = _read_mono_limited(full_song, max_seconds=90.0)
-        if err is None and y is not None and sr is not None:
-            bpm2, conf2 = _estimate_bpm_from_audio(y, sr)
-            if bpm2 is not None:
-                return bpm2, conf2, "estimated_full_song_stage"
-
-    return None, 0.0, "none"
+    # Sin BPM en el análisis: tempo de sesión (no se vuelve a leer audio)
+    return bpm_from_session(temp_dir)
 
 
 def _tempo_synced_release_ms_for_vocal(bpm: float, style_preset: str) -> float:
@@ -230,55 +142,39 @@ def _apply_deesser_fft(
     if n < frame + hop:
         return y, {"enabled": 0.0, "avg_deess_db": 0.0, "max_deess_db": 0.0}
 
-    win = np.hanning(frame).astype(np.float32)
-    win_norm = float(np.sum(win**2) / max(hop, 1))
-
     freqs = np.fft.rfftfreq(frame, d=1.0 / float(sr)).astype(np.float32)
     hi_mask = (freqs >= band_lo_hz) & (freqs < band_hi_hz)
     mid_mask = (freqs >= mid_lo_hz) & (freqs < mid_hi_hz)
 
-    y_out = np.zeros_like(y2d, dtype=np.float32)
-    ola_norm = np.zeros((n,), dtype=np.float32)
-
-    deess_vals: List[float] = []
-
-    # Procesamiento por chunks de frames para memoria controlada
-    n_frames = 1 + (n - frame) // hop
-    for k in range(n_frames):
-        i0 = k * hop
-        seg = y2d[i0 : i0 + frame, :]  # (frame, ch)
-        segw = seg * win[:, None]
+    deess_vals: List[np.ndarray] = []
 
-        # rfft por canal
-        X = np.fft.rfft(segw, axis=0)  # (bins, ch)
-        mag2 = (np.abs(X) ** 2).astype(np.float64)
+    def _deess(X: np.ndarray, _f0: int) -> tuple[np.ndarray, np.ndarray]:
+        # X: (ch, frames, bins) de un chunk de frames
+        e_hi = band_energy(X, hi_mask) + EPS
+        e_mid = band_energy(X, mid_mask) + EPS
+        ratio_db = 10.0 * np.log10(e_hi / e_mid)  # (ch, frames)
 
-        e_hi = np.sum(mag2[hi_mask, :], axis=0) + EPS
-        e_mid = np.sum(mag2[mid_mask, :], axis=0) + EPS
-        ratio_db = 10.0 * np.log10(e_hi / e_mid)  # (ch,)
-
-        # GR por canal
+        # GR por canal y frame
         over = ratio_db - float(ratio_thr_db)
         gr_db = np.clip(over * float(slope), 0.0, float(max_deess_db)).astype(np.float32)
 
-        # Atenuación en hi band
-        att = (10.0 ** (-gr_db / 20.0)).astype(np.float32)  # (ch,)
-        if np.any(gr_db > 0.0):
-            deess_vals.extend([float(v) for v in gr_db])
-
-        # aplica por bins: sólo banda hi
-        X2 = X.copy()
-        if np.any(hi_mask):
-            X2[hi_mask, :] *= att[None, :]
-
-        x_time = np.fft.irfft(X2, n=frame, axis=0).astype(np.float32)
-
-        y_out[i0 : i0 + frame, :] += x_time * win[:, None]
-        ola_norm[i0 : i0 + frame] += (win.astype(np.float32) ** 2)
-
-    # Normalización OLA
-    norm = np.maximum(ola_norm, EPS)[:, None]
-    y_out = (y_out / norm).astype(np.float32)
+        active = np.any(gr_db > 0.0, axis=0)
+        if np.any(active):
+            deess_vals.append(gr_db[:, active].reshape(-1))
+
+        # Atenuación sólo en la banda hi; los frames sin GR pasan sin irfft
+        changed = gr_db > 0.0
+        if np.any(hi_mask) and np.any(changed):
+            att = (10.0 ** (-gr_db[changed] / 20.0)).astype(np.float32)
+            Xc = X[changed]
+            Xc[:, hi_mask] *= att[:, None]
+            X[changed] = Xc
+        return X, changed
+
+    # STFT por lotes (frames en chunks de memoria acotada) por canal
+    y_out = np.ascontiguousarray(
+        stft_process(np.ascontiguousarray(y2d.T, dtype=np.float32), frame, hop, _deess).T
+    )
 
     if y.ndim == 1:
         y_out_final = y_out[:, 0]
@@ -286,7 +182,7 @@ def _apply_deesser_fft(
         y_out_final = y_out
 
     if deess_vals:
-        arr = np.array(deess_vals, dtype=np.float32)
+        arr = np.concatenate(deess_vals).astype(np.float32)
         stats = {
             "enabled": 1.0,
             "avg_deess_db": float(np.mean(arr)),
@@ -354,10 +250,7 @@ def _compress_leveler_rms(
     level_db = (20.0 * np.log10(np.maximum(rms, EPS))).astype(np.float32)
 
     # GR target por frame
-    inv_ratio = 1.0 / max(float(ratio), 1.0)
-    k = 1.0 - inv_ratio
-    over_db = (level_db - float(threshold_db)).astype(np.float32)
-    gr_t = np.maximum(over_db * float(k), 0.0).astype(np.float32)
+    gr_t = gain_reduction_db(level_db, threshold_db, ratio).astype(np.float32)
 
     # gate: si muy bajo, no comprimir
     gr_t = np.where(level_db > float(gate_dbfs), gr_t, 0.0).astype(np.float32)
@@ -367,15 +260,7 @@ def _compress_leveler_rms(
     a_att = float(np.exp(-dt / max(float(attack_ms) / 1000.0, 1e-6)))
     a_rel = float(np.exp(-dt / max(float(release_ms) / 1000.0, 1e-6)))
 
-    gr_s = np.zeros_like(gr_t, dtype=np.float32)
-    g = 0.0
-    for i in range(gr_t.size):
-        tgt = float(gr_t[i])
-        if tgt > g:
-            g = a_att * g + (1.0 - a_att) * tgt
-        else:
-            g = a_rel * g + (1.0 - a_rel) * tgt
-        gr_s[i] = g
+    gr_s = envelope_follower(gr_t, a_att, a_rel).astype(np.float32)
 
     # ganancia lineal por frame -> por muestra
     gain = (10.0 ** (-gr_s / 20.0)).astype(np.float32)
@@ -464,7 +349,7 @@ def _compress_lead_stem_worker(
     path = Path(path_str)
 
     try:
-        data, sr = sf.read(path, always_2d=True)
+        data, sr = read_stem(path, always_2d=True)
     except Exception as e:
         logger.logger.info(f"[S5_LEADVOX_DYNAMICS] {fname}: error al leer el archivo: {e}")
         return None
@@ -556,7 +441,7 @@ def _compress_lead_stem_worker(
 
     post_rms_db, post_peak_db, post_crest_db = compute_crest_factor_db(_to_mono(y_out))
 
-    sf.write(path, y_out.astype(np.float32), int(sr))
+    write_stem(path, y_out.astype(np.float32), int(sr))
 
     return {
         "file_name": fname,
@@ -763,7 +648,7 @@ def main() -> None:
         )
 
     # ------------------------------------------------------------------
-    # 2) Ejecutar en serie
+    # 2) Ejecutar (executor de stems)
     # ------------------------------------------------------------------
     metrics_records: List[Dict[str, Any]] = []
     processed = 0
@@ -771,7 +656,7 @@ def main() -> None:
     if not tasks:
         logger.logger.info("[S5_LEADVOX_DYNAMICS] No hay stems lead válidos para procesar.")
     else:
-        for result in map(_compress_lead_stem_worker, tasks):
+        for result in map_stems(_compress_lead_stem_worker, tasks):
             if result is None:
                 continue
 
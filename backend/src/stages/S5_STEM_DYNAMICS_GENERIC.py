@@ -14,12 +14,16 @@ if str(SRC_DIR) not in sys.path:
 
 import json  # noqa: E402
 import numpy as np  # noqa: E402
-import soundfile as sf  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
+from utils.stem_bus import read_stem, write_stem  # noqa: E402
 from utils.dynamics_utils import compute_crest_factor_db  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
+from utils.tempo_utils import bpm_from_session  # noqa: E402
 from pedalboard import Pedalboard, Compressor  # noqa: E402
-from pedalboard.io import AudioFile  # noqa: E402
+
+# Lee/escribe stems con read_stem/write_stem (stem bus del contexto activo).
+USES_STEM_BUS = True
 
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
@@ -55,93 +59,6 @@ def _compute_threshold_for_stem(
     return float(threshold_db)
 
 
-def _read_mono_limited(path: Path, max_seconds: float = 90.0) -> tuple[np.ndarray | None, int | None, str | None]:
-    try:
-        with sf.SoundFile(str(path)) as f:
-            sr = int(f.samplerate)
-            max_frames = int(max_seconds * sr)
-            frames = min(max_frames, len(f))
-            y = f.read(frames=frames, dtype="float32", always_2d=False)
-        if y is None:
-            return None, None, "lectura None"
-        if not isinstance(y, np.ndarray):
-            y = np.asarray(y, dtype=np.float32)
-        if y.size == 0:
-            return None, None, "archivo vacío"
-        if y.ndim > 1:
-            y = np.mean(y, axis=1).astype(np.float32)
-        return y.astype(np.float32), sr, None
-    except Exception as e:
-        return None, None, str(e)
-
-
-def _estimate_bpm_from_audio(y: np.ndarray, sr: int, bpm_min: float = 60.0, bpm_max: float = 200.0) -> tuple[float | None, float]:
-    if y is None or sr is None:
-        return None, 0.0
-    if y.size < sr * 5:
-        return None, 0.0
-
-    y = y.astype(np.float32)
-    y = y - float(np.mean(y))
-
-    frame = 2048
-    hop = 512
-    n = int((len(y) - frame) / hop) + 1
-    if n < 256:
-        return None, 0.0
-
-    idx = np.arange(frame, dtype=np.int32)[None, :] + (np.arange(n, dtype=np.int32) * hop)[:, None]
-    frames = y[idx]
-    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12).astype(np.float32)
-
-    env = np.diff(rms, prepend=rms[:1])
-    env = np.maximum(env, 0.0)
-
-    k = 5
-    if env.size > k:
-        env = np.convolve(env, np.ones(k, dtype=np.float32) / k, mode="same")
-
-    env = env - float(np.mean(env))
-    std = float(np.std(env) + 1e-12)
-    env = (env / std).astype(np.float32)
-
-    fe = sr / float(hop)
-
-    m = int(env.size)
-    nfft = 1 << ((2 * m - 1).bit_length())
-    F = np.fft.rfft(env, n=nfft)
-    ac = np.fft.irfft(F * np.conj(F), n=nfft)[:m].real
-    ac[0] = 0.0
-
-    lag_min = int(round((60.0 * fe) / bpm_max))
-    lag_max = int(round((60.0 * fe) / bpm_min))
-    if lag_max <= lag_min + 2 or lag_max >= ac.size:
-        return None, 0.0
-
-    window = ac[lag_min : lag_max + 1]
-    peak_i = int(np.argmax(window))
-    peak_lag = lag_min + peak_i
-    bpm0 = 60.0 * fe / float(peak_lag)
-
-    candidates: List[tuple[float, float]] = []
-    for mult in (0.5, 1.0, 2.0):
-        bpm_c = bpm0 * mult
-        if bpm_c < bpm_min or bpm_c > bpm_max:
-            continue
-        lag_c = int(round((60.0 * fe) / bpm_c))
-        if lag_c <= 1 or lag_c >= ac.size:
-            continue
-        candidates.append((bpm_c, float(ac[lag_c])))
-
-    if not candidates:
-        return None, 0.0
-
-    bpm_best, score_best = max(candidates, key=lambda t: t[1])
-    med = float(np.median(window) + 1e-12)
-    conf = float(np.clip((score_best / med - 1.0) / 10.0, 0.0, 1.0))
-    return float(bpm_best), conf
-
-
 def _get_bpm_from_analysis_or_audio(analysis: Dict[str, Any], temp_dir: Path) -> tuple[float | None, float, str]:
     session = analysis.get("session", {}) or {}
     bpm = session.get("bpm")
@@ -156,15 +73,8 @@ def _get_bpm_from_analysis_or_audio(analysis: Dict[str, Any], temp_dir: Path) ->
     except (TypeError, ValueError):
         pass
 
-    full_song = temp_dir / "full_song.wav"
-    if full_song.exists():
-        y, sr, err = _read_mono_limited(full_song, max_seconds=90.0)
-        if err is None and y is not None and sr is not None:
-            bpm2, conf2 = _estimate_bpm_from_audio(y, sr)
-            if bpm2 is not None:
-                return bpm2, conf2, "estimated_full_song_stage"
-
-    return None, 0.0, "none"
+    # Sin BPM en el análisis: tempo de sesión (no se vuelve a leer audio)
+    return bpm_from_session(temp_dir)
 
 
 def _tempo_synced_release_ms_generic(bpm: float, style_preset: str, min_ms: float, max_ms: float) -> float:
@@ -225,9 +135,9 @@ def _compress_stem_worker(
 
     path = Path(path_str)
     try:
-        with AudioFile(str(path)) as f:
-            audio = f.read(f.frames)
-            samplerate = f.samplerate
+        # (channels, samples), como AudioFile de Pedalboard
+        data, samplerate = read_stem(path, dtype="float32", always_2d=True)
+        audio = data.T
     except Exception as e:
         logger.logger.info(f"[S5_STEM_DYNAMICS_GENERIC] {fname}: error al leer el archivo: {e}")
         return None
@@ -306,13 +216,9 @@ def _compress_stem_worker(
 
     post_rms_db, post_peak_db, post_crest_db = compute_crest_factor_db(data_out)
 
-    with AudioFile(
-        str(path),
-        "w",
-        samplerate=samplerate,
-        num_channels=out_cs.shape[0],
-    ) as f:
-        f.write(processed)
+    # temp + os.replace: el stem puede compartir inodo con el stage anterior.
+    # PCM_16 = bit depth por defecto de AudioFile en escritura.
+    write_stem(path, out_cs.T, int(samplerate), subtype="PCM_16")
 
     return {
         "file_name": fname,
@@ -435,7 +341,7 @@ def main() -> None:
     metrics_records: List[Dict[str, Any]] = []
 
     if tasks:
-        for result in map(_compress_stem_worker, tasks):
+        for result in map_stems(_compress_stem_worker, tasks):
             if result is None:
                 continue
             fname = result["file_name"]
@@ -3,10 +3,9 @@ from __future__ import annotations
 import json
 import sys
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
-import soundfile as sf
 
 # Ensure src is on sys.path when executed standalone
 THIS_DIR = Path(__file__).resolve().parent
@@ -15,7 +14,8 @@ if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
 from context import PipelineContext
-from utils.audio_utils import save_audio_stems, load_audio_stems
+from utils.audio_utils import save_audio_stems
+from utils.stem_bus import read_stem, stem_info
 from utils.logger import logger as pipeline_logger
 
 # Try importing pedalboard for DSP
@@ -28,6 +28,9 @@ except ImportError:  # pragma: no cover
 
 STAGE_ID = "S6_MANUAL_CORRECTION"
 
+# Lee/escribe stems a través de context.stem_bus (read_stem/put) cuando está disponible.
+USES_STEM_BUS = True
+
 
 def _normalize_stem_name(value: str) -> str:
     """
@@ -155,12 +158,34 @@ def _detect_sample_rate(*directories: Optional[Path]) -> Optional[int]:
             if wav_path.name.lower() == "full_song.wav":
                 continue
             try:
-                return int(sf.info(str(wav_path)).samplerate)
+                return stem_info(wav_path).samplerate
             except Exception:
                 continue
     return None
 
 
+def _load_stems(directory: Path) -> Tuple[Dict[str, np.ndarray], Optional[int]]:
+    """
+    Like audio_utils.load_audio_stems ((channels, samples) float32), but through
+    read_stem: stems with pending changes in the stem bus come from memory.
+    Returns (stems, sample_rate of the first stem).
+    """
+    stems: Dict[str, np.ndarray] = {}
+    sr_ref: Optional[int] = None
+    for f in sorted(directory.iterdir()):
+        if f.suffix.lower() != ".wav" or f.name == "full_song.wav":
+            continue
+        try:
+            data, sr = read_stem(f, dtype="float32", always_2d=True)
+        except Exception as e:
+            pipeline_logger.logger.warning(f"[{STAGE_ID}] Failed to load stem {f.name}: {e}")
+            continue
+        stems[f.name] = data.T
+        if sr_ref is None:
+            sr_ref = int(sr)
+    return stems, sr_ref
+
+
 def _load_corrections(context: PipelineContext, current_dir: Path) -> List[Dict[str, Any]]:
     """
     Load corrections saved by the Studio UI via POST /jobs/{job_id}/correction.
@@ -238,18 +263,24 @@ def process(context: PipelineContext, *args) -> bool:
 
     # 3) Load input stems (prefer in-memory; fallback to disk)
     stems_map: Dict[str, np.ndarray] = getattr(context, "audio_stems", {}) or {}
+    stem_bus = getattr(context, "stem_bus", None)
 
     # IMPORTANT:
     # Corrections coming from the UI are *absolute* (volume_db/pan/reverb/speed/etc).
     # To keep the stage idempotent (and avoid stacking on re-runs), we prefer
     # loading the pre-correction stems from the previous stage (S5) when present.
+    # Los stems de S5 pueden estar pendientes en el stem bus (sin volcar):
+    # _load_stems los lee de memoria y el resto de disco.
     if not stems_map:
+        sr_loaded: Optional[int] = None
         if s5_dir and s5_dir.exists():
-            stems_map = load_audio_stems(s5_dir)
+            stems_map, sr_loaded = _load_stems(s5_dir)
             if stems_map:
                 pipeline_logger.info(f"[{STAGE_ID}] Using base stems from {s5_dir}.")
         if not stems_map:
-            stems_map = load_audio_stems(current_dir)
+            stems_map, sr_loaded = _load_stems(current_dir)
+        if stems_map and sr_loaded and not getattr(context, "sample_rate", None):
+            context.sample_rate = sr_loaded
 
     if not stems_map:
         pipeline_logger.info(f"[{STAGE_ID}] No input stems found.")
@@ -376,7 +407,14 @@ def process(context: PipelineContext, *args) -> bool:
 
     # 6) Save results
     context.audio_stems = processed_stems
-    save_audio_stems(current_dir, processed_stems, sr)
+    if stem_bus is not None:
+        # Quedan en memoria hasta el siguiente checkpoint; el volcado usa el
+        # subtype de los stems de la carpeta.
+        for filename, audio in processed_stems.items():
+            if isinstance(audio, np.ndarray):
+                stem_bus.put(filename, audio, sr)
+    else:
+        save_audio_stems(current_dir, processed_stems, sr)
 
     pipeline_logger.info(f"[{STAGE_ID}] Processed {len(processed_stems)} stems. Muted: {muted_count}.")
     pipeline_logger.log_stage_success(STAGE_ID)
@@ -7,7 +7,6 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 import numpy as np
-import soundfile as sf
 
 # Pedalboard imports for effects
 try:
@@ -27,12 +26,16 @@ if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
 from utils.logger import logger
+from utils.stem_bus import read_stem, write_stem
 
 try:
     from context import PipelineContext
 except ImportError:  # pragma: no cover
     PipelineContext = None  # type: ignore
 
+# Reads/writes stems with read_stem/write_stem (stem bus of the active context).
+USES_STEM_BUS = True
+
 
 STAGE_ID = "S6_MANUAL_CORRECTION_ADJUSTMENT"
 
@@ -247,7 +250,7 @@ def process(context: "PipelineContext", *args) -> bool:
             should_play = not is_muted
 
         try:
-            audio, sr = sf.read(str(stem_path), dtype="float32")
+            audio, sr = read_stem(stem_path, dtype="float32")
         except Exception as e:
             logger.logger.warning(f"[{STAGE_ID}] Error reading stem {stem_name}: {e}")
             continue
@@ -314,7 +317,7 @@ def process(context: "PipelineContext", *args) -> bool:
             audio = audio / peak
 
         out_path = stage_dir / f"{stem_name}.wav"
-        sf.write(str(out_path), audio, sr)
+        write_stem(out_path, audio, sr)
         processed_count += 1
 
     logger.logger.info(f"[{STAGE_ID}] Processed {processed_count} stems.")
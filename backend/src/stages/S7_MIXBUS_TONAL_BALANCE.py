@@ -35,7 +35,6 @@ from pathlib import Path
 from typing import Dict, Any, Optional, Tuple, List, Union
 
 import numpy as np  # noqa: E402
-import scipy.signal as spsig  # noqa: E402
 import soundfile as sf  # noqa: E402
 
 from pedalboard import Pedalboard, LowShelfFilter, PeakFilter, HighShelfFilter  # noqa: E402
@@ -99,12 +98,16 @@ def _log():
 # ---------------------------------------------------------------------
 # Imports utils tonal
 # ---------------------------------------------------------------------
+from src.utils.audio_utils import write_audio_atomic  # noqa: E402
+from src.utils.loudness_utils import true_peak_block_maxima  # noqa: E402
 from src.utils.tonal_balance_utils import (  # noqa: E402
     compute_band_energies,
     normalize_band_energies,
     get_style_tonal_profile,
     get_freq_bands,
 )
+# Mismo módulo (y caché en memoria) que importan los análisis
+from utils.spectral_cache import SpectralFeatures, get_spectral_features  # noqa: E402
 
 # ---------------------------------------------------------------------
 # Defaults / tuning (conservadores)
@@ -134,7 +137,6 @@ DEFAULT_SAFETY_PEAK_MAX_DBFS = -1.0   # sample peak
 DEFAULT_SAFETY_TP_MAX_DBTP = -1.0     # true-peak estimado (OS4x)
 DEFAULT_AUTOTRIM_STEP_DB = 0.75       # entre 0.5 y 1.0 dB
 
-
 # ---------------------------------------------------------------------
 # Helpers dB
 # ---------------------------------------------------------------------
@@ -222,7 +224,7 @@ def _band_is_low_20_120(band: Dict[str, Any]) -> bool:
 def _band_center_hz_fallback(band_id: str) -> float:
     """
     Centro aproximado para reporting si no viene en get_freq_bands().
-    Debe coincidir razonablemente con _build_eq_plugins().
+    Debe coincidir razonablemente con _build_eq_specs().
     """
     bid = band_id.lower()
     mapping = {
@@ -241,47 +243,35 @@ def _band_center_hz_fallback(band_id: str) -> float:
 # ---------------------------------------------------------------------
 # De-harsh / edge ratio (se mantiene tu lógica, pero compatible con loop)
 # ---------------------------------------------------------------------
-def _band_rms_db_welch(
-    y: np.ndarray,
-    sr: int,
-    fmin_hz: float,
-    fmax_hz: float,
-    nperseg: int = 8192,
-    noverlap: int = 4096,
-) -> float:
-    if y.size == 0:
-        return -120.0
-    y = np.asarray(y, dtype=np.float32)
-    y = y - float(np.mean(y))  # remove DC
-
-    nper = min(int(nperseg), max(2048, int(y.size)))
-    nov = min(int(noverlap), max(1024, int(nper // 2)))
-
-    freqs, pxx = spsig.welch(y, fs=int(sr), nperseg=nper, noverlap=nov, scaling="spectrum")
-    mask = (freqs >= float(fmin_hz)) & (freqs < float(fmax_hz))
-    if not np.any(mask):
-        return -120.0
-
-    power = float(np.mean(pxx[mask]))
-    rms = float(np.sqrt(max(power, 1e-20)))
-    return _linear_to_db(rms)
-
-
 def _compute_edge_ratio_db(
-    y: np.ndarray,
-    sr: int,
+    features: SpectralFeatures,
     edge_band_hz: Tuple[float, float] = (5000.0, 10000.0),
     ref_band_hz: Tuple[float, float] = (1000.0, 4000.0),
 ) -> float:
-    edge_db = _band_rms_db_welch(y, sr, edge_band_hz[0], edge_band_hz[1])
-    ref_db = _band_rms_db_welch(y, sr, ref_band_hz[0], ref_band_hz[1])
+    edge_db = features.band_power_db(edge_band_hz[0], edge_band_hz[1])
+    ref_db = features.band_power_db(ref_band_hz[0], ref_band_hz[1])
     return float(edge_db - ref_db)
 
 
 # ---------------------------------------------------------------------
 # Pedalboard EQ (por banda)
 # ---------------------------------------------------------------------
-def _build_eq_plugins(eq_gains_db: Dict[str, float]) -> List[Any]:
+# Filtro EQ: (tipo, fc_hz, q, gain_db), tipo en {"low_shelf", "peak", "high_shelf"}
+EqFilterSpec = Tuple[str, float, float, float]
+
+_BAND_FILTERS: Dict[str, Tuple[str, float, float]] = {
+    "sub": ("low_shelf", 60.0, 0.7),
+    "low": ("peak", 120.0, 0.9),
+    "low_mid": ("peak", 350.0, 1.0),
+    "mid": ("peak", 1000.0, 1.0),
+    "high_mid": ("peak", 2500.0, 1.0),
+    "presence": ("peak", 4500.0, 0.9),
+    "air": ("high_shelf", 10000.0, 0.7),
+    "ultra_air": ("high_shelf", 14000.0, 0.7),
+}
+
+
+def _build_eq_specs(eq_gains_db: Dict[str, float]) -> List[EqFilterSpec]:
     """
     Mapeo (aprox) a filtros:
     sub        -> LowShelf 60 Hz
@@ -296,49 +286,93 @@ def _build_eq_plugins(eq_gains_db: Dict[str, float]) -> List[Any]:
     if not eq_gains_db:
         return []
 
-    band_to_filter = {
-        "sub": lambda g: LowShelfFilter(cutoff_frequency_hz=60, gain_db=g, q=0.7),
-        "low": lambda g: PeakFilter(cutoff_frequency_hz=120, q=0.9, gain_db=g),
-        "low_mid": lambda g: PeakFilter(cutoff_frequency_hz=350, q=1.0, gain_db=g),
-        "mid": lambda g: PeakFilter(cutoff_frequency_hz=1000, q=1.0, gain_db=g),
-        "high_mid": lambda g: PeakFilter(cutoff_frequency_hz=2500, q=1.0, gain_db=g),
-        "presence": lambda g: PeakFilter(cutoff_frequency_hz=4500, q=0.9, gain_db=g),
-        "air": lambda g: HighShelfFilter(cutoff_frequency_hz=10000, gain_db=g, q=0.7),
-        "ultra_air": lambda g: HighShelfFilter(cutoff_frequency_hz=14000, gain_db=g, q=0.7),
-    }
-
-    plugins: List[Any] = []
+    specs: List[EqFilterSpec] = []
     for band in get_freq_bands():
         bid = str(band["id"])
         g = float(eq_gains_db.get(bid, 0.0))
         if abs(g) < 1e-3:
             continue
-        fn = band_to_filter.get(bid)
-        if fn is not None:
-            plugins.append(fn(g))
+        filt = _BAND_FILTERS.get(bid)
+        if filt is not None:
+            kind, fc, q = filt
+            specs.append((kind, fc, q, g))
+
+    return specs
+
+
+def _spec_to_plugin(spec: EqFilterSpec) -> Any:
+    kind, fc, q, g = spec
+    if kind == "low_shelf":
+        return LowShelfFilter(cutoff_frequency_hz=fc, gain_db=g, q=q)
+    if kind == "high_shelf":
+        return HighShelfFilter(cutoff_frequency_hz=fc, gain_db=g, q=q)
+    return PeakFilter(cutoff_frequency_hz=fc, q=q, gain_db=g)
+
+
+def _biquad_coeffs(spec: EqFilterSpec, sr: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coeficientes (b, a) del biquad que usa Pedalboard para cada filtro
+    (juce::dsp::IIR::Coefficients: makeLowShelf / makePeakFilter / makeHighShelf).
+    """
+    kind, fc, q, g = spec
+    A = np.sqrt(10.0 ** (float(g) / 20.0))
+    omega = 2.0 * np.pi * max(float(fc), 2.0) / float(sr)
+    cos_w = np.cos(omega)
+    sin_w = np.sin(omega)
+
+    if kind == "peak":
+        alpha = sin_w / (2.0 * float(q))
+        b = [1.0 + alpha * A, -2.0 * cos_w, 1.0 - alpha * A]
+        a = [1.0 + alpha / A, -2.0 * cos_w, 1.0 - alpha / A]
+    else:
+        am1, ap1 = A - 1.0, A + 1.0
+        beta = sin_w * np.sqrt(A) / float(q)
+        if kind == "low_shelf":
+            b = [A * (ap1 - am1 * cos_w + beta), 2.0 * A * (am1 - ap1 * cos_w), A * (ap1 - am1 * cos_w - beta)]
+            a = [ap1 + am1 * cos_w + beta, -2.0 * (am1 + ap1 * cos_w), ap1 + am1 * cos_w - beta]
+        else:
+            b = [A * (ap1 + am1 * cos_w + beta), -2.0 * A * (am1 + ap1 * cos_w), A * (ap1 + am1 * cos_w - beta)]
+            a = [ap1 - am1 * cos_w + beta, 2.0 * (am1 - ap1 * cos_w), ap1 - am1 * cos_w - beta]
+
+    return np.asarray(b, dtype=np.float64), np.asarray(a, dtype=np.float64)
+
 
-    return plugins
+def _eq_power_response(specs: List[EqFilterSpec], freqs: np.ndarray, sr: int) -> np.ndarray:
+    """
+    |H(f)|² de la cadena de filtros en las frecuencias freqs (Hz):
+    |b0 + b1 z^-1 + b2 z^-2|² = b0²+b1²+b2² + 2(b0 b1 + b1 b2) cos w + 2 b0 b2 cos 2w
+    """
+    w = 2.0 * np.pi * np.asarray(freqs, dtype=np.float64) / float(sr)
+    cos_w = np.cos(w)
+    cos_2w = np.cos(2.0 * w)
+
+    def _poly_power(c: np.ndarray) -> np.ndarray:
+        return (
+            (c[0] * c[0] + c[1] * c[1] + c[2] * c[2])
+            + 2.0 * (c[0] * c[1] + c[1] * c[2]) * cos_w
+            + 2.0 * c[0] * c[2] * cos_2w
+        )
+
+    resp = np.ones_like(w)
+    for spec in specs:
+        b, a = _biquad_coeffs(spec, sr)
+        resp *= _poly_power(b) / np.maximum(_poly_power(a), 1e-30)
+    return resp
 
 
 def _apply_eq_pedalboard(
     audio: np.ndarray,
     sr: int,
-    eq_gains_db: Dict[str, float],
-    *,
-    extra_plugins: Optional[List[Any]] = None,
+    specs: List[EqFilterSpec],
 ) -> np.ndarray:
+    """
+    Renderiza la cadena de filtros specs (en orden) con Pedalboard.
+    """
     x = np.asarray(audio, dtype=np.float32)
-    if x.size == 0 or sr <= 0:
-        return x
-
-    plugins = _build_eq_plugins(eq_gains_db)
-    if extra_plugins:
-        plugins.extend(list(extra_plugins))
-
-    if not plugins:
+    if x.size == 0 or sr <= 0 or not specs:
         return x
 
-    board = Pedalboard(plugins)
+    board = Pedalboard([_spec_to_plugin(s) for s in specs])
     y = board(x, int(sr))
     return np.asarray(y, dtype=np.float32)
 
@@ -355,16 +389,13 @@ def _sample_peak_dbfs(y: np.ndarray) -> float:
 
 def _true_peak_est_dbtp_os4x(y: np.ndarray, sr: int) -> float:
     """
-    Estimación rápida de true peak con oversampling 4x (resample_poly).
-    No pretende ser ITU-R BS.1770 completo, pero sirve como guardrail.
+    Estimación rápida de true peak con oversampling 4x (medidor en streaming
+    de loudness_utils). Sirve como guardrail.
     """
     if y.size == 0:
         return -120.0
     try:
-        y = np.asarray(y, dtype=np.float32)
-        up = 4
-        y_up = spsig.resample_poly(y, up=up, down=1)
-        peak = float(np.max(np.abs(y_up)))
+        peak = float(np.max(true_peak_block_maxima(np.asarray(y, dtype=np.float32), oversample=4)))
         return _linear_to_db(peak)
     except Exception:
         # Fallback: sample peak
@@ -419,7 +450,8 @@ def _apply_autotrim_if_needed(
 
     m["autotrim_applied_db"] = applied_db
     m["peak_dbfs_post"] = _sample_peak_dbfs(y2)
-    m["tp_est_db_post"] = _true_peak_est_dbtp_os4x(y2, sr)
+    # Trim lineal: el true-peak baja exactamente applied_db
+    m["tp_est_db_post"] = tp_pre - applied_db
     return y2, m
 
 
@@ -687,8 +719,9 @@ def process(*args) -> bool:
         freq_bands = get_freq_bands()
         band_ids = [str(b["id"]) for b in freq_bands]
 
-        # Métricas PRE
-        pre_band_abs = compute_band_energies(y, sr)
+        # Métricas PRE (PSD de Welch compartida con el análisis)
+        features = get_spectral_features(full_song_path, y=y, sr=sr)
+        pre_band_abs = features.band_energies()
         pre_band_rel = normalize_band_energies(pre_band_abs)
         pre_err_rms_rel, pre_err_by_band_rel = _compute_error_rel(pre_band_rel, target_rel)
 
@@ -745,7 +778,7 @@ def process(*args) -> bool:
 
         edge_ratio_db_pre = float("nan")
         try:
-            edge_ratio_db_pre = _compute_edge_ratio_db(y, sr)
+            edge_ratio_db_pre = _compute_edge_ratio_db(features)
         except Exception:
             pass
 
@@ -771,15 +804,9 @@ def process(*args) -> bool:
         else:
             log.info("[S7_MIXBUS_TONAL_BALANCE] De-harsh: edge_ratio_pre=nan (skip)")
 
-        extra_plugins_static: List[Any] = []
+        deharsh_specs: List[EqFilterSpec] = []
         if deharsh_cut_db > 0.0:
-            extra_plugins_static.append(
-                PeakFilter(
-                    cutoff_frequency_hz=float(deharsh_fc_hz),
-                    q=float(deharsh_q),
-                    gain_db=float(-deharsh_cut_db),
-                )
-            )
+            deharsh_specs.append(("peak", float(deharsh_fc_hz), float(deharsh_q), float(-deharsh_cut_db)))
 
         boost_caps = {
             "high_mid": float(boost_cap_high_mid_db),
@@ -792,11 +819,18 @@ def process(*args) -> bool:
         # Loop iterativo
         # -----------------------------------------------------------------
         cumulative_eq: Dict[str, float] = {bid: 0.0 for bid in band_ids}
-        y_work = np.asarray(y, dtype=np.float32)
 
         best_err = float(pre_err_rms_rel)
-        best_y = np.asarray(y_work, dtype=np.float32)
         best_cum = dict(cumulative_eq)
+        best_pass = 0
+
+        # Passes predichos: las bandas tras cada pass salen del espectro de y
+        # ponderado por |H|² de los filtros acumulados (el autotrim es una
+        # ganancia escalar y no cambia las energías relativas). El EQ se
+        # renderiza una sola vez al final.
+        spectrum = features.band_spectrum()
+        eq_power = np.ones_like(spectrum.freqs)
+        pass_specs: List[List[EqFilterSpec]] = []
 
         passes_used = 0
         consecutive_stall = 0
@@ -811,7 +845,7 @@ def process(*args) -> bool:
             passes_used = p
 
             # Medición current
-            band_abs = compute_band_energies(y_work, sr)
+            band_abs = spectrum.band_energies(eq_power)
             band_rel = normalize_band_energies(band_abs)
             err_rms, err_by_band = _compute_error_rel(band_rel, target_rel)
 
@@ -861,56 +895,48 @@ def process(*args) -> bool:
                 log.warning("[S7_MIXBUS_TONAL_BALANCE] Pass %d: no hay deltas aplicables (min_gain=%.2f).", p, min_gain_db)
                 break
 
-            # Aplica EQ del pass (solo deltas), pero acumulando en state
-            # (Pedalboard encadena filtros; por eso aplicamos deltas directamente en audio actual)
-            y_next = _apply_eq_pedalboard(y_work, sr, deltas, extra_plugins=extra_plugins_static)
+            # EQ del pass (solo deltas + de-harsh), encadenado sobre el estado actual
+            specs = _build_eq_specs(deltas) + deharsh_specs
 
-            # Seguridad picos: autotrim si excede
-            y_next, trim_metrics = _apply_autotrim_if_needed(
-                y_next,
-                sr,
-                safety_peak_max_dbfs=safety_peak_max_dbfs,
-                safety_tp_max_dbtp=safety_tp_max_dbtp,
-                step_db=autotrim_step_db,
-            )
+            eq_power = eq_power * _eq_power_response(specs, spectrum.freqs, sr)
+            pass_specs.append(specs)
 
             # Actualiza acumulado (solo lo que realmente aplicamos)
             for bid, d in deltas.items():
                 cumulative_eq[bid] = float(cumulative_eq.get(bid, 0.0) + float(d))
 
             # Mide post-pass
-            band_abs_post = compute_band_energies(y_next, sr)
+            band_abs_post = spectrum.band_energies(eq_power)
             band_rel_post = normalize_band_energies(band_abs_post)
             err_rms_post, _ = _compute_error_rel(band_rel_post, target_rel)
 
             improvement = float(prev_err - err_rms_post)
 
-            per_pass_history.append({
+            pass_entry: Dict[str, Any] = {
                 "pass": p,
                 "err_rms_rel_db_pre_pass": float(prev_err),
                 "err_rms_rel_db_post_pass": float(err_rms_post),
                 "improvement_db": float(improvement),
                 "deltas_db": deltas,
-                "autotrim": trim_metrics,
-            })
+                "predicted": True,
+            }
+            per_pass_history.append(pass_entry)
 
             log.info(
-                "[S7_MIXBUS_TONAL_BALANCE] Pass %d/%d: err %.2f -> %.2f (impr=%.2f dB) | max|delta|=%.2f dB | autotrim=%.2f dB",
+                "[S7_MIXBUS_TONAL_BALANCE] Pass %d/%d (pred): err %.2f -> %.2f (impr=%.2f dB) | max|delta|=%.2f dB",
                 p, passes_max, prev_err, err_rms_post, improvement,
                 float(max([abs(v) for v in deltas.values()] + [0.0])),
-                float(trim_metrics.get("autotrim_applied_db", 0.0)),
             )
 
             # Actualiza best
             if err_rms_post < best_err - 1e-9:
                 best_err = float(err_rms_post)
-                best_y = np.asarray(y_next, dtype=np.float32)
                 best_cum = dict(cumulative_eq)
+                best_pass = p
 
             # Stop conditions
             if err_rms_post <= target_err_db + 1e-9:
                 stop_reason = "target_met"
-                y_work = y_next
                 prev_err = float(err_rms_post)
                 break
 
@@ -926,24 +952,35 @@ def process(*args) -> bool:
                     "[S7_MIXBUS_TONAL_BALANCE] BREAK por stall: improvement < %.2f dB en %d passes consecutivos.",
                     min_improve_stall_db, stall_consec_passes
                 )
-                y_work = y_next
                 prev_err = float(err_rms_post)
                 break
 
             # Continue policy
             if improvement >= min_improve_continue_db:
-                y_work = y_next
                 prev_err = float(err_rms_post)
                 continue
 
             # Si no mejora lo suficiente para "continue", aún así seguimos hasta N (pero sin resetear stall)
-            y_work = y_next
             prev_err = float(err_rms_post)
 
         # Use best result (protege contra overshoot o regresión en el último pass)
-        y_final = np.asarray(best_y, dtype=np.float32)
+        y_final = np.asarray(y, dtype=np.float32)
         cumulative_final = dict(best_cum)
 
+        # Render único de los passes hasta el mejor (los filtros encadenados en
+        # orden) y autotrim sobre el resultado
+        render_trim: Optional[Dict[str, Any]] = None
+        if best_pass > 0:
+            chain = [s for specs in pass_specs[:best_pass] for s in specs]
+            y_final = _apply_eq_pedalboard(y, sr, chain)
+            y_final, render_trim = _apply_autotrim_if_needed(
+                y_final,
+                sr,
+                safety_peak_max_dbfs=safety_peak_max_dbfs,
+                safety_tp_max_dbtp=safety_tp_max_dbtp,
+                step_db=autotrim_step_db,
+            )
+
         # Métricas POST finales
         post_band_abs = compute_band_energies(y_final, sr)
         post_band_rel = normalize_band_energies(post_band_abs)
@@ -951,6 +988,13 @@ def process(*args) -> bool:
 
         improvement_total = float(pre_err_rms_rel - post_err_rms_rel)
 
+        if best_pass > 0:
+            log.info(
+                "[S7_MIXBUS_TONAL_BALANCE] Render único (%d passes, %d filtros): err predicho=%.2f medido=%.2f dB | autotrim=%.2f dB",
+                best_pass, len(chain), best_err, post_err_rms_rel,
+                float(render_trim.get("autotrim_applied_db", 0.0)),
+            )
+
         # Severity gates (sin detener pipeline)
         status_severity = _severity_gate(post_err_rms_rel, pre_err_rms_rel)
         ideal_met = bool(post_err_rms_rel <= DEFAULT_GATE_IDEAL_DB + 1e-9)
@@ -972,7 +1016,7 @@ def process(*args) -> bool:
 
         # Escribe WAV resultado
         out_path = temp_dir / "full_song_tonal.wav"
-        sf.write(out_path, y_final, sr)
+        write_audio_atomic(out_path, y_final, sr)
 
         # JSON "analysis_*" enriquecido (mantiene filosofía del otro S7 análisis)
         analysis_out: Dict[str, Any] = {
@@ -1019,6 +1063,12 @@ def process(*args) -> bool:
                 "boost_caps_db": boost_caps,
             },
             "per_pass": per_pass_history,
+            "render": {
+                "predicted_passes": True,
+                "rendered_passes": int(best_pass),
+                "error_rms_rel_db_predicted": float(best_err),
+                "autotrim": render_trim,
+            },
             "outputs": {
                 "full_song_tonal_wav": str(out_path),
                 "analysis_json": str(temp_dir / f"analysis_{contract_id}.json"),
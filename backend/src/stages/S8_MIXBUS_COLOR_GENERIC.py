@@ -18,12 +18,13 @@ import soundfile as sf  # noqa: E402
 from pedalboard import Distortion  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
+from utils.audio_utils import write_audio_atomic  # noqa: E402
 from utils.color_utils import (  # noqa: E402
     compute_rms_dbfs,
-    compute_true_peak_dbfs,
     compute_sample_peak_dbfs,
     estimate_thd_percent,
 )
+from utils.loudness_utils import true_peak_block_maxima, true_peak_dbtp_from_blocks  # noqa: E402
 
 
 def load_analysis(contract_id: str) -> Dict[str, Any]:
@@ -126,7 +127,9 @@ def _process_mixbus_color_worker(
     y = np.asarray(y, dtype=np.float32)
     sr = int(sr)
 
-    pre_tp = float(compute_true_peak_dbfs(y, oversample_factor=4))
+    # Máximos true-peak por bloque: las ganancias lineales posteriores los reutilizan
+    pre_tp_blocks = true_peak_block_maxima(y, oversample=4)
+    pre_tp = true_peak_dbtp_from_blocks(pre_tp_blocks)
     pre_sample_peak = float(compute_sample_peak_dbfs(y))
     pre_rms = float(compute_rms_dbfs(y))
     pre_nf = float(_estimate_noise_floor_dbfs(y, sr))
@@ -203,7 +206,9 @@ def _process_mixbus_color_worker(
                     f"[S8_MIXBUS_COLOR_GENERIC] Color_drive ajustado a {color_drive_db:.2f} dB, THD≈{thd_pct:.2f}%."
                 )
 
-    tp_after_color = float(compute_true_peak_dbfs(y_color, oversample_factor=4))
+    # Sin color (drive < 0.1 dB) y_color es una copia de y
+    color_tp_blocks = pre_tp_blocks if color_drive_db < 0.1 else true_peak_block_maxima(y_color, oversample=4)
+    tp_after_color = true_peak_dbtp_from_blocks(color_tp_blocks)
 
     # --------------------------------------------------------------
     # 2) MAKEUP GAIN LIMPIO: nivelado post-color para dejar pre-master en rango útil
@@ -243,7 +248,8 @@ def _process_mixbus_color_worker(
     # --------------------------------------------------------------
     # Safety trim para NO pasarnos del techo del rango (evita clipping / TP runaway)
     # --------------------------------------------------------------
-    post_tp = float(compute_true_peak_dbfs(y_out, oversample_factor=4))
+    # y_out = y_color * makeup (lineal): TP desde los máximos de y_color
+    post_tp = true_peak_dbtp_from_blocks(color_tp_blocks, gain_db=makeup_gain_clean_db)
     post_sample_peak = float(compute_sample_peak_dbfs(y_out))
     safety_trim_db = 0.0
 
@@ -253,7 +259,7 @@ def _process_mixbus_color_worker(
         target_tp = target_tp_max - 0.2
         safety_trim_db = float(target_tp - post_tp)
         y_out = (y_out * _db_to_lin(safety_trim_db)).astype(np.float32)
-        post_tp = float(compute_true_peak_dbfs(y_out, oversample_factor=4))
+        post_tp = true_peak_dbtp_from_blocks(color_tp_blocks, gain_db=makeup_gain_clean_db + safety_trim_db)
         post_sample_peak = float(compute_sample_peak_dbfs(y_out))
         logger.logger.info(
             f"[S8_MIXBUS_COLOR_GENERIC] Safety trim adicional {safety_trim_db:+.2f} dB "
@@ -276,7 +282,7 @@ def _process_mixbus_color_worker(
     )
 
     # Guardar como FLOAT para NO introducir cuantización/dureza
-    sf.write(full_song_path, y_out.astype(np.float32), sr, subtype="FLOAT")
+    write_audio_atomic(full_song_path, y_out.astype(np.float32), sr, subtype="FLOAT")
     logger.logger.info(f"[S8_MIXBUS_COLOR_GENERIC] Mixbus reescrito (FLOAT) en {full_song_path}.")
 
     return {
@@ -3,7 +3,7 @@ from utils.logger import logger
 
 import sys
 from pathlib import Path
-from typing import Dict, Any, Tuple, List, Optional
+from typing import Dict, Any, Tuple, Optional
 
 # --- hack sys.path para ejecutar como script suelto desde stage.py ---
 THIS_DIR = Path(__file__).resolve().parent
@@ -18,9 +18,27 @@ import soundfile as sf  # noqa: E402
 from pedalboard import Pedalboard, Gain, Limiter  # noqa: E402
 
 from utils.analysis_utils import get_temp_dir  # noqa: E402
-from utils.loudness_utils import compute_lufs_and_lra  # noqa: E402
+from utils.audio_utils import write_audio_atomic  # noqa: E402
+from utils.loudness_utils import (  # noqa: E402
+    LoudnessEngine,
+    compute_lufs_and_lra,
+    gated_lufs_and_lra,
+    measure_true_peak_dbtp,
+)
 from utils.mastering_profiles_utils import get_mastering_profile  # noqa: E402
 
+# Búsqueda del gain de LRA sobre un proxy de la canción.
+# Proxy: secciones más fuertes + una sección por estrato, de PROXY_SEGMENT_S segundos
+PROXY_SEGMENT_S = 6.0
+PROXY_LOUDEST_SEGMENTS = 3
+PROXY_STRATA = 5
+# Fundido en las uniones del proxy (evita clicks que verían limiter y true-peak)
+PROXY_FADE_S = 0.01
+# Modelo de transferencia del proxy: bins de nivel de entrada (dB)
+PROXY_TRANSFER_BIN_DB = 1.0
+# Bisección del gain: resolución (dB)
+GAIN_SEARCH_TOL_DB = 0.25
+
 
 # ------------------------------------------------------------
 # Medición de pico / true-peak
@@ -41,35 +59,14 @@ def _peak_dbfs_sample(x: np.ndarray) -> float:
 
 def _true_peak_dbfs(x: np.ndarray, sr: int, oversample_factor: int = 4) -> float:
     """
-    True-peak aproximado por oversampling.
-    - Si SciPy está disponible, usa resample_poly (mejor).
-    - Si no, cae a sample-peak.
+    True-peak por oversampling (medidor en streaming de loudness_utils).
     """
     arr = np.asarray(x, dtype=np.float32)
     if arr.size == 0 or sr <= 0:
         return float("-inf")
-
-    try:
-        from scipy.signal import resample_poly  # type: ignore
-    except Exception:
+    if arr.ndim > 2:
         return _peak_dbfs_sample(arr)
-
-    if arr.ndim == 1:
-        chans = [arr]
-    elif arr.ndim == 2:
-        chans = [arr[:, ch] for ch in range(arr.shape[1])]
-    else:
-        return _peak_dbfs_sample(arr)
-
-    peaks: List[float] = []
-    for y in chans:
-        y_os = resample_poly(y, oversample_factor, 1)
-        peaks.append(float(np.max(np.abs(y_os))) if y_os.size else 0.0)
-
-    peak = float(max(peaks)) if peaks else 0.0
-    if peak <= 0.0:
-        return float("-inf")
-    return float(20.0 * np.log10(peak))
+    return measure_true_peak_dbtp(arr, sr, oversample=oversample_factor)
 
 
 def _measure_tp_dbfs(x: np.ndarray, sr: int) -> float:
@@ -105,6 +102,23 @@ def _apply_clipper(x: np.ndarray, threshold_dbfs: float, mode: str = "soft") ->
     return (t * np.tanh(arr / t)).astype(np.float32)
 
 
+def _clipped_peak_dbfs(peak_dbfs: float, threshold_dbfs: float, mode: str = "soft") -> float:
+    """
+    Sample-peak (dBFS) a la salida de _apply_clipper para una entrada de pico peak_dbfs.
+    """
+    peak = _db_to_lin(float(peak_dbfs))
+    t = _db_to_lin(float(threshold_dbfs))
+    if not np.isfinite(t) or t <= 0.0:
+        return float(peak_dbfs)
+    if mode.lower().startswith("hard"):
+        out = min(peak, t)
+    else:
+        out = t * float(np.tanh(peak / t))
+    if out <= 0.0:
+        return float("-inf")
+    return float(20.0 * np.log10(out))
+
+
 def _clipper_to_target_shave(
     x: np.ndarray,
     target_shave_db: float,
@@ -145,19 +159,19 @@ def _clipper_to_target_shave(
     thr = float(peak_pre - float(target_shave_db))
     thr = max(low, min(high, thr))
 
-    best_y = arr
+    # El pico tras el clipper solo depende del pico previo (|x| -> t*tanh(|x|/t)
+    # o min(|x|, t) son monótonas): la búsqueda del umbral se hace sobre el
+    # escalar y se renderiza una sola vez con el umbral elegido.
     best_thr = thr
     best_shave = 0.0
     best_peak_post = peak_pre
 
     for _ in range(max_iters):
-        y = _apply_clipper(arr, thr, mode=mode)
-        peak_post = _peak_dbfs_sample(y)
+        peak_post = _clipped_peak_dbfs(peak_pre, thr, mode=mode)
         shave = float(peak_pre - peak_post)
 
         # Guardar mejor aproximación
         if abs(shave - target_shave_db) < abs(best_shave - target_shave_db):
-            best_y = y
             best_thr = thr
             best_shave = shave
             best_peak_post = peak_post
@@ -172,12 +186,18 @@ def _clipper_to_target_shave(
             thr = 0.5 * (low + high)
         else:
             # suficientemente cerca
-            best_y = y
             best_thr = thr
             best_shave = shave
             best_peak_post = peak_post
             break
 
+    if best_shave > 0.0:
+        best_y = _apply_clipper(arr, best_thr, mode=mode)
+        best_peak_post = _peak_dbfs_sample(best_y)
+        best_shave = float(peak_pre - best_peak_post)
+    else:
+        best_y = arr
+
     # porcentaje aproximado de muestras afectadas
     t_lin = _db_to_lin(best_thr)
     if np.isfinite(t_lin) and t_lin > 0.0:
@@ -284,7 +304,8 @@ def _enforce_ceiling_with_trim(
     trim_db = target_tp - tp
     lin = 10.0 ** (trim_db / 20.0)
     y = (np.asarray(x, dtype=np.float32) * lin).astype(np.float32)
-    tp2 = _measure_tp_dbfs(y, sr)
+    # Trim lineal: el true-peak baja exactamente trim_db (no hace falta re-medir)
+    tp2 = tp + trim_db
     return y, float(trim_db), float(tp2)
 
 
@@ -326,6 +347,119 @@ def _choose_clipper_shave_db(
     return shave
 
 
+def _select_proxy(y: np.ndarray, sr: int) -> Optional[np.ndarray]:
+    """
+    Proxy representativo de la canción para evaluar candidatos de gain:
+      - las PROXY_LOUDEST_SEGMENTS secciones más fuertes (incluida la del
+        pico máximo, que decide clipper y limiter),
+      - una sección por cada uno de los PROXY_STRATA tramos de la canción
+        (la de nivel mediano del tramo), para conservar la distribución de
+        niveles que mide el LRA.
+    Las secciones se concatenan en orden temporal con fundidos cortos.
+    Devuelve None si la canción no es más larga que el proxy.
+    """
+    arr = np.asarray(y, dtype=np.float32)
+    seg = int(round(PROXY_SEGMENT_S * sr))
+    n_seg = arr.shape[0] // seg if seg > 0 else 0
+    if n_seg <= PROXY_LOUDEST_SEGMENTS + PROXY_STRATA:
+        return None
+
+    frames = arr[: n_seg * seg].reshape((n_seg, seg) + arr.shape[1:])
+    flat = np.abs(frames.reshape(n_seg, -1))
+    energy = np.mean(np.square(flat, dtype=np.float64), axis=1)
+    peak_seg = int(np.argmax(np.max(flat, axis=1)))
+
+    chosen = {peak_seg}
+    for idx in np.argsort(energy)[::-1]:
+        if len(chosen) >= PROXY_LOUDEST_SEGMENTS:
+            break
+        chosen.add(int(idx))
+
+    for stratum in np.array_split(np.arange(n_seg), PROXY_STRATA):
+        candidates = [int(i) for i in stratum if int(i) not in chosen]
+        if not candidates:
+            continue
+        order = sorted(candidates, key=lambda i: energy[i])
+        chosen.add(order[len(order) // 2])
+
+    fade_len = max(1, int(round(PROXY_FADE_S * sr)))
+    ramp = np.linspace(0.0, 1.0, fade_len, dtype=np.float32)
+    if arr.ndim == 2:
+        ramp = ramp[:, None]
+
+    parts = []
+    for idx in sorted(chosen):
+        part = frames[idx].copy()
+        part[:fade_len] *= ramp
+        part[-fade_len:] *= ramp[::-1]
+        parts.append(part)
+    return np.concatenate(parts, axis=0)
+
+
+def _predict_block_powers(
+    full: LoudnessEngine,
+    proxy_in: LoudnessEngine,
+    proxy_out: LoudnessEngine,
+    gain_db: float,
+    short_term: bool = False,
+) -> np.ndarray:
+    """
+    Potencias de bloque (400 ms, o 3 s si short_term) de la canción completa
+    tras la cadena con gain_db.
+
+    Clipper y limiter actúan según el pico: el cambio de nivel (salida -
+    entrada) de cada bloque del proxy se promedia por bins del sample-peak de
+    entrada del bloque y se interpola sobre los picos de la canción completa.
+    """
+    if short_term:
+        full_pw, full_pk = full.short_term_powers, full.short_term_peaks
+        in_pw, in_pk, out_pw = proxy_in.short_term_powers, proxy_in.short_term_peaks, proxy_out.short_term_powers
+    else:
+        full_pw, full_pk = full.block_powers, full.block_peaks
+        in_pw, in_pk, out_pw = proxy_in.block_powers, proxy_in.block_peaks, proxy_out.block_powers
+
+    eps = 1e-20
+    gain_pow = 10.0 ** (float(gain_db) / 10.0)
+    n = min(in_pw.size, out_pw.size)
+    in_db = 10.0 * np.log10(np.maximum(in_pw[:n] * gain_pow, eps))
+    delta_db = 10.0 * np.log10(np.maximum(out_pw[:n], eps)) - in_db
+    key_db = 20.0 * np.log10(np.maximum(in_pk[:n], 1e-10)) + float(gain_db)
+
+    # Bloques casi en silencio: no aportan al modelo (y las puertas los descartan)
+    valid = in_db > -80.0
+    if not np.any(valid):
+        return full_pw * gain_pow
+
+    _, inv = np.unique(np.floor(key_db[valid] / PROXY_TRANSFER_BIN_DB), return_inverse=True)
+    counts = np.bincount(inv)
+    centers = np.bincount(inv, weights=key_db[valid]) / counts
+    mean_delta = np.bincount(inv, weights=delta_db[valid]) / counts
+
+    full_key_db = 20.0 * np.log10(np.maximum(full_pk, 1e-10)) + float(gain_db)
+    return full_pw * gain_pow * 10.0 ** (np.interp(full_key_db, centers, mean_delta) / 10.0)
+
+
+def _render_master_chain(
+    y: np.ndarray,
+    sr: int,
+    gain_db: float,
+    target_ceiling: float,
+    clipper_shave_db: float,
+    clipper_mode: str,
+) -> np.ndarray:
+    """
+    Gain -> (Clipper) -> Limiter, igual que la cadena principal de _process_master.
+    """
+    y_test = _apply_gain_only(y, sr, gain_db)
+    if clipper_shave_db >= 0.5:
+        y_test, _ = _clipper_to_target_shave(
+            y_test,
+            target_shave_db=clipper_shave_db,
+            mode=clipper_mode,
+        )
+    return _apply_limiter_only(y_test, sr, target_ceiling)
+
+
 def _find_optimal_gain_for_lra(
     y: np.ndarray,
     sr: int,
@@ -336,80 +470,82 @@ def _find_optimal_gain_for_lra(
     clipper_shave_db: float,
     clipper_mode: str,
     max_iterations: int = 5,
-    gain_step_db: float = 1.0,
+    pre_lufs_lra: Optional[Tuple[float, float]] = None,
 ) -> Tuple[float, Dict[str, float]]:
     """
-    Busca iterativamente el gain máximo que no destruya el LRA.
+    Busca el gain máximo en [0, initial_gain_db] que no destruya el LRA.
 
     Algoritmo:
-    1. test_gain = initial_gain_db
-    2. Loop hasta max_iterations:
-       a. Aplicar gain al audio
-       b. Aplicar clipper si clipper_shave_db >= 0.5
-       c. Aplicar limiter con target_ceiling
-       d. Medir LUFS y LRA
-       e. Si LRA >= target_lra_min: encontrado, break
-       f. Si no: test_gain -= gain_step_db
-       g. Si test_gain <= 0: usar 0, break
-    3. Return (test_gain, metrics)
+    1. Evaluar initial_gain_db (gain -> clipper -> limiter -> LUFS/LRA);
+       si LRA >= target_lra_min, se usa.
+    2. Evaluar gain 0; si tampoco cumple, se queda el candidato con más LRA.
+    3. Bisección entre 0 (cumple) e initial_gain_db (no cumple) hasta
+       GAIN_SEARCH_TOL_DB o max_iterations evaluaciones más.
+
+    Con pre_lufs_lra (LUFS/LRA de y), los candidatos se
+    renderizan solo sobre _select_proxy(y): el cambio de nivel por bloque que
+    produce la cadena en el proxy (según el pico de entrada) se aplica a las
+    potencias de bloque de la canción completa (LoudnessEngine) y la
+    estimación queda anclada a pre_lufs_lra. La cadena completa se renderiza
+    una única vez después, en _process_master.
 
     Nota: No modifica el audio original, solo simula para encontrar el gain óptimo.
     """
-    test_gain = float(initial_gain_db)
-    best_gain = test_gain
-    best_lra = 0.0
-    best_lufs = float("-inf")
-    iterations = 0
-
-    for i in range(max_iterations):
-        iterations = i + 1
-
-        # Simular cadena de procesamiento
-        y_test = _apply_gain_only(y, sr, test_gain)
-
-        if clipper_shave_db >= 0.5:
-            y_test, _ = _clipper_to_target_shave(
-                y_test,
-                target_shave_db=clipper_shave_db,
-                mode=clipper_mode,
-            )
-
-        y_test = _apply_limiter_only(y_test, sr, target_ceiling)
-
-        test_lufs, test_lra = compute_lufs_and_lra(y_test, sr)
-
-        # Guardar mejor resultado
-        if test_lra >= target_lra_min:
-            best_gain = test_gain
-            best_lra = test_lra
-            best_lufs = test_lufs
-            break
-
-        # Guardar incluso si no cumple (por si ninguno cumple)
-        if test_lra > best_lra:
-            best_gain = test_gain
-            best_lra = test_lra
-            best_lufs = test_lufs
-
-        # Reducir gain para próxima iteración
-        test_gain -= gain_step_db
-        if test_gain <= 0:
-            test_gain = 0.0
-            # Una última prueba con gain 0
-            y_test = _apply_limiter_only(y, sr, target_ceiling)
-            test_lufs, test_lra = compute_lufs_and_lra(y_test, sr)
-            if test_lra > best_lra:
-                best_gain = 0.0
-                best_lra = test_lra
-                best_lufs = test_lufs
-            break
-
-    return best_gain, {
+    proxy = _select_proxy(y, sr) if pre_lufs_lra is not None else None
+    if proxy is not None:
+        full_engine = LoudnessEngine(y, sr)
+        proxy_engine = LoudnessEngine(proxy, sr)
+        own_lufs, own_lra = full_engine.lufs_and_lra()
+        if not (np.isfinite(own_lufs) and np.isfinite(pre_lufs_lra[0])):
+            proxy = None
+
+    audio = proxy if proxy is not None else y
+    evaluated: Dict[float, Tuple[float, float]] = {}
+
+    def _evaluate(gain_db: float) -> Tuple[float, float]:
+        gain_db = round(float(gain_db), 4)
+        if gain_db not in evaluated:
+            y_test = _render_master_chain(audio, sr, gain_db, target_ceiling, clipper_shave_db, clipper_mode)
+            if proxy is None:
+                test_lufs, test_lra = compute_lufs_and_lra(y_test, sr)
+            else:
+                out_engine = LoudnessEngine(y_test, sr)
+                pred_lufs, pred_lra = gated_lufs_and_lra(
+                    _predict_block_powers(full_engine, proxy_engine, out_engine, gain_db),
+                    _predict_block_powers(full_engine, proxy_engine, out_engine, gain_db, short_term=True),
+                )
+                test_lufs = float(pre_lufs_lra[0]) + (pred_lufs - own_lufs)
+                test_lra = max(0.0, float(pre_lufs_lra[1]) + (pred_lra - own_lra))
+            evaluated[gain_db] = (float(test_lufs), float(test_lra))
+        return evaluated[gain_db]
+
+    hi = max(0.0, float(initial_gain_db))
+    best_gain = hi
+    if _evaluate(hi)[1] < target_lra_min:
+        lo = 0.0
+        if _evaluate(lo)[1] < target_lra_min:
+            # Ninguno cumple: el de más LRA
+            best_gain = max(evaluated, key=lambda g: evaluated[g][1])
+        else:
+            for _ in range(max_iterations):
+                if hi - lo <= GAIN_SEARCH_TOL_DB:
+                    break
+                mid = 0.5 * (lo + hi)
+                if _evaluate(mid)[1] >= target_lra_min:
+                    lo = mid
+                else:
+                    hi = mid
+            best_gain = lo
+
+    best_lufs, best_lra = evaluated[round(best_gain, 4)]
+    return float(best_gain), {
         "lufs_achieved": float(best_lufs),
         "lra_achieved": float(best_lra),
-        "iterations_used": int(iterations),
+        "iterations_used": int(len(evaluated)),
         "lra_protected": bool(best_gain < initial_gain_db),
         "gain_reduction_db": float(initial_gain_db - best_gain),
+        "proxy_used": bool(proxy is not None),
+        "proxy_seconds": float(proxy.shape[0] / sr) if proxy is not None else 0.0,
     }
 
 
@@ -425,7 +561,7 @@ def _process_master(
     max_clipper_shave_db: float,
     clipper_mode: str,
     clipper_reco_shave_db: float,
-) -> Dict[str, float]:
+) -> Dict[str, Optional[float]]:
     """
     Master robusto con clipper pre-limiter:
       - Pre métricas
@@ -502,6 +638,7 @@ def _process_master(
     lra_was_protected = False
     lra_protection_gain_reduction_db = 0.0
     initial_pre_gain_db = float(pre_gain_db)
+    lra_metrics: Dict[str, float] = {}
 
     if pre_gain_db > 2.0 and target_lra_min > 0:
         optimal_gain, lra_metrics = _find_optimal_gain_for_lra(
@@ -514,7 +651,7 @@ def _process_master(
             clipper_shave_db=clipper_target_shave_db,
             clipper_mode=clipper_mode,
             max_iterations=5,
-            gain_step_db=1.0,
+            pre_lufs_lra=(pre_lufs, pre_lra),
         )
 
         if optimal_gain < pre_gain_db:
@@ -570,6 +707,20 @@ def _process_master(
     sample_peak_post_limiter = _peak_dbfs_sample(y_lim)
     post_lim_lufs, post_lim_lra = compute_lufs_and_lra(y_lim, sr)
 
+    # Precisión de la estimación de la búsqueda (proxy o completa) frente al render final
+    # None si no hubo búsqueda: el JSON del master y del informe debe seguir siendo JSON estricto.
+    search_lufs_error_db: Optional[float] = None
+    search_lra_error_lu: Optional[float] = None
+    if lra_metrics:
+        search_lufs_error_db = float(lra_metrics["lufs_achieved"] - post_lim_lufs)
+        search_lra_error_lu = float(lra_metrics["lra_achieved"] - post_lim_lra)
+        logger.logger.info(
+            f"[S9_MASTER_GENERIC] Búsqueda de gain ({'proxy' if lra_metrics['proxy_used'] else 'completa'}, "
+            f"{int(lra_metrics['iterations_used'])} evaluaciones): estimado LUFS={lra_metrics['lufs_achieved']:.2f}, "
+            f"LRA={lra_metrics['lra_achieved']:.2f} | error LUFS={search_lufs_error_db:+.2f} dB, "
+            f"LRA={search_lra_error_lu:+.2f} LU."
+        )
+
     # Estimación de GR del limiter a partir de TP (después del clipper)
     limiter_gr_est = max(0.0, float(tp_post_clip - tp_post_limiter))
 
@@ -604,7 +755,13 @@ def _process_master(
     y_final, trim_db, post_tp = _enforce_ceiling_with_trim(
         y_ms, sr, target_ceiling, safety_db=0.3
     )
-    post_lufs, post_lra = compute_lufs_and_lra(y_final, sr)
+    # El trim es lineal: LUFS/LRA desde las potencias de bloque de y_ms
+    if trim_db != 0.0:
+        post_lufs, post_lra = LoudnessEngine(y_ms, sr).lufs_and_lra(
+            trim_db, reference=(post_lufs_pretrim, post_lra_pretrim)
+        )
+    else:
+        post_lufs, post_lra = post_lufs_pretrim, post_lra_pretrim
     post_sample_peak = _peak_dbfs_sample(y_final)
 
     if trim_db != 0.0:
@@ -629,7 +786,7 @@ def _process_master(
     # ------------------------------------------------------------
     # 5) Escritura FLOAT para evitar clip por PCM
     # ------------------------------------------------------------
-    sf.write(full_song_path, y_final, sr, subtype="FLOAT")
+    write_audio_atomic(full_song_path, y_final, sr, subtype="FLOAT")
     logger.logger.info(f"[S9_MASTER_GENERIC] Master reescrito (FLOAT) en {full_song_path}.")
 
     return {
@@ -641,6 +798,12 @@ def _process_master(
 
         "lra_protection_applied": float(1.0 if lra_was_protected else 0.0),
         "lra_protection_gain_reduction_db": float(lra_protection_gain_reduction_db),
+        "gain_search_ran": float(1.0 if lra_metrics else 0.0),
+        "gain_search_proxy_used": float(1.0 if lra_metrics.get("proxy_used") else 0.0),
+        "gain_search_proxy_seconds": float(lra_metrics.get("proxy_seconds", 0.0)),
+        "gain_search_evaluations": float(lra_metrics.get("iterations_used", 0)),
+        "gain_search_lufs_error_db": search_lufs_error_db,
+        "gain_search_lra_error_lu": search_lra_error_lu,
 
         "clipper_enabled": float(1.0 if clipper_target_shave_db >= 0.5 else 0.0),
         "clipper_target_shave_db": float(clipper_target_shave_db),
@@ -781,6 +944,16 @@ def main() -> None:
                     "sp_pre_clip_dbfs": result["sp_pre_clip_dbfs"],
                     "sp_post_clip_dbfs": result["sp_post_clip_dbfs"],
                 },
+                "gain_search": {
+                    "ran": bool(result["gain_search_ran"] >= 0.5),
+                    "proxy_used": bool(result["gain_search_proxy_used"] >= 0.5),
+                    "proxy_seconds": result["gain_search_proxy_seconds"],
+                    "evaluations": int(result["gain_search_evaluations"]),
+                    "lra_protection_applied": bool(result["lra_protection_applied"] >= 0.5),
+                    "lra_protection_gain_reduction_db": result["lra_protection_gain_reduction_db"],
+                    "lufs_error_db": result["gain_search_lufs_error_db"],
+                    "lra_error_lu": result["gain_search_lra_error_lu"],
+                },
                 "post_limiter": {
                     "true_peak_dbtp": result["post_true_peak_lim_dbtp"],
                     "sample_peak_dbfs": result["post_sample_peak_lim_dbfs"],
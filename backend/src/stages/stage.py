@@ -7,17 +7,25 @@ import json
 import time
 import importlib.util
 import datetime
+import threading
 import traceback
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 from pathlib import Path
 from typing import List, Optional, Dict
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 # Agregar backend/src al path para importar context
 BASE_DIR = Path(__file__).resolve().parents[1]  # .../src
 if str(BASE_DIR) not in sys.path:
     sys.path.insert(0, str(BASE_DIR))
 
 try:
-    from context import PipelineContext
+    from context import PipelineContext, activate_context, get_active_context
 except ImportError:
     # Fallback por si acaso
     # We can't use logger here if imports are broken, but try anyway as it is imported above
@@ -26,9 +34,15 @@ except ImportError:
     except:
         print("[stage] Warning: Could not import PipelineContext from context")
     PipelineContext = None
+    activate_context = None
+    get_active_context = None
 
 from utils.plot_utils import generate_comparison_data
 from utils.diff_utils import compute_analysis_diff
+from utils.copy_stems import link_or_copy
+from utils import stage_cache
+from utils import mixdown_stems
+from utils.phase_metrics import PhaseRecorder, sum_phases
 
 
 
@@ -43,17 +57,25 @@ MIXDOWN_STAGES = {
 }
 
 # Secuencia activa de contratos
-ACTIVE_CONTRACT_SEQUENCE: Optional[List[str]] = None
 TIMINGS_FILENAME = "pipeline_timings.json"
 
 # Cache de módulos para evitar re-importación constante
 _MODULE_CACHE: Dict[Path, object] = {}
+# io declarado por contrato en contracts.json (se carga una vez)
+_CONTRACT_IO_CACHE: Optional[Dict[str, object]] = None
 
 def _get_job_temp_root(create: bool = False) -> Path:
     """
-    Raiz temporal del job en disco (respeta MIX_TEMP_ROOT y MIX_JOB_ID).
-    Legacy fallback si no se pasa contexto.
+    Raiz temporal del job en disco: temp_root del contexto activo o, en CLI,
+    MIX_TEMP_ROOT y MIX_JOB_ID. Legacy fallback si no se pasa contexto.
     """
+    active = get_active_context() if get_active_context is not None else None
+    if active is not None and active.temp_root:
+        base = Path(active.temp_root)
+        if create:
+            base.mkdir(parents=True, exist_ok=True)
+        return base
+
     temp_root_env = os.environ.get("MIX_TEMP_ROOT")
     job_id_env = os.environ.get("MIX_JOB_ID")
     project_root = Path(__file__).resolve().parents[2]  # .../backend
@@ -76,9 +98,19 @@ def _get_job_temp_root(create: bool = False) -> Path:
     return base
 
 
-def _record_stage_timing(stage_id: str, duration_sec: float, context: Optional[PipelineContext] = None) -> None:
+def _record_stage_timing(
+    stage_id: str,
+    duration_sec: float,
+    context: Optional[PipelineContext] = None,
+    phases: Optional[Dict[str, Dict]] = None,
+    cached: bool = False,
+) -> None:
     """
     Guarda/actualiza un JSON con la duracion por etapa y el total acumulado.
+    Si se pasa phases, se guarda también el desglose por fase
+    (wall_sec, process_cpu_sec, peak_rss_mb, rss_delta_mb, process_read_bytes,
+    process_write_bytes)
+    y los totales por fase de todo el job en "phase_totals".
     """
     if context and context.temp_root:
         job_root = context.temp_root
@@ -89,6 +121,32 @@ def _record_stage_timing(stage_id: str, duration_sec: float, context: Optional[P
 
     timings_path = job_root / TIMINGS_FILENAME
 
+    # Los contratos de una wave paralela terminan a la vez: serializamos el read-modify-write.
+    with _timings_lock(job_root):
+        _update_timings_file(timings_path, stage_id, duration_sec, phases, cached)
+
+
+@contextmanager
+def _timings_lock(job_root: Path):
+    lock_path = job_root / f".{TIMINGS_FILENAME}.lock"
+    if fcntl is None:
+        yield
+        return
+    with lock_path.open("a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _update_timings_file(
+    timings_path: Path,
+    stage_id: str,
+    duration_sec: float,
+    phases: Optional[Dict[str, Dict]] = None,
+    cached: bool = False,
+) -> None:
     data: dict = {"stages": [], "total_duration_sec": 0.0}
     if timings_path.exists():
         try:
@@ -104,13 +162,16 @@ def _record_stage_timing(stage_id: str, duration_sec: float, context: Optional[P
         stages = []
 
     stages = [s for s in stages if s.get("contract_id") != stage_id]
-    stages.append(
-        {"contract_id": stage_id, "duration_sec": round(float(duration_sec), 3)}
-    )
+    entry = {"contract_id": stage_id, "duration_sec": round(float(duration_sec), 3)}
+    if phases is not None:
+        entry["phases"] = phases
+        entry["cached"] = bool(cached)
+    stages.append(entry)
     data["stages"] = stages
     data["total_duration_sec"] = round(
         sum(s.get("duration_sec", 0.0) for s in stages), 3
     )
+    data["phase_totals"] = sum_phases(stages)
     data["generated_at_utc"] = (
         datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z"
     )
@@ -119,12 +180,40 @@ def _record_stage_timing(stage_id: str, duration_sec: float, context: Optional[P
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def set_active_contract_sequence(ordered_contract_ids: Optional[List[str]]) -> None:
-    global ACTIVE_CONTRACT_SEQUENCE
-    if ordered_contract_ids:
-        ACTIVE_CONTRACT_SEQUENCE = list(ordered_contract_ids)
-    else:
-        ACTIVE_CONTRACT_SEQUENCE = None
+# argv del script legacy que se ejecuta en el hilo/tarea actual (ver _ContextArgv).
+_SCRIPT_ARGV: ContextVar[Optional[List[str]]] = ContextVar("mix_script_argv", default=None)
+_IMPORT_LOCK = threading.RLock()
+
+
+class _ContextArgv(list):
+    """
+    Sustituto de sys.argv para los scripts legacy con main(): cada hilo ve los
+    argumentos de SU script (_SCRIPT_ARGV) en lugar de un sys.argv global que
+    otro job podría estar reescribiendo. Fuera de _run_script se comporta como
+    el sys.argv original.
+    """
+
+    def _current(self) -> List[str]:
+        override = _SCRIPT_ARGV.get()
+        return override if override is not None else list.__getitem__(self, slice(None))
+
+    def __getitem__(self, index):
+        return self._current()[index]
+
+    def __len__(self) -> int:
+        return len(self._current())
+
+    def __iter__(self):
+        return iter(self._current())
+
+    def __contains__(self, item) -> bool:
+        return item in self._current()
+
+    def __eq__(self, other) -> bool:
+        return self._current() == other
+
+    def __repr__(self) -> str:
+        return repr(self._current())
 
 
 def _import_module(script_path: Path):
@@ -134,6 +223,13 @@ def _import_module(script_path: Path):
     if script_path in _MODULE_CACHE:
         return _MODULE_CACHE[script_path]
 
+    with _IMPORT_LOCK:
+        if script_path in _MODULE_CACHE:
+            return _MODULE_CACHE[script_path]
+        return _load_module(script_path)
+
+
+def _load_module(script_path: Path):
     # Nombre único basado en carpeta y archivo para evitar choques en sys.modules.
     module_name = f"pipeline.{script_path.parent.name}.{script_path.stem}"
 
@@ -179,10 +275,11 @@ def _run_script(script_path: Path, context: PipelineContext, *args: str) -> int:
             traceback.print_exc()
             return 1
 
-    # 2. Fallback a main() con sys.argv
-    old_argv = sys.argv[:]
+    # 2. Fallback a main() con sys.argv (local al hilo/tarea, ver _ContextArgv)
+    if not isinstance(sys.argv, _ContextArgv):
+        sys.argv = _ContextArgv(sys.argv)
     # args son strings adicionales. sys.argv[0] es el nombre del script.
-    sys.argv = [script_path.name, *args]
+    argv_token = _SCRIPT_ARGV.set([script_path.name, *args])
 
     try:
         main_fn = getattr(module, "main", None)
@@ -202,18 +299,26 @@ def _run_script(script_path: Path, context: PipelineContext, *args: str) -> int:
         traceback.print_exc()
         return 1
     finally:
-        sys.argv = old_argv
+        _SCRIPT_ARGV.reset(argv_token)
 
 
-def _get_next_contract_id(base_dir: Path, current_contract_id: str) -> str | None:
-    if ACTIVE_CONTRACT_SEQUENCE:
+def _get_next_contract_id(
+    base_dir: Path,
+    current_contract_id: str,
+    sequence: Optional[List[str]] = None,
+) -> str | None:
+    """
+    Siguiente contrato tras current_contract_id: según la secuencia efectiva
+    del job (context.contract_sequence) o, sin ella, el orden de contracts.json.
+    """
+    if sequence:
         try:
-            idx = ACTIVE_CONTRACT_SEQUENCE.index(current_contract_id)
+            idx = sequence.index(current_contract_id)
         except ValueError:
             pass
         else:
-            if idx + 1 < len(ACTIVE_CONTRACT_SEQUENCE):
-                return ACTIVE_CONTRACT_SEQUENCE[idx + 1]
+            if idx + 1 < len(sequence):
+                return sequence[idx + 1]
             return None
 
     contracts_path = base_dir / "struct" / "contracts.json"
@@ -236,6 +341,115 @@ def _get_next_contract_id(base_dir: Path, current_contract_id: str) -> str | Non
     return None
 
 
+def _contract_io(base_dir: Path, contract_id: str) -> Optional[dict]:
+    """
+    Declaración io del contrato en contracts.json (None si no la tiene).
+    """
+    global _CONTRACT_IO_CACHE
+    if _CONTRACT_IO_CACHE is None:
+        contracts_path = base_dir / "struct" / "contracts.json"
+        with contracts_path.open("r", encoding="utf-8") as f:
+            contracts = json.load(f)
+        _CONTRACT_IO_CACHE = {}
+        for stage_data in contracts.get("stages", {}).values():
+            for c in stage_data.get("contracts", []) or []:
+                if c.get("id"):
+                    _CONTRACT_IO_CACHE[c["id"]] = c.get("io")
+
+    io = _CONTRACT_IO_CACHE.get(contract_id)
+    return io if isinstance(io, dict) else None
+
+
+def _contract_reads_mixbus(base_dir: Path, contract_id: str) -> bool:
+    """
+    True si el contrato declara que lee el mixbus (io.reads con "mixbus" o "*").
+    Sin declaración io se asume que sí (comportamiento conservador).
+    """
+    io = _contract_io(base_dir, contract_id)
+    if io is None:
+        return True
+    reads = io.get("reads", []) or []
+    return "mixbus" in reads or "*" in reads
+
+
+def _contract_writes_session_only(base_dir: Path, contract_id: str) -> bool:
+    """
+    True si el contrato solo declara escrituras de sesión (io.writes todo
+    "session:..."), p.ej. S1_KEY_DETECTION: no toca stems ni mixbus.
+    Sin declaración io se asume que no.
+    """
+    io = _contract_io(base_dir, contract_id)
+    if io is None:
+        return False
+    writes = io.get("writes", []) or []
+    return bool(writes) and all(str(w).startswith("session:") for w in writes)
+
+
+def _stem_fingerprints(stage_dir: Path) -> Dict[str, tuple]:
+    """
+    (inode, size, mtime_ns) de cada stem. Los writers son atómicos, así que un
+    stem modificado por el stage cambia de inodo.
+    """
+    prints: Dict[str, tuple] = {}
+    if not stage_dir.exists():
+        return prints
+    for p in stage_dir.glob("*.wav"):
+        if p.name.lower() in ("full_song.wav", "full_song_pre.wav"):
+            continue
+        st = p.stat()
+        prints[p.name] = (st.st_ino, st.st_size, st.st_mtime_ns)
+    return prints
+
+
+def _modified_stems(before: Dict[str, tuple], after: Dict[str, tuple]) -> List[str]:
+    return sorted(name for name, fp in after.items() if before.get(name) != fp)
+
+
+def _script_uses_stem_bus(script_path: Path) -> bool:
+    """
+    True si el script declara USES_STEM_BUS = True: un stage que lee y escribe
+    los stems únicamente a través de context.stem_bus, o un análisis que los
+    lee con sf_read_limited/stem_bus_buffer (sirven los buffers en memoria).
+    """
+    module = _import_module(script_path)
+    return bool(module is not None and getattr(module, "USES_STEM_BUS", False))
+
+
+def _contract_reads_stems(base_dir: Path, contract_id: str) -> bool:
+    """
+    True si el contrato declara que lee stems (io.reads con "stems:..." o "*").
+    Sin declaración io se asume que sí.
+    """
+    io = _contract_io(base_dir, contract_id)
+    if io is None:
+        return True
+    reads = io.get("reads", []) or []
+    return any(r == "*" or str(r).startswith("stems") for r in reads)
+
+
+def _reads_stems_from_disk(script_path: Path, base_dir: Path, contract_id: str) -> bool:
+    """
+    True si el script va a leer stems de disco: el contrato lee stems y el
+    script no declara USES_STEM_BUS. Antes de él hay que volcar el bus.
+    """
+    return _contract_reads_stems(base_dir, contract_id) and not _script_uses_stem_bus(script_path)
+
+
+def _checkpoint_stem_bus(context: PipelineContext) -> None:
+    """
+    Vuelca los stems pendientes del bus antes de un consumidor que lee de disco
+    (y ejecuta los guardados de caché diferidos).
+    """
+    bus = getattr(context, "stem_bus", None)
+    if bus is None:
+        return
+    try:
+        bus.flush()
+    except Exception as exc:
+        logger.logger.warning(f"[stage] No se pudo volcar el stem bus: {exc}")
+        bus.invalidate()
+
+
 def _ensure_analysis_file(stage_id: str, analysis_script: Path, context: PipelineContext) -> None:
     """
     Garantiza que exista analysis_<stage_id>.json.
@@ -250,6 +464,8 @@ def _ensure_analysis_file(stage_id: str, analysis_script: Path, context: Pipelin
         return
 
     logger.logger.warning(f"[stage] analysis_{stage_id}.json no encontrado, reintentando analisis...")
+    if not _script_uses_stem_bus(analysis_script):
+        _checkpoint_stem_bus(context)
     # Pasamos stage_id como argumento por si es legacy, aunque context ya lo tiene
     _run_script(analysis_script, context, stage_id)
 
@@ -271,10 +487,13 @@ def _load_analysis_json(context: PipelineContext, stage_id: str) -> Dict:
     return {}
 
 
-def run_stage(stage_id: str, context: Optional[PipelineContext] = None) -> None:
+def run_stage(stage_id: str, context: Optional[PipelineContext] = None, handoff: bool = True) -> None:
     """
     Ejecuta el análisis, el procesamiento y la validación de un contrato.
     Ahora acepta un contexto opcional.
+
+    handoff=False no copia los stems al siguiente contrato (lo hace el scheduler
+    al fusionar una wave de contratos paralelos).
     """
     base_dir = Path(__file__).resolve().parent.parent  # .../src
 
@@ -287,40 +506,97 @@ def run_stage(stage_id: str, context: Optional[PipelineContext] = None) -> None:
         # Actualizamos el stage_id del contexto para este run
         context.stage_id = stage_id
 
+    # Los helpers legacy (get_temp_dir, main() de los scripts) resuelven las
+    # rutas del job desde el contexto activo de este hilo, no desde os.environ.
+    with activate_context(context) if activate_context is not None else nullcontext():
+        _run_stage_in_context(stage_id, context, base_dir, handoff)
+
+
+def _run_stage_in_context(stage_id: str, context: PipelineContext, base_dir: Path, handoff: bool) -> None:
     analysis_script = base_dir / "analysis" / f"{stage_id}.py"
     stage_script = base_dir / "stages" / f"{stage_id}.py"
     check_script = base_dir / "utils" / "check_metrics_limits.py"
-    mixdown_script = base_dir / "utils" / "mixdown_stems.py"
-    copy_script = base_dir / "utils" / "copy_stems.py"
 
     logger.print_header(f"Running stage: {stage_id}", color="\033[34m")
     stage_start = time.perf_counter()
+    # Desglose por fase (wall/CPU/RSS/IO) para pipeline_timings.json
+    phases = PhaseRecorder()
+
+    stage_dir = context.get_stage_dir()
+    stem_bus = getattr(context, "stem_bus", None)
+    if stem_bus is not None:
+        stem_bus.bind(stage_id, stage_dir)
 
     # Mixbus/master stages expect full_song.wav to be chained from the previous stage.
 
     # 1) Análisis previo (Legacy args: stage_id)
-    _run_script(analysis_script, context, stage_id)
-    pre_analysis = _load_analysis_json(context, stage_id)
+    # Los stems pendientes del bus siguen en memoria salvo que el análisis
+    # los lea de disco (no declara USES_STEM_BUS).
+    if _reads_stems_from_disk(analysis_script, base_dir, stage_id):
+        with phases.phase("stem_bus_flush"):
+            _checkpoint_stem_bus(context)
+
+    # Contratos de stems que leen el mixbus (p.ej. BPM desde full_song.wav): render bajo demanda.
+    if stage_id not in MIXDOWN_STAGES and _contract_reads_mixbus(base_dir, stage_id):
+        with phases.phase("mixdown"):
+            mixdown_stems.ensure_mixdown(context, stage_id)
+
+    # 0) Caché de resultados: mismas entradas + contrato + código => mismas salidas.
+    with phases.phase("cache"):
+        if stem_bus is not None and stem_bus.is_dirty():
+            # La carpeta no refleja los stems reales: sin clave de caché.
+            logger.logger.info(f"[stage] {stage_id}: stems pendientes en el stem bus; no se usa la caché.")
+            cache_key = None
+        else:
+            cache_key = _compute_cache_key(stage_id, stage_dir, context)
+        cached = stage_cache.lookup(cache_key)
+        restored = cached is not None and stage_cache.restore(cache_key, cached, stage_dir)
+    if restored:
+        logger.logger.info(f"[stage] {stage_id}: resultado restaurado de caché ({cache_key[:12]}).")
+        if stem_bus is not None:
+            stem_bus.discard()
+        logger.log_stage_result(stage_id, bool(cached.get("success", True)))
+        _finish_stage(stage_id, context, base_dir, analysis_script, stage_start, handoff, phases, cached=True)
+        return
+
+    with phases.phase("pre_analysis"):
+        _run_script(analysis_script, context, stage_id)
+        pre_analysis = _load_analysis_json(context, stage_id)
 
     # Capture Pre Audio for Mixdown Stages
     pre_audio_path = None
-    stage_dir = context.get_stage_dir()
     if stage_id in MIXDOWN_STAGES:
         full_song = stage_dir / "full_song.wav"
         if full_song.exists():
             pre_audio_path = stage_dir / "full_song_pre.wav"
-            import shutil
-            shutil.copy2(full_song, pre_audio_path)
+            # Los writers reemplazan full_song.wav atómicamente, así que basta con enlazarlo.
+            link_or_copy(full_song, pre_audio_path)
 
     # 2) Procesamiento principal (Legacy args: stage_id)
-    _run_script(stage_script, context, stage_id)
+    if _reads_stems_from_disk(stage_script, base_dir, stage_id):
+        with phases.phase("stem_bus_flush"):
+            _checkpoint_stem_bus(context)
+    stems_before = _stem_fingerprints(stage_dir)
+    versions_before = stem_bus.versions() if stem_bus is not None else {}
+    with phases.phase("processing"):
+        _run_script(stage_script, context, stage_id)
+
+    if stem_bus is not None and not _script_uses_stem_bus(stage_script):
+        # El stage escribe directamente en disco: los stems que ha reescrito o
+        # borrado ya no valen en memoria; el resto sigue en el bus.
+        stems_disk = _stem_fingerprints(stage_dir)
+        stem_bus.drop(
+            name for name in set(stems_before) | set(stems_disk)
+            if stems_before.get(name) != stems_disk.get(name)
+        )
 
     # Generate comparison data when pre-stage audio is available
     if pre_audio_path and pre_audio_path.exists():
         post_audio_path = stage_dir / "full_song.wav"
         if post_audio_path.exists():
-             generate_comparison_data(pre_audio_path, post_audio_path, stage_dir, stage_id)
-             # S11 reads the json left in the stage folder.
+            with phases.phase("comparison_data"):
+                generate_comparison_data(pre_audio_path, post_audio_path, stage_dir, stage_id)
+            # S11 reads the json left in the stage folder.
 
         # Cleanup pre file
         try:
@@ -329,8 +605,32 @@ def run_stage(stage_id: str, context: Optional[PipelineContext] = None) -> None:
             pass
 
     # 3) Análisis posterior (Legacy args: stage_id)
-    _run_script(analysis_script, context, stage_id)
-    post_analysis = _load_analysis_json(context, stage_id)
+    # Un análisis que lee del bus (USES_STEM_BUS) consume los buffers en memoria.
+    if _reads_stems_from_disk(analysis_script, base_dir, stage_id):
+        with phases.phase("stem_bus_flush"):
+            _checkpoint_stem_bus(context)
+    # Los análisis por stem reutilizan las features de los stems que el stage no ha tocado.
+    stems_after = _stem_fingerprints(stage_dir)
+    versions_after = stem_bus.versions() if stem_bus is not None else {}
+    # Stems que el stage ha dejado pendientes en el bus (versión nueva y dirty).
+    put_in_bus = {
+        name for name in (stem_bus.dirty_names() if stem_bus is not None else [])
+        if versions_before.get(name) != versions_after.get(name)
+    }
+    modified = sorted(set(_modified_stems(stems_before, stems_after)) | put_in_bus)
+    logger.logger.info(
+        f"[stage] {stage_id}: {len(modified)}/{len(stems_before)} stems modificados"
+        + (f" ({', '.join(modified)})" if modified else "")
+    )
+    if pre_analysis and not modified and stems_after == stems_before and _contract_writes_session_only(base_dir, stage_id):
+        # Contrato de solo análisis con los stems intactos: el post-análisis
+        # daría exactamente el pre-análisis
+        logger.logger.info(f"[stage] {stage_id}: sin cambios de audio; se reutiliza el pre-análisis.")
+        post_analysis = pre_analysis
+    else:
+        with phases.phase("post_analysis"):
+            _run_script(analysis_script, context, stage_id)
+            post_analysis = _load_analysis_json(context, stage_id)
 
     # Log Comparison
     if pre_analysis and post_analysis:
@@ -348,20 +648,76 @@ def run_stage(stage_id: str, context: Optional[PipelineContext] = None) -> None:
     # 4) Validación (Legacy args: stage_id)
     logger.logger.info("") # Blank line
     logger.print_section("Metrics Limits Check", color="\033[36m")
-    ret = _run_script(check_script, context, stage_id)
+    with phases.phase("check_metrics"):
+        ret = _run_script(check_script, context, stage_id)
     success = (ret == 0)
 
     logger.log_stage_result(stage_id, success)
 
     # Post-Mixdown
     if stage_id not in MIXDOWN_STAGES:
-        _run_script(mixdown_script, context, stage_id)
+        # Mixdown perezoso: full_song.wav solo se renderiza si el siguiente
+        # contrato lee el mixbus; el preview del contrato lo renderiza el
+        # servidor bajo demanda (mixdown_stems.ensure_mixdown).
+        with phases.phase("mixdown"):
+            next_for_mix = _get_next_contract_id(base_dir, stage_id, context.contract_sequence)
+            if next_for_mix is None or _contract_reads_mixbus(base_dir, next_for_mix):
+                mixdown_stems.ensure_mixdown(context, stage_id)
+            else:
+                # Nadie escucha este mixbus antes de que cambien los stems otra vez.
+                mixdown_stems.drop_stale_mixdown(stage_dir)
+                logger.logger.info(f"[stage] {stage_id}: mixdown omitido ({next_for_mix} solo lee stems).")
+
+    if cache_key is not None:
+        def _store() -> None:
+            try:
+                stage_cache.store(cache_key, stage_id, stage_dir, success)
+            except Exception as e:
+                logger.logger.warning(f"[stage] No se pudo guardar {stage_id} en caché: {e}")
+
+        with phases.phase("cache"):
+            if stem_bus is not None:
+                # Con stems pendientes la carpeta se completa en el próximo volcado.
+                stem_bus.defer(stage_dir, _store)
+            else:
+                _store()
+
+    _finish_stage(stage_id, context, base_dir, analysis_script, stage_start, handoff, phases)
+
+
+def _compute_cache_key(stage_id: str, stage_dir: Path, context: PipelineContext) -> Optional[str]:
+    job_root = context.temp_root or _get_job_temp_root(create=False)
+    try:
+        return stage_cache.compute_stage_key(stage_id, stage_dir, Path(job_root))
+    except Exception as e:
+        logger.logger.warning(f"[stage] No se pudo calcular la clave de caché de {stage_id}: {e}")
+        return None
+
+
+def _finish_stage(
+    stage_id: str,
+    context: PipelineContext,
+    base_dir: Path,
+    analysis_script: Path,
+    stage_start: float,
+    handoff: bool,
+    phases: PhaseRecorder,
+    cached: bool = False,
+) -> None:
+    """
+    Cierre común de un contrato (ejecutado o restaurado de caché):
+    copia al siguiente contrato, análisis garantizado y timings.
+    """
+    copy_script = base_dir / "utils" / "copy_stems.py"
 
     # Copiar stems
-    next_contract_id = _get_next_contract_id(base_dir, stage_id)
+    next_contract_id = (
+        _get_next_contract_id(base_dir, stage_id, context.contract_sequence) if handoff else None
+    )
     if next_contract_id is not None:
         # Copy script toma src_stage, dst_stage
-        _run_script(copy_script, context, stage_id, next_contract_id)
+        with phases.phase("copy"):
+            _run_script(copy_script, context, stage_id, next_contract_id)
 
     # --- Generate Images ---
     # Attempt to generate images if we have a "pre" and "post" audio.
@@ -375,11 +731,11 @@ def run_stage(stage_id: str, context: Optional[PipelineContext] = None) -> None:
     _ensure_analysis_file(stage_id, analysis_script, context)
 
     duration_sec = time.perf_counter() - stage_start
-    _record_stage_timing(stage_id, duration_sec, context)
+    _record_stage_timing(stage_id, duration_sec, context, phases=phases.as_dict(), cached=cached)
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        logger.logger.info("Uso: python stage.py <STAGE_ID>")
+        logger.logger.info("Uso: python stage.py <STAGE_ID> [--no-handoff]")
     else:
-        run_stage(sys.argv[1])
+        run_stage(sys.argv[1], handoff="--no-handoff" not in sys.argv[2:])
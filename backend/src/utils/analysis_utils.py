@@ -13,7 +13,8 @@ import math
 import traceback
 import scipy.signal
 
-from utils.loudness_utils import compute_lufs_and_lra
+from utils.loudness_utils import ShortTermLoudness, compute_lufs_and_lra
+from utils.stem_bus import active_stem_bus
 
 # Límite global de segundos para análisis (se puede sobrescribir con MIX_ANALYSIS_MAX_SECONDS)
 # Solo se aplica en helpers de análisis; NO se toca el comportamiento global de soundfile.read
@@ -55,12 +56,34 @@ def load_contract(contract_id: str) -> Dict[str, Any]:
 # Gestión de carpetas temporales (single-job vs multi-job)
 # ---------------------------------------------------------------------
 
+def _active_job_root() -> Optional[Path]:
+    """
+    temp_root del PipelineContext activo en este hilo/tarea (si lo hay).
+    """
+    try:
+        from context import get_active_context
+    except ImportError:
+        return None
+    ctx = get_active_context()
+    if ctx is not None and ctx.temp_root:
+        return Path(ctx.temp_root)
+    return None
+
+
 def _get_job_temp_root(create: bool = False) -> Path:
     """
     Devuelve la raíz temporal del job en disco.
-    Usa backend/temp como base por defecto; si MIX_TEMP_ROOT está definido se toma como base.
-    Si hay MIX_JOB_ID y la ruta base no lo incluye, se añade como subcarpeta.
+    Si hay un PipelineContext activo (pipeline/Celery) se usa su temp_root.
+    Si no (CLI), usa backend/temp como base por defecto; si MIX_TEMP_ROOT está
+    definido se toma como base. Si hay MIX_JOB_ID y la ruta base no lo incluye,
+    se añade como subcarpeta.
     """
+    active_root = _active_job_root()
+    if active_root is not None:
+        if create:
+            active_root.mkdir(parents=True, exist_ok=True)
+        return active_root
+
     temp_root_env = os.getenv("MIX_TEMP_ROOT")
     job_id_env = os.getenv("MIX_JOB_ID")
 
@@ -94,10 +117,35 @@ def get_temp_dir(contract_id: str, create: bool = False) -> Path:
 # Utilidades de audio
 # ---------------------------------------------------------------------
 
+def stem_bus_buffer(path: Path):
+    """
+    Buffer del stem bus del PipelineContext activo para `path` (StemBuffer con
+    data (channels, samples) float32, sample_rate y dirty), o None si el stem
+    no está en memoria y hay que leerlo de disco.
+    """
+    bus = active_stem_bus()
+    if bus is None:
+        return None
+    return bus.buffer_for(Path(path))
+
+
 def sf_read_limited(path: Path, always_2d: bool = False, max_seconds: float | None = MAX_ANALYSIS_SECONDS):
     """
     Lectura limitada a max_seconds (si se especifica) usando soundfile.
+    Si el stem está en el stem bus se sirve desde memoria, con la misma forma
+    y dtype que sf.read (float64, (frames, channels) o 1-D si es mono).
     """
+    buffered = stem_bus_buffer(path)
+    if buffered is not None:
+        sr = int(buffered.sample_rate)
+        frames = buffered.frames
+        if max_seconds is not None:
+            frames = min(frames, int(sr * max_seconds))
+        data = buffered.data[:, :frames].T.astype(np.float64)
+        if not always_2d and data.shape[1] == 1:
+            data = data[:, 0]
+        return data, sr
+
     info = sf.info(path)
     frames = None
     if max_seconds is not None:
@@ -342,7 +390,7 @@ def sanitize_json_floats(obj: Any) -> Any:
         return tuple(sanitize_json_floats(v) for v in obj)
     return obj
 
-def _analyze_audio_series(audio: np.ndarray, sr: int) -> Dict[str, Any]:
+def _analyze_audio_series(audio: np.ndarray, sr: int, spectral: Optional[Any] = None) -> Dict[str, Any]:
     """
     Computes time-series and spectral analysis for a single audio track.
     Returns a dict with:
@@ -350,6 +398,9 @@ def _analyze_audio_series(audio: np.ndarray, sr: int) -> Dict[str, Any]:
       - dynamics: {crest, time}
       - stereo: {correlation, width, time}
       - spectrogram: {data (low-res), freqs, times}
+
+    spectral: SpectralFeatures (utils.spectral_cache) of the same audio, to
+    reuse its mel spectrogram instead of recomputing the STFT.
     """
     if audio.ndim == 1:
         # Mono -> Make stereo duplicate for consistent processing if needed,
@@ -363,10 +414,11 @@ def _analyze_audio_series(audio: np.ndarray, sr: int) -> Dict[str, Any]:
 
     duration = len(mono) / sr
 
-    # --- 1. Loudness (EBU R128) via Essentia ---
-    # Essentia's LoudnessEBUR128 returns (momentary, shortTerm, integrated, lra)
-    # Momentary is every 400ms typically (100ms step).
-    # We want to downsample to avoid huge JSONs.
+    # --- 1. Loudness (EBU R128) ---
+    # Momentary (400 ms) and short-term (3 s) curves every 100 ms, plus
+    # integrated / LRA, from one K-weighting pass over the signal (shared
+    # short-term loudness engine, windows derived from cumulative sums).
+    # Downsampled to ~500 points max for the UI.
 
     l_momentary = []
     l_short = []
@@ -375,60 +427,21 @@ def _analyze_audio_series(audio: np.ndarray, sr: int) -> Dict[str, Any]:
     l_time = []
 
     try:
-        import essentia.standard as es
-        # Essentia expects Stereo for Loudness? Docs say "signal" (mono) or use specific algo.
-        # LoudnessEBUR128 takes a vector (mono) or stereo audio?
-        # Actually in standard mode it takes a signal. If we pass stereo, we might need a different algo.
-        # Standard LoudnessEBUR128 usually takes a sound signal (mono).
-        # But EBU R128 is defined for stereo/multichannel.
-        # Essentia docs: "Input: signal (vector_real)". It mixes to mono internally or expects mono?
-        # Let's use the mono signal for approximation if stereo is not supported easily,
-        # but EBU R128 K-weighting accounts for channel summing.
-        # Ideally we use `Loudness` algo but that's not R128.
-        # Let's stick to mono for "Loudness" approx or if Essentia handles it.
-        # Wait, Essentia has `LoudnessEBUR128`.
-
-        # hopSize is expressed in seconds for Essentia (not samples)
-        loudness_algo = es.LoudnessEBUR128(sampleRate=sr, hopSize=0.1) # 100ms hop
-        # Ensure stereo input; some Essentia builds require VECTOR_STEREOSAMPLE.
-        audio_for_es = audio.astype(np.float32, copy=False)
-        if audio_for_es.ndim == 1:
-            audio_for_es = np.column_stack((audio_for_es, np.zeros_like(audio_for_es)))
-        elif audio_for_es.shape[1] == 1:
-            audio_for_es = np.column_stack((audio_for_es[:, 0], np.zeros_like(audio_for_es[:, 0])))
-        elif audio_for_es.shape[1] > 2:
-            audio_for_es = audio_for_es[:, :2]
-
-        # Essentia necesita C-contiguous float32 array para convertir a VECTOR_STEREOSAMPLE
-        audio_for_es = np.ascontiguousarray(audio_for_es, dtype=np.float32)
-
-        m, s, i, lra = loudness_algo(audio_for_es)
-
-        # Downsample to ~500 points max for UI
+        st_loudness = ShortTermLoudness(audio, sr)
+        t_end, m, s = st_loudness.meter_curves(hop_s=0.1)
+        l_integrated, l_lra = st_loudness.lufs_and_lra()
+
         step = max(1, len(m) // 500)
         l_momentary = [round(float(x), 2) for x in m[::step]]
         l_short = [round(float(x), 2) for x in s[::step]]
-        l_integrated = float(i)
-        l_lra = float(lra)
 
-        # Time axis
-        l_time = [round(t * 0.1 * step, 2) for t in range(len(l_momentary))]
+        # Time axis (end of each window, as a real-time meter)
+        l_time = [round(float(t), 2) for t in t_end[::step]]
 
-    except ImportError:
-        # Fallback to simple RMS-based "Loudness"
-        pass
     except Exception:
-        # Fallback
+        # Fallback to simple RMS-based "Loudness" (below)
         traceback.print_exc()
 
-    if not l_momentary:
-        # RMS fallback
-        window_sec = 0.1
-        w_samp = int(sr * window_sec)
-        # ... (RMS logic similar to old implementation)
-        # Use existing logic logic
-        pass
-
 
     # --- 2. Dynamics (Crest Factor) ---
     # Crest Factor = Peak_dB - RMS_dB
@@ -519,25 +532,16 @@ def _analyze_audio_series(audio: np.ndarray, sr: int) -> Dict[str, Any]:
 
     # --- 4. Spectrogram (Downsampled) ---
     # We produce a grid of roughly 128 freq bands x 600 time slices for better UI resolution
-    n_fft = 2048
-    # Target ~600 time frames
-    hop_length = len(mono) // 600
-    if hop_length < 512: hop_length = 512
-
+    # (mel magnitude spectrogram from the shared spectral feature service)
     try:
         import librosa
-        # Spectrogram
-        S = librosa.stft(mono, n_fft=n_fft, hop_length=hop_length)
-        S_db = librosa.amplitude_to_db(np.abs(S), ref=np.max)
-
-        # Resize to 128 bands (Mel scale ideally, or Log)
-        # We can use librosa.feature.melspectrogram logic but applied to pre-computed STFT
-        # Or just bin averaging
-
-        # Use mel filter bank
-        n_mels = 128
-        mels = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=20, fmax=sr/2)
-        mel_S = np.dot(mels, np.abs(S))
+        from utils.spectral_cache import SPECTROGRAM_N_MELS, mel_magnitude_spectrogram
+
+        n_mels = SPECTROGRAM_N_MELS
+        if spectral is not None and spectral.mel is not None:
+            mel_S, hop_length = spectral.mel, spectral.mel_hop
+        else:
+            mel_S, hop_length = mel_magnitude_spectrogram(mono, sr)
         mel_db = librosa.power_to_db(mel_S**2, ref=np.max)
 
         # mel_db is (n_mels, n_frames).
@@ -606,18 +610,25 @@ def _analyze_audio_series(audio: np.ndarray, sr: int) -> Dict[str, Any]:
     }
 
 
-def compute_interactive_data(audio: np.ndarray, sr: int, audio_original: Optional[np.ndarray] = None) -> Dict[str, Any]:
+def compute_interactive_data(
+    audio: np.ndarray,
+    sr: int,
+    audio_original: Optional[np.ndarray] = None,
+    spectral: Optional[Any] = None,
+    spectral_original: Optional[Any] = None,
+) -> Dict[str, Any]:
     """
     Generates data for interactive charts including A/B comparison.
+    spectral / spectral_original: optional SpectralFeatures of each audio.
     """
     if audio is None or len(audio) == 0:
         return {}
 
-    result_data = _analyze_audio_series(audio, sr)
+    result_data = _analyze_audio_series(audio, sr, spectral)
 
     original_data = None
     if audio_original is not None and len(audio_original) > 0:
-        original_data = _analyze_audio_series(audio_original, sr)
+        original_data = _analyze_audio_series(audio_original, sr, spectral_original)
 
     return {
         "result": result_data,
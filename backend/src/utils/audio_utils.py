@@ -1,12 +1,61 @@
 
 import logging
+import os
+import tempfile
 import soundfile as sf
 import numpy as np
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+def write_audio_atomic(path: Path, data: np.ndarray, samplerate: int, subtype: Optional[str] = None) -> None:
+    """
+    Drop-in replacement for sf.write(path, data, samplerate, subtype) that writes
+    to a temp file in the same folder and then os.replace()s it over `path`.
+
+    Stage folders may share inodes with the previous stage (hardlinks/reflinks
+    created by copy_stems), so files must never be truncated in place: replacing
+    the directory entry breaks the link and leaves the other stage untouched.
+    Expects soundfile layout (samples, channels).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.stem}.", suffix=path.suffix or ".wav", dir=path.parent)
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        sf.write(tmp_path, data, samplerate, subtype=subtype)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+_MONO_READ_BLOCK = 1 << 20
+
+
+def read_mono_float32(path: Path, start: int = 0, stop: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """
+    Reads frames [start, stop) of an audio file block by block straight into a
+    float32 mono array (mean of channels), without the float64 multichannel
+    buffer of sf.read. Returns (mono, samplerate).
+    """
+    info = sf.info(str(path))
+    total = int(info.frames)
+    stop = total if stop is None else max(0, min(int(stop), total))
+    start = max(0, min(int(start), stop))
+    mono = np.empty(stop - start, dtype=np.float32)
+    pos = 0
+    for block in sf.blocks(
+        str(path), blocksize=_MONO_READ_BLOCK, start=start, stop=stop, dtype="float32", always_2d=True
+    ):
+        n = block.shape[0]
+        np.mean(block, axis=1, out=mono[pos : pos + n])
+        pos += n
+    return mono[:pos], int(info.samplerate)
+
+
 def load_audio_stems(directory: Path) -> Dict[str, np.ndarray]:
     """
     Loads all WAV files in a directory into a dict of {filename: numpy_array}.
@@ -44,6 +93,6 @@ def save_audio_stems(directory: Path, stems: Dict[str, np.ndarray], sample_rate:
         try:
             # Soundfile expects (samples, channels)
             path = directory / name
-            sf.write(path, data.T, sample_rate)
+            write_audio_atomic(path, data.T, sample_rate)
         except Exception as e:
             logger.error(f"Failed to save stem {name}: {e}")
@@ -55,8 +55,13 @@ def process(context: PipelineContext, *args) -> bool:
             if item.suffix.lower() in [".png", ".jpg", ".jpeg"]:
                 continue
 
-            # Borrar wavs (stems), aiffs, flacs, etc.
-            if item.suffix.lower() in [".wav", ".aif", ".aiff", ".flac", ".mp3"]:
+            # Borrar wavs (stems), aiffs, flacs, etc. y los sidecars de features
+            # de los stems (.{stem}.spectral.npz, .{stem}.f0.npz)
+            is_stem_sidecar = (
+                item.name.endswith((".spectral.npz", ".f0.npz"))
+                and not item.name.lower().startswith(".full_song.wav.")
+            )
+            if item.suffix.lower() in [".wav", ".aif", ".aiff", ".flac", ".mp3"] or is_stem_sidecar:
                 try:
                     s = item.stat().st_size
                     item.unlink()
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import os
 import sys
 import shutil
 from pathlib import Path
@@ -20,6 +21,73 @@ try:
 except ImportError:
     PipelineContext = None # type: ignore
 
+# ioctl FICLONE de Linux (btrfs, xfs con reflink=1, ...)
+_FICLONE = 0x40049409
+
+# Dispositivos (st_dev) donde ya sabemos que reflink/hardlink no funcionan
+_NO_REFLINK_DEVS: set[int] = set()
+_NO_HARDLINK_DEVS: set[int] = set()
+
+
+def _try_reflink(src: Path, tmp: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:  # pragma: no cover - no POSIX
+        return False
+
+    try:
+        with src.open("rb") as fsrc, tmp.open("wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return False
+
+
+def link_or_copy(src: Path, dst: Path, hardlink: bool = True) -> str:
+    """
+    Traspasa src a dst sin copiar bytes cuando el FS lo permite.
+
+    Orden: reflink (copy-on-write real) -> hardlink -> shutil.copy2.
+    Con hardlink ambos stages comparten inodo, por eso los writers de stems
+    usan audio_utils.write_audio_atomic (temp + os.replace), que rompe el
+    enlace en lugar de modificar el fichero compartido.
+
+    Con hardlink=False solo se usa reflink o copia (dst nunca comparte inodo
+    con src).
+
+    Devuelve el método usado: "reflink", "hardlink" o "copy".
+    """
+    dev = src.stat().st_dev
+    tmp = dst.with_name(f".{dst.name}.link")
+    if tmp.exists():
+        tmp.unlink()
+
+    if dev not in _NO_REFLINK_DEVS:
+        if _try_reflink(src, tmp):
+            os.replace(tmp, dst)
+            return "reflink"
+        _NO_REFLINK_DEVS.add(dev)
+
+    if hardlink and dev not in _NO_HARDLINK_DEVS:
+        try:
+            os.link(src, tmp)
+            os.replace(tmp, dst)
+            # Si dst ya era el mismo inodo, rename() no hace nada y deja tmp
+            if tmp.exists():
+                tmp.unlink()
+            return "hardlink"
+        except OSError:
+            _NO_HARDLINK_DEVS.add(dev)
+            if tmp.exists():
+                tmp.unlink()
+
+    shutil.copy2(src, dst)
+    return "copy"
+
 
 def process(context: PipelineContext, *args) -> bool:
     """
@@ -49,8 +117,16 @@ def process(context: PipelineContext, *args) -> bool:
         )
         return True # No es error fatal, el pipeline continua
 
+    # Si el bus de stems tiene en memoria los stems del stage origen, pasan al
+    # destino sin volcarse: los ficheros enlazados abajo pueden ser la versión
+    # anterior de un stem pendiente, que el volcado del bus sustituye después.
+    stem_bus = getattr(context, "stem_bus", None)
+    if stem_bus is not None and stem_bus.stage_id == src_stage_id and stem_bus.names():
+        stem_bus.handoff(dst_stage_id, dst_dir)
+
     audio_exts = {".wav", ".aif", ".aiff", ".flac", ".mp3", ".m4a", ".ogg", ".aac"}
     count = 0
+    methods: dict[str, int] = {}
     for audio_path in src_dir.glob("*"):
         if not audio_path.is_file():
             continue
@@ -59,22 +135,30 @@ def process(context: PipelineContext, *args) -> bool:
         # No copiar el mixdown dentro del loop de stems (se copia aparte)
         if audio_path.name.lower() == "full_song.wav":
             continue
-        shutil.copy2(audio_path, dst_dir / audio_path.name)
+        method = link_or_copy(audio_path, dst_dir / audio_path.name)
+        methods[method] = methods.get(method, 0) + 1
         count += 1
 
     full_song_src = src_dir / "full_song.wav"
     if full_song_src.exists():
-        shutil.copy2(full_song_src, dst_dir / full_song_src.name)
+        method = link_or_copy(full_song_src, dst_dir / full_song_src.name)
         logger.logger.info(
-            f"[copy_stems] Copiado full_song.wav de {src_stage_id} a {dst_stage_id}"
+            f"[copy_stems] Copiado full_song.wav de {src_stage_id} a {dst_stage_id} ({method})"
         )
+        # Firma del mixdown (mixdown_stems.ensure_mixdown): evita re-renderizar en destino.
+        sig_src = src_dir / ".full_song.sig.json"
+        if sig_src.exists():
+            shutil.copy2(sig_src, dst_dir / sig_src.name)
 
-    # Copiar session_config.json si existe
+    # Copiar session_config.json si existe (copia real: algunos análisis lo reescriben in-place)
     config_src = src_dir / "session_config.json"
     if config_src.exists():
         shutil.copy2(config_src, dst_dir / "session_config.json")
 
-    logger.logger.info(f"[copy_stems] Copiados {count} stems de {src_stage_id} a {dst_stage_id}")
+    methods_str = ", ".join(f"{k}={v}" for k, v in sorted(methods.items())) or "-"
+    logger.logger.info(
+        f"[copy_stems] Copiados {count} stems de {src_stage_id} a {dst_stage_id} ({methods_str})"
+    )
     return True
 
 
@@ -6,6 +6,8 @@ from typing import Tuple
 
 import numpy as np
 
+from .envelope_kernels import envelope_follower, gain_computer
+
 
 def _to_mono_float32(y: np.ndarray) -> np.ndarray:
     arr = np.asarray(y, dtype=np.float32)
@@ -75,8 +77,11 @@ def compress_peak_detector(
 
     n, c = data.shape
 
-    # Detector: máximo absoluto entre canales
-    detector = np.max(np.abs(data), axis=1)
+    # Detector: máximo absoluto entre canales (por columnas: mucho más rápido
+    # que np.max(..., axis=1) con pocas columnas)
+    detector = np.abs(data[:, 0])
+    for ch in range(1, c):
+        np.maximum(detector, np.abs(data[:, ch]), out=detector)
 
     # Coeficientes de ataque y release
     attack_ms = max(attack_ms, 0.1)
@@ -86,33 +91,10 @@ def compress_peak_detector(
     release_coeff = float(np.exp(-1.0 / (release_ms * 0.001 * sr)))
 
     eps = 1e-12
-    env = 0.0
-
-    gr_db_arr = np.zeros(n, dtype=np.float32)
-    gain_db_arr = np.zeros(n, dtype=np.float32)
-
-    inv_ratio = 1.0 / float(max(ratio, 1.0))
-    k = 1.0 - inv_ratio  # factor para GR: over_db * k
-
-    for i in range(n):
-        x = detector[i]
-        if x > env:
-            env = attack_coeff * env + (1.0 - attack_coeff) * x
-        else:
-            env = release_coeff * env + (1.0 - release_coeff) * x
-
-        env_db = 20.0 * np.log10(env + eps)
-        over_db = env_db - threshold_db
-
-        if over_db > 0.0:
-            gr_db = over_db * k
-        else:
-            gr_db = 0.0
-
-        gr_db_arr[i] = gr_db
-        gain_db_arr[i] = -gr_db + makeup_gain_db
 
-    gain_lin = 10.0 ** (gain_db_arr / 20.0)
+    # Envolvente (kernel compilado) y computador de ganancia vectorizado
+    env = envelope_follower(detector, attack_coeff, release_coeff)
+    gr_db_arr, gain_lin = gain_computer(env, threshold_db, ratio, makeup_db=makeup_gain_db, eps=eps)
     gain_lin = gain_lin.reshape(-1, 1)
 
     data_out = data * gain_lin
@@ -123,12 +105,12 @@ def compress_peak_detector(
         y_out = data_out
 
     # Métricas de GR
-    mask = gr_db_arr > 0.0
-    if np.any(mask):
-        avg_gr_db = float(np.mean(gr_db_arr[mask]))
-        max_gr_db = float(np.max(gr_db_arr[mask]))
+    n_active = int(np.count_nonzero(gr_db_arr > 0.0))
+    if n_active:
+        avg_gr_db = float(np.sum(gr_db_arr, dtype=np.float64) / n_active)
+        max_gr_db = float(np.max(gr_db_arr))
     else:
         avg_gr_db = 0.0
         max_gr_db = 0.0
 
-    return y_out.astype(np.float32), avg_gr_db, max_gr_db
+    return y_out.astype(np.float32, copy=False), avg_gr_db, max_gr_db
@@ -0,0 +1,160 @@
+# C:\mix-master\backend\src\utils\envelope_kernels.py
+
+from __future__ import annotations
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+try:
+    # numba llega como dependencia de librosa; sin él se usa el bucle Python.
+    from numba import njit  # type: ignore
+except Exception:  # pragma: no cover
+    njit = None
+
+
+# dB -> exponente natural: 10 ** (x / 20) == exp(x * _DB_TO_NEPER)
+_DB_TO_NEPER = math.log(10.0) / 20.0
+
+
+# ---------------------------------------------------------------------
+# Bucles (compilados con numba si está disponible)
+# ---------------------------------------------------------------------
+
+def _follow_loop(x, attack_coeff, release_coeff, state, out):
+    for i in range(len(x)):
+        xi = x[i]
+        if xi > state:
+            state = attack_coeff * state + (1.0 - attack_coeff) * xi
+        else:
+            state = release_coeff * state + (1.0 - release_coeff) * xi
+        out[i] = state
+    return out
+
+
+def _hold_release_loop(gate, hold_frames, release_coeff, out):
+    state = 0.0
+    hold = 0
+    triggered = 0
+    for i in range(len(gate)):
+        if gate[i]:
+            state = 1.0
+            hold = hold_frames
+            triggered += 1
+        elif hold > 0:
+            hold -= 1
+            state = 1.0
+        else:
+            state = state * release_coeff
+        out[i] = state
+    return triggered
+
+
+if njit is not None:
+    _follow_jit = njit(cache=True, nogil=True)(_follow_loop)
+    _hold_release_jit = njit(cache=True, nogil=True)(_hold_release_loop)
+else:
+    _follow_jit = None
+    _hold_release_jit = None
+
+
+# ---------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------
+
+def envelope_follower(
+    x: np.ndarray,
+    attack_coeff: float,
+    release_coeff: float,
+    initial: float = 0.0,
+) -> np.ndarray:
+    """
+    Seguidor de envolvente one-pole asimétrico:
+
+        env[n] = a * env[n-1] + (1 - a) * x[n]
+        a = attack_coeff si x[n] > env[n-1], si no release_coeff
+
+    x es 1D (detector por muestra o por frame). Devuelve float64 de la misma
+    longitud.
+    """
+    arr = np.ascontiguousarray(x).reshape(-1)
+    if arr.dtype not in (np.float32, np.float64):
+        arr = arr.astype(np.float64)
+    out = np.empty(arr.size, dtype=np.float64)
+    if arr.size == 0:
+        return out
+    if _follow_jit is not None:
+        return _follow_jit(arr, float(attack_coeff), float(release_coeff), float(initial), out)
+    res = _follow_loop(arr.tolist(), float(attack_coeff), float(release_coeff), float(initial), [0.0] * arr.size)
+    return np.asarray(res, dtype=np.float64)
+
+
+def gain_reduction_db(
+    level_db: np.ndarray,
+    threshold_db: float,
+    ratio: float,
+) -> np.ndarray:
+    """
+    Computador de ganancia hard-knee: reducción (dB, >= 0) para cada nivel.
+    """
+    k = 1.0 - 1.0 / float(max(ratio, 1.0))
+    over_db = np.asarray(level_db, dtype=np.float64) - float(threshold_db)
+    return np.maximum(over_db, 0.0) * k
+
+
+def gain_computer(
+    env: np.ndarray,
+    threshold_db: float,
+    ratio: float,
+    makeup_db: float = 0.0,
+    eps: float = 1e-12,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computador de ganancia hard-knee sobre una envolvente lineal.
+
+    Devuelve (gr_db, gain_lin) en float32:
+      gr_db    = max(20*log10(env + eps) - threshold_db, 0) * (1 - 1/ratio)
+      gain_lin = 10 ** ((makeup_db - gr_db) / 20)
+
+    Vectorizado en float32 (log/exp SIMD de numpy): más rápido que un bucle
+    compilado en float64.
+    """
+    env32 = np.asarray(env, dtype=np.float32).reshape(-1) + np.float32(eps)
+    k = np.float32(1.0 - 1.0 / float(max(ratio, 1.0)))
+
+    gr = np.log10(env32, out=env32)
+    gr *= np.float32(20.0)
+    gr -= np.float32(threshold_db)
+    np.maximum(gr, np.float32(0.0), out=gr)
+    gr *= k
+
+    gain = np.float32(makeup_db) - gr
+    gain *= np.float32(_DB_TO_NEPER)
+    np.exp(gain, out=gain)
+    return gr, gain
+
+
+def hold_release_gate(
+    gate: np.ndarray,
+    hold_frames: int,
+    release_coeff: float,
+) -> Tuple[np.ndarray, int]:
+    """
+    Puerta con hold y release exponencial:
+      - gate activo => 1.0 y se rearma el hold
+      - durante el hold => 1.0
+      - después decae: state *= release_coeff
+
+    Devuelve (estado float64 en [0..1], nº de frames que dispararon la puerta).
+    """
+    g = np.ascontiguousarray(gate, dtype=np.bool_).reshape(-1)
+    out = np.empty(g.size, dtype=np.float64)
+    if g.size == 0:
+        return out, 0
+    if _hold_release_jit is not None:
+        triggered = _hold_release_jit(g, int(max(0, hold_frames)), float(release_coeff), out)
+        return out, int(triggered)
+    res = [0.0] * g.size
+    triggered = _hold_release_loop(g.tolist(), int(max(0, hold_frames)), float(release_coeff), res)
+    return np.asarray(res, dtype=np.float64), int(triggered)
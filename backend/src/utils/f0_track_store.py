@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import soundfile as sf
+
+# --- hack sys.path para poder importar utils.* cuando se ejecuta como script ---
+THIS_DIR = Path(__file__).resolve().parent      # .../src/utils
+SRC_DIR = THIS_DIR.parent                       # .../src
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.audio_utils import read_mono_float32  # noqa: E402
+from utils.logger import logger  # noqa: E402
+from utils.pitch_utils import yin_f0  # noqa: E402
+from utils.stage_cache import file_content_hash  # noqa: E402
+
+# Entradas de la LRU en memoria de curvas f0 por contenido
+F0_TRACK_STORE_MAX_ENTRIES = int(os.getenv("MIX_F0_TRACK_STORE_MAX_ENTRIES", 32))
+
+# Sube si cambia el cálculo de la curva (invalida los sidecars)
+_FORMAT_VERSION = 1
+
+# (hash de contenido, parámetros yin) -> curva
+_TRACKS: "OrderedDict[Tuple[str, Tuple], F0Track]" = OrderedDict()
+_STATS = {"hits": 0, "disk_hits": 0, "misses": 0, "partial_updates": 0}
+_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class YinParams:
+    """
+    Parámetros de librosa.yin que definen una curva (los de
+    pitch_utils.tune_vocal_time_varying por defecto).
+    """
+
+    fmin_note: str = "C2"
+    fmax_note: str = "C7"
+    frame_length: int = 2048
+    hop_length: int = 512
+
+    def key(self) -> Tuple:
+        return (self.fmin_note, self.fmax_note, int(self.frame_length), int(self.hop_length))
+
+
+DEFAULT_YIN_PARAMS = YinParams()
+
+
+@dataclass
+class F0Track:
+    """
+    Curva yin de la mezcla mono de un audio (frames centrados, hop
+    params.hop_length):
+
+    - f0: Hz por frame (float32, NaN = sin pitch).
+    - voiced: máscara de frames con f0.
+    - midi: f0 en notas MIDI (NaN donde no hay pitch), calculada al pedirla.
+    """
+
+    sr: int
+    n_samples: int
+    params: YinParams
+    f0: np.ndarray
+    _midi: Optional[np.ndarray] = field(default=None, repr=False)
+
+    @property
+    def voiced(self) -> np.ndarray:
+        return ~np.isnan(self.f0)
+
+    @property
+    def midi(self) -> np.ndarray:
+        if self._midi is None:
+            midi = np.full(self.f0.shape, np.nan, dtype=np.float32)
+            voiced = self.voiced
+            midi[voiced] = 12.0 * (np.log2(self.f0[voiced]) - np.log2(440.0)) + 69.0
+            self._midi = midi
+        return self._midi
+
+
+# ---------------------------------------------------------------------
+# Cálculo
+# ---------------------------------------------------------------------
+
+def compute_f0_track(y_mono: np.ndarray, sr: int, params: YinParams = DEFAULT_YIN_PARAMS) -> F0Track:
+    mono = np.asarray(y_mono, dtype=np.float32)
+    f0 = yin_f0(mono, int(sr), params.fmin_note, params.fmax_note, params.frame_length, params.hop_length)
+    return F0Track(sr=int(sr), n_samples=int(mono.size), params=params, f0=np.asarray(f0, dtype=np.float32))
+
+
+def _frame_ranges(
+    sample_ranges: Sequence[Tuple[int, int]],
+    n_frames: int,
+    params: YinParams,
+) -> List[Tuple[int, int]]:
+    """
+    Frames [t0, t1] (inclusive, fusionados) cuyo soporte centrado
+    [t*hop - frame/2, t*hop + frame/2) toca algún rango de samples.
+    """
+    hop = int(params.hop_length)
+    half = int(params.frame_length) // 2
+    spans: List[Tuple[int, int]] = []
+    for s0, s1 in sorted(sample_ranges):
+        if s1 <= s0:
+            continue
+        t0 = max(0, (int(s0) - half) // hop)
+        t1 = min(n_frames - 1, (int(s1) + half) // hop + 1)
+        if t1 < t0:
+            continue
+        if spans and t0 <= spans[-1][1] + 1:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], t1))
+        else:
+            spans.append((t0, t1))
+    return spans
+
+
+def _recompute_frames(audio_path: Path, track: F0Track, t0: int, t1: int) -> np.ndarray:
+    """
+    f0 de los frames [t0, t1] leyendo sólo su tramo del fichero (con el
+    padding de ceros de center=True en los extremos).
+    """
+    params = track.params
+    hop = int(params.hop_length)
+    frame = int(params.frame_length)
+    a = t0 * hop - frame // 2
+    b = t1 * hop - frame // 2 + frame
+
+    seg, _ = read_mono_float32(audio_path, start=max(0, a), stop=min(b, track.n_samples))
+    pad_left = max(0, -a)
+    pad_right = (b - a) - pad_left - seg.size
+    if pad_left or pad_right:
+        seg = np.pad(seg, (pad_left, max(0, pad_right)), mode="constant")
+
+    f0 = yin_f0(seg, track.sr, params.fmin_note, params.fmax_note, frame, hop, center=False)
+    return np.asarray(f0, dtype=np.float32)
+
+
+# ---------------------------------------------------------------------
+# Persistencia (sidecar junto al audio)
+# ---------------------------------------------------------------------
+
+def sidecar_path(audio_path: Path) -> Path:
+    """
+    .{nombre}.f0.npz en la carpeta del audio (como los de spectral_cache, los
+    ficheros que empiezan por "." no son salidas del contrato).
+    """
+    return audio_path.parent / f".{audio_path.name}.f0.npz"
+
+
+def _load_sidecar(path: Path, content_hash: str, params: YinParams) -> Optional[F0Track]:
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            if (
+                int(z["version"]) != _FORMAT_VERSION
+                or str(z["content_hash"]) != content_hash
+                or str(z["params"]) != repr(params.key())
+            ):
+                return None
+            n_frames = int(z["n_frames"])
+            voiced = np.unpackbits(z["voiced_bits"], count=n_frames).astype(bool)
+            f0 = np.full(n_frames, np.nan, dtype=np.float32)
+            f0[voiced] = z["f0_voiced"]
+            return F0Track(sr=int(z["sr"]), n_samples=int(z["n_samples"]), params=params, f0=f0)
+    except Exception:
+        return None
+
+
+def _save_sidecar(path: Path, content_hash: str, track: F0Track) -> None:
+    """
+    Máscara de voicing en bits + f0 float32 sólo de los frames con pitch
+    (la curva MIDI se deriva al cargar). Escritura atómica; best-effort.
+    """
+    voiced = track.voiced
+    try:
+        fd, tmp_name = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+        os.close(fd)
+        try:
+            with open(tmp_name, "wb") as f:
+                np.savez(
+                    f,
+                    version=np.int64(_FORMAT_VERSION),
+                    content_hash=np.str_(content_hash),
+                    params=np.str_(repr(track.params.key())),
+                    sr=np.int64(track.sr),
+                    n_samples=np.int64(track.n_samples),
+                    n_frames=np.int64(track.f0.size),
+                    voiced_bits=np.packbits(voiced),
+                    f0_voiced=track.f0[voiced].astype(np.float32),
+                )
+            os.replace(tmp_name, path)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+    except OSError as exc:
+        logger.logger.info(f"[f0_track_store] No se pudo guardar {path.name}: {exc}")
+
+
+def _remember(key: Tuple[str, Tuple], track: F0Track) -> None:
+    with _LOCK:
+        _TRACKS[key] = track
+        _TRACKS.move_to_end(key)
+        while len(_TRACKS) > F0_TRACK_STORE_MAX_ENTRIES:
+            _TRACKS.popitem(last=False)
+
+
+def _store(audio_path: Path, track: F0Track) -> None:
+    content_hash = file_content_hash(audio_path)
+    _save_sidecar(sidecar_path(audio_path), content_hash, track)
+    _remember((content_hash, track.params.key()), track)
+
+
+# ---------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------
+
+def get_f0_track(
+    audio_path: Path,
+    params: YinParams = DEFAULT_YIN_PARAMS,
+    y_mono: Optional[np.ndarray] = None,
+    sr: Optional[int] = None,
+) -> F0Track:
+    """
+    Curva f0 del fichero audio_path (mezcla mono), calculada una sola vez por
+    contenido y parámetros yin:
+
+      1) memoria del proceso (LRU por hash de contenido + parámetros),
+      2) sidecar .{nombre}.f0.npz junto al audio,
+      3) yin sobre y_mono (si el llamante ya tiene la mezcla mono del fichero)
+         o leyendo el fichero, y persistencia en el sidecar.
+
+    Los llamantes no deben modificar los arrays devueltos.
+    """
+    audio_path = Path(audio_path)
+    content_hash = file_content_hash(audio_path)
+    key = (content_hash, params.key())
+    with _LOCK:
+        track = _TRACKS.get(key)
+        if track is not None:
+            _TRACKS.move_to_end(key)
+            _STATS["hits"] += 1
+    if track is not None:
+        return track
+
+    track = _load_sidecar(sidecar_path(audio_path), content_hash, params)
+    if track is not None:
+        with _LOCK:
+            _STATS["disk_hits"] += 1
+        _remember(key, track)
+        return track
+
+    with _LOCK:
+        _STATS["misses"] += 1
+    if y_mono is None or sr is None:
+        y_mono, sr = read_mono_float32(audio_path)
+    track = compute_f0_track(y_mono, int(sr), params)
+    _store(audio_path, track)
+    return track
+
+
+def update_f0_track(
+    audio_path: Path,
+    track: F0Track,
+    sample_ranges: Sequence[Tuple[int, int]],
+) -> F0Track:
+    """
+    Curva del nuevo contenido de audio_path cuando sólo han cambiado los
+    samples de sample_ranges respecto al audio de track (p.ej. las regiones
+    reafinadas): recalcula los frames que los tocan leyendo sólo esos tramos
+    y la registra para el contenido actual del fichero, de modo que el
+    post-análisis no vuelve a pasar yin por todo el stem.
+    """
+    audio_path = Path(audio_path)
+    try:
+        n_samples = int(sf.info(str(audio_path)).frames)
+    except Exception:
+        return track
+    if n_samples != track.n_samples:
+        # Cambió la longitud: no es un parche local
+        return get_f0_track(audio_path, track.params)
+
+    f0 = track.f0.copy()
+    for t0, t1 in _frame_ranges(sample_ranges, f0.size, track.params):
+        f0[t0 : t1 + 1] = _recompute_frames(audio_path, track, t0, t1)
+
+    updated = F0Track(sr=track.sr, n_samples=track.n_samples, params=track.params, f0=f0)
+    with _LOCK:
+        _STATS["partial_updates"] += 1
+    _store(audio_path, updated)
+    return updated
+
+
+def stats() -> Dict[str, int]:
+    return dict(_STATS)
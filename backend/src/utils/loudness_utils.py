@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from typing import Union, Tuple, Optional
+from typing import Dict, List, Union, Tuple, Optional
 
 import numpy as np
 import scipy.signal
@@ -73,22 +73,6 @@ def _bs1770_loudness(audio: np.ndarray, sr: int) -> Tuple[Optional[float], Optio
     return None, None
 
 
-def _oversample_channel(x: np.ndarray, factor: int) -> np.ndarray:
-    """
-    Oversampling seguro para una sola señal (1D).
-    Usa resample_poly y hace fallback a interpolación lineal.
-    """
-    if factor <= 1 or x.size == 0:
-        return x.astype(np.float32, copy=False)
-
-    try:
-        return scipy.signal.resample_poly(x, up=factor, down=1).astype(np.float32, copy=False)
-    except Exception:
-        t_in = np.arange(x.size, dtype=np.float32)
-        t_out = np.linspace(0.0, float(x.size - 1), int(x.size * factor), dtype=np.float32)
-        return np.interp(t_out, t_in, x).astype(np.float32, copy=False)
-
-
 def measure_sample_peak_dbfs(y: ArrayLike) -> float:
     """
     Sample-peak en dBFS (sin oversampling).
@@ -103,31 +87,128 @@ def measure_sample_peak_dbfs(y: ArrayLike) -> float:
     return float(20.0 * np.log10(peak))
 
 
+# ---------------------------------------------------------------------
+# True peak (streaming, FIR polifásico)
+# ---------------------------------------------------------------------
+
+# Oversampling mínimo del true-peak (BS.1770-4: 4x)
+TRUE_PEAK_OVERSAMPLE = 4
+# Muestras (por canal) de cada bloque del medidor de true-peak
+TRUE_PEAK_BLOCK_SIZE = 32768
+
+_TP_KERNELS: Dict[int, np.ndarray] = {}
+
+
+def _true_peak_kernel(factor: int) -> np.ndarray:
+    """
+    Taps del FIR de interpolación x factor en forma polifásica (taps_por_fase, factor),
+    invertidos para aplicarse como producto con la ventana de entrada.
+
+    Es el mismo filtro que usaba resample_poly(x, factor, 1) (firwin Kaiser
+    beta=5, 10 ceros por lado), así que el valor medido no cambia. Se calcula
+    una vez por factor.
+    """
+    kernel = _TP_KERNELS.get(factor)
+    if kernel is None:
+        h = scipy.signal.firwin(2 * 10 * factor + 1, 1.0 / factor, window=("kaiser", 5.0)) * factor
+        taps = -(-h.size // factor)
+        h_pad = np.zeros(taps * factor, dtype=np.float64)
+        h_pad[: h.size] = h
+        # fase p: h[p], h[p + factor], ... ; columna p, en orden temporal inverso
+        kernel = np.ascontiguousarray(h_pad.reshape(taps, factor)[::-1], dtype=np.float32)
+        _TP_KERNELS[factor] = kernel
+    return kernel
+
+
+class TruePeakMeter:
+    """
+    Medidor de true-peak en streaming.
+
+    process(block) recibe bloques consecutivos (n, ch) y devuelve el máximo
+    |x| sobremuestreado del bloque (lineal, máximo entre canales). El estado
+    del FIR (últimas taps-1 muestras) pasa de un bloque al siguiente, y las
+    fases se evalúan a la vez sin materializar la señal sobremuestreada.
+    finish() vacía la cola del filtro y devuelve los máximos por bloque.
+    """
+
+    def __init__(self, channels: int, oversample: int = TRUE_PEAK_OVERSAMPLE):
+        self.oversample = max(int(oversample), TRUE_PEAK_OVERSAMPLE)
+        self._kernel = _true_peak_kernel(self.oversample)
+        self._taps = int(self._kernel.shape[0])
+        self._history = np.zeros((max(1, int(channels)), self._taps - 1), dtype=np.float32)
+        self.block_maxima: List[float] = []
+
+    def _peak(self, buf: np.ndarray) -> float:
+        # Por canal (contiguo): (n, taps) @ (taps, factor) -> (n, factor)
+        peak = 0.0
+        for ch_buf in buf:
+            windows = np.lib.stride_tricks.sliding_window_view(ch_buf, self._taps)
+            up = windows @ self._kernel
+            peak = max(peak, float(up.max()), float(-up.min()))
+        return peak
+
+    def process(self, block: ArrayLike) -> float:
+        blk = np.asarray(block, dtype=np.float32).reshape(len(block), -1)
+        if blk.shape[0] == 0:
+            return 0.0
+        buf = np.concatenate((self._history, blk.T), axis=1)
+        self._history = buf[:, buf.shape[1] - (self._taps - 1):].copy()
+        peak = self._peak(buf)
+        self.block_maxima.append(peak)
+        return peak
+
+    def finish(self) -> np.ndarray:
+        if self.block_maxima:
+            tail = np.concatenate((self._history, np.zeros_like(self._history)), axis=1)
+            self.block_maxima[-1] = max(self.block_maxima[-1], self._peak(tail))
+            self._history = np.zeros_like(self._history)
+        return np.asarray(self.block_maxima, dtype=np.float64)
+
+
+def true_peak_block_maxima(
+    y: ArrayLike,
+    oversample: int = TRUE_PEAK_OVERSAMPLE,
+    block_size: int = TRUE_PEAK_BLOCK_SIZE,
+) -> np.ndarray:
+    """
+    Máximos true-peak (lineales, máximo entre canales) por bloque de block_size muestras.
+
+    Una ganancia lineal g escala todos los máximos por g: quien prueba varias
+    ganancias sobre la misma señal reutiliza este vector con
+    true_peak_dbtp_from_blocks(maxima, gain_db) en lugar de volver a medir.
+    """
+    arr = _normalize_channels(y)
+    meter = TruePeakMeter(arr.shape[1], oversample=oversample)
+    step = max(1, int(block_size))
+    for start in range(0, arr.shape[0], step):
+        meter.process(arr[start : start + step])
+    return meter.finish()
+
+
+def true_peak_dbtp_from_blocks(block_maxima: np.ndarray, gain_db: float = 0.0) -> float:
+    """
+    True peak (dBTP) a partir de los máximos por bloque, con una ganancia opcional.
+    """
+    maxima = np.asarray(block_maxima, dtype=np.float64)
+    peak_lin = float(np.max(maxima)) if maxima.size else 0.0
+    if peak_lin <= 0.0:
+        return float("-inf")
+    return float(20.0 * np.log10(peak_lin) + float(gain_db))
+
+
 def measure_true_peak_dbtp(y: ArrayLike, sr: int | None = None, oversample: int = 4) -> float:
     """
     True Peak (dBTP) con oversampling >=4×.
 
     - Máximo entre todos los canales.
-    - Oversampling por factor entero (resample_poly); fallback a interpolación lineal.
+    - Medidor en streaming (TruePeakMeter): FIR polifásico por bloques, sin
+      materializar la señal sobremuestreada.
     - oversample se fuerza a 4 como mínimo.
     """
     arr = _normalize_channels(y)
     if arr.size == 0:
         return float("-inf")
-
-    factor = max(int(oversample), 4)
-    peak_lin = 0.0
-
-    for ch in range(arr.shape[1]):
-        ch_data = arr[:, ch]
-        up = _oversample_channel(ch_data, factor)
-        pk = float(np.max(np.abs(up))) if up.size else 0.0
-        if pk > peak_lin:
-            peak_lin = pk
-
-    if peak_lin <= 0.0:
-        return float("-inf")
-    return float(20.0 * np.log10(peak_lin))
+    return true_peak_dbtp_from_blocks(true_peak_block_maxima(arr, oversample=oversample))
 
 
 def measure_true_peak_dbfs(y: ArrayLike, sr: int | None = None, oversample: int = 4) -> float:
@@ -219,3 +300,395 @@ def compute_lufs_and_lra(
     lra = max(0.0, p95 - p10)
 
     return lufs_integrated, lra
+
+
+# ---------------------------------------------------------------------
+# Motor de loudness paramétrico en ganancia
+# ---------------------------------------------------------------------
+
+# BS.1770: bloques de 400 ms con 75% de solape; LRA (EBU Tech 3342): short-term de 3 s
+_BS1770_BLOCK_S = 0.4
+_BS1770_STEP_S = 0.1
+_LRA_BLOCK_S = 3.0
+_ABS_GATE_LUFS = -70.0
+_REL_GATE_INTEGRATED_LU = -10.0
+_REL_GATE_LRA_LU = -20.0
+_LUFS_OFFSET = -0.691
+
+
+def _k_weighting_sos(sr: int) -> np.ndarray:
+    """
+    Filtro K (BS.1770) como dos biquads para cualquier sr: shelving de +4 dB
+    y paso-alto RLB. Fórmulas de libebur128 (a 48 kHz dan los coeficientes
+    tabulados en la norma).
+    """
+    # Shelving
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / sr)
+    vh = 10.0 ** (gain_db / 20.0)
+    vb = vh ** 0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0,
+        2.0 * (k * k - vh) / a0,
+        (vh - vb * k / q + k * k) / a0,
+        1.0,
+        2.0 * (k * k - 1.0) / a0,
+        (1.0 - k / q + k * k) / a0,
+    ]
+    # Paso-alto RLB
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / sr)
+    a0 = 1.0 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+    return np.asarray([shelf, highpass], dtype=np.float64)
+
+
+def _energy_cumsum(audio: np.ndarray, sr: int, k_weighting: bool = True) -> np.ndarray:
+    """
+    Suma acumulada (ch, n + 1) de la señal (ch, n) al cuadrado, K-ponderada
+    (filtrada una sola vez sobre toda la señal) salvo k_weighting=False.
+    """
+    n = audio.shape[-1]
+    if not n or sr <= 0:
+        return np.zeros((audio.shape[0], 1), dtype=np.float64)
+    weighted = scipy.signal.sosfilt(_k_weighting_sos(sr), audio, axis=-1) if k_weighting else audio
+    cum = np.zeros((audio.shape[0], n + 1), dtype=np.float64)
+    np.cumsum(weighted * weighted, axis=-1, out=cum[:, 1:])
+    return cum
+
+
+def _block_mean_squares(cum: np.ndarray, block: int, step: int) -> np.ndarray:
+    """
+    Media cuadrática de los bloques completos [j*step, j*step + block) a partir
+    de la suma acumulada (ch, n + 1) de la señal al cuadrado -> (ch, n_blocks).
+    """
+    n = cum.shape[-1] - 1
+    if block <= 0 or step <= 0 or n < block:
+        return np.zeros(cum.shape[:-1] + (0,), dtype=np.float64)
+    starts = np.arange(0, n - block + 1, step)
+    return (cum[..., starts + block] - cum[..., starts]) / float(block)
+
+
+def _block_peaks(audio: np.ndarray, block: int, step: int, n_blocks: int) -> np.ndarray:
+    """
+    Sample-peak de los bloques [j*step, j*step + block) de audio (ch, n): máximo
+    por tramos de step muestras y máximo deslizante de block/step tramos.
+    """
+    if n_blocks <= 0 or step <= 0:
+        return np.zeros(0, dtype=np.float64)
+    per_step = max(1, int(round(block / step)))
+    n_steps = audio.shape[-1] // step
+    step_max = np.abs(audio[:, : n_steps * step]).reshape(audio.shape[0], n_steps, step).max(axis=(0, 2))
+    peaks = np.lib.stride_tricks.sliding_window_view(step_max, per_step).max(axis=-1)
+    out = np.zeros(n_blocks, dtype=np.float64)
+    m = min(n_blocks, peaks.size)
+    out[:m] = peaks[:m]
+    return out
+
+
+class _GatedPowers:
+    """
+    Potencias de bloque ordenadas + suma acumulada: permite aplicar las
+    puertas absoluta/relativa para cualquier ganancia con searchsorted.
+    """
+
+    def __init__(self, powers: np.ndarray):
+        self.sorted = np.sort(np.asarray(powers, dtype=np.float64))
+        self.cumsum = np.concatenate(([0.0], np.cumsum(self.sorted)))
+
+    def _mean_from(self, idx: int) -> float:
+        count = self.sorted.size - idx
+        if count <= 0:
+            return 0.0
+        return float((self.cumsum[-1] - self.cumsum[idx]) / count)
+
+    def gated_index(self, gain_pow: float, rel_gate_lu: float) -> int:
+        """
+        Primer índice (en sorted) que supera la puerta absoluta y la relativa
+        con la ganancia de potencia gain_pow.
+        """
+        abs_thr = 10.0 ** ((_ABS_GATE_LUFS - _LUFS_OFFSET) / 10.0) / gain_pow
+        idx_abs = int(np.searchsorted(self.sorted, abs_thr, side="right"))
+        mean_abs = self._mean_from(idx_abs)
+        if mean_abs <= 0.0:
+            return self.sorted.size
+        rel_thr = mean_abs * 10.0 ** (rel_gate_lu / 10.0)
+        return max(idx_abs, int(np.searchsorted(self.sorted, rel_thr, side="right")))
+
+
+def _gated_integrated(powers: _GatedPowers, gain_pow: float = 1.0) -> float:
+    idx = powers.gated_index(gain_pow, _REL_GATE_INTEGRATED_LU)
+    mean = powers._mean_from(idx)
+    if mean <= 0.0:
+        return float("-inf")
+    return float(_LUFS_OFFSET + 10.0 * np.log10(mean * gain_pow))
+
+
+def _gated_lra(powers: _GatedPowers, gain_pow: float = 1.0) -> float:
+    gated = powers.sorted[powers.gated_index(gain_pow, _REL_GATE_LRA_LU):]
+    if gated.size == 0:
+        return 0.0
+    # La ganancia desplaza todos los niveles por igual: no afecta a la diferencia
+    levels = 10.0 * np.log10(gated)
+    return float(np.percentile(levels, 95.0) - np.percentile(levels, 10.0))
+
+
+def gated_lufs_and_lra(block_powers: np.ndarray, short_term_powers: np.ndarray) -> Tuple[float, float]:
+    """
+    (LUFS integrado, LRA) a partir de potencias K-ponderadas de bloque
+    (400 ms / 3 s, p.ej. LoudnessEngine.block_powers tras un modelo de proceso).
+    """
+    return _gated_integrated(_GatedPowers(block_powers)), _gated_lra(_GatedPowers(short_term_powers))
+
+
+class LoudnessEngine:
+    """
+    Loudness BS.1770 / EBU R128 paramétrico en ganancia.
+
+    Calcula una sola vez las potencias K-ponderadas de los bloques de 400 ms
+    (integrado) y de 3 s (LRA). Una ganancia g escala todas las potencias por
+    g², de modo que "LUFS / LRA si gain = g" se resuelve sobre las potencias
+    ordenadas (solo cambian los bloques que cruzan las puertas) sin volver a
+    filtrar el audio. Tras cualquier proceso no lineal hay que medir de nuevo.
+
+    Como el medidor completo (compute_lufs_and_lra) puede ser Essentia o
+    pyloudnorm, lufs_and_lra(gain_db, reference) devuelve la medición de
+    referencia a ganancia 0 más el cambio predicho por el motor.
+    """
+
+    def __init__(self, x: ArrayLike, sr: int):
+        # Igual que _bs1770_loudness: como mucho dos canales
+        audio = _normalize_channels(x)[:, :2].astype(np.float64).T
+        self.sr = int(sr)
+        cum = _energy_cumsum(audio, self.sr)
+
+        step = int(round(_BS1770_STEP_S * self.sr))
+        block_len = int(round(_BS1770_BLOCK_S * self.sr))
+        short_len = int(round(_LRA_BLOCK_S * self.sr))
+        block_ms = _block_mean_squares(cum, block_len, step)
+        short_ms = _block_mean_squares(cum, short_len, step)
+
+        self.channels = int(audio.shape[0])
+        # Potencias K-ponderadas (sumadas entre canales) en orden temporal
+        self.block_powers = block_ms.sum(axis=0)
+        self.short_term_powers = short_ms.sum(axis=0)
+        # Sample-peak (sin ponderar, máximo entre canales) de los mismos bloques
+        self.block_peaks = _block_peaks(audio, block_len, step, self.block_powers.size)
+        self.short_term_peaks = _block_peaks(audio, short_len, step, self.short_term_powers.size)
+        self._channel_blocks = block_ms
+        self._integrated = _GatedPowers(self.block_powers)
+        self._short_term = _GatedPowers(self.short_term_powers)
+        self._per_channel: Dict[int, _GatedPowers] = {}
+
+    def integrated_lufs(self, gain_db: float = 0.0, channel: Optional[int] = None) -> float:
+        """
+        LUFS integrado con ganancia gain_db (de un solo canal si channel no es None).
+        """
+        if channel is None:
+            powers = self._integrated
+        else:
+            powers = self._per_channel.get(channel)
+            if powers is None:
+                powers = _GatedPowers(self._channel_blocks[channel])
+                self._per_channel[channel] = powers
+
+        return _gated_integrated(powers, 10.0 ** (float(gain_db) / 10.0))
+
+    def loudness_range(self, gain_db: float = 0.0) -> float:
+        """
+        LRA (LU) con ganancia gain_db: P95 - P10 de los short-term que pasan las puertas.
+        """
+        return _gated_lra(self._short_term, 10.0 ** (float(gain_db) / 10.0))
+
+    def predict_lufs(
+        self,
+        reference_lufs: float,
+        gain_db: float,
+        channel: Optional[int] = None,
+    ) -> float:
+        """
+        LUFS integrado con ganancia gain_db anclado a reference_lufs (medido a
+        ganancia 0 con el medidor completo): reference + cambio del motor.
+        """
+        lufs = self.integrated_lufs(gain_db, channel=channel)
+        lufs_0 = self.integrated_lufs(0.0, channel=channel)
+        ref = float(reference_lufs)
+        if np.isfinite(ref) and np.isfinite(lufs) and np.isfinite(lufs_0):
+            return float(ref + (lufs - lufs_0))
+        return lufs
+
+    def lufs_and_lra(
+        self,
+        gain_db: float = 0.0,
+        reference: Optional[Tuple[float, float]] = None,
+    ) -> Tuple[float, float]:
+        """
+        (LUFS integrado, LRA) con ganancia gain_db.
+
+        reference = (lufs, lra) medidos a ganancia 0 con compute_lufs_and_lra:
+        el resultado es reference + (cambio predicho por el motor), coherente
+        con el medidor completo.
+        """
+        if reference is None:
+            return self.integrated_lufs(gain_db), self.loudness_range(gain_db)
+
+        lufs = self.predict_lufs(reference[0], gain_db)
+        lra = float(reference[1]) + (self.loudness_range(gain_db) - self.loudness_range(0.0))
+        return lufs, float(max(0.0, lra))
+
+
+# ---------------------------------------------------------------------
+# Series de loudness por ventanas (short-term / momentary)
+# ---------------------------------------------------------------------
+
+# Ventanas EBU R128: momentary 400 ms, short-term 3 s
+MOMENTARY_WINDOW_S = _BS1770_BLOCK_S
+SHORT_TERM_WINDOW_S = _LRA_BLOCK_S
+
+
+def _window_starts(n: int, win: int, hop: int) -> np.ndarray:
+    """Inicios de las ventanas completas range(0, n - win + 1, hop)."""
+    if win <= 0 or hop <= 0 or n < win:
+        return np.zeros(0, dtype=np.int64)
+    return np.arange(0, n - win + 1, hop, dtype=np.int64)
+
+
+def _powers_to_lufs(powers: np.ndarray) -> np.ndarray:
+    powers = np.asarray(powers, dtype=np.float64)
+    out = np.full(powers.shape, float("-inf"), dtype=np.float64)
+    pos = powers > 0.0
+    out[pos] = _LUFS_OFFSET + 10.0 * np.log10(powers[pos])
+    return out
+
+
+def _gated_integrated_rows(powers: np.ndarray) -> np.ndarray:
+    """
+    _gated_integrated por filas de una matriz (n_ventanas, n_bloques) de
+    potencias de 400 ms: puerta absoluta, puerta relativa de -10 LU sobre la
+    media de los bloques que pasan la absoluta y media de los que pasan ambas.
+    """
+    abs_thr = 10.0 ** ((_ABS_GATE_LUFS - _LUFS_OFFSET) / 10.0)
+    above_abs = powers > abs_thr
+    count_abs = above_abs.sum(axis=1)
+    mean_abs = np.where(above_abs, powers, 0.0).sum(axis=1) / np.maximum(count_abs, 1)
+
+    rel_thr = mean_abs * 10.0 ** (_REL_GATE_INTEGRATED_LU / 10.0)
+    gated = above_abs & (powers > rel_thr[:, None])
+    count = gated.sum(axis=1)
+    mean = np.where(gated, powers, 0.0).sum(axis=1) / np.maximum(count, 1)
+    return _powers_to_lufs(np.where(count > 0, mean, 0.0))
+
+
+class ShortTermLoudness:
+    """
+    Loudness de muchas ventanas de una misma señal en una sola pasada.
+
+    Filtra la señal (K-weighting BS.1770; k_weighting=False para potencia
+    sin ponderar, en dBFS) una sola vez y guarda la suma acumulada de la
+    energía sumada entre canales (como mucho dos, igual que el medidor
+    completo). La potencia de cualquier ventana es una resta de la suma
+    acumulada, así que la serie completa (3 s con hop de 1 s, curvas
+    momentary/short-term cada 100 ms...) se obtiene vectorizada, sin volver
+    a instanciar el medidor por ventana.
+
+    No es idéntico a medir cada tramo con measure_integrated_lufs: el filtro
+    K arranca con el estado de la señal anterior a la ventana (sin
+    transitorio inicial) y usa los coeficientes de libebur128, no los de
+    pyloudnorm/Essentia. Los bloques de 400 ms sí empiezan en el inicio de
+    cada ventana, como en el medidor. En ventanas de 3 s la diferencia es
+    del orden de 0.05 dB.
+    """
+
+    def __init__(self, x: ArrayLike, sr: int, k_weighting: bool = True):
+        audio = _normalize_channels(x)[:, :2].astype(np.float64).T
+        self.sr = int(sr)
+        self.k_weighting = bool(k_weighting)
+        self.n_samples = int(audio.shape[1])
+        self._cum = _energy_cumsum(audio, self.sr, k_weighting=self.k_weighting).sum(axis=0)
+
+    def _window_powers(self, starts: np.ndarray, length: int) -> np.ndarray:
+        """Potencia media de las ventanas [start, start + length)."""
+        if starts.size == 0 or length <= 0:
+            return np.zeros(starts.shape, dtype=np.float64)
+        return (self._cum[starts + length] - self._cum[starts]) / float(length)
+
+    def window_powers(
+        self,
+        window_s: float = SHORT_TERM_WINDOW_S,
+        hop_s: float = 1.0,
+        n_samples: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (inicios en muestras, potencia media) de las ventanas completas de
+        window_s con hop hop_s sobre las primeras n_samples muestras.
+        """
+        n = self.n_samples if n_samples is None else min(int(n_samples), self.n_samples)
+        win = int(round(window_s * self.sr))
+        starts = _window_starts(n, win, int(round(hop_s * self.sr)))
+        return starts, self._window_powers(starts, win)
+
+    def window_lufs(
+        self,
+        window_s: float = SHORT_TERM_WINDOW_S,
+        hop_s: float = 1.0,
+        n_samples: Optional[int] = None,
+        gated: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (inicios en muestras, LUFS) de las mismas ventanas que window_powers.
+
+        gated=True: loudness integrado de cada ventana (bloques de 400 ms
+        con paso de 100 ms desde el inicio de la ventana y puertas
+        absoluta/relativa, todas las ventanas a la vez). Coincide con
+        measure_integrated_lufs sobre el tramo salvo por el filtro K (ver
+        la clase), del orden de 0.05 dB. gated=False: loudness short-term EBU (media
+        sin puertas de la ventana). -inf en ventanas en silencio.
+        """
+        if not gated:
+            starts, powers = self.window_powers(window_s, hop_s, n_samples)
+            return starts, _powers_to_lufs(powers)
+
+        n = self.n_samples if n_samples is None else min(int(n_samples), self.n_samples)
+        win = int(round(window_s * self.sr))
+        block = int(round(_BS1770_BLOCK_S * self.sr))
+        step = int(round(_BS1770_STEP_S * self.sr))
+        starts = _window_starts(n, win, int(round(hop_s * self.sr)))
+        if starts.size == 0 or block <= 0 or step <= 0 or win < block:
+            return starts, np.full(starts.shape, float("-inf"), dtype=np.float64)
+
+        # (n_ventanas, n_bloques): inicios de los bloques completos de cada ventana
+        offsets = np.arange(0, win - block + 1, step, dtype=np.int64)
+        block_starts = starts[:, None] + offsets[None, :]
+        powers = self._window_powers(block_starts, block)
+        return starts, _gated_integrated_rows(powers)
+
+    def lufs_and_lra(self) -> Tuple[float, float]:
+        """
+        (LUFS integrado, LRA) de la señal completa con la misma suma acumulada
+        (bloques de 400 ms y short-term de 3 s con paso de 100 ms).
+        """
+        step = int(round(_BS1770_STEP_S * self.sr))
+        block_ms = _block_mean_squares(self._cum, int(round(_BS1770_BLOCK_S * self.sr)), step)
+        short_ms = _block_mean_squares(self._cum, int(round(_LRA_BLOCK_S * self.sr)), step)
+        return gated_lufs_and_lra(block_ms, short_ms)
+
+    def meter_curves(self, hop_s: float = _BS1770_STEP_S) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Curvas de un medidor EBU R128 en tiempo real: cada hop_s, loudness
+        momentary (400 ms) y short-term (3 s) de las ventanas que terminan en
+        ese instante (con ceros antes del inicio de la señal).
+        Devuelve (tiempos de fin en s, momentary LUFS, short-term LUFS).
+        """
+        hop = int(round(hop_s * self.sr))
+        if hop <= 0 or self.n_samples < hop:
+            empty = np.zeros(0, dtype=np.float64)
+            return empty, empty, empty
+
+        ends = np.arange(hop, self.n_samples + 1, hop, dtype=np.int64)
+        curves = []
+        for window_s in (MOMENTARY_WINDOW_S, SHORT_TERM_WINDOW_S):
+            win = int(round(window_s * self.sr))
+            starts = np.maximum(ends - win, 0)
+            curves.append(_powers_to_lufs((self._cum[ends] - self._cum[starts]) / float(win)))
+        return ends / float(self.sr), curves[0], curves[1]
@@ -1,6 +1,10 @@
 from __future__ import annotations
+import os
 import sys
+import json
+import tempfile
 from pathlib import Path
+from typing import Dict, List, Optional
 import numpy as np
 import soundfile as sf
 
@@ -12,6 +16,7 @@ if str(SRC_DIR) not in sys.path:
 
 from utils.logger import logger
 from utils.analysis_utils import get_temp_dir  # noqa: E402
+from utils.audio_utils import write_audio_atomic  # noqa: E402
 
 try:
     from context import PipelineContext
@@ -19,31 +24,137 @@ except ImportError:
     PipelineContext = None # type: ignore
 
 
-def process(context: PipelineContext, *args) -> bool:
+BLOCKSIZE = 65536
+
+# Firma de los stems usados en el último render de full_song.wav (ver ensure_mixdown).
+SIGNATURE_NAME = ".full_song.sig.json"
+
+
+def _bus_buffers_for(context, stage_dir: Path, names: List[str]) -> Optional[Dict[str, np.ndarray]]:
     """
-    Realiza el mixdown de los stems en la carpeta del stage.
-    args[0] (opcional): stage_id override (si context.stage_id no es el deseado)
+    Devuelve los buffers del stem bus si está ligado a stage_dir y contiene
+    todos los stems (mismo sr). None si hay que leer de disco.
+
+    Con stems pendientes en el bus (el disco no está al día) se cargan antes
+    los que falten, para no tener que volcarlo.
     """
-    # Si se pasa un argumento extra (legacy calling convention en stage.py pasaba stage_id)
-    # stage.py: _run_script(mixdown_script, context, stage_id) -> args=(stage_id,)
-    stage_id = args[0] if args else context.stage_id
+    bus = getattr(context, "stem_bus", None)
+    if bus is None or bus.stage_dir != stage_dir:
+        return None
+    if bus.is_dirty():
+        bus.load(names)
+    buffers = bus.as_dict()
+    if not names or any(n not in buffers for n in names):
+        return None
+    return {n: buffers[n] for n in names}
 
-    # Resolver stage_dir usando context
-    stage_dir = context.get_stage_dir(stage_id)
 
-    if not stage_dir.exists():
-        logger.logger.info(f"[mixdown_stems] La carpeta de stage {stage_dir} no existe.")
-        return False # O True si queremos ser permisivos? Originalmente retornaba sin error.
+def _mix_buffers(buffers: List[np.ndarray]) -> np.ndarray:
+    """
+    Suma buffers (channels, samples) y normaliza a pico 1.0 si hace falta.
+    """
+    channels = max(b.shape[0] for b in buffers)
+    frames = max(b.shape[1] for b in buffers)
+    mix = np.zeros((channels, frames), dtype=np.float32)
+    for b in buffers:
+        mix[: b.shape[0], : b.shape[1]] += b
+
+    peak = float(np.max(np.abs(mix))) if mix.size else 0.0
+    if peak > 1.0:
+        mix *= np.float32(1.0 / peak)
+    return mix
+
+
+def _stream_mixdown(paths: List[Path], out_path: Path, sr: int, channels: int) -> None:
+    """
+    Mixdown en una sola lectura de cada stem.
+
+    Se acumula en un único buffer reutilizable y se escribe float32 sin
+    normalizar mientras se mide el pico. Solo si el pico supera 1.0 se hace
+    una segunda pasada, pero sobre full_song (un fichero) y no sobre N stems.
+    """
+    stage_dir = out_path.parent
+    # Escribimos a un temporal y hacemos os.replace: full_song.wav puede ser un
+    # hardlink/reflink del stage anterior (copy_stems) y no debe truncarse in-place.
+    fd, tmp_name = tempfile.mkstemp(prefix=".full_song.", suffix=".wav", dir=stage_dir)
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    scaled_path: Optional[Path] = None
+
+    sum_block = np.empty((BLOCKSIZE, channels), dtype=np.float32)
+    read_block = np.empty((BLOCKSIZE, channels), dtype=np.float32)
+    peak_mix = 0.0
+
+    files = [sf.SoundFile(p, "r") for p in paths]
+    try:
+        with sf.SoundFile(tmp_path, "w", samplerate=sr, channels=channels, subtype="FLOAT") as out_f:
+            while True:
+                max_len = 0
+                for f in files:
+                    data = f.read(BLOCKSIZE, dtype="float32", always_2d=True, out=read_block)
+                    n = data.shape[0]
+                    if n == 0:
+                        continue
+                    if n > max_len:
+                        # Las zonas nuevas del bloque se inicializan al primer stem que las cubre.
+                        sum_block[max_len:n] = data[max_len:n]
+                        if max_len:
+                            sum_block[:max_len] += data[:max_len]
+                        max_len = n
+                    else:
+                        sum_block[:n] += data
+                if max_len == 0:
+                    break
+                block = sum_block[:max_len]
+                peak_mix = max(peak_mix, float(np.max(np.abs(block))))
+                out_f.write(block)
+
+        for f in files:
+            f.close()
+        files = []
+
+        if peak_mix > 1.0:
+            gain = np.float32(1.0 / peak_mix)
+            fd, scaled_name = tempfile.mkstemp(prefix=".full_song.", suffix=".wav", dir=stage_dir)
+            os.close(fd)
+            scaled_path = Path(scaled_name)
+            with sf.SoundFile(tmp_path, "r") as in_f, sf.SoundFile(
+                scaled_path, "w", samplerate=sr, channels=channels, subtype="FLOAT"
+            ) as out_f:
+                while True:
+                    data = in_f.read(BLOCKSIZE, dtype="float32", always_2d=True, out=read_block)
+                    if data.shape[0] == 0:
+                        break
+                    data *= gain
+                    out_f.write(data)
+            os.replace(scaled_path, out_path)
+        else:
+            os.replace(tmp_path, out_path)
+    finally:
+        for f in files:
+            f.close()
+        for p in (tmp_path, scaled_path):
+            if p is not None and p.exists():
+                p.unlink()
 
+def _stem_candidates(stage_dir: Path) -> List[Path]:
     # Tomar todos los .wav excepto full_song.wav (por si ya existiera)
-    stem_paths = [
+    return sorted(
         p for p in stage_dir.glob("*.wav")
         if p.name.lower() != "full_song.wav"
-    ]
+    )
+
+
+def _collect_valid_stems(stage_dir: Path):
+    """
+    Devuelve (valid_paths, sr, channels) o (None, None, None) si no hay stems
+    mezclables (se loguea el motivo).
+    """
+    stem_paths = _stem_candidates(stage_dir)
 
     if not stem_paths:
         logger.logger.info(f"[mixdown_stems] No se han encontrado stems en {stage_dir}")
-        return True # No es error critico quizas?
+        return None, None, None
 
     sr_ref = None
     ch_ref = None
@@ -74,60 +185,111 @@ def process(context: PipelineContext, *args) -> bool:
 
     if not valid_paths or sr_ref is None or ch_ref is None:
         logger.logger.info(f"[mixdown_stems] No hay stems válidos para mixdown en {stage_dir}")
-        return True
+        return None, None, None
+
+    return valid_paths, sr_ref, ch_ref
+
+
+def _stem_signature(paths: List[Path]) -> List[List]:
+    """
+    Huella de los stems de los que sale un mixdown: (nombre, tamaño, mtime_ns).
+    copy_stems enlaza o copia con copy2, así que la huella sobrevive al traspaso.
+    """
+    sig = []
+    for p in paths:
+        st = p.stat()
+        sig.append([p.name, int(st.st_size), int(st.st_mtime_ns)])
+    return sig
+
+
+def _write_signature(stage_dir: Path, paths: List[Path]) -> None:
+    try:
+        (stage_dir / SIGNATURE_NAME).write_text(json.dumps(_stem_signature(paths)), encoding="utf-8")
+    except OSError as e:
+        logger.logger.warning(f"[mixdown_stems] No se pudo guardar la firma del mixdown: {e}")
 
-    blocksize = 65536
 
-    def _compute_peak(paths):
-        peak_val = 0.0
-        files = [sf.SoundFile(p, "r") for p in paths]
+def ensure_mixdown(context: PipelineContext, *args) -> bool:
+    """
+    Mixdown perezoso: solo renderiza full_song.wav si no existe o si los stems
+    de la carpeta han cambiado desde el último render (firma en SIGNATURE_NAME).
+    """
+    stage_id = args[0] if args else context.stage_id
+    stage_dir = context.get_stage_dir(stage_id)
+    full_song = stage_dir / "full_song.wav"
+    sig_path = stage_dir / SIGNATURE_NAME
+
+    if full_song.exists() and sig_path.exists():
         try:
-            while True:
-                sum_block = np.zeros((blocksize, ch_ref), dtype=np.float32)
-                max_len = 0
-                for f in files:
-                    data = f.read(blocksize, dtype="float32", always_2d=True)
-                    if data.size == 0:
-                        continue
-                    n = data.shape[0]
-                    max_len = max(max_len, n)
-                    sum_block[:n, :] += data
-                if max_len == 0:
-                    break
-                peak_val = max(peak_val, float(np.max(np.abs(sum_block[:max_len]))))
-        finally:
-            for f in files:
-                f.close()
-        return peak_val
+            stored = json.loads(sig_path.read_text(encoding="utf-8"))
+        except Exception:
+            stored = None
+        bus = getattr(context, "stem_bus", None)
+        bus_dirty = bus is not None and bus.stage_dir == stage_dir and bus.is_dirty()
+        if not bus_dirty and stored == _stem_signature(_stem_candidates(stage_dir)):
+            logger.logger.info(f"[mixdown_stems] full_song.wav de {stage_id} al día; se reutiliza.")
+            return True
 
-    peak_mix = _compute_peak(valid_paths)
-    if peak_mix <= 0.0:
-        peak_mix = 1.0
-    norm_gain = 1.0 / peak_mix if peak_mix > 1.0 else 1.0
+    return process(context, stage_id)
 
-    out_path = stage_dir / "full_song.wav"
-    files = [sf.SoundFile(p, "r") for p in valid_paths]
+
+def _drop_signature(stage_dir: Path) -> None:
     try:
-        with sf.SoundFile(out_path, "w", samplerate=sr_ref, channels=ch_ref, subtype="FLOAT") as out_f:
-            while True:
-                sum_block = np.zeros((blocksize, ch_ref), dtype=np.float32)
-                max_len = 0
-                for f in files:
-                    data = f.read(blocksize, dtype="float32", always_2d=True)
-                    if data.size == 0:
-                        continue
-                    n = data.shape[0]
-                    max_len = max(max_len, n)
-                    sum_block[:n, :] += data
-                if max_len == 0:
-                    break
-                if norm_gain != 1.0:
-                    sum_block[:max_len, :] *= norm_gain
-                out_f.write(sum_block[:max_len, :])
-    finally:
-        for f in files:
-            f.close()
+        (stage_dir / SIGNATURE_NAME).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def drop_stale_mixdown(stage_dir: Path) -> None:
+    """
+    Elimina el full_song.wav heredado de una carpeta cuyos stems pueden haber
+    cambiado y que nadie va a escuchar: así no se propaga un mixbus obsoleto.
+    """
+    for name in ("full_song.wav", SIGNATURE_NAME):
+        try:
+            (stage_dir / name).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def process(context: PipelineContext, *args) -> bool:
+    """
+    Realiza el mixdown de los stems en la carpeta del stage.
+    args[0] (opcional): stage_id override (si context.stage_id no es el deseado)
+    """
+    # Si se pasa un argumento extra (legacy calling convention en stage.py pasaba stage_id)
+    # stage.py: _run_script(mixdown_script, context, stage_id) -> args=(stage_id,)
+    stage_id = args[0] if args else context.stage_id
 
+    # Resolver stage_dir usando context
+    stage_dir = context.get_stage_dir(stage_id)
+
+    if not stage_dir.exists():
+        logger.logger.info(f"[mixdown_stems] La carpeta de stage {stage_dir} no existe.")
+        return False # O True si queremos ser permisivos? Originalmente retornaba sin error.
+
+    valid_paths, sr_ref, ch_ref = _collect_valid_stems(stage_dir)
+    if valid_paths is None:
+        return True
+
+    out_path = stage_dir / "full_song.wav"
+
+    # Si el bus en memoria del contexto ya tiene todos los stems de esta carpeta,
+    # mezclamos desde ahí sin volver a leer disco.
+    buffers = _bus_buffers_for(context, stage_dir, [p.name for p in valid_paths])
+    if buffers is not None:
+        mix = _mix_buffers(list(buffers.values()))
+        write_audio_atomic(out_path, mix.T, sr_ref, subtype="FLOAT")
+    else:
+        # Si el bus ha tenido que volcar (presupuesto de memoria) el disco ya está al día.
+        _stream_mixdown(valid_paths, out_path, sr_ref, ch_ref)
+
+    bus = getattr(context, "stem_bus", None)
+    if buffers is not None and bus is not None and bus.is_dirty():
+        # Los ficheros de la carpeta no son los mezclados: sin firma válida.
+        _drop_signature(stage_dir)
+    else:
+        _write_signature(stage_dir, valid_paths)
     logger.logger.info(f"[mixdown_stems] Mixdown completado en: {out_path}")
     return True
 
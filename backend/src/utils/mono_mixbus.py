@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import os
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import soundfile as sf
+
+# --- hack sys.path para poder importar utils.* cuando se ejecuta como script ---
+THIS_DIR = Path(__file__).resolve().parent      # .../src/utils
+SRC_DIR = THIS_DIR.parent                       # .../src
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.analysis_utils import MAX_ANALYSIS_SECONDS  # noqa: E402
+from utils.audio_utils import read_mono_float32  # noqa: E402
+from utils.stage_cache import file_content_hash  # noqa: E402
+from utils.stem_executor import map_stems  # noqa: E402
+from utils.stem_bus import active_stem_bus, stem_content_id  # noqa: E402
+
+# Mixbus mono compartido por los análisis de sesión: S1_KEY_DETECTION (todos
+# los stems, hasta MAX_ANALYSIS_SECONDS) y el tempo de sesión de tempo_utils
+# (bus de Drums, tema completo). Cada entrada es un buffer mono float32.
+MONO_MIXBUS_CACHE_MAX_ENTRIES = int(os.getenv("MIX_MONO_MIXBUS_CACHE_MAX_ENTRIES", 4))
+
+# huella (stems + duración) -> (mix, sr)
+_MIXES: "OrderedDict[str, Tuple[np.ndarray, int]]" = OrderedDict()
+_STATS = {"hits": 0, "misses": 0}
+_LOCK = threading.Lock()
+
+
+def mixbus_fingerprint(stem_files: Sequence[Path], max_seconds: Optional[float] = MAX_ANALYSIS_SECONDS) -> str:
+    """
+    Huella del mixbus mono: nombre + hash de contenido de cada stem y la
+    duración leída. Los hashes están memoizados por inodo, así que con stems
+    sin cambios no se vuelve a leer audio; un stem pendiente en el stem bus
+    aporta su versión en memoria.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr(max_seconds).encode("utf-8"))
+    for p in sorted(Path(s) for s in stem_files):
+        h.update(p.name.encode("utf-8"))
+        h.update(stem_content_id(p, file_content_hash).encode("ascii"))
+    return h.hexdigest()
+
+
+def _read_stem_mono(task: Tuple[str, Optional[float]]) -> Tuple[np.ndarray, int]:
+    path_str, max_seconds = task
+    p = Path(path_str)
+    bus = active_stem_bus()
+    buffered = bus.buffer_for(p) if bus is not None else None
+    if buffered is not None:
+        sr = int(buffered.sample_rate)
+        stop = buffered.frames if max_seconds is None else min(buffered.frames, int(max_seconds * sr))
+        return np.mean(buffered.data[:, :stop].T, axis=1, dtype=np.float32), sr
+    if max_seconds is None:
+        return read_mono_float32(p)
+    sr = int(sf.info(str(p)).samplerate)
+    return read_mono_float32(p, stop=int(max_seconds * sr))
+
+
+def _mix(stem_files: Sequence[Path], max_seconds: Optional[float]) -> Tuple[np.ndarray, int]:
+    # Lectura en paralelo (executor de stems)
+    results = map_stems(_read_stem_mono, [(str(p), max_seconds) for p in stem_files])
+
+    data_list: List[np.ndarray] = []
+    sr_ref: Optional[int] = None
+    for y_mono, sr in results:
+        if sr_ref is None:
+            sr_ref = sr
+        # Mismo samplerate garantizado por S0_SESSION_FORMAT
+        data_list.append(y_mono)
+
+    if sr_ref is None or not data_list:
+        return np.zeros(1, dtype=np.float32), 44100
+
+    mix = np.zeros(max(len(y) for y in data_list), dtype=np.float32)
+    for y in data_list:
+        mix[: len(y)] += y
+    return mix, sr_ref
+
+
+def get_mono_mixbus(
+    stem_files: Sequence[Path],
+    max_seconds: Optional[float] = MAX_ANALYSIS_SECONDS,
+) -> Tuple[np.ndarray, int, str]:
+    """
+    Suma mono (sin normalizar) de los stems, leyendo como mucho max_seconds
+    de cada uno. Devuelve (mix, sr, huella). Se reutiliza entre análisis (y
+    entre el pre y el post-análisis) mientras los stems no cambien.
+
+    Los llamantes no deben modificar el array devuelto.
+    """
+    stem_files = sorted(Path(p) for p in stem_files)
+    if not stem_files:
+        return np.zeros(1, dtype=np.float32), 44100, ""
+
+    fingerprint = mixbus_fingerprint(stem_files, max_seconds)
+    with _LOCK:
+        cached = _MIXES.get(fingerprint)
+        if cached is not None:
+            _MIXES.move_to_end(fingerprint)
+            _STATS["hits"] += 1
+        else:
+            _STATS["misses"] += 1
+    if cached is not None:
+        return cached[0], cached[1], fingerprint
+
+    mix, sr = _mix(stem_files, max_seconds)
+    mix.setflags(write=False)
+    with _LOCK:
+        _MIXES[fingerprint] = (mix, sr)
+        while len(_MIXES) > MONO_MIXBUS_CACHE_MAX_ENTRIES:
+            _MIXES.popitem(last=False)
+    return mix, sr, fingerprint
+
+
+def stats() -> Dict[str, int]:
+    return dict(_STATS)
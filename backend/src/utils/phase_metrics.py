@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+# Métricas que se registran por fase en pipeline_timings.json:
+# - process_cpu_sec: CPU de todo el proceso (time.process_time), es decir, el
+#   hilo del job más los hilos del executor de stems, numba y BLAS. Con varios
+#   jobs concurrentes en el mismo proceso incluye también su CPU.
+# - peak_rss_mb: pico de RSS del proceso al terminar la fase (absoluto, no delta).
+# - rss_delta_mb: RSS actual al terminar menos RSS al empezar la fase (lo que la
+#   fase deja reservado; negativo si libera memoria).
+# - process_*_bytes: E/S de todo el proceso (incluye otros jobs/hilos concurrentes).
+PHASE_FIELDS = (
+    "wall_sec",
+    "process_cpu_sec",
+    "peak_rss_mb",
+    "rss_delta_mb",
+    "process_read_bytes",
+    "process_write_bytes",
+)
+# Campos que se agregan con máximo en lugar de suma
+_MAX_FIELDS = {"peak_rss_mb"}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux da KB; macOS da bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def _current_rss_mb() -> Optional[float]:
+    """
+    RSS actual del proceso (/proc/self/statm); None fuera de Linux.
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+    except (OSError, IndexError, ValueError, AttributeError):
+        return None
+
+
+def _io_counters() -> Optional[Dict[str, int]]:
+    """
+    Bytes leídos/escritos por el proceso a nivel de syscall (rchar/wchar de
+    /proc/self/io). Incluye lecturas servidas desde page cache y la E/S de
+    todos los hilos del proceso: no es atribuible a una sola fase.
+    """
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            raw = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"read": int(raw["rchar"]), "write": int(raw["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _snapshot() -> Dict[str, Any]:
+    return {
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "rss": _peak_rss_mb(),
+        "rss_now": _current_rss_mb(),
+        "io": _io_counters(),
+    }
+
+
+class PhaseRecorder:
+    """
+    Acumula tiempo de pared, CPU del proceso, pico y delta de RSS y bytes de E/S
+    del proceso por fase de un contrato (pre_analysis, processing, mixdown, copy, ...).
+
+    Una fase que se repite suma sus valores (el pico de RSS se queda con el máximo).
+    """
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = _snapshot()
+        try:
+            yield
+        finally:
+            self._add(name, start, _snapshot())
+
+    def _add(self, name: str, start: Dict[str, Any], end: Dict[str, Any]) -> None:
+        entry = self.phases.setdefault(name, {k: 0.0 if k.endswith(("_sec", "_mb")) else 0 for k in PHASE_FIELDS})
+        entry["wall_sec"] += end["wall"] - start["wall"]
+        entry["process_cpu_sec"] += end["cpu"] - start["cpu"]
+
+        if end["rss"] is not None and entry["peak_rss_mb"] is not None:
+            entry["peak_rss_mb"] = max(entry["peak_rss_mb"], end["rss"])
+        else:
+            entry["peak_rss_mb"] = None
+
+        if start["rss_now"] is not None and end["rss_now"] is not None and entry["rss_delta_mb"] is not None:
+            entry["rss_delta_mb"] += end["rss_now"] - start["rss_now"]
+        else:
+            entry["rss_delta_mb"] = None
+
+        if start["io"] is not None and end["io"] is not None:
+            entry["process_read_bytes"] += end["io"]["read"] - start["io"]["read"]
+            entry["process_write_bytes"] += end["io"]["write"] - start["io"]["write"]
+        else:
+            entry["process_read_bytes"] = None
+            entry["process_write_bytes"] = None
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for name, entry in self.phases.items():
+            out[name] = {
+                k: (round(v, 3) if isinstance(v, float) else v)
+                for k, v in entry.items()
+            }
+        return out
+
+
+def sum_phases(stages: list) -> Dict[str, Dict[str, Any]]:
+    """
+    Totales por fase sumando todos los contratos de pipeline_timings.json
+    (peak_rss_mb: máximo entre contratos; rss_delta_mb se suma).
+    """
+    totals: Dict[str, Dict[str, Any]] = {}
+    for s in stages:
+        phases = s.get("phases") if isinstance(s, dict) else None
+        if not isinstance(phases, dict):
+            continue
+        for name, entry in phases.items():
+            if not isinstance(entry, dict):
+                continue
+            acc = totals.setdefault(name, {k: 0 for k in PHASE_FIELDS})
+            for k in PHASE_FIELDS:
+                v = entry.get(k)
+                if isinstance(v, (int, float)) and acc[k] is not None:
+                    acc[k] = max(acc[k], v) if k in _MAX_FIELDS else acc[k] + v
+                else:
+                    acc[k] = None
+    for entry in totals.values():
+        for k, v in entry.items():
+            if isinstance(v, float):
+                entry[k] = round(v, 3)
+    return totals
@@ -2,7 +2,7 @@
 
 from __future__ import annotations
 
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
 import numpy as np
 
@@ -29,6 +29,8 @@ def bandlimit_signal(
     Filtro pasa-banda simple en dominio de frecuencia usando FFT real:
       - Si no se dan fmin/fmax, devuelve y tal cual.
       - Si y está vacío, devuelve y.
+      - y puede ser (n,) o un lote (K, n): filtra cada fila (último eje) con
+        una sola llamada a la FFT.
 
     Optimización:
       - Evita construir freqs/mask: calcula directamente bins [kmin, kmax].
@@ -37,13 +39,13 @@ def bandlimit_signal(
         return np.asarray(y, dtype=np.float32)
 
     y = np.asarray(y, dtype=np.float32)
-    n = int(y.shape[0])
+    n = int(y.shape[-1])
     if n <= 1 or sr <= 0:
         return y
 
     # rfft tamaño n => bins 0..(n//2)
-    Y = _rfft(y)
-    nb = int(Y.shape[0])  # = n//2 + 1
+    Y = _rfft(y, axis=-1)
+    nb = int(Y.shape[-1])  # = n//2 + 1
 
     # Convertir frecuencia a bin: k ≈ f * n / sr
     # Clamp a [0, nb-1]
@@ -65,9 +67,9 @@ def bandlimit_signal(
 
     Y_filt = np.zeros_like(Y)
     if kmin <= kmax:
-        Y_filt[kmin : kmax + 1] = Y[kmin : kmax + 1]
+        Y_filt[..., kmin : kmax + 1] = Y[..., kmin : kmax + 1]
 
-    y_filt = _irfft(Y_filt, n=n)
+    y_filt = _irfft(Y_filt, n=n, axis=-1)
     return np.asarray(y_filt, dtype=np.float32)
 
 
@@ -83,6 +85,9 @@ def _xcorr_centered_lags_fft(
     Definición de numerador que replica tu implementación:
       num(lag) = sum_{i} ref[i] * cand[i + lag] con solapamiento válido.
 
+    ref/cand pueden ser (n,) o lotes (K, n) (se emparejan por broadcasting en
+    el último eje); numeradores con forma (..., 2*max_shift+1).
+
     Mapeo de índice tras ifft:
       - lag >= 0 -> idx = lag
       - lag < 0  -> idx = L + lag
@@ -90,35 +95,36 @@ def _xcorr_centered_lags_fft(
     ref = np.asarray(ref, dtype=np.float32)
     cand = np.asarray(cand, dtype=np.float32)
 
-    n = int(min(ref.shape[0], cand.shape[0]))
+    n = int(min(ref.shape[-1], cand.shape[-1]))
     if n <= 0:
         return np.array([0], dtype=np.int32), np.array([0.0], dtype=np.float64)
 
-    ref = ref[:n]
-    cand = cand[:n]
+    ref = ref[..., :n]
+    cand = cand[..., :n]
 
     # Longitud para correlación lineal
     L = int(_next_fast_len(2 * n - 1))
     # FFT real
-    R = _rfft(ref, n=L)
-    C = _rfft(cand, n=L)
+    R = _rfft(ref, n=L, axis=-1)
+    C = _rfft(cand, n=L, axis=-1)
     # Cross-correlation circular en longitud L; con zero-pad se comporta lineal en rango útil
-    cc = _irfft(R * np.conj(C), n=L)  # real
+    cc = _irfft(R * np.conj(C), n=L, axis=-1)  # real
 
     lags = np.arange(-max_shift, max_shift + 1, dtype=np.int32)
     idx = np.where(lags >= 0, lags, L + lags).astype(np.int64)
-    nums = np.asarray(cc[idx], dtype=np.float64)
+    nums = np.asarray(cc[..., idx], dtype=np.float64)
     return lags, nums
 
 
 def _segment_energy_prefix(x: np.ndarray) -> np.ndarray:
     """
     Prefijo de energía: E[k] = sum_{i<=k} x[i]^2   (float64 para estabilidad).
+    Por filas (último eje) si x es un lote.
     """
     x = np.asarray(x, dtype=np.float32)
     if x.size == 0:
         return np.zeros((0,), dtype=np.float64)
-    return np.cumsum(x.astype(np.float64) * x.astype(np.float64), dtype=np.float64)
+    return np.cumsum(x.astype(np.float64) * x.astype(np.float64), axis=-1, dtype=np.float64)
 
 
 def _energy_range(prefix: np.ndarray, start: np.ndarray, length: np.ndarray) -> np.ndarray:
@@ -131,62 +137,46 @@ def _energy_range(prefix: np.ndarray, start: np.ndarray, length: np.ndarray) ->
     # end = start+length-1
     end = start + length - 1
     # prefix[end] - prefix[start-1] (si start>0)
-    base = prefix[end]
-    sub = np.where(start > 0, prefix[start - 1], 0.0)
+    base = prefix[..., end]
+    sub = np.where(start > 0, prefix[..., start - 1], 0.0)
     return base - sub
 
 
-def estimate_best_lag_and_corr(
+def _max_shift_samples(max_time_shift_ms: float, sr: int, n: int) -> int:
+    max_shift = int(round(float(max_time_shift_ms) * 1e-3 * float(sr)))
+    if max_shift >= n:
+        max_shift = n - 1
+    if max_shift < 0:
+        max_shift = 0
+    return max_shift
+
+
+def normalized_xcorr(
     ref: np.ndarray,
     cand: np.ndarray,
     sr: int,
     max_time_shift_ms: float,
-    fmin: Optional[float] = None,
-    fmax: Optional[float] = None,
-) -> Dict[str, float]:
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Estima el mejor desplazamiento temporal (lag, en samples) maximizando correlación normalizada.
+    Correlación normalizada por energía de solape para lags en
+    [-max_shift, +max_shift] (max_shift = max_time_shift_ms en samples):
 
-    Nota importante (coherente con tu pipeline actual):
-      - Esta función devuelve el *lag medido* (cand vs ref) que maximiza corr en el sentido:
-            num(lag) = sum ref[i] * cand[i + lag]
-        Por tanto:
-          lag > 0  suele indicar que CANDIDATE está retrasado respecto a REF (para corregir: shift = -lag).
-          lag < 0  suele indicar que CANDIDATE está adelantado (para corregir: shift = -lag).
+        corr(lag) = sum ref[i] * cand[i + lag] / sqrt(E_ref * E_cand)
 
-    Devuelve:
-      {"lag_samples": float, "lag_ms": float, "correlation": float}
+    ref/cand (ya bandlimitadas si procede) pueden ser (n,) o lotes (K, n);
+    todas las filas se resuelven con una sola FFT por lado. Se truncan a la
+    longitud común.
+
+    Devuelve (lags, corr) con corr de forma (..., n_lags).
     """
     ref = np.asarray(ref, dtype=np.float32)
     cand = np.asarray(cand, dtype=np.float32)
 
-    if ref.size == 0 or cand.size == 0 or sr <= 0:
-        return {"lag_samples": 0.0, "lag_ms": 0.0, "correlation": 0.0}
+    n = int(min(ref.shape[-1], cand.shape[-1]))
+    ref = ref[..., :n]
+    cand = cand[..., :n]
 
-    # Bandlimit (si aplica)
-    if fmin is not None or fmax is not None:
-        ref = bandlimit_signal(ref, sr, fmin=fmin, fmax=fmax)
-        cand = bandlimit_signal(cand, sr, fmin=fmin, fmax=fmax)
-
-    n = int(min(ref.shape[0], cand.shape[0]))
-    if n <= 1:
-        return {"lag_samples": 0.0, "lag_ms": 0.0, "correlation": 0.0}
-
-    ref = ref[:n]
-    cand = cand[:n]
-
-    max_shift = int(round(float(max_time_shift_ms) * 1e-3 * float(sr)))
-    if max_shift >= n:
-        max_shift = n - 1
-    if max_shift < 0:
-        max_shift = 0
-
-    # Caso trivial
-    if max_shift == 0:
-        num = float(np.dot(ref, cand))
-        den = float(np.linalg.norm(ref) * np.linalg.norm(cand))
-        corr = (num / den) if den > 0.0 else 0.0
-        return {"lag_samples": 0.0, "lag_ms": 0.0, "correlation": float(corr)}
+    max_shift = _max_shift_samples(max_time_shift_ms, sr, n)
 
     # ----------------------------
     # Numeradores para lags [-M..M] con FFT
@@ -213,7 +203,7 @@ def estimate_best_lag_and_corr(
     # evitar longitudes no válidas (aunque con clamp de max_shift no debería)
     len_pos = np.maximum(len_pos, 0)
 
-    ref_e_pos = np.where(len_pos > 0, pref_r[len_pos - 1], 0.0)
+    ref_e_pos = np.where(len_pos > 0, pref_r[..., len_pos - 1], 0.0)
     cand_start_pos = l[pos]
     cand_e_pos = np.where(
         len_pos > 0,
@@ -230,7 +220,7 @@ def estimate_best_lag_and_corr(
     len_neg = (n - k).astype(np.int64)
     len_neg = np.maximum(len_neg, 0)
 
-    cand_e_neg = np.where(len_neg > 0, pref_c[len_neg - 1], 0.0)
+    cand_e_neg = np.where(len_neg > 0, pref_c[..., len_neg - 1], 0.0)
     ref_start_neg = k
     ref_e_neg = np.where(
         len_neg > 0,
@@ -241,18 +231,24 @@ def estimate_best_lag_and_corr(
     # Combinar energías en el orden original de lags
     ref_e = np.zeros_like(nums, dtype=np.float64)
     cand_e = np.zeros_like(nums, dtype=np.float64)
-    ref_e[pos] = ref_e_pos
-    cand_e[pos] = cand_e_pos
-    ref_e[neg] = ref_e_neg
-    cand_e[neg] = cand_e_neg
+    ref_e[..., pos] = ref_e_pos
+    cand_e[..., pos] = cand_e_pos
+    ref_e[..., neg] = ref_e_neg
+    cand_e[..., neg] = cand_e_neg
 
     den = np.sqrt(ref_e * cand_e)
     # correlación normalizada
     corr = np.zeros_like(nums, dtype=np.float64)
     valid = den > 0.0
     corr[valid] = nums[valid] / den[valid]
+    return lags, corr
 
-    # Buscar mejor
+
+def best_lag_from_corr(lags: np.ndarray, corr: np.ndarray, sr: int) -> Dict[str, float]:
+    """
+    {"lag_samples", "lag_ms", "correlation"} del máximo de una curva corr(lag)
+    de normalized_xcorr (una fila).
+    """
     best_idx = int(np.argmax(corr))
     best_lag = int(lags[best_idx])
     best_corr = float(corr[best_idx])
@@ -265,6 +261,95 @@ def estimate_best_lag_and_corr(
     }
 
 
+def estimate_best_lag_and_corr(
+    ref: np.ndarray,
+    cand: np.ndarray,
+    sr: int,
+    max_time_shift_ms: float,
+    fmin: Optional[float] = None,
+    fmax: Optional[float] = None,
+) -> Dict[str, float]:
+    """
+    Estima el mejor desplazamiento temporal (lag, en samples) maximizando correlación normalizada.
+
+    Nota importante (coherente con tu pipeline actual):
+      - Esta función devuelve el *lag medido* (cand vs ref) que maximiza corr en el sentido:
+            num(lag) = sum ref[i] * cand[i + lag]
+        Por tanto:
+          lag > 0  suele indicar que CANDIDATE está retrasado respecto a REF (para corregir: shift = -lag).
+          lag < 0  suele indicar que CANDIDATE está adelantado (para corregir: shift = -lag).
+
+    Devuelve:
+      {"lag_samples": float, "lag_ms": float, "correlation": float}
+    """
+    ref = np.asarray(ref, dtype=np.float32)
+    cand = np.asarray(cand, dtype=np.float32)
+
+    if ref.size == 0 or cand.size == 0 or sr <= 0:
+        return {"lag_samples": 0.0, "lag_ms": 0.0, "correlation": 0.0}
+
+    # Bandlimit (si aplica)
+    if fmin is not None or fmax is not None:
+        ref = bandlimit_signal(ref, sr, fmin=fmin, fmax=fmax)
+        cand = bandlimit_signal(cand, sr, fmin=fmin, fmax=fmax)
+
+    n = int(min(ref.shape[0], cand.shape[0]))
+    if n <= 1:
+        return {"lag_samples": 0.0, "lag_ms": 0.0, "correlation": 0.0}
+
+    ref = ref[:n]
+    cand = cand[:n]
+
+    # Caso trivial
+    if _max_shift_samples(max_time_shift_ms, sr, n) == 0:
+        num = float(np.dot(ref, cand))
+        den = float(np.linalg.norm(ref) * np.linalg.norm(cand))
+        corr = (num / den) if den > 0.0 else 0.0
+        return {"lag_samples": 0.0, "lag_ms": 0.0, "correlation": float(corr)}
+
+    lags, corr = normalized_xcorr(ref, cand, sr, max_time_shift_ms)
+    return best_lag_from_corr(lags, corr, sr)
+
+
+def estimate_best_lags_batched(
+    ref: np.ndarray,
+    cand: np.ndarray,
+    sr: int,
+    max_time_shift_ms: float,
+    fmin: Optional[float] = None,
+    fmax: Optional[float] = None,
+) -> List[Dict[str, float]]:
+    """
+    estimate_best_lag_and_corr para K pares de segmentos a la vez: ref y cand
+    son (K, n) (o ref (n,) común a todas las filas). El bandlimit y la
+    cross-correlation de todas las filas van en una sola FFT por lado, con el
+    mismo resultado que fila a fila.
+    """
+    ref = np.asarray(ref, dtype=np.float32)
+    cand = np.asarray(cand, dtype=np.float32)
+    rows = int(cand.shape[0]) if cand.ndim > 1 else 1
+
+    if ref.size == 0 or cand.size == 0 or sr <= 0:
+        return [{"lag_samples": 0.0, "lag_ms": 0.0, "correlation": 0.0} for _ in range(rows)]
+
+    if fmin is not None or fmax is not None:
+        ref = bandlimit_signal(ref, sr, fmin=fmin, fmax=fmax)
+        cand = bandlimit_signal(cand, sr, fmin=fmin, fmax=fmax)
+
+    n = int(min(ref.shape[-1], cand.shape[-1]))
+    if n <= 1 or _max_shift_samples(max_time_shift_ms, sr, n) == 0:
+        ref_rows = np.broadcast_to(ref, cand.shape) if cand.ndim > 1 else ref[None, :]
+        cand_rows = cand if cand.ndim > 1 else cand[None, :]
+        return [
+            estimate_best_lag_and_corr(r, c, sr, max_time_shift_ms)
+            for r, c in zip(ref_rows, cand_rows)
+        ]
+
+    lags, corr = normalized_xcorr(ref, cand, sr, max_time_shift_ms)
+    corr = corr.reshape(-1, corr.shape[-1])
+    return [best_lag_from_corr(lags, row, sr) for row in corr]
+
+
 def apply_time_shift_samples(y: np.ndarray, lag_samples: int) -> np.ndarray:
     """
     Aplica un shift temporal a y:
@@ -28,6 +28,32 @@ def _quantize_single_midi_to_scale(m: float, scale_pcs: List[int]) -> float:
     return float(best_n)
 
 
+def yin_f0(
+    y: np.ndarray,
+    sr: int,
+    fmin_note: str = "C2",
+    fmax_note: str = "C7",
+    frame_length: int = 2048,
+    hop_length: int = 512,
+    center: bool = True,
+) -> np.ndarray:
+    """
+    Curva f0 (Hz por frame) de una señal mono con librosa.yin. Cada frame es
+    independiente: con center=False sobre un tramo (ya con el padding de
+    center) se obtienen exactamente los mismos frames que sobre la señal
+    completa.
+    """
+    return librosa.yin(
+        np.asarray(y, dtype=np.float32),
+        fmin=librosa.note_to_hz(fmin_note),
+        fmax=librosa.note_to_hz(fmax_note),
+        sr=sr,
+        frame_length=frame_length,
+        hop_length=hop_length,
+        center=center,
+    )
+
+
 def estimate_pitch_deviation(
     y: np.ndarray,
     sr: int,
@@ -48,17 +74,21 @@ def estimate_pitch_deviation(
     Si no hay frames sonoros (todo NaN), devuelve valores por defecto.
     """
     if y.size == 0:
-        return {
-            "max_abs_deviation_cents": None,
-            "median_deviation_cents": None,
-            "recommended_global_shift_semitones": 0.0,
-        }
+        return pitch_deviation_from_f0(np.zeros(0, dtype=np.float32))
 
     fmin_hz = librosa.note_to_hz(fmin_note)
     fmax_hz = librosa.note_to_hz(fmax_note)
 
     f0 = librosa.yin(y, fmin=fmin_hz, fmax=fmax_hz, sr=sr)
+    return pitch_deviation_from_f0(f0)
+
 
+def pitch_deviation_from_f0(f0: np.ndarray) -> Dict[str, Any]:
+    """
+    Estadísticas de estimate_pitch_deviation a partir de una curva f0 ya
+    calculada (p.ej. del almacén de f0 por stem).
+    """
+    f0 = np.asarray(f0)
     mask = ~np.isnan(f0)
     if not mask.any():
         return {
@@ -93,7 +123,8 @@ def apply_global_pitch_shift(
     """
     Aplica un pitch-shift global en semitonos usando librosa.effects.pitch_shift.
 
-    - Soporta mono o multicanal (n_samples,) o (n_samples, n_channels).
+    - Soporta mono o multicanal (n_samples,) o (n_samples, n_channels); los
+      canales se procesan en una sola llamada.
     """
     if abs(shift_semitones) < 1e-3 or y.size == 0:
         return y
@@ -102,16 +133,98 @@ def apply_global_pitch_shift(
         y_shifted = librosa.effects.pitch_shift(y, sr=sr, n_steps=shift_semitones)
         return y_shifted.astype(y.dtype)
 
-    # Multicanal: aplicar canal a canal
-    y_T = y.T  # (n_channels, n_samples)
-    shifted_channels = []
-    for ch in y_T:
-        ch_shifted = librosa.effects.pitch_shift(ch, sr=sr, n_steps=shift_semitones)
-        shifted_channels.append(ch_shifted)
+    # librosa procesa (n_channels, n_samples) de una vez
+    y_shifted_T = librosa.effects.pitch_shift(np.ascontiguousarray(y.T), sr=sr, n_steps=shift_semitones)
+    return y_shifted_T.T.astype(y.dtype)
+
 
-    y_shifted_T = np.stack(shifted_channels, axis=0)
-    y_shifted = y_shifted_T.T  # (n_samples, n_channels)
-    return y_shifted.astype(y.dtype)
+def _pitch_marks(t_start: float, t_end: float, times: np.ndarray, periods: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    """
+    Marcas separadas por el periodo local (interpolado de periods en times,
+    dividido por scale) desde t_start hasta pasar t_end.
+    """
+    marks = []
+    t = float(t_start)
+    while t < t_end:
+        marks.append(t)
+        t += max(float(np.interp(t, times, periods)) / scale, 1.0)
+    return np.asarray(marks, dtype=np.float64)
+
+
+def psola_shift_segment(
+    y: np.ndarray,
+    start: int,
+    end: int,
+    shift_semitones: float,
+    times: np.ndarray,
+    periods: np.ndarray,
+) -> np.ndarray:
+    """
+    y[start:end] con el pitch desplazado shift_semitones por TD-PSOLA (sin
+    cambio de duración ni de formantes):
+
+      - Marcas de análisis separadas por el periodo local (periods en samples,
+        definidos en las posiciones times, p.ej. sr / f0 por frame).
+      - Marcas de síntesis separadas por periodo / ratio; cada una toma el
+        grano (ventana Hann) de la marca de análisis más cercana en el tiempo.
+      - Los granos se leen de y con contexto fuera de [start, end) y se
+        normalizan por la suma de ventanas.
+
+    Soporta mono o multicanal (todos los canales con las mismas marcas). El
+    coste es proporcional a end - start, no a la longitud de y.
+    """
+    ratio = float(2.0 ** (shift_semitones / 12.0))
+    n = y.shape[0]
+    periods = np.asarray(periods, dtype=np.float64)
+    p_max = float(np.max(periods))
+    # Semiancho del grano: >= periodo de síntesis para que las ventanas
+    # solapen al menos al 50 % también al bajar el pitch
+    half_scale = max(1.0, 1.0 / ratio)
+    margin = int(np.ceil(2.0 * p_max * half_scale)) + 1
+
+    analysis = _pitch_marks(start - margin, end + margin, times, periods)
+    synthesis = _pitch_marks(start - p_max * half_scale, end + p_max * half_scale, times, periods, scale=ratio)
+
+    buf_start = start - margin
+    buf_len = (end - start) + 2 * margin
+    acc = np.zeros((buf_len,) + y.shape[1:], dtype=np.float64)
+    wsum = np.zeros(buf_len, dtype=np.float64)
+
+    nearest = np.clip(np.searchsorted(analysis, synthesis), 1, max(analysis.size - 1, 1))
+    nearest -= (synthesis - analysis[nearest - 1] < analysis[nearest] - synthesis).astype(nearest.dtype)
+    nearest = np.clip(nearest, 0, analysis.size - 1)
+
+    for ts, ia in zip(synthesis, nearest):
+        ta = int(round(analysis[ia]))
+        ts = int(round(ts))
+        half = int(round(float(np.interp(ts, times, periods)) * half_scale))
+        if half < 2:
+            continue
+        win = np.hanning(2 * half + 1)
+
+        # Recorte del grano a y (analysis) y al buffer (síntesis)
+        lo = max(-half, -ta, buf_start - ts)
+        hi = min(half, n - 1 - ta, buf_start + buf_len - 1 - ts)
+        if hi < lo:
+            continue
+        w = win[lo + half : hi + half + 1]
+        grain = y[ta + lo : ta + hi + 1]
+        o0 = ts + lo - buf_start
+        o1 = ts + hi + 1 - buf_start
+        if y.ndim == 1:
+            acc[o0:o1] += grain * w
+        else:
+            acc[o0:o1] += grain * w[:, None]
+        wsum[o0:o1] += w
+
+    out = acc[margin : margin + (end - start)]
+    norm = wsum[margin : margin + (end - start)]
+    norm = np.where(norm > 1e-3, norm, 1.0)
+    if y.ndim == 1:
+        out = out / norm
+    else:
+        out = out / norm[:, None]
+    return out.astype(y.dtype)
 
 
 def tune_vocal_time_varying(
@@ -125,7 +238,9 @@ def tune_vocal_time_varying(
     frame_length: int = 2048,
     hop_length: int = 512,
     allowed_scale_pcs: List[int] | None = None,
-) -> np.ndarray:
+    f0: np.ndarray | None = None,
+    return_regions: bool = False,
+) -> np.ndarray | Tuple[np.ndarray, List[Tuple[int, int]]]:
     """
     Afinación time-varying (nota a nota) con escala + corrección suave:
 
@@ -135,29 +250,34 @@ def tune_vocal_time_varying(
           * regiones muy desviadas -> corrección fuerte
           * regiones poco desviadas -> corrección suave o nula
       - Usa crossfades en bordes para evitar clics.
+      - Cada región se desplaza con TD-PSOLA guiado por la propia curva f0
+        (todos los canales a la vez); el resto del audio se copia tal cual,
+        así que el coste depende de cuánto hay que corregir, no de la
+        longitud del stem.
 
     Esto reduce el efecto robótico y mantiene más “humanidad” en la voz.
+
+    f0: curva yin ya calculada sobre la mezcla mono de y (mismos fmin/fmax,
+    frame_length y hop_length), p.ej. del almacén de f0 por stem; si es None
+    se calcula aquí. Con return_regions devuelve también los rangos de
+    samples [start, end) que se han reafinado.
     """
-    if y.size == 0:
-        return y
+    retuned: List[Tuple[int, int]] = []
 
-    # Curva de pitch en mono (audio puede ser multicanal)
-    if y.ndim == 1:
-        y_mono = y.astype(np.float32)
-    else:
-        y_mono = np.mean(y, axis=1).astype(np.float32)
+    def _result(out: np.ndarray):
+        return (out, retuned) if return_regions else out
 
-    fmin_hz = librosa.note_to_hz(fmin_note)
-    fmax_hz = librosa.note_to_hz(fmax_note)
+    if y.size == 0:
+        return _result(y)
 
-    f0 = librosa.yin(
-        y_mono,
-        fmin=fmin_hz,
-        fmax=fmax_hz,
-        sr=sr,
-        frame_length=frame_length,
-        hop_length=hop_length,
-    )
+    if f0 is None:
+        # Curva de pitch en mono (audio puede ser multicanal)
+        if y.ndim == 1:
+            y_mono = y.astype(np.float32)
+        else:
+            y_mono = np.mean(y, axis=1).astype(np.float32)
+
+        f0 = yin_f0(y_mono, sr, fmin_note, fmax_note, frame_length, hop_length)
 
     n_frames = len(f0)
     frames_idx = np.arange(n_frames)
@@ -165,7 +285,7 @@ def tune_vocal_time_varying(
     midi = np.full_like(f0, np.nan, dtype=np.float32)
     mask_valid = ~np.isnan(f0)
     if not mask_valid.any():
-        return y
+        return _result(y)
 
     midi[mask_valid] = librosa.hz_to_midi(f0[mask_valid])
 
@@ -274,9 +394,19 @@ def tune_vocal_time_varying(
         if seg_len < MIN_SEG_SAMPLES:
             continue
 
-        seg_shifted = apply_global_pitch_shift(segment, sr=sr, shift_semitones=shift_semitones)
+        region_frames = np.arange(start_f, end_f + 1)[region_mask]
+        seg_shifted = psola_shift_segment(
+            y,
+            start_sample,
+            end_sample,
+            shift_semitones,
+            times=region_frames * float(hop_length),
+            periods=float(sr) / f0[region_frames].astype(np.float64),
+        )
 
         # CROSSFADE
+        retuned.append((start_sample, end_sample))
+
         fade_len = min(MAX_FADE_SAMPLES, seg_len // 4)
         if fade_len < 16:
             y_out[start_sample:end_sample] = seg_shifted
@@ -301,5 +431,5 @@ def tune_vocal_time_varying(
 
         y_out[start_sample:end_sample] = new_seg
 
-    return y_out
+    return _result(y_out)
 
@@ -3,7 +3,7 @@ from __future__ import annotations
 from typing import List, Dict
 
 import numpy as np
-from scipy.signal import lfilter
+from scipy.signal import lfilter, sosfilt, sosfreqz
 
 
 # ---------------------------------------------------------------------
@@ -222,6 +222,57 @@ def _design_peaking_eq_biquad(
     return b, a
 
 
+def design_notch_sos(
+    notches: List[Dict[str, float]],
+    sr: int,
+    q_default: float = 5.0,
+) -> np.ndarray:
+    """
+    Cascada de notches {"freq_hz", "cut_db", "q"?} como SOS (n, 6) para
+    scipy.signal.sosfilt. Mismos biquads RBJ que el PeakFilter de Pedalboard
+    (juce makePeakFilter); ignora notches fuera de (0, Nyquist) o sin corte.
+    """
+    nyquist = 0.5 * float(sr)
+    sections: List[np.ndarray] = []
+    for notch in notches or []:
+        try:
+            f0 = float(notch.get("freq_hz", 0.0))
+            cut_db = float(notch.get("cut_db", 0.0))
+            q = float(notch.get("q", q_default))
+        except (TypeError, ValueError):
+            continue
+        if f0 <= 0.0 or f0 >= nyquist or cut_db <= 0.0 or q <= 0.0:
+            continue
+        b, a = _design_peaking_eq_biquad(f0=f0, fs=sr, gain_db=-abs(cut_db), q=q)
+        sections.append(np.concatenate([b, a]))
+
+    if not sections:
+        return np.zeros((0, 6), dtype=np.float64)
+    return np.vstack(sections)
+
+
+def sos_magnitude_response(sos: np.ndarray, freqs: np.ndarray, sr: int) -> np.ndarray:
+    """
+    |H(f)| de la cascada sos en las frecuencias freqs (Hz).
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    if sos.shape[0] == 0:
+        return np.ones_like(freqs)
+    _, h = sosfreqz(sos, worN=freqs, fs=float(sr))
+    return np.abs(h)
+
+
+def apply_notch_sos(y: np.ndarray, sos: np.ndarray) -> np.ndarray:
+    """
+    Aplica la cascada sos en un único pase (float64 interno) sobre una señal
+    mono (N,) o multicanal (N, C).
+    """
+    x = np.asarray(y, dtype=np.float32)
+    if x.size == 0 or sos.shape[0] == 0:
+        return x
+    return sosfilt(sos, x.astype(np.float64), axis=0).astype(np.float32)
+
+
 def _apply_resonance_cuts_mono(
     y: np.ndarray,
     sr: int,
@@ -11,7 +11,7 @@ from .analysis_utils import get_temp_dir
 
 def load_session_config(contract_id: str) -> Dict[str, Any]:
     """
-    Lee temp[/<MIX_JOB_ID>]/<contract_id>/session_config.json si existe.
+    Lee <temp_root del job>/<contract_id>/session_config.json si existe.
 
     Devuelve:
       - style_preset: str
@@ -21,9 +21,9 @@ def load_session_config(contract_id: str) -> Dict[str, Any]:
     Comportamiento:
       - Modo CLI (single-job):
           PROJECT_ROOT/temp/<contract_id>/session_config.json
-      - Modo multi-job (Celery, con MIX_JOB_ID/MIX_TEMP_ROOT):
-          PROJECT_ROOT/temp/<MIX_JOB_ID>/<contract_id>/session_config.json
-          o MIX_TEMP_ROOT/<contract_id>/session_config.json
+      - Modo multi-job (Celery, con PipelineContext activo):
+          <context.temp_root>/<contract_id>/session_config.json
+          (en CLI: MIX_TEMP_ROOT[/<MIX_JOB_ID>]/<contract_id>/session_config.json)
     """
     # No forzamos create=True: si no existe la carpeta, simplemente no hay config.
     temp_dir: Path = get_temp_dir(contract_id, create=False)
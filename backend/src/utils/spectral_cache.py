@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# --- hack sys.path para poder importar utils.* cuando se ejecuta como script ---
+THIS_DIR = Path(__file__).resolve().parent      # .../src/utils
+SRC_DIR = THIS_DIR.parent                       # .../src
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.audio_utils import read_mono_float32  # noqa: E402
+from utils.logger import logger  # noqa: E402
+from utils.stage_cache import file_content_hash  # noqa: E402
+from utils.stft_engine import welch_psd  # noqa: E402
+from utils.tonal_balance_utils import BandPowerSpectrum  # noqa: E402
+
+# Entradas de la LRU en memoria de features espectrales por contenido
+SPECTRAL_CACHE_MAX_ENTRIES = int(os.getenv("MIX_SPECTRAL_CACHE_MAX_ENTRIES", 64))
+
+# Espectrograma resumido (mismo que el de los gráficos interactivos del report)
+SPECTROGRAM_N_FFT = 2048
+SPECTROGRAM_FRAMES = 600
+SPECTROGRAM_MIN_HOP = 512
+SPECTROGRAM_N_MELS = 128
+
+# Sube si cambia el cálculo de cualquier feature (invalida los sidecars)
+_FORMAT_VERSION = 1
+
+# hash de contenido -> features
+_FEATURES: "OrderedDict[str, SpectralFeatures]" = OrderedDict()
+_STATS = {"hits": 0, "disk_hits": 0, "misses": 0}
+_LOCK = threading.Lock()
+
+
+@dataclass
+class SpectralFeatures:
+    """
+    Features espectrales de un audio (mono = media de canales):
+
+    - freqs/psd: PSD de Welch one-sided (stft_engine.welch_psd).
+    - mel/mel_hop: espectrograma de magnitud en bandas mel
+      (SPECTROGRAM_N_MELS x ~SPECTROGRAM_FRAMES), o None sin librosa.
+    """
+
+    sr: int
+    n_samples: int
+    freqs: np.ndarray
+    psd: np.ndarray
+    mel: Optional[np.ndarray] = None
+    mel_hop: int = 0
+
+    def band_spectrum(self) -> BandPowerSpectrum:
+        return BandPowerSpectrum(self.freqs, self.psd, self.n_samples, self.sr)
+
+    def band_energies(self) -> Dict[str, float]:
+        """Igual que tonal_balance_utils.compute_band_energies sobre el audio."""
+        return self.band_spectrum().band_energies()
+
+    def band_power_db(self, fmin_hz: float, fmax_hz: float) -> float:
+        """Densidad media (dB) de la PSD en [fmin_hz, fmax_hz)."""
+        mask = (self.freqs >= float(fmin_hz)) & (self.freqs < float(fmax_hz))
+        if not np.any(mask):
+            return -120.0
+        return float(10.0 * np.log10(max(float(np.mean(self.psd[mask])), 1e-24)))
+
+
+# ---------------------------------------------------------------------
+# Cálculo
+# ---------------------------------------------------------------------
+
+def mel_magnitude_spectrogram(mono: np.ndarray, sr: int) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Espectrograma mel de magnitud (n_mels, frames) con n_fft SPECTROGRAM_N_FFT
+    y hop len/SPECTROGRAM_FRAMES (mínimo SPECTROGRAM_MIN_HOP). Devuelve
+    (None, hop) si librosa no está disponible.
+    """
+    hop_length = max(SPECTROGRAM_MIN_HOP, len(mono) // SPECTROGRAM_FRAMES)
+    try:
+        import librosa
+    except ImportError:
+        return None, hop_length
+
+    S = np.abs(librosa.stft(np.asarray(mono, dtype=np.float32), n_fft=SPECTROGRAM_N_FFT, hop_length=hop_length))
+    mels = librosa.filters.mel(sr=sr, n_fft=SPECTROGRAM_N_FFT, n_mels=SPECTROGRAM_N_MELS, fmin=20, fmax=sr / 2)
+    return np.dot(mels, S).astype(np.float32), hop_length
+
+
+def compute_spectral_features(y: np.ndarray, sr: int) -> SpectralFeatures:
+    """
+    Calcula las features de un array (samples,) o (samples, channels).
+    """
+    arr = np.asarray(y, dtype=np.float32)
+    mono = np.mean(arr, axis=1, dtype=np.float32) if arr.ndim > 1 else arr
+    freqs, psd = welch_psd(mono, int(sr))
+    mel, mel_hop = mel_magnitude_spectrogram(mono, int(sr)) if mono.size else (None, 0)
+    return SpectralFeatures(
+        sr=int(sr),
+        n_samples=int(mono.size),
+        freqs=freqs,
+        psd=psd,
+        mel=mel,
+        mel_hop=int(mel_hop),
+    )
+
+
+# ---------------------------------------------------------------------
+# Persistencia (sidecar junto al audio)
+# ---------------------------------------------------------------------
+
+def sidecar_path(audio_path: Path) -> Path:
+    """
+    .{nombre}.spectral.npz en la carpeta del audio: los ficheros que empiezan
+    por "." no son salidas del contrato para stage_cache ni los copia copy_stems.
+    """
+    return audio_path.parent / f".{audio_path.name}.spectral.npz"
+
+
+def _load_sidecar(path: Path, content_hash: str) -> Optional[SpectralFeatures]:
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["version"]) != _FORMAT_VERSION or str(z["content_hash"]) != content_hash:
+                return None
+            mel = z["mel"] if z["mel"].size else None
+            return SpectralFeatures(
+                sr=int(z["sr"]),
+                n_samples=int(z["n_samples"]),
+                freqs=z["freqs"].astype(np.float64),
+                psd=z["psd"].astype(np.float64),
+                mel=mel,
+                mel_hop=int(z["mel_hop"]),
+            )
+    except Exception:
+        return None
+
+
+def _save_sidecar(path: Path, content_hash: str, feats: SpectralFeatures) -> None:
+    """
+    Escritura atómica (tmp + os.replace) en float32; best-effort.
+    """
+    try:
+        fd, tmp_name = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+        os.close(fd)
+        try:
+            with open(tmp_name, "wb") as f:
+                np.savez(
+                    f,
+                    version=np.int64(_FORMAT_VERSION),
+                    content_hash=np.str_(content_hash),
+                    sr=np.int64(feats.sr),
+                    n_samples=np.int64(feats.n_samples),
+                    freqs=feats.freqs.astype(np.float32),
+                    psd=feats.psd.astype(np.float32),
+                    mel=feats.mel if feats.mel is not None else np.zeros(0, dtype=np.float32),
+                    mel_hop=np.int64(feats.mel_hop),
+                )
+            os.replace(tmp_name, path)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+    except OSError as exc:
+        logger.logger.info(f"[spectral_cache] No se pudo guardar {path.name}: {exc}")
+
+
+def _remember(content_hash: str, feats: SpectralFeatures) -> None:
+    with _LOCK:
+        _FEATURES[content_hash] = feats
+        _FEATURES.move_to_end(content_hash)
+        while len(_FEATURES) > SPECTRAL_CACHE_MAX_ENTRIES:
+            _FEATURES.popitem(last=False)
+
+
+# ---------------------------------------------------------------------
+# API
+# ---------------------------------------------------------------------
+
+def get_spectral_features(
+    audio_path: Path,
+    y: Optional[np.ndarray] = None,
+    sr: Optional[int] = None,
+) -> SpectralFeatures:
+    """
+    Features espectrales del fichero audio_path, calculadas una sola vez por
+    contenido:
+
+      1) memoria del proceso (LRU por hash de contenido: un stem o mixbus que
+         pasa de un contrato a otro por hardlink se reutiliza),
+      2) sidecar .{nombre}.spectral.npz junto al audio,
+      3) cálculo (desde y/sr si el llamante ya tiene el audio en memoria; si
+         no, leyendo el fichero) y persistencia en el sidecar.
+
+    Los llamantes no deben modificar los arrays devueltos.
+    """
+    audio_path = Path(audio_path)
+    content_hash = file_content_hash(audio_path)
+    with _LOCK:
+        feats = _FEATURES.get(content_hash)
+        if feats is not None:
+            _FEATURES.move_to_end(content_hash)
+            _STATS["hits"] += 1
+    if feats is not None:
+        return feats
+
+    side = sidecar_path(audio_path)
+    feats = _load_sidecar(side, content_hash)
+    if feats is not None:
+        with _LOCK:
+            _STATS["disk_hits"] += 1
+        _remember(content_hash, feats)
+        return feats
+
+    with _LOCK:
+        _STATS["misses"] += 1
+    if y is None or sr is None:
+        y, sr = read_mono_float32(audio_path)
+    feats = compute_spectral_features(y, int(sr))
+    _save_sidecar(side, content_hash, feats)
+    _remember(content_hash, feats)
+    return feats
+
+
+def stats() -> Dict[str, int]:
+    return dict(_STATS)
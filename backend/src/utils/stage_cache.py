@@ -0,0 +1,477 @@
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# --- hack sys.path para poder importar utils.* cuando se ejecuta como script ---
+THIS_DIR = Path(__file__).resolve().parent      # .../src/utils
+SRC_DIR = THIS_DIR.parent                       # .../src
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.logger import logger  # noqa: E402
+from utils.analysis_utils import PROJECT_ROOT, load_contract  # noqa: E402
+from utils.copy_stems import link_or_copy  # noqa: E402
+
+# Caché de resultados por contrato, compartida entre jobs
+STAGE_CACHE_DIR = PROJECT_ROOT / "temp" / "_stage_cache"
+STAGE_CACHE_MAX_GB = 20.0
+
+MANIFEST_NAME = "manifest.json"
+
+# Contratos que leen estado del job fuera de su carpeta que no podemos hashear
+# de forma fiable (correcciones de Studio, timings, todas las carpetas).
+UNCACHEABLE_CONTRACTS = {
+    "S6_MANUAL_CORRECTION",
+    "S11_REPORT_GENERATION",
+}
+
+# Entradas de otros contratos que forman parte de la clave (rutas relativas al job).
+# Se hashea el fichero entero salvo que EXTERNAL_INPUT_FIELDS diga qué campos lee.
+EXTERNAL_INPUTS: Dict[str, List[str]] = {
+    "S1_VOX_TUNING": ["S1_KEY_DETECTION/analysis_S1_KEY_DETECTION.json"],
+    # BPM de sesión (utils.tempo_utils)
+    "S5_STEM_DYNAMICS_GENERIC": ["work/session_tempo.json"],
+    "S5_BUS_DYNAMICS_DRUMS": ["work/session_tempo.json"],
+    "S5_LEADVOX_DYNAMICS": ["work/session_tempo.json"],
+}
+
+# Campos (rutas con puntos) de las entradas externas JSON que leen sus consumidores:
+# el análisis de S1_KEY_DETECTION lleva rutas absolutas del job y style_preset,
+# que no deben impedir un acierto de S1_VOX_TUNING entre jobs.
+EXTERNAL_INPUT_FIELDS: Dict[str, List[str]] = {
+    "S1_KEY_DETECTION/analysis_S1_KEY_DETECTION.json": [
+        "session.key_root_pc",
+        "session.key_mode",
+        "session.key_name",
+        "session.scale_pitch_classes",
+        "session.scale_pitch_classes_detected",
+    ],
+}
+
+# Campos de session_config.json que los análisis solo copian en su JSON (no
+# cambian ningún resultado). No forman parte de la clave de los contratos que
+# no los declaran en io.config; al restaurar se reescriben con el valor del job actual.
+ECHOED_CONFIG_FIELDS = ("style_preset",)
+
+# Marcador de la carpeta del job en los JSON guardados: la caché es compartida
+# entre jobs y los análisis llevan rutas absolutas (file_path) del job.
+_JOB_ROOT_MARKER = "@@MIX_JOB_ROOT@@"
+
+# Ficheros de la carpeta del stage que NO son resultado del contrato.
+_SKIP_OUTPUTS = {"full_song_pre.wav", MANIFEST_NAME}
+
+# Hash por (dev, inode, size, mtime_ns): los stems que pasan de un contrato a otro
+# por hardlink comparten inodo, así que solo se leen una vez por proceso. LRU
+# acotada: cada escritura atómica crea un inodo nuevo.
+FILE_HASH_CACHE_MAX_ENTRIES = int(os.getenv("MIX_FILE_HASH_CACHE_MAX_ENTRIES", 4096))
+_FILE_HASH_CACHE: "OrderedDict[Tuple[int, int, int, int], str]" = OrderedDict()
+_FILE_HASH_LOCK = threading.Lock()
+_CODE_VERSION: Optional[str] = None
+
+
+# ---------------------------------------------------------------------
+# Hashing
+# ---------------------------------------------------------------------
+
+def file_content_hash(path: Path) -> str:
+    """
+    Hash del contenido de un fichero, memoizado por inodo/tamaño/mtime.
+    """
+    st = path.stat()
+    memo_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    with _FILE_HASH_LOCK:
+        cached = _FILE_HASH_CACHE.get(memo_key)
+        if cached is not None:
+            _FILE_HASH_CACHE.move_to_end(memo_key)
+            return cached
+
+    h = hashlib.blake2b(digest_size=20)
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _FILE_HASH_LOCK:
+        _FILE_HASH_CACHE[memo_key] = digest
+        while len(_FILE_HASH_CACHE) > FILE_HASH_CACHE_MAX_ENTRIES:
+            _FILE_HASH_CACHE.popitem(last=False)
+    return digest
+
+
+def _json_fields_hash(path: Path, fields: List[str]) -> str:
+    """
+    Hash de los campos `fields` (rutas con puntos) de un JSON. Si no se puede
+    leer como JSON se hashea el fichero entero.
+    """
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return file_content_hash(path)
+    used: Dict[str, Any] = {}
+    for field in fields:
+        value: Any = data
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        used[field] = value
+    return hashlib.blake2b(
+        json.dumps(used, sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=20
+    ).hexdigest()
+
+
+def code_version() -> str:
+    """
+    Hash de los fuentes que pueden cambiar un resultado (stages, analysis, utils,
+    contracts.json). Se calcula una vez por proceso.
+    """
+    global _CODE_VERSION
+    if _CODE_VERSION is not None:
+        return _CODE_VERSION
+
+    h = hashlib.blake2b(digest_size=20)
+    for sub in ("stages", "analysis", "utils", "struct"):
+        for p in sorted((SRC_DIR / sub).glob("*")):
+            if p.suffix not in (".py", ".json") or not p.is_file():
+                continue
+            h.update(p.name.encode("utf-8"))
+            h.update(p.read_bytes())
+    _CODE_VERSION = h.hexdigest()
+    return _CODE_VERSION
+
+
+def _config_fields(contract: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Campos de session_config.json que lee el contrato (io.config en
+    contracts.json); None si no lo declara.
+    """
+    io = contract.get("io")
+    fields = io.get("config") if isinstance(io, dict) else None
+    return [str(f) for f in fields] if isinstance(fields, list) else None
+
+
+def _session_config_hash(config_path: Path, fields: Optional[List[str]]) -> str:
+    """
+    Hash de los campos de session_config.json que lee el contrato (io.config en
+    contracts.json). Sin declaración se hashea el fichero entero.
+    """
+    if fields is None:
+        return file_content_hash(config_path)
+    try:
+        cfg = json.loads(config_path.read_text(encoding="utf-8"))
+    except Exception:
+        return file_content_hash(config_path)
+    if not isinstance(cfg, dict):
+        return file_content_hash(config_path)
+    used = {k: cfg.get(k) for k in fields}
+    return hashlib.blake2b(
+        json.dumps(used, sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=20
+    ).hexdigest()
+
+
+def compute_stage_key(contract_id: str, stage_dir: Path, job_root: Path) -> Optional[str]:
+    """
+    Clave de caché de un contrato: hash de los ficheros de entrada de su carpeta
+    (stems, full_song.wav), los campos de session_config.json que declara en
+    io.config (p.ej. cambiar style_preset no invalida los contratos de stems
+    que no lo usan), el contrato de contracts.json, las entradas externas
+    conocidas y la versión de código.
+
+    Devuelve None si el contrato no es cacheable.
+    """
+    if contract_id in UNCACHEABLE_CONTRACTS or not stage_dir.exists():
+        return None
+
+    try:
+        contract = load_contract(contract_id)
+    except ValueError:
+        return None
+
+    h = hashlib.blake2b(digest_size=20)
+    h.update(contract_id.encode("utf-8"))
+    h.update(json.dumps(contract, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    h.update(code_version().encode("utf-8"))
+
+    config_fields = _config_fields(contract)
+
+    for p in sorted(stage_dir.iterdir()):
+        if not p.is_file() or p.name in _SKIP_OUTPUTS:
+            continue
+        if p.name == "session_config.json":
+            h.update(p.name.encode("utf-8"))
+            h.update(_session_config_hash(p, config_fields).encode("utf-8"))
+            continue
+        if p.suffix.lower() != ".wav":
+            continue
+        h.update(p.name.encode("utf-8"))
+        h.update(file_content_hash(p).encode("utf-8"))
+
+    for rel in EXTERNAL_INPUTS.get(contract_id, []):
+        ext = job_root / rel
+        h.update(rel.encode("utf-8"))
+        if not ext.exists():
+            h.update(b"-")
+        elif rel in EXTERNAL_INPUT_FIELDS:
+            h.update(_json_fields_hash(ext, EXTERNAL_INPUT_FIELDS[rel]).encode("utf-8"))
+        else:
+            h.update(file_content_hash(ext).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+# ---------------------------------------------------------------------
+# Entradas
+# ---------------------------------------------------------------------
+
+def _entry_dir(key: str) -> Path:
+    return STAGE_CACHE_DIR / key[:2] / key
+
+
+def _iter_stage_outputs(stage_dir: Path):
+    for p in sorted(stage_dir.rglob("*")):
+        if p.is_file() and p.name not in _SKIP_OUTPUTS and not p.name.startswith("."):
+            yield p
+
+
+def _job_root_forms(job_root: Path) -> List[str]:
+    """
+    Formas en que aparece la carpeta del job (con separador final) dentro de
+    un JSON: tal cual (ensure_ascii=False) y escapada (ensure_ascii=True).
+    """
+    root = str(job_root) + os.sep
+    return sorted({json.dumps(root, ensure_ascii=False)[1:-1], json.dumps(root)[1:-1]}, key=len, reverse=True)
+
+
+def _to_marker(job_root: Path) -> Callable[[str], str]:
+    def _sub(text: str) -> str:
+        for form in _job_root_forms(job_root):
+            text = text.replace(form, _JOB_ROOT_MARKER)
+        return text
+    return _sub
+
+
+def _from_marker(job_root: Path) -> Callable[[str], str]:
+    root = json.dumps(str(job_root) + os.sep, ensure_ascii=False)[1:-1]
+    return lambda text: text.replace(_JOB_ROOT_MARKER, root)
+
+
+def _place(src: Path, dst: Path, relocate: Optional[Callable[[str], str]] = None) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if src.suffix.lower() == ".wav":
+        # Los writers de stems/mixdown son atómicos (write_audio_atomic +
+        # os.replace): la entrada puede compartir inodo con la carpeta del job
+        # sin copiar bytes en FS sin reflink (ext4, overlayfs).
+        link_or_copy(src, dst)
+    elif relocate is not None and src.suffix.lower() == ".json":
+        # Rutas absolutas del job (file_path...) <-> marcador de la caché
+        dst.write_text(relocate(src.read_text(encoding="utf-8")), encoding="utf-8")
+    else:
+        # JSON/imágenes se reescriben in situ: copia real.
+        shutil.copy2(src, dst)
+
+
+def _restore_session_config(
+    src: Path,
+    dst: Path,
+    fields: Optional[List[str]],
+    relocate: Callable[[str], str],
+) -> None:
+    """
+    session_config.json restaurado: solo los campos que forman parte de la clave
+    vienen de la caché; el resto (p.ej. style_preset en un contrato de stems)
+    se conserva del job actual para que siga llegando a los contratos siguientes.
+    """
+    cached_text = relocate(src.read_text(encoding="utf-8"))
+    if fields is not None and dst.exists():
+        try:
+            current = json.loads(dst.read_text(encoding="utf-8"))
+            cached = json.loads(cached_text)
+        except Exception:
+            current = cached = None
+        if isinstance(current, dict) and isinstance(cached, dict):
+            for k in fields:
+                if k in cached:
+                    current[k] = cached[k]
+                else:
+                    current.pop(k, None)
+            cached_text = json.dumps(current, indent=2, ensure_ascii=False)
+    dst.write_text(cached_text, encoding="utf-8")
+
+
+def _echoed_fields(stage_dir: Path, fields: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    Valores del job actual (session_config.json de stage_dir) de los campos que
+    los análisis solo copian y que no forman parte de la clave.
+    """
+    if fields is None:
+        return {}
+    config_path = stage_dir / "session_config.json"
+    try:
+        cfg = json.loads(config_path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    if not isinstance(cfg, dict):
+        return {}
+    return {k: cfg[k] for k in ECHOED_CONFIG_FIELDS if k not in fields and k in cfg}
+
+
+def _with_echoed_fields(relocate: Callable[[str], str], echoed: Dict[str, Any]) -> Callable[[str], str]:
+    """
+    Tras reubicar las rutas, sustituye en el JSON restaurado (a cualquier
+    profundidad) los campos copiados de session_config.json por los del job actual.
+    """
+    if not echoed:
+        return relocate
+
+    def _sub(node: Any) -> bool:
+        changed = False
+        if isinstance(node, dict):
+            for k, v in node.items():
+                if k in echoed and v != echoed[k]:
+                    node[k] = echoed[k]
+                    changed = True
+                else:
+                    changed = _sub(v) or changed
+        elif isinstance(node, list):
+            for v in node:
+                changed = _sub(v) or changed
+        return changed
+
+    def _apply(text: str) -> str:
+        text = relocate(text)
+        try:
+            data = json.loads(text)
+        except Exception:
+            return text
+        if not _sub(data):
+            return text
+        return json.dumps(data, indent=2, ensure_ascii=False)
+
+    return _apply
+
+
+def lookup(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    if key is None:
+        return None
+    manifest_path = _entry_dir(key) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    # LRU: el mtime del manifest marca el último uso.
+    try:
+        os.utime(manifest_path, None)
+    except OSError:
+        pass
+    return manifest
+
+
+def restore(key: str, manifest: Dict[str, Any], stage_dir: Path) -> bool:
+    """
+    Vuelca en stage_dir los ficheros guardados para key. Devuelve False si la
+    entrada está incompleta (se trata como fallo de caché). Las rutas del
+    job guardadas en los JSON se reescriben a la carpeta del job actual
+    (la carpeta padre de stage_dir), igual que los ECHOED_CONFIG_FIELDS que
+    no forman parte de la clave.
+    """
+    entry = _entry_dir(key)
+    files = manifest.get("files", []) or []
+    if not all((entry / rel).exists() for rel in files):
+        return False
+    relocate = _from_marker(stage_dir.parent)
+    try:
+        fields = _config_fields(load_contract(str(manifest.get("contract_id", ""))))
+    except ValueError:
+        fields = None
+    # Antes de restaurar session_config.json: valores del job actual
+    relocate_json = _with_echoed_fields(relocate, _echoed_fields(stage_dir, fields))
+    for rel in files:
+        if rel == "session_config.json":
+            _restore_session_config(entry / rel, stage_dir / rel, fields, relocate)
+        else:
+            _place(entry / rel, stage_dir / rel, relocate_json)
+    return True
+
+
+def store(key: Optional[str], contract_id: str, stage_dir: Path, success: bool) -> None:
+    """
+    Guarda los resultados de un contrato (stems, full_song, analysis, comparison,
+    imágenes...) y aplica el límite de tamaño. En los JSON, la carpeta del
+    job (padre de stage_dir) se guarda como marcador.
+    """
+    if key is None:
+        return
+
+    entry = _entry_dir(key)
+    if entry.exists():
+        return
+
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=str(entry.parent)))
+    try:
+        files: List[str] = []
+        size = 0
+        relocate = _to_marker(stage_dir.parent)
+        for p in _iter_stage_outputs(stage_dir):
+            rel = p.relative_to(stage_dir).as_posix()
+            _place(p, tmp / rel, relocate)
+            files.append(rel)
+            size += p.stat().st_size
+
+        manifest = {
+            "contract_id": contract_id,
+            "success": bool(success),
+            "files": files,
+            "size_bytes": size,
+            "created_at": time.time(),
+        }
+        (tmp / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, entry)
+    except OSError as exc:
+        logger.logger.warning(f"[stage_cache] No se pudo guardar {contract_id}: {exc}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+
+    evict()
+
+
+def evict(max_bytes: Optional[int] = None) -> int:
+    """
+    Elimina las entradas usadas hace más tiempo hasta quedar bajo el límite.
+    Devuelve el nº de entradas eliminadas.
+    """
+    limit = int(max_bytes if max_bytes is not None else STAGE_CACHE_MAX_GB * 1024 ** 3)
+    if not STAGE_CACHE_DIR.exists():
+        return 0
+
+    entries = []
+    total = 0
+    for manifest_path in STAGE_CACHE_DIR.glob(f"*/*/{MANIFEST_NAME}"):
+        try:
+            size = int(json.loads(manifest_path.read_text(encoding="utf-8")).get("size_bytes", 0))
+            last_used = manifest_path.stat().st_mtime
+        except Exception:
+            continue
+        entries.append((last_used, size, manifest_path.parent))
+        total += size
+
+    removed = 0
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= limit:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+
+    if removed:
+        logger.logger.info(f"[stage_cache] {removed} entradas expulsadas (LRU); {total / 1e9:.2f} GB en caché.")
+    return removed
@@ -0,0 +1,533 @@
+from __future__ import annotations
+
+import io
+import itertools
+import os
+import threading
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from utils.logger import logger
+from utils.audio_utils import write_audio_atomic
+
+# Presupuesto de memoria del bus (MB). Si se supera, se vuelca a disco y se liberan buffers.
+STEM_BUS_MAX_MB = float(os.getenv("MIX_STEM_BUS_MAX_MB", 2048.0))
+
+# Subtypes que guardan un float32 sin pérdida: el buffer ya es lo que se leería del fichero.
+_LOSSLESS_SUBTYPES = {"FLOAT", "DOUBLE"}
+
+
+@dataclass
+class StemBuffer:
+    """
+    Buffer de un stem en memoria.
+
+    data: float32 con forma (channels, samples), igual que audio_utils/Pedalboard.
+    dirty: True si la versión en memoria todavía no está escrita en disco.
+    subtype: subtype del fichero (p.ej. "PCM_24"); flush() escribe con él.
+    folders: carpeta de stage donde se escribió el stem y las que lo han
+        heredado después por handoff (copy_stems). Un buffer "dirty" es más
+        reciente que el fichero de todas ellas.
+    version: identificador único de esta versión del stem (cambia en cada put).
+    """
+    data: np.ndarray
+    sample_rate: int
+    dirty: bool = False
+    subtype: Optional[str] = None
+    folders: List[Path] = field(default_factory=list)
+    version: str = ""
+
+    @property
+    def channels(self) -> int:
+        return int(self.data.shape[0])
+
+    @property
+    def frames(self) -> int:
+        return int(self.data.shape[1])
+
+
+class StemBus:
+    """
+    Bus de stems en memoria que el PipelineContext lleva de contrato en contrato.
+
+    - Está ligado a la carpeta de un stage (stage_dir) y lo traspasa
+      copy_stems (handoff) al siguiente contrato, con los buffers "dirty"
+      incluidos: los cambios de un stem no se escriben en disco al acabar el
+      contrato que los hace.
+    - Los stages leen y escriben los stems con read_stem()/write_stem(), y los
+      análisis con sf_read_limited/stem_bus_buffer: todos se sirven de memoria
+      si el bus tiene el stem.
+    - flush() escribe cada stem pendiente una sola vez, en la carpeta donde se
+      modificó, y lo enlaza (copy_stems.link_or_copy) en las carpetas que lo
+      heredaron, así que todas quedan como sin bus.
+    - Solo se vuelca en los checkpoints: pausa de S6, final del run, presión
+      de memoria (enforce_budget) y antes de un consumidor que no sabe leer
+      del bus (scripts sin USES_STEM_BUS, S11, wave paralela del scheduler).
+    - Mientras hay stems pendientes el disco no refleja el estado real: la
+      caché de stages no busca con ellos; los guardados se difieren (defer)
+      al siguiente volcado.
+
+    Una versión "dirty" que otro contrato reescribe antes del volcado no se
+    escribe nunca: sus carpetas conservan el fichero anterior y sus
+    guardados diferidos se cancelan.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None) -> None:
+        self.max_bytes = int(max_bytes if max_bytes is not None else STEM_BUS_MAX_MB * 1024 * 1024)
+        self.stage_id: Optional[str] = None
+        self.stage_dir: Optional[Path] = None
+        self._buffers: Dict[str, StemBuffer] = {}
+        self._deferred: List[Tuple[Path, Callable[[], None]]] = []
+        # Carpetas a las que les falta una versión de stem que no se volcará.
+        self._incomplete: set = set()
+        # Los stages escriben desde los hilos del executor de stems (map_stems).
+        self._lock = threading.RLock()
+        self._uid = uuid.uuid4().hex[:12]
+        self._serial = itertools.count(1)
+
+    # ------------------------------------------------------------------
+    # Estado
+    # ------------------------------------------------------------------
+
+    def bind(self, stage_id: str, stage_dir: Path) -> None:
+        """
+        Liga el bus a un stage. Si estaba ligado a otro stage (sin handoff),
+        los buffers pendientes se vuelcan primero para no perder cambios.
+        """
+        with self._lock:
+            if self.stage_dir is not None and self.stage_dir != stage_dir:
+                self.flush()
+                self._buffers.clear()
+            self.stage_id = stage_id
+            self.stage_dir = stage_dir
+
+    def names(self) -> List[str]:
+        return sorted(self._buffers.keys())
+
+    def has(self, name: str) -> bool:
+        return name in self._buffers
+
+    def is_dirty(self) -> bool:
+        return any(b.dirty for b in list(self._buffers.values()))
+
+    def dirty_names(self) -> List[str]:
+        return sorted(name for name, buf in list(self._buffers.items()) if buf.dirty)
+
+    def versions(self) -> Dict[str, str]:
+        """{file_name: version} de los buffers cargados (para ver qué cambia un stage)."""
+        return {name: buf.version for name, buf in list(self._buffers.items())}
+
+    def buffer_for(self, path: Path) -> Optional[StemBuffer]:
+        """
+        Buffer en memoria del stem en `path` si el bus lo tiene cargado y
+        `path` está en la carpeta ligada o en una que el buffer ha recorrido.
+        No lee disco.
+        """
+        path = Path(path)
+        if self.stage_dir is None:
+            return None
+        buf = self._buffers.get(path.name)
+        if buf is None:
+            return None
+        if any(_same_folder(path.parent, f) for f in [self.stage_dir, *buf.folders]):
+            return buf
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(b.data.nbytes for b in list(self._buffers.values())))
+
+    @property
+    def sample_rate(self) -> Optional[int]:
+        for buf in list(self._buffers.values()):
+            return buf.sample_rate
+        return None
+
+    def _next_version(self) -> str:
+        return f"{self._uid}:{next(self._serial)}"
+
+    # ------------------------------------------------------------------
+    # Lectura / escritura
+    # ------------------------------------------------------------------
+
+    def load(self, names: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Carga desde disco los stems que aún no estén en memoria y devuelve
+        {file_name: (channels, samples) float32}.
+        """
+        if self.stage_dir is None:
+            return {}
+
+        if names is None:
+            wanted = [
+                p.name for p in sorted(self.stage_dir.glob("*.wav"))
+                if p.name.lower() != "full_song.wav"
+            ]
+        else:
+            wanted = list(names)
+
+        for name in wanted:
+            if name in self._buffers:
+                continue
+            path = self.stage_dir / name
+            if not path.exists():
+                continue
+            try:
+                with sf.SoundFile(str(path)) as f:
+                    subtype = f.subtype
+                    sr = f.samplerate
+                    data = f.read(dtype="float32", always_2d=True)
+            except Exception as exc:
+                logger.logger.warning(f"[stem_bus] No se pudo leer {path}: {exc}")
+                continue
+            with self._lock:
+                self._buffers[name] = StemBuffer(
+                    data=np.ascontiguousarray(data.T, dtype=np.float32),
+                    sample_rate=int(sr),
+                    dirty=False,
+                    subtype=subtype,
+                    folders=[self.stage_dir],
+                    version=self._next_version(),
+                )
+
+        self.enforce_budget()
+        return {n: self._buffers[n].data for n in wanted if n in self._buffers}
+
+    def get(self, name: str) -> Optional[np.ndarray]:
+        if name not in self._buffers:
+            self.load([name])
+        buf = self._buffers.get(name)
+        return buf.data if buf is not None else None
+
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        """Buffers en memoria (sin tocar disco)."""
+        return {name: buf.data for name, buf in list(self._buffers.items())}
+
+    def put(self, name: str, data: np.ndarray, sample_rate: int, subtype: Optional[str] = None) -> None:
+        """
+        Sustituye el stem `name` de la carpeta ligada (pendiente de volcar).
+        Sin subtype explícito se conserva el del buffer anterior o el del
+        fichero en disco.
+
+        El buffer guarda lo que se leería del fichero escrito con ese subtype
+        (cuantización PCM incluida), así que los consumidores ven lo mismo que
+        sin bus.
+        """
+        arr = np.asarray(data, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr[np.newaxis, :]
+        if subtype is None:
+            subtype = self._source_subtype(name)
+        arr = _as_stored(arr, int(sample_rate), subtype)
+        with self._lock:
+            previous = self._buffers.get(name)
+            if previous is not None and previous.dirty:
+                self._incomplete.update(f for f in previous.folders if f != self.stage_dir)
+            self._buffers[name] = StemBuffer(
+                data=arr,
+                sample_rate=int(sample_rate),
+                dirty=True,
+                subtype=subtype,
+                folders=[self.stage_dir] if self.stage_dir is not None else [],
+                version=self._next_version(),
+            )
+        self.enforce_budget()
+
+    def _source_subtype(self, name: str) -> Optional[str]:
+        buf = self._buffers.get(name)
+        if buf is not None and buf.subtype:
+            return buf.subtype
+        if self.stage_dir is None:
+            return None
+        path = self.stage_dir / name
+        if not path.exists():
+            return None
+        try:
+            return sf.info(str(path)).subtype
+        except Exception:
+            return None
+
+    def invalidate(self) -> None:
+        """
+        Descarta los buffers (p.ej. tras un script que escribió directamente en disco).
+        Los cambios pendientes se vuelcan antes.
+        """
+        with self._lock:
+            self.flush()
+            self._buffers.clear()
+
+    def discard(self) -> None:
+        """
+        Descarta los buffers SIN volcarlos (el disco es la versión buena).
+        """
+        with self._lock:
+            self._buffers.clear()
+            self._deferred.clear()
+            self._incomplete.clear()
+
+    def drop(self, names: Iterable[str]) -> None:
+        """
+        Descarta SIN volcar los buffers de `names` (stems que un script ha
+        reescrito o borrado en disco); el resto sigue en memoria.
+        """
+        with self._lock:
+            for name in names:
+                buf = self._buffers.pop(name, None)
+                if buf is not None and buf.dirty:
+                    self._incomplete.update(f for f in buf.folders if f != self.stage_dir)
+
+    def defer(self, stage_dir: Path, callback: Callable[[], None]) -> None:
+        """
+        Ejecuta callback (que lee la carpeta stage_dir) en cuanto el disco esté
+        al día: ahora si no hay stems pendientes, o tras el siguiente flush().
+        Se cancela si la carpeta se queda sin alguna versión de stem.
+        """
+        with self._lock:
+            if self.is_dirty():
+                self._deferred.append((Path(stage_dir), callback))
+                return
+        callback()
+
+    # ------------------------------------------------------------------
+    # Disco
+    # ------------------------------------------------------------------
+
+    def flush(self) -> int:
+        """
+        Escribe los buffers "dirty" en la carpeta donde se modificaron y los
+        enlaza en las carpetas que los heredaron. Devuelve nº de stems escritos.
+        """
+        # Import local: copy_stems importa analysis_utils, que importa este módulo.
+        from utils.copy_stems import link_or_copy
+
+        with self._lock:
+            written = 0
+            for name, buf in self._buffers.items():
+                if not buf.dirty:
+                    continue
+                folders = buf.folders or ([self.stage_dir] if self.stage_dir is not None else [])
+                if not folders:
+                    continue
+                origin = folders[0] / name
+                write_audio_atomic(origin, buf.data.T, buf.sample_rate, subtype=buf.subtype)
+                for folder in folders[1:]:
+                    if folder.exists():
+                        link_or_copy(origin, folder / name)
+                buf.dirty = False
+                written += 1
+
+            if written:
+                logger.logger.info(f"[stem_bus] Volcados {written} stems (hasta {self.stage_dir})")
+
+            deferred, self._deferred = self._deferred, []
+            incomplete, self._incomplete = self._incomplete, set()
+
+        for folder, callback in deferred:
+            if folder in incomplete:
+                logger.logger.info(f"[stem_bus] {folder.name} no tiene todas sus versiones en disco; se omite su tarea diferida.")
+                continue
+            try:
+                callback()
+            except Exception as exc:
+                logger.logger.warning(f"[stem_bus] Falló una tarea diferida tras el volcado: {exc}")
+        return written
+
+    def handoff(self, dst_stage_id: str, dst_stage_dir: Path) -> List[str]:
+        """
+        Pasa los buffers al siguiente contrato SIN volcarlos: los pendientes
+        siguen en memoria y se anotan en dst_stage_dir, donde copy_stems enlaza
+        la versión anterior del fichero (flush() la sustituye después).
+        Devuelve los nombres de stems que siguen en memoria.
+        """
+        with self._lock:
+            for buf in self._buffers.values():
+                if dst_stage_dir not in buf.folders:
+                    buf.folders.append(dst_stage_dir)
+            self.stage_id = dst_stage_id
+            self.stage_dir = dst_stage_dir
+            return self.names()
+
+    def enforce_budget(self) -> None:
+        """
+        Si el bus supera el presupuesto de memoria, vuelca a disco y libera buffers.
+        """
+        if self.max_bytes <= 0 or self.nbytes <= self.max_bytes:
+            return
+        logger.logger.info(
+            f"[stem_bus] {self.nbytes / 1e6:.1f} MB > presupuesto "
+            f"{self.max_bytes / 1e6:.1f} MB; volcando a disco."
+        )
+        self.invalidate()
+
+
+def _same_folder(a: Path, b: Path) -> bool:
+    # Los scripts construyen las rutas con get_temp_dir; pueden no venir resueltas.
+    return a == b or a.resolve() == b.resolve()
+
+
+def _as_stored(data: np.ndarray, sample_rate: int, subtype: Optional[str]) -> np.ndarray:
+    """
+    (channels, samples) float32 tal y como quedaría tras escribirlo con
+    `subtype` y volver a leerlo. La conversión se hace en memoria (WAV en un
+    BytesIO), sin tocar disco.
+    """
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    if subtype is None or subtype in _LOSSLESS_SUBTYPES:
+        return data
+    buf = io.BytesIO()
+    sf.write(buf, data.T, sample_rate, subtype=subtype, format="WAV")
+    buf.seek(0)
+    stored, _ = sf.read(buf, dtype="float32", always_2d=True)
+    return np.ascontiguousarray(stored.T)
+
+
+# ---------------------------------------------------------------------
+# Acceso desde los scripts de contrato (PipelineContext activo)
+# ---------------------------------------------------------------------
+
+def active_stem_bus() -> Optional[StemBus]:
+    """
+    Stem bus del PipelineContext activo del hilo (None sin contexto o sin bus).
+    """
+    try:
+        from context import get_active_context
+    except ImportError:
+        return None
+    ctx = get_active_context()
+    return getattr(ctx, "stem_bus", None) if ctx is not None else None
+
+
+def read_stem(path: Path, dtype: str = "float64", always_2d: bool = False) -> Tuple[np.ndarray, int]:
+    """
+    Equivalente a sf.read(path, dtype=..., always_2d=...) que sirve el stem
+    desde el stem bus si lo tiene (misma forma (frames, channels) y dtype).
+    """
+    bus = active_stem_bus()
+    buffered = bus.buffer_for(Path(path)) if bus is not None else None
+    if buffered is None:
+        return sf.read(str(path), dtype=dtype, always_2d=always_2d)
+    data = buffered.data.T.astype(dtype)
+    if not always_2d and data.shape[1] == 1:
+        data = data[:, 0]
+    return data, int(buffered.sample_rate)
+
+
+def write_stem(path: Path, data: np.ndarray, samplerate: int, subtype: Optional[str] = None) -> None:
+    """
+    Equivalente a write_audio_atomic(path, data, samplerate, subtype) para
+    stems (data en (samples, channels) o mono). Si el stem bus está ligado a
+    la carpeta de `path` el stem queda en memoria, pendiente de volcar con el
+    mismo subtype que se habría escrito.
+    """
+    path = Path(path)
+    bus = active_stem_bus()
+    if bus is None or bus.stage_dir is None or not _same_folder(path.parent, bus.stage_dir):
+        write_audio_atomic(path, data, samplerate, subtype=subtype)
+        if bus is not None and bus.buffer_for(path) is not None:
+            bus.drop([path.name])
+        return
+    if subtype is None:
+        # Lo que sf.write usaría por defecto para la extensión.
+        subtype = sf.default_subtype((path.suffix.lstrip(".") or "wav").upper())
+    arr = np.asarray(data, dtype=np.float32)
+    bus.put(path.name, arr.T if arr.ndim == 2 else arr, samplerate, subtype=subtype)
+
+
+@dataclass(frozen=True)
+class StemInfo:
+    """Metadatos de un stem (subconjunto de sf.info)."""
+    samplerate: int
+    channels: int
+    frames: int
+    subtype: Optional[str]
+
+
+def stem_info(path: Path) -> StemInfo:
+    """
+    Equivalente a sf.info(path) para los campos de StemInfo; si el stem está
+    en el stem bus se toman del buffer (el fichero puede estar sin volcar).
+    """
+    bus = active_stem_bus()
+    buffered = bus.buffer_for(Path(path)) if bus is not None else None
+    if buffered is not None:
+        return StemInfo(int(buffered.sample_rate), buffered.channels, buffered.frames, buffered.subtype)
+    info = sf.info(str(path))
+    return StemInfo(int(info.samplerate), int(info.channels), int(info.frames), info.subtype)
+
+
+class BufferReader:
+    """
+    Lectura por bloques de un StemBuffer con la parte de la interfaz de
+    sf.SoundFile que usan los scripts (samplerate, channels, frames, len,
+    read, seek, close y with).
+    """
+
+    def __init__(self, buffered: StemBuffer) -> None:
+        self.samplerate = int(buffered.sample_rate)
+        self.channels = buffered.channels
+        self.frames = buffered.frames
+        self._data = buffered.data
+        self._pos = 0
+
+    def __len__(self) -> int:
+        return self.frames
+
+    def __enter__(self) -> "BufferReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def seek(self, frames: int) -> int:
+        self._pos = max(0, min(int(frames), self.frames))
+        return self._pos
+
+    def read(
+        self,
+        frames: int = -1,
+        dtype: str = "float64",
+        always_2d: bool = False,
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        stop = self.frames if frames < 0 else min(self._pos + int(frames), self.frames)
+        block = self._data[:, self._pos:stop].T.astype(dtype)
+        self._pos = stop
+        if out is not None:
+            out[: block.shape[0]] = block
+            return out[: block.shape[0]]
+        if not always_2d and block.shape[1] == 1:
+            block = block[:, 0]
+        return block
+
+    def close(self) -> None:
+        pass
+
+
+def open_stem(path: Path):
+    """
+    sf.SoundFile(path, "r") o, si el stem está en el stem bus, un
+    BufferReader sobre su buffer (misma interfaz de lectura).
+    """
+    bus = active_stem_bus()
+    buffered = bus.buffer_for(Path(path)) if bus is not None else None
+    if buffered is not None:
+        return BufferReader(buffered)
+    return sf.SoundFile(str(path), mode="r")
+
+
+def stem_content_id(path: Path, file_hash: Callable[[Path], str]) -> str:
+    """
+    Identificador del contenido del stem en `path` para claves de caché en
+    memoria: la versión del bus si tiene cambios pendientes, si no
+    file_hash(path) (el fichero está al día).
+    """
+    bus = active_stem_bus()
+    buffered = bus.buffer_for(Path(path)) if bus is not None else None
+    if buffered is not None and buffered.dirty:
+        return f"bus:{buffered.version}"
+    return file_hash(Path(path))
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+# --- hack sys.path para poder importar utils.* cuando se ejecuta como script ---
+THIS_DIR = Path(__file__).resolve().parent      # .../src/utils
+SRC_DIR = THIS_DIR.parent                       # .../src
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.logger import logger  # noqa: E402
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Nº de hilos del executor de stems (MIX_STEM_WORKERS=0 => según CPU; 1 => en serie).
+STEM_WORKERS = int(os.getenv("MIX_STEM_WORKERS", "0"))
+# Procesos worker que comparten la máquina. En Celery lo fija
+# set_worker_processes() con la concurrencia real del pool (también con -c).
+WORKER_PROCESSES = max(1, int(os.getenv("MIX_WORKER_PROCESSES", os.getenv("CELERY_WORKER_CONCURRENCY", "1"))))
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+_IN_WORKER = threading.local()
+
+
+def cpu_budget() -> int:
+    """
+    CPUs que le tocan a este proceso: las de su afinidad (cgroups/taskset)
+    repartidas entre los procesos worker de la máquina.
+    """
+    if STEM_WORKERS > 0:
+        return STEM_WORKERS
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    return max(1, cpus // WORKER_PROCESSES)
+
+
+def set_worker_processes(n: int) -> None:
+    """
+    Nº de procesos worker entre los que se reparten las CPUs. Se llama en el
+    proceso principal del worker antes del fork de los hijos prefork, que lo
+    heredan (el executor se crea en cada hijo después).
+    """
+    global WORKER_PROCESSES
+    WORKER_PROCESSES = max(1, int(n))
+    logger.logger.info(f"[stem_executor] {WORKER_PROCESSES} procesos worker; {cpu_budget()} hilos por proceso.")
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Executor compartido del proceso (uno por worker, lo usan todos los jobs).
+
+    Son hilos y no procesos: los hijos prefork de Celery son daemonic y no
+    pueden tener hijos de multiprocessing, y los scripts de contrato se cargan
+    por ruta (sus funciones no son picklables). El trabajo pesado por stem
+    (soundfile, numpy FFT, scipy.signal) libera el GIL.
+    """
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=cpu_budget(),
+                thread_name_prefix="stem",
+                initializer=_mark_worker_thread,
+            )
+            logger.logger.info(f"[stem_executor] Executor de stems con {cpu_budget()} hilos.")
+        return _EXECUTOR
+
+
+def _mark_worker_thread() -> None:
+    _IN_WORKER.active = True
+
+
+def _reset_after_fork() -> None:
+    # Los hilos no sobreviven a fork(): el hijo crea su propio executor.
+    global _EXECUTOR, _EXECUTOR_LOCK
+    _EXECUTOR = None
+    _EXECUTOR_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def map_stems(func: Callable[[T], R], tasks: Iterable[T]) -> List[R]:
+    """
+    Equivalente a list(map(func, tasks)) repartido en el executor de stems.
+
+    - Conserva el orden de tasks y propaga la primera excepción (como map).
+    - Cada tarea corre con una copia del contexto del llamante, de modo que
+      get_temp_dir/main() siguen viendo el PipelineContext activo del job.
+    - Llamadas anidadas (desde un hilo del executor) se ejecutan en serie
+      para no bloquear el pool.
+    """
+    tasks = list(tasks)
+    if len(tasks) <= 1 or cpu_budget() <= 1 or getattr(_IN_WORKER, "active", False):
+        return [func(t) for t in tasks]
+
+    executor = get_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, func, t)
+        for t in tasks
+    ]
+    return [f.result() for f in futures]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import os
+import sys
+import copy
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple, Union
+
+# --- hack sys.path para poder importar utils.* cuando se ejecuta como script ---
+THIS_DIR = Path(__file__).resolve().parent      # .../src/utils
+SRC_DIR = THIS_DIR.parent                       # .../src
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.stage_cache import file_content_hash  # noqa: E402
+from utils.stem_bus import stem_content_id  # noqa: E402
+
+# Análisis incremental: nº máximo de stems con features en memoria.
+STEM_FEATURE_CACHE_MAX_ENTRIES = int(os.getenv("MIX_STEM_FEATURE_CACHE_MAX_ENTRIES", 1024))
+
+# (contract_id, función, args extra, ruta, hash de contenido) -> features del stem
+_FEATURES: "OrderedDict[Tuple[str, str, str, str, str], Dict[str, Any]]" = OrderedDict()
+_STATS = {"hits": 0, "misses": 0}
+# Varios jobs pueden compartir el proceso (un hilo por job).
+_LOCK = threading.Lock()
+
+
+def analyze_stem_cached(
+    contract_id: str,
+    func: Callable[[Any], Dict[str, Any]],
+    task: Union[Path, Tuple[Any, ...]],
+) -> Dict[str, Any]:
+    """
+    Ejecuta func(task) reutilizando el resultado si el stem no ha cambiado.
+
+    task es la ruta del stem o una tupla cuyo primer elemento es la ruta (la
+    convención de los análisis por stem). El resto de la tupla forma parte de
+    la clave, igual que la ruta resuelta: los resultados llevan file_name /
+    file_path y los stages procesan esa ruta, así que dos stems con el mismo
+    audio (duplicados o de otro job) no comparten entrada. Como los stages reescriben stems atómicamente, un stem que el
+    stage no toca conserva inodo y su hash sale de memoria: el post-análisis
+    solo vuelve a medir los stems que el stage ha modificado. Un stem con
+    cambios pendientes en el stem bus (aún no volcados) se identifica por su
+    versión en el bus en lugar del hash de disco.
+    """
+    stem_path = task[0] if isinstance(task, tuple) else task
+    extra = repr(task[1:]) if isinstance(task, tuple) else ""
+    try:
+        resolved = Path(stem_path).resolve()
+        key = (contract_id, func.__qualname__, extra, str(resolved), stem_content_id(Path(stem_path), file_content_hash))
+    except OSError:
+        return func(task)
+
+    with _LOCK:
+        cached = _FEATURES.get(key)
+        if cached is not None:
+            _FEATURES.move_to_end(key)
+            _STATS["hits"] += 1
+        else:
+            _STATS["misses"] += 1
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    result = func(task)
+    if isinstance(result, dict) and not result.get("error"):
+        entry = copy.deepcopy(result)
+        with _LOCK:
+            _FEATURES[key] = entry
+            while len(_FEATURES) > STEM_FEATURE_CACHE_MAX_ENTRIES:
+                _FEATURES.popitem(last=False)
+    return result
+
+
+def stats() -> Dict[str, int]:
+    return dict(_STATS)
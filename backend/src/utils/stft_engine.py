@@ -0,0 +1,192 @@
+# C:\mix-master\backend\src\utils\stft_engine.py
+
+from __future__ import annotations
+
+from typing import Callable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+# Memoria máxima (aprox.) de los espectros de un chunk de frames.
+STFT_CHUNK_BYTES = 32 * 1024 * 1024
+
+EPS = 1e-12
+
+# Segmento de la PSD de Welch compartida (~1.35 Hz a 44.1 kHz, ~15 bins en 20-40 Hz)
+WELCH_NPERSEG = 32768
+
+
+def frame_view(x: np.ndarray, frame: int, hop: int) -> np.ndarray:
+    """
+    Vista (sin copia) de los frames completos de x a lo largo del último eje:
+    (..., n) -> (..., n_frames, frame), con n_frames = 1 + (n - frame) // hop.
+    """
+    return np.lib.stride_tricks.sliding_window_view(x, frame, axis=-1)[..., ::hop, :]
+
+
+def _chunk_frames(frame: int, channels: int, chunk_frames: Optional[int]) -> int:
+    if chunk_frames is not None:
+        return max(1, int(chunk_frames))
+    # complejo (16 B) por bin + frame en tiempo, por canal
+    per_frame = (frame // 2 + 1) * 16 * max(1, channels) + frame * 8 * max(1, channels)
+    return max(1, STFT_CHUNK_BYTES // per_frame)
+
+
+def _iter_windowed(
+    x: np.ndarray,
+    frame: int,
+    hop: int,
+    window: np.ndarray,
+    chunk_frames: Optional[int],
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    frames = frame_view(x, frame, hop)
+    n_frames = frames.shape[-2]
+    channels = int(np.prod(x.shape[:-1])) if x.ndim > 1 else 1
+    step = _chunk_frames(frame, channels, chunk_frames)
+    for f0 in range(0, n_frames, step):
+        seg = frames[..., f0 : f0 + step, :] * window
+        yield f0, seg, np.fft.rfft(seg, axis=-1)
+
+
+def iter_stft(
+    x: np.ndarray,
+    frame: int,
+    hop: int,
+    window: np.ndarray,
+    chunk_frames: Optional[int] = None,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    STFT por bloques de frames: devuelve (primer_frame, X) con
+    X = rfft(frames * window) de forma (..., n_frames_chunk, bins).
+
+    x se enmarca a lo largo del último eje (p.ej. (ch, n)). Solo frames
+    completos, como los bucles hop a hop que sustituye.
+    """
+    for f0, _seg, X in _iter_windowed(x, frame, hop, window, chunk_frames):
+        yield f0, X
+
+
+def _overlap_add(out: np.ndarray, chunk: np.ndarray, f0: int, hop: int) -> None:
+    """
+    Suma (overlap-add) los frames chunk (..., F, frame) en out (..., n) a
+    partir del frame f0.
+
+    Si hop divide a frame, cada frame son R = frame/hop bloques de hop
+    muestras y el OLA son R sumas vectorizadas desplazadas; si no, se usa
+    np.add.at con índices.
+    """
+    n_chunk, frame = chunk.shape[-2], chunk.shape[-1]
+    if frame % hop == 0:
+        r_blocks = frame // hop
+        n_blocks = out.shape[-1] // hop
+        blocks = out[..., : n_blocks * hop].reshape(out.shape[:-1] + (n_blocks, hop))
+        sub = chunk.reshape(chunk.shape[:-1] + (r_blocks, hop))
+        for r in range(r_blocks):
+            blocks[..., f0 + r : f0 + r + n_chunk, :] += sub[..., r, :]
+        return
+
+    idx = (np.arange(f0, f0 + n_chunk)[:, None] * hop + np.arange(frame)[None, :]).reshape(-1)
+    flat = chunk.reshape(chunk.shape[:-2] + (-1,))
+    if out.ndim == 1:
+        np.add.at(out, idx, flat)
+    else:
+        for c in np.ndindex(out.shape[:-1]):
+            np.add.at(out[c], idx, flat[c])
+
+
+def stft_process(
+    x: np.ndarray,
+    frame: int,
+    hop: int,
+    process: Callable[[np.ndarray, int], Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]],
+    window: Optional[np.ndarray] = None,
+    chunk_frames: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Procesador espectral genérico con análisis/síntesis STFT por lotes.
+
+    - x: (..., n) float; se procesa a lo largo del último eje.
+    - process(X, f0) recibe el espectro del chunk (..., F, bins) y su primer
+      frame, y devuelve el espectro modificado (puede modificar X in situ), o
+      (X, changed) con changed (..., F) bool: los frames no modificados se
+      resintetizan directamente desde el frame enventanado (sin irfft).
+    - Síntesis: irfft * window, overlap-add y normalización por la suma de
+      window² (weighted OLA). Las muestras que no cubre ningún frame completo
+      quedan a 0.
+
+    Devuelve float32 con la forma de x.
+    """
+    win = np.hanning(frame).astype(np.float32) if window is None else np.asarray(window, dtype=np.float32)
+    n = x.shape[-1]
+
+    y_out = np.zeros(x.shape, dtype=np.float32)
+    if n < frame:
+        return y_out
+
+    for f0, seg, X in _iter_windowed(x, frame, hop, win, chunk_frames):
+        res = process(X, f0)
+        if isinstance(res, tuple):
+            X2, changed = res
+            # Frames sin cambios: irfft(rfft(seg)) == seg
+            x_time = seg.astype(np.float32, copy=True)
+            if np.any(changed):
+                x_time[changed] = np.fft.irfft(X2[changed], n=frame, axis=-1)
+        else:
+            x_time = np.fft.irfft(res, n=frame, axis=-1).astype(np.float32)
+        x_time *= win
+        _overlap_add(y_out, x_time, f0, hop)
+
+    # Normalización OLA (independiente de los datos)
+    n_frames = 1 + (n - frame) // hop
+    ola_norm = np.zeros((n,), dtype=np.float32)
+    _overlap_add(ola_norm, np.broadcast_to(win * win, (n_frames, frame)), 0, hop)
+
+    y_out /= np.maximum(ola_norm, EPS)
+    return y_out
+
+
+def band_energy(X: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    Energía (sum |X|^2, float64) de los bins mask en cada frame: (..., F, bins) -> (..., F).
+    """
+    band = X[..., mask]
+    return np.sum(band.real.astype(np.float64) ** 2 + band.imag.astype(np.float64) ** 2, axis=-1)
+
+
+def welch_psd(
+    x: np.ndarray,
+    sr: int,
+    nperseg: int = WELCH_NPERSEG,
+    chunk_frames: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    PSD de Welch (densidad one-sided, ventana Hann periódica, 50% de solape)
+    de x 1D, acumulada por chunks de frames con iter_stft: la memoria no
+    depende de la duración (a diferencia de scipy.signal.welch o de una rfft
+    de toda la señal). Como scipy con detrend=False.
+
+    Si x es más corta que nperseg se usa un único segmento de len(x).
+    Devuelve (freqs, psd) float64.
+    """
+    arr = np.asarray(x, dtype=np.float32).reshape(-1)
+    n = arr.size
+    frame = int(min(int(nperseg), n))
+    if frame < 2 or sr <= 0:
+        return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float64)
+
+    hop = max(1, frame // 2)
+    # Hann periódica (la de scipy.signal.get_window("hann"))
+    win = (0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(frame) / frame)).astype(np.float32)
+
+    acc = np.zeros(frame // 2 + 1, dtype=np.float64)
+    n_frames = 0
+    for _f0, X in iter_stft(arr, frame, hop, win, chunk_frames):
+        acc += np.sum(X.real.astype(np.float64) ** 2 + X.imag.astype(np.float64) ** 2, axis=0)
+        n_frames += X.shape[0]
+
+    psd = acc / (max(1, n_frames) * float(sr) * float(np.sum(win.astype(np.float64) ** 2)))
+    # one-sided: se duplica todo menos DC (y Nyquist si frame es par)
+    if frame % 2 == 0:
+        psd[1:-1] *= 2.0
+    else:
+        psd[1:] *= 2.0
+    return np.fft.rfftfreq(frame, 1.0 / float(sr)), psd
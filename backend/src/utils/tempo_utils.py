@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# --- hack sys.path para poder importar utils.* cuando se ejecuta como script ---
+THIS_DIR = Path(__file__).resolve().parent      # .../src/utils
+SRC_DIR = THIS_DIR.parent                       # .../src
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.audio_utils import read_mono_float32  # noqa: E402
+from utils.logger import logger  # noqa: E402
+from utils.mono_mixbus import get_mono_mixbus  # noqa: E402
+from utils.profiles_utils import get_instrument_family  # noqa: E402
+
+try:
+    from context import PipelineContext
+except ImportError:
+    PipelineContext = None  # type: ignore
+
+# Tempo de sesión: se calcula una vez tras S0 y lo leen todos los consumidores
+# (<temp_root del job>/work/session_tempo.json).
+SESSION_TEMPO_FILE = "session_tempo.json"
+_FORMAT_VERSION = 1
+
+# Envolvente de onsets (RMS por frames)
+ENV_FRAME = 2048
+ENV_HOP = 512
+
+BPM_MIN = 60.0
+BPM_MAX = 200.0
+
+
+# ---------------------------------------------------------------------
+# Estimación
+# ---------------------------------------------------------------------
+
+def onset_envelope(y: np.ndarray, sr: int, frame: int = ENV_FRAME, hop: int = ENV_HOP) -> Optional[np.ndarray]:
+    """
+    Envolvente de onsets normalizada (media 0, desviación 1) a sr / hop:
+    derivada positiva del RMS por frames, suavizada. None si la señal es
+    demasiado corta.
+
+    Los frames son vistas con strides sobre y (sin copiar frame x n samples).
+    """
+    y = np.asarray(y, dtype=np.float32)
+    y = y - float(np.mean(y))
+
+    n = int((len(y) - frame) / hop) + 1
+    if n < 256:
+        return None
+
+    # RMS por frame
+    frames = np.lib.stride_tricks.sliding_window_view(y, frame)[::hop][:n]
+    rms = np.sqrt(np.einsum("ij,ij->i", frames, frames) / frame + 1e-12).astype(np.float32)
+
+    # Resaltar onsets: derivada positiva
+    env = np.diff(rms, prepend=rms[:1])
+    env = np.maximum(env, 0.0)
+
+    # Suavizado rápido
+    k = 5
+    if env.size > k:
+        env = np.convolve(env, np.ones(k, dtype=np.float32) / k, mode="same")
+
+    # Normalizar
+    env = env - float(np.mean(env))
+    std = float(np.std(env) + 1e-12)
+    return (env / std).astype(np.float32)
+
+
+def _autocorr(env: np.ndarray) -> np.ndarray:
+    """Autocorrelación vía FFT (lags >= 0, lag 0 anulado)."""
+    m = int(env.size)
+    nfft = 1 << ((2 * m - 1).bit_length())
+    F = np.fft.rfft(env, n=nfft)
+    ac = np.fft.irfft(F * np.conj(F), n=nfft)[:m].real
+    ac[0] = 0.0
+    return ac
+
+
+def _bpm_from_autocorr(
+    ac: np.ndarray,
+    fe: float,
+    bpm_min: float = BPM_MIN,
+    bpm_max: float = BPM_MAX,
+) -> Tuple[Optional[float], float]:
+    """
+    BPM a partir de la autocorrelación de la envolvente (fe = su "sample
+    rate"), con corrección de octava. Devuelve (bpm, confidence[0..1 aprox]).
+    """
+
+    lag_min = int(round((60.0 * fe) / bpm_max))
+    lag_max = int(round((60.0 * fe) / bpm_min))
+    if lag_max <= lag_min + 2 or lag_max >= ac.size:
+        return None, 0.0
+
+    window = ac[lag_min : lag_max + 1]
+    if window.size < 4:
+        return None, 0.0
+
+    peak_i = int(np.argmax(window))
+    peak_lag = lag_min + peak_i
+    bpm0 = 60.0 * fe / float(peak_lag)
+
+    # Corrección de octava (bpm, bpm*2, bpm/2) eligiendo el que maximiza la ac
+    candidates: List[Tuple[float, float]] = []
+    for mult in (0.5, 1.0, 2.0):
+        bpm_c = bpm0 * mult
+        if bpm_c < bpm_min or bpm_c > bpm_max:
+            continue
+        lag_c = int(round((60.0 * fe) / bpm_c))
+        if lag_c <= 1 or lag_c >= ac.size:
+            continue
+        candidates.append((bpm_c, float(ac[lag_c])))
+
+    if not candidates:
+        return None, 0.0
+
+    bpm_best, score_best = max(candidates, key=lambda t: t[1])
+
+    # Confianza: peak vs mediana del rango
+    med = float(np.median(window) + 1e-12)
+    conf = float(np.clip((score_best / med - 1.0) / 10.0, 0.0, 1.0))  # heurística
+    return float(bpm_best), conf
+
+
+def _refine_period(ac: np.ndarray, lag: int) -> float:
+    """
+    Periodo (en frames) con precisión sub-frame: interpolación parabólica del
+    máximo de la autocorrelación alrededor de lag.
+    """
+    # El lag entero puede no ser el máximo local exacto
+    while 1 < lag < ac.size - 2 and ac[lag + 1] > ac[lag]:
+        lag += 1
+    while 2 < lag < ac.size - 1 and ac[lag - 1] > ac[lag]:
+        lag -= 1
+    if lag <= 1 or lag >= ac.size - 1:
+        return float(lag)
+    a, b, c = float(ac[lag - 1]), float(ac[lag]), float(ac[lag + 1])
+    den = a - 2.0 * b + c
+    if den >= 0.0:
+        return float(lag)
+    return float(lag) + float(np.clip(0.5 * (a - c) / den, -0.5, 0.5))
+
+
+def _beat_frames(env: np.ndarray, period: float) -> np.ndarray:
+    """
+    Rejilla de beats a tempo constante: fase (en frames de la envolvente) que
+    maximiza la envolvente media sobre offset + k * period.
+    """
+    offsets = np.arange(int(np.ceil(period)), dtype=np.float64)
+    k = np.arange(int(env.size / period) + 1, dtype=np.float64)
+    grid = np.rint(offsets[:, None] + k[None, :] * period).astype(np.int64)
+    valid = grid < env.size
+    scores = np.where(valid, env[np.minimum(grid, env.size - 1)], 0.0).sum(axis=1) / np.maximum(valid.sum(axis=1), 1)
+    best = grid[int(np.argmax(scores))]
+    return best[best < env.size]
+
+
+def estimate_bpm_from_audio(
+    y: np.ndarray,
+    sr: int,
+    bpm_min: float = BPM_MIN,
+    bpm_max: float = BPM_MAX,
+) -> Tuple[Optional[float], float]:
+    """
+    Estimación ligera de BPM basada en envolvente de energía + autocorrelación FFT.
+    Devuelve (bpm_est, confidence[0..1 aprox]).
+    """
+    res = analyze_tempo(y, sr, bpm_min=bpm_min, bpm_max=bpm_max)
+    return res["bpm"], res["confidence"]
+
+
+def analyze_tempo(
+    y: np.ndarray,
+    sr: int,
+    bpm_min: float = BPM_MIN,
+    bpm_max: float = BPM_MAX,
+) -> Dict[str, Any]:
+    """
+    BPM, confianza y rejilla de beats (segundos) de una señal mono.
+    """
+    out: Dict[str, Any] = {"bpm": None, "confidence": 0.0, "beat_times_s": []}
+    if y is None or sr is None:
+        return out
+    if y.size < sr * 5:
+        # demasiado corto
+        return out
+
+    env = onset_envelope(y, sr)
+    if env is None:
+        return out
+
+    fe = sr / float(ENV_HOP)  # "sample rate" de la envolvente
+    ac = _autocorr(env)
+    bpm, conf = _bpm_from_autocorr(ac, fe, bpm_min, bpm_max)
+    if bpm is None:
+        return out
+
+    # La rejilla usa el periodo refinado (el BPM entero en lags deriva a lo
+    # largo del tema); el frame i de la envolvente cubre [i*hop, i*hop + frame): el onset que
+    # lo activa está, en media, en su centro
+    beats = _beat_frames(env, _refine_period(ac, int(round(60.0 * fe / bpm))))
+    beat_times = (beats * ENV_HOP + ENV_FRAME / 2) / float(sr)
+
+    out.update(bpm=float(bpm), confidence=float(conf), beat_times_s=[round(float(t), 4) for t in beat_times])
+    return out
+
+
+# ---------------------------------------------------------------------
+# Servicio de sesión
+# ---------------------------------------------------------------------
+
+def session_tempo_path(job_root: Path) -> Path:
+    return Path(job_root) / "work" / SESSION_TEMPO_FILE
+
+
+def _drum_stems(stage_dir: Path) -> List[Path]:
+    """
+    Stems de la familia Drums según session_config.json de stage_dir.
+    """
+    config_path = stage_dir / "session_config.json"
+    if not config_path.exists():
+        return []
+    try:
+        cfg = json.loads(config_path.read_text(encoding="utf-8"))
+    except Exception:
+        return []
+
+    paths: List[Path] = []
+    for stem in cfg.get("stems", []) or []:
+        if not isinstance(stem, dict):
+            continue
+        fname = stem.get("file_name")
+        if not fname or get_instrument_family(str(stem.get("instrument_profile", "Other"))) != "Drums":
+            continue
+        p = stage_dir / str(fname)
+        if p.exists():
+            paths.append(p)
+    return sorted(paths)
+
+
+def compute_session_tempo(stage_dir: Path) -> Dict[str, Any]:
+    """
+    Tempo de la sesión a partir de los stems de stage_dir: primero el bus de
+    Drums (sumado en mono) y, si no hay batería o no da BPM, full_song.wav.
+    """
+    stage_dir = Path(stage_dir)
+    result: Dict[str, Any] = {"bpm": None, "confidence": 0.0, "beat_times_s": [], "source": "none"}
+
+    drum_paths = _drum_stems(stage_dir)
+    if drum_paths:
+        # Mixbus mono compartido (utils.mono_mixbus), con el tema completo
+        try:
+            y, sr, _ = get_mono_mixbus(drum_paths, max_seconds=None)
+        except Exception as exc:
+            logger.logger.info(f"[tempo_utils] No se puede leer el bus de Drums: {exc}.")
+            y = sr = None
+        if y is not None and sr is not None:
+            res = analyze_tempo(y, sr)
+            if res["bpm"] is not None:
+                result.update(res, source="session_drum_bus", stems=[p.name for p in drum_paths])
+                return result
+
+    full_song = stage_dir / "full_song.wav"
+    if full_song.exists():
+        try:
+            y, sr = read_mono_float32(full_song)
+        except Exception as exc:
+            logger.logger.info(f"[tempo_utils] No se puede leer '{full_song.name}': {exc}.")
+            return result
+        res = analyze_tempo(y, sr)
+        if res["bpm"] is not None:
+            result.update(res, source="session_full_song")
+
+    return result
+
+
+def _write_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_name, path)
+    finally:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+
+
+def load_session_tempo(job_root: Path) -> Optional[Dict[str, Any]]:
+    """
+    Tempo de sesión guardado para el job (None si no existe o es de otra versión).
+    """
+    path = session_tempo_path(job_root)
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if not isinstance(data, dict) or int(data.get("version", 0)) != _FORMAT_VERSION:
+        return None
+    return data
+
+
+def store_session_tempo(stage_dir: Path) -> Dict[str, Any]:
+    """
+    Calcula el tempo de sesión sobre stage_dir y lo guarda en
+    <temp_root>/work/session_tempo.json (temp_root = carpeta padre del stage).
+    """
+    stage_dir = Path(stage_dir)
+    data = compute_session_tempo(stage_dir)
+    data["version"] = _FORMAT_VERSION
+    data["stage_id"] = stage_dir.name
+    try:
+        _write_json_atomic(session_tempo_path(stage_dir.parent), data)
+    except OSError as exc:
+        logger.logger.info(f"[tempo_utils] No se pudo guardar {SESSION_TEMPO_FILE}: {exc}")
+
+    if data["bpm"] is not None:
+        logger.logger.info(
+            f"[tempo_utils] Tempo de sesión: bpm={data['bpm']:.2f} (conf={data['confidence']:.2f}, "
+            f"source={data['source']}, beats={len(data['beat_times_s'])})."
+        )
+    else:
+        logger.logger.info("[tempo_utils] Tempo de sesión no disponible.")
+    return data
+
+
+def get_session_tempo(stage_dir: Path) -> Dict[str, Any]:
+    """
+    Tempo de sesión para un consumidor cuyo directorio de stage es stage_dir:
+    lo lee de work/session_tempo.json y, si el job no lo tiene (p.ej. jobs
+    anteriores o CLI sin paso S0), lo calcula una vez sobre stage_dir y lo guarda.
+    """
+    stage_dir = Path(stage_dir)
+    data = load_session_tempo(stage_dir.parent)
+    if data is not None:
+        return data
+    return store_session_tempo(stage_dir)
+
+
+def bpm_from_session(stage_dir: Path) -> Tuple[Optional[float], float, str]:
+    """
+    (bpm, confidence, source) del tempo de sesión, o (None, 0.0, "none").
+    """
+    data = get_session_tempo(stage_dir)
+    bpm = data.get("bpm")
+    try:
+        if bpm is not None:
+            return float(bpm), float(data.get("confidence", 0.0) or 0.0), str(data.get("source", "none"))
+    except (TypeError, ValueError):
+        pass
+    return None, 0.0, "none"
+
+
+def process(context: PipelineContext, *args) -> bool:
+    """
+    Paso del pipeline tras S0: calcula y guarda el tempo de sesión.
+    args[0] (opcional): stage_id sobre el que medir (por defecto context.stage_id).
+    """
+    stage_id = args[0] if args else context.stage_id
+    stage_dir = context.get_stage_dir(stage_id)
+    if not stage_dir.exists():
+        logger.logger.info(f"[tempo_utils] La carpeta de stage {stage_dir} no existe.")
+        return True
+    try:
+        store_session_tempo(stage_dir)
+    except Exception as exc:
+        # El tempo es opcional: los consumidores lo recalculan si falta
+        logger.logger.info(f"[tempo_utils] Error calculando el tempo de sesión: {exc}")
+    return True
@@ -5,6 +5,8 @@ from __future__ import annotations
 from typing import Dict, Any, List, Tuple
 import numpy as np
 
+from .stft_engine import welch_psd
+
 # Definición de bandas de frecuencia para el tonal balance (ejemplo 8 bandas)
 _FREQ_BANDS: List[Dict[str, Any]] = [
     {"id": "sub",        "f_min": 20.0,    "f_max": 40.0},
@@ -33,47 +35,62 @@ def _to_mono(x: np.ndarray) -> np.ndarray:
 
 def compute_band_energies(y: np.ndarray, sr: int) -> Dict[str, float]:
     """
-    Calcula energía media en dB por banda de frecuencia a partir de la FFT
-    de un mix mono.
+    Calcula energía media en dB por banda de frecuencia a partir de la PSD
+    (Welch) de un mix mono.
 
-    Devuelve dict band_id -> energy_db (dBFS aprox).
+    Devuelve dict band_id -> energy_db (dBFS aprox), en la escala del
+    periodograma de la señal completa (mean |rfft|² por banda).
     """
     mono = _to_mono(y)
-    n = mono.size
-    if n == 0 or sr <= 0:
-        return {b["id"]: float("-inf") for b in _FREQ_BANDS}
-
-    # FFT real
-    spec = np.fft.rfft(mono)
-    freqs = np.fft.rfftfreq(n, 1.0 / float(sr))
-    power = (np.abs(spec) ** 2).astype(np.float64)
-
-    band_energies: Dict[str, float] = {}
-
-    for b in _FREQ_BANDS:
-        band_id = b["id"]
-        f_min = b["f_min"]
-        f_max = b["f_max"]
-
-        if f_min >= sr / 2.0:
-            band_energies[band_id] = float("-inf")
-            continue
+    freqs, psd = welch_psd(mono, sr)
+    return BandPowerSpectrum(freqs, psd, mono.size, sr).band_energies()
 
-        idx = (freqs >= f_min) & (freqs < min(f_max, sr / 2.0))
-        if not np.any(idx):
-            band_energies[band_id] = float("-inf")
-            continue
 
-        band_power = float(np.mean(power[idx]))
-        if band_power <= 0.0:
-            band_db = float("-inf")
-        else:
-            # 10*log10(power) es más coherente con energía
-            band_db = 10.0 * np.log10(band_power)
+class BandPowerSpectrum:
+    """
+    PSD one-sided (Welch) repartida por bandas, escalada a la potencia por bin
+    del periodograma de la señal completa: |X_k|² ~ n * sr * psd / 2.
 
-        band_energies[band_id] = band_db
+    Permite predecir las energías por banda tras un filtro lineal sin volver
+    a procesar el audio: band_energies(power_gain) pondera cada bin con
+    |H(f)|² evaluado en self.freqs.
+    """
 
-    return band_energies
+    def __init__(self, freqs: np.ndarray, psd: np.ndarray, n_samples: int, sr: int):
+        freqs = np.asarray(freqs, dtype=np.float64)
+        power = np.asarray(psd, dtype=np.float64) * (float(n_samples) * float(sr) / 2.0)
+        self.sr = int(sr)
+
+        freqs_parts: List[np.ndarray] = []
+        power_parts: List[np.ndarray] = []
+        self._bands: List[Tuple[str, slice]] = []
+
+        offset = 0
+        for b in _FREQ_BANDS:
+            if freqs.size == 0 or sr <= 0 or b["f_min"] >= sr / 2.0:
+                self._bands.append((b["id"], slice(offset, offset)))
+                continue
+            idx = (freqs >= b["f_min"]) & (freqs < min(b["f_max"], sr / 2.0))
+            freqs_parts.append(freqs[idx])
+            power_parts.append(power[idx])
+            n_bins = freqs_parts[-1].size
+            self._bands.append((b["id"], slice(offset, offset + n_bins)))
+            offset += n_bins
+
+        self.freqs = np.concatenate(freqs_parts) if freqs_parts else np.zeros(0, dtype=np.float64)
+        self.power = np.concatenate(power_parts) if power_parts else np.zeros(0, dtype=np.float64)
+
+    def band_energies(self, power_gain: np.ndarray | None = None) -> Dict[str, float]:
+        """
+        Energía media en dB por banda, con la potencia de cada bin
+        multiplicada por power_gain (|H|² en self.freqs) si se indica.
+        """
+        power = self.power if power_gain is None else self.power * power_gain
+        band_energies: Dict[str, float] = {}
+        for band_id, sl in self._bands:
+            band_power = float(np.mean(power[sl])) if sl.stop > sl.start else 0.0
+            band_energies[band_id] = 10.0 * np.log10(band_power) if band_power > 0.0 else float("-inf")
+        return band_energies
 
 
 def get_style_tonal_profile(style_preset: str | None) -> Dict[str, float]:
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import sys
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+# Los scripts de contrato importan utils.* (no src.utils.*): el warm-up tiene
+# que calentar esos mismos módulos, no una copia bajo el paquete src.
+SRC_DIR = Path(__file__).resolve().parent
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from .stages import stage as stage_runner  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Sample rates habituales de sesión
+_WARMUP_SAMPLE_RATES = (44100, 48000)
+# Tamaños de FFT que usan los análisis/stages (STFT, autocorrelación de envolventes, bloques)
+_WARMUP_FFT_SIZES = (1024, 2048, 4096, 8192, 16384, 65536)
+
+
+def _contract_ids() -> List[str]:
+    contracts_path = SRC_DIR / "struct" / "contracts.json"
+    with contracts_path.open("r", encoding="utf-8") as f:
+        contracts = json.load(f)
+    ids: List[str] = []
+    for stage_data in contracts.get("stages", {}).values():
+        for c in stage_data.get("contracts", []) or []:
+            if c.get("id"):
+                ids.append(c["id"])
+    return ids
+
+
+def _preload_contract_scripts() -> int:
+    """
+    Importa (y deja en la caché de stage._import_module) los scripts de análisis
+    y de stage de todos los contratos, más los utilitarios que ejecuta run_stage.
+    """
+    scripts: List[Path] = []
+    for cid in _contract_ids():
+        scripts.append(SRC_DIR / "analysis" / f"{cid}.py")
+        scripts.append(SRC_DIR / "stages" / f"{cid}.py")
+    for util in ("check_metrics_limits", "mixdown_stems", "copy_stems"):
+        scripts.append(SRC_DIR / "utils" / f"{util}.py")
+
+    loaded = 0
+    for path in scripts:
+        if path.exists() and stage_runner._import_module(path) is not None:
+            loaded += 1
+    return loaded
+
+
+def _start_stem_executor() -> None:
+    """
+    Arranca los hilos del executor de stems (tras el fork del worker).
+    """
+    from utils.stem_executor import cpu_budget, get_executor
+
+    executor = get_executor()
+    list(executor.map(abs, range(cpu_budget())))
+
+
+def _warm_numeric_kernels() -> None:
+    """
+    Pasa una señal sintética corta por los kernels calientes: rfft/irfft de los
+    tamaños habituales (planes de pocketfft), el medidor de true peak, resample_poly
+    44.1k<->48k, filtros IIR de scipy y los kernels de envolvente.
+    """
+    import scipy.signal
+
+    from utils.loudness_utils import measure_true_peak_dbtp
+
+    rng = np.random.default_rng(0)
+    for n in _WARMUP_FFT_SIZES:
+        x = rng.standard_normal(n).astype(np.float32)
+        np.fft.irfft(np.fft.rfft(x), n=n)
+
+    x = rng.standard_normal(4096).astype(np.float32)
+    measure_true_peak_dbtp(x)
+    scipy.signal.resample_poly(x, up=160, down=147)
+    scipy.signal.resample_poly(x, up=147, down=160)
+
+    sos = scipy.signal.butter(4, 100.0, btype="highpass", fs=48000, output="sos")
+    scipy.signal.sosfilt(sos, x)
+    scipy.signal.lfilter([1.0, -0.5], [1.0], x)
+
+    # Kernels de envolvente (compilación numba en el primer uso)
+    from utils.dynamics_utils import compress_peak_detector
+    from utils.envelope_kernels import hold_release_gate
+
+    compress_peak_detector(np.column_stack((x, x)), 48000, -20.0, 4.0, 5.0, 50.0)
+    hold_release_gate(np.abs(x) > 1.0, 2, 0.5)
+
+
+def _warm_loudness() -> None:
+    """
+    Construye LoudnessEBUR128 (Essentia) o el Meter de pyloudnorm para los sr
+    habituales y mide un tono corto (también con el LoudnessEngine).
+    """
+    from utils.loudness_utils import LoudnessEngine, _bs1770_loudness
+
+    for sr in _WARMUP_SAMPLE_RATES:
+        t = np.arange(int(sr * 3.0), dtype=np.float32) / sr
+        tone = (0.25 * np.sin(2.0 * np.pi * 997.0 * t)).astype(np.float32)
+        _bs1770_loudness(np.column_stack((tone, tone)), sr)
+        LoudnessEngine(np.column_stack((tone, tone)), sr).lufs_and_lra(-1.0)
+
+
+def _warm_librosa() -> None:
+    """
+    librosa compila (numba) y cachea ventanas/filtros en el primer uso.
+    """
+    import librosa
+
+    sr = 22050
+    y = (0.1 * np.sin(2.0 * np.pi * 220.0 * np.arange(sr) / sr)).astype(np.float32)
+    librosa.stft(y, n_fft=2048, hop_length=512)
+    librosa.feature.chroma_stft(y=y, sr=sr)
+    librosa.onset.onset_strength(y=y, sr=sr)
+
+
+def _warm_essentia() -> None:
+    import essentia.standard as es
+
+    sr = 44100
+    y = (0.1 * np.sin(2.0 * np.pi * 220.0 * np.arange(sr) / sr)).astype(np.float32)
+    es.KeyExtractor(sampleRate=sr)
+    es.Windowing(type="hann")(y[:2048])
+
+
+def _warm_matplotlib() -> None:
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(1, 1))
+    plt.close(fig)
+
+
+def warm_up_worker() -> Dict[str, float]:
+    """
+    Calienta un proceso worker para que el primer job no pague imports ni
+    inicializaciones: scripts de contratos, librerías DSP y kernels numéricos.
+
+    Cada paso es best-effort (una dependencia opcional ausente no impide el resto).
+    Devuelve la duración de cada paso en segundos.
+    """
+    steps: List[tuple[str, Callable[[], object]]] = [
+        ("contract_scripts", _preload_contract_scripts),
+        ("stem_executor", _start_stem_executor),
+        ("numeric_kernels", _warm_numeric_kernels),
+        ("loudness", _warm_loudness),
+        ("librosa", _warm_librosa),
+        ("essentia", _warm_essentia),
+        ("matplotlib", _warm_matplotlib),
+    ]
+
+    durations: Dict[str, float] = {}
+    for name, func in steps:
+        t0 = time.perf_counter()
+        try:
+            func()
+        except Exception as exc:
+            logger.info("[warmup] Paso %s omitido: %s", name, exc)
+        durations[name] = round(time.perf_counter() - t0, 3)
+
+    logger.info(
+        "[warmup] Worker listo en %.2fs (%s)",
+        sum(durations.values()),
+        ", ".join(f"{k}={v:.2f}s" for k, v in durations.items()),
+    )
+    return durations
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-import os
 import json
+import contextlib
 import time
 import logging
 from pathlib import Path
@@ -47,17 +47,18 @@ def _import_analysis_utils():
 # -------------------------------------------------------------------
 
 
-def _safe_compute_final_metrics(job_id: str) -> Dict[str, Any]:
+def _safe_compute_final_metrics(job_id: str, job_root: Path) -> Dict[str, Any]:
     """
     Calcula un bloque mínimo de métricas finales para el frontend.
 
     - Lee el full_song de S10_MASTER_FINAL_LIMITS (si existe).
     - Lee análisis de S1_KEY_DETECTION (si existe).
+    - Lee el tempo de sesión (work/session_tempo.json, si existe).
     - El resto de campos se devuelven con valores neutros.
 
     Devuelve un dict con la forma de MixMetrics.
     """
-    get_temp_dir, load_audio_mono, compute_peak_dbfs, compute_integrated_loudness_lufs = _import_analysis_utils()
+    _, load_audio_mono, compute_peak_dbfs, compute_integrated_loudness_lufs = _import_analysis_utils()
 
     # Defaults neutros
     final_peak_dbfs = 0.0
@@ -79,7 +80,7 @@ def _safe_compute_final_metrics(job_id: str) -> Dict[str, Any]:
     # -----------------------------
     try:
         contract_id = "S10_MASTER_FINAL_LIMITS"
-        master_dir = get_temp_dir(contract_id, create=False)
+        master_dir = job_root / contract_id
         master_path = master_dir / "full_song.wav"
         if master_path.exists():
             mono, sr = load_audio_mono(master_path)
@@ -102,7 +103,7 @@ def _safe_compute_final_metrics(job_id: str) -> Dict[str, Any]:
     # -----------------------------
     try:
         contract_id = "S1_KEY_DETECTION"
-        key_dir = get_temp_dir(contract_id, create=False)
+        key_dir = job_root / contract_id
         key_json = key_dir / f"analysis_{contract_id}.json"
         if key_json.exists():
             with key_json.open("r", encoding="utf-8") as f:
@@ -123,7 +124,29 @@ def _safe_compute_final_metrics(job_id: str) -> Dict[str, Any]:
             job_id,
         )
 
-    # (3) Tempo y shifts vocales: de momento neutros.
+    # -----------------------------
+    # 3) Tempo de sesión (work/session_tempo.json, calculado tras S0)
+    # -----------------------------
+    try:
+        from src.utils.tempo_utils import load_session_tempo
+
+        tempo = load_session_tempo(job_root)
+        if tempo is not None and tempo.get("bpm") is not None:
+            tempo_bpm = float(tempo["bpm"])
+            tempo_confidence = float(tempo.get("confidence", 0.0) or 0.0)
+        else:
+            logger.warning(
+                "[%s] No hay tempo de sesión en %s",
+                job_id,
+                job_root / "work",
+            )
+    except Exception:
+        logger.exception(
+            "[%s] Error leyendo el tempo de sesión",
+            job_id,
+        )
+
+    # (4) Shifts vocales: de momento neutros.
 
     logger.info(
         "[%s] Métricas finales: peak_dbfs=%.2f rms_dbfs=%.2f tempo_bpm=%.2f key=%s mode=%s key_strength=%.3f",
@@ -174,19 +197,17 @@ def _make_files_url(job_root: Path, job_id: str, path: Path | None) -> str:
     return f"/files/{job_id}/{rel.as_posix()}"
 
 
-def _locate_original_and_master_paths(job_id: str) -> tuple[Path | None, Path | None]:
+def _locate_original_and_master_paths(job_id: str, job_root: Path) -> tuple[Path | None, Path | None]:
     """
     Intenta localizar:
       - original_mix_path: full_song de S0_MIX_ORIGINAL
       - master_path: full_song de S10_MASTER_FINAL_LIMITS
     """
-    get_temp_dir, *_ = _import_analysis_utils()
-
     original_path: Path | None = None
     master_path: Path | None = None
 
     try:
-        s0_dir = get_temp_dir("S0_MIX_ORIGINAL", create=False)
+        s0_dir = job_root / "S0_MIX_ORIGINAL"
         cand = s0_dir / "full_song.wav"
         if cand.exists():
             original_path = cand
@@ -208,7 +229,7 @@ def _locate_original_and_master_paths(job_id: str) -> tuple[Path | None, Path |
         )
 
     try:
-        s10_dir = get_temp_dir("S10_MASTER_FINAL_LIMITS", create=False)
+        s10_dir = job_root / "S10_MASTER_FINAL_LIMITS"
         cand = s10_dir / "full_song.wav"
         if cand.exists():
             master_path = cand
@@ -263,11 +284,8 @@ def run_full_pipeline_task(
     # Import diferido del pipeline (por si el import es costoso)
     run_pipeline_for_job = _import_pipeline()
 
-    # Exportar info mínima a variables de entorno para los scripts
-    os.environ["MIX_JOB_ID"] = job_id
-    os.environ["MIX_MEDIA_DIR"] = media_dir
-    os.environ["MIX_TEMP_ROOT"] = temp_root
-
+    # Las rutas del job viajan en el PipelineContext (no en os.environ) para
+    # que un mismo worker pueda ejecutar varios jobs a la vez.
     media_dir_path = Path(media_dir)
     temp_root_path = Path(temp_root)
 
@@ -477,8 +495,8 @@ def run_full_pipeline_task(
     # ---------------------------
     # 2) Calcular métricas y URLs finales
     # ---------------------------
-    metrics = _safe_compute_final_metrics(job_id)
-    original_path, master_path = _locate_original_and_master_paths(job_id)
+    metrics = _safe_compute_final_metrics(job_id, job_root_path)
+    original_path, master_path = _locate_original_and_master_paths(job_id, job_root_path)
 
     original_url = _make_files_url(job_root_path, job_id, original_path)
     master_url = _make_files_url(job_root_path, job_id, master_path)
@@ -542,9 +560,6 @@ def run_manual_correction_task(
     backend_root = Path(__file__).resolve().parent
     temp_root = backend_root / "temp" / job_id
 
-    os.environ["MIX_JOB_ID"] = job_id
-    os.environ["MIX_TEMP_ROOT"] = str(temp_root)
-
     logger.info(f"[{job_id}] Iniciando correccion manual {stage_name}")
 
     # Escribir estado 'processing'
@@ -556,8 +571,9 @@ def run_manual_correction_task(
     # Construir Context
     # Importar aqui para evitar circularidad si context importa tasks (raro pero posible)
     try:
-        from src.context import PipelineContext
+        from src.context import PipelineContext, activate_context
         ctx = PipelineContext(stage_id=stage_name, job_id=job_id, temp_root=temp_root)
+        job_scope = activate_context(ctx)
     except ImportError:
          # Fallback simple
         class MockContext:
@@ -571,24 +587,27 @@ def run_manual_correction_task(
             def get_stage_dir(self, sid):
                 return self.temp_root / sid
         ctx = MockContext(job_id, temp_root, stage_name)
+        job_scope = contextlib.nullcontext()
 
-    # 1. Importar y ejecutar stage de correcciones manuales
-    try:
-        # Import dinamico para asegurar que recoge el fichero recien creado
-        import importlib
-        import src.stages.S6_MANUAL_CORRECTION_ADJUSTMENT as s6_adjustment
-        importlib.reload(s6_adjustment)
-
-        success = s6_adjustment.process(ctx)
-        if not success:
-            raise Exception(f"{stage_name} process failed")
-    except Exception as e:
-        logger.error(f"{stage_name} execution failed: {e}")
-        update_job_status(temp_root, {"status": "failure", "message": str(e)})
-        raise
-
-    # 2. Ejecutar mixdown
-    mixdown_stems.process(ctx)
+    # Los helpers que resuelven rutas (get_temp_dir, session_config) usan ctx.
+    with job_scope:
+        # 1. Importar y ejecutar stage de correcciones manuales
+        try:
+            # Import dinamico para asegurar que recoge el fichero recien creado
+            import importlib
+            import src.stages.S6_MANUAL_CORRECTION_ADJUSTMENT as s6_adjustment
+            importlib.reload(s6_adjustment)
+
+            success = s6_adjustment.process(ctx)
+            if not success:
+                raise Exception(f"{stage_name} process failed")
+        except Exception as e:
+            logger.error(f"{stage_name} execution failed: {e}")
+            update_job_status(temp_root, {"status": "failure", "message": str(e)})
+            raise
+
+        # 2. Ejecutar mixdown
+        mixdown_stems.process(ctx)
 
     # 3. Actualizar estado a success
     # Actualizar URLs
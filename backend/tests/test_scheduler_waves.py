@@ -0,0 +1,108 @@
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = BACKEND_DIR / "src"
+for _p in (BACKEND_DIR, SRC_DIR):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+from src import scheduler  # noqa: E402
+from src.context import PipelineContext  # noqa: E402
+from src.stages.stage import run_stage  # noqa: E402
+from utils import stage_cache  # noqa: E402
+
+SR = 44100
+# Única wave paralela del plan actual de contracts.json, y el contrato que la recibe.
+WAVE = ["S1_VOX_TUNING", "S2_GROUP_PHASE_DRUMS"]
+NEXT = "S3_MIXBUS_HEADROOM"
+SEQUENCE = WAVE + [NEXT]
+
+
+def _seed_job(job_root: Path) -> dict:
+    """
+    Job de 4 s donde los dos contratos de la wave cambian audio: una voz en
+    Mi fuera de la escala [Do, Sol] (S1 la reafina) y una caja retrasada
+    respecto al bombo (S2 la alinea).
+    """
+    t = np.arange(4 * SR) / SR
+    click = np.zeros_like(t)
+    click[:: SR // 2] = 0.9
+    n = np.arange(2000)
+    kick = np.convolve(click, np.exp(-n / 300.0) * np.sin(2.0 * np.pi * 60.0 * n / SR))[: t.size]
+    snare = np.roll(kick, 37) * 0.5 + 0.02 * np.random.default_rng(0).standard_normal(t.size)
+    stems = {
+        "lead_vox.wav": (0.3 * np.sin(2.0 * np.pi * 329.63 * t), "Lead_Vocal_Melodic"),
+        "kick.wav": (kick, "Kick"),
+        "snare.wav": (snare, "Snare"),
+        "bass.wav": (0.2 * np.sin(2.0 * np.pi * 55.0 * t), "Bass_Electric"),
+    }
+
+    stage_dir = job_root / WAVE[0]
+    stage_dir.mkdir(parents=True)
+    for name, (x, _) in stems.items():
+        sf.write(stage_dir / name, np.stack([x, x], axis=1).astype(np.float32), SR, subtype="PCM_24")
+    config = {
+        "style_preset": "Pop",
+        "stems": [{"file_name": name, "instrument_profile": prof} for name, (_, prof) in stems.items()],
+    }
+    (stage_dir / "session_config.json").write_text(json.dumps(config), encoding="utf-8")
+
+    key_dir = job_root / "S1_KEY_DETECTION"
+    key_dir.mkdir()
+    key = {"session": {"key_root_pc": 0, "key_mode": "major", "key_name": "C major", "scale_pitch_classes": [0, 7]}}
+    (key_dir / "analysis_S1_KEY_DETECTION.json").write_text(json.dumps(key), encoding="utf-8")
+    return _folder_audio(stage_dir)
+
+
+def _context(job_root: Path) -> PipelineContext:
+    return PipelineContext(stage_id="", job_id=job_root.name, temp_root=job_root, contract_sequence=SEQUENCE)
+
+
+def _folder_audio(stage_dir: Path) -> dict:
+    return {p.name: sf.read(p, dtype="float32")[0] for p in sorted(stage_dir.glob("*.wav"))}
+
+
+@pytest.fixture
+def run_job(tmp_path, monkeypatch):
+    def _run(name: str, wave: bool):
+        job_root = tmp_path / name
+        seed = _seed_job(job_root)
+        # Caché propia por job: el segundo run no debe restaurar los resultados del primero.
+        monkeypatch.setattr(stage_cache, "STAGE_CACHE_DIR", tmp_path / f"_stage_cache_{name}")
+        context = _context(job_root)
+        if wave:
+            scheduler.run_contract_wave(WAVE, context)
+        else:
+            for cid in WAVE:
+                run_stage(cid, context=context)
+        return job_root, seed
+
+    return _run
+
+
+def test_wave_matches_sequential_run(run_job):
+    contracts = json.loads((SRC_DIR / "struct" / "contracts.json").read_text(encoding="utf-8"))
+    assert WAVE in scheduler.plan_contract_waves(contracts, SEQUENCE)
+
+    sequential, seed = run_job("sequential", wave=False)
+    parallel, _ = run_job("wave", wave=True)
+
+    for folder in (WAVE[-1], NEXT):
+        expected = _folder_audio(sequential / folder)
+        got = _folder_audio(parallel / folder)
+        assert sorted(got) == sorted(expected)
+        for name in expected:
+            assert np.array_equal(got[name], expected[name]), f"{folder}/{name}"
+
+    # Cada contrato de la wave cambió su stem, así que el merge no es trivial.
+    merged = _folder_audio(parallel / NEXT)
+    for name in ("lead_vox.wav", "snare.wav"):
+        assert not np.array_equal(merged[name], seed[name]), name
+    for name in ("kick.wav", "bass.wav"):
+        assert np.array_equal(merged[name], seed[name]), name
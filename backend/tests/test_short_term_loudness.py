@@ -0,0 +1,62 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils.loudness_utils import ShortTermLoudness, measure_integrated_lufs  # noqa: E402
+
+SR = 44100
+WINDOW_S = 3.0
+HOP_S = 1.0
+# Diferencia documentada en ShortTermLoudness (estado y coeficientes del filtro K)
+TOLERANCE_DB = 0.1
+
+
+def _load_s3_audibility():
+    path = SRC_DIR / "analysis" / "S3_LEADVOX_AUDIBILITY.py"
+    spec = importlib.util.spec_from_file_location("S3_LEADVOX_AUDIBILITY", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _varying_level(seed: int, freq_hz: float, period_s: float) -> np.ndarray:
+    """Señal de 20 s con nivel variable (vibrato de nivel + escalón a los 11 s)."""
+    t = np.arange(int(20 * SR)) / SR
+    rng = np.random.default_rng(seed)
+    env_db = -20.0 + 12.0 * np.sin(2.0 * np.pi * t / period_s) + 6.0 * (t > 11.0)
+    x = rng.standard_normal(t.size) * 0.3 + np.sin(2.0 * np.pi * freq_hz * t)
+    return (x * 10.0 ** (env_db / 20.0)).astype(np.float32)
+
+
+def _per_window_lufs(x: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    win = int(round(WINDOW_S * SR))
+    return np.array([measure_integrated_lufs(x[s:s + win], SR) for s in starts])
+
+
+def test_window_lufs_matches_per_window_measure():
+    x = _varying_level(seed=1, freq_hz=220.0, period_s=7.0)
+
+    starts, lufs = ShortTermLoudness(x, SR).window_lufs(WINDOW_S, HOP_S)
+
+    assert starts.tolist() == list(range(0, 17 * SR + 1, SR))
+    assert np.allclose(lufs, _per_window_lufs(x, starts), atol=TOLERANCE_DB)
+
+
+def test_short_term_offsets_match_per_window_measure():
+    s3 = _load_s3_audibility()
+    lead = _varying_level(seed=2, freq_hz=440.0, period_s=5.0)
+    bed = _varying_level(seed=3, freq_hz=110.0, period_s=9.0)
+
+    stats = s3._compute_short_term_offsets_series(lead, bed, SR, window_sec=WINDOW_S, hop_sec=HOP_S)
+
+    starts = (np.asarray(stats["window_starts_sec"]) * SR).round().astype(np.int64)
+    expected = _per_window_lufs(lead, starts) - _per_window_lufs(bed, starts)
+    assert stats["num_windows_used"] == stats["num_windows_total"] == 18
+    assert stats["offsets_db"] == pytest.approx(expected.tolist(), abs=TOLERANCE_DB)
@@ -0,0 +1,181 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from utils import stage_cache  # noqa: E402
+
+SR = 44100
+# Declara io.config = ["stems", "style_preset"] y lee work/session_tempo.json
+CONTRACT_ID = "S5_STEM_DYNAMICS_GENERIC"
+# Contrato de stems con io.config = ["stems"]: su análisis solo copia style_preset
+STEM_CONTRACT_ID = "S4_STEM_HPF_LPF"
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    cache = tmp_path / "_stage_cache"
+    monkeypatch.setattr(stage_cache, "STAGE_CACHE_DIR", cache)
+    return cache
+
+
+def _make_job(root: Path, style_preset: str = "pop", bpm: float = 120.0, contract_id: str = CONTRACT_ID) -> Path:
+    """Carpeta de job con un stage de dos stems, session_config y tempo de sesión."""
+    stage_dir = root / contract_id
+    stage_dir.mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    for name in ("bass.wav", "drums.wav"):
+        sf.write(stage_dir / name, (rng.standard_normal((SR, 2)) * 0.1).astype(np.float32), SR, subtype="PCM_24")
+    config = {
+        "style_preset": style_preset,
+        "stems": [{"file_name": "bass.wav"}, {"file_name": "drums.wav"}],
+        "mastering_notes": "not read by the contract",
+    }
+    (stage_dir / "session_config.json").write_text(json.dumps(config), encoding="utf-8")
+    (root / "work").mkdir()
+    (root / "work" / "session_tempo.json").write_text(json.dumps({"bpm": bpm}), encoding="utf-8")
+    return stage_dir
+
+
+def _edit_config(stage_dir: Path, **changes) -> None:
+    path = stage_dir / "session_config.json"
+    config = json.loads(path.read_text(encoding="utf-8"))
+    config.update(changes)
+    path.write_text(json.dumps(config), encoding="utf-8")
+
+
+def _key(stage_dir: Path) -> str:
+    return stage_cache.compute_stage_key(stage_dir.name, stage_dir, stage_dir.parent)
+
+
+def test_key_follows_declared_config_fields(tmp_path):
+    stage_dir = _make_job(tmp_path / "job")
+    base = _key(stage_dir)
+
+    _edit_config(stage_dir, mastering_notes="changed")
+    assert _key(stage_dir) == base
+
+    _edit_config(stage_dir, style_preset="rock")
+    assert _key(stage_dir) != base
+
+
+def test_style_preset_does_not_invalidate_stem_contract(tmp_path):
+    stage_dir = _make_job(tmp_path / "job", contract_id=STEM_CONTRACT_ID)
+    base = _key(stage_dir)
+
+    _edit_config(stage_dir, style_preset="rock")
+    assert _key(stage_dir) == base
+
+    _edit_config(stage_dir, stems=[{"file_name": "bass.wav", "instrument_profile": "Bass_Electric"}])
+    assert _key(stage_dir) != base
+
+
+def test_restore_rewrites_echoed_style_preset(tmp_path):
+    src_dir = _make_job(tmp_path / "job_a", style_preset="pop", contract_id=STEM_CONTRACT_ID)
+    key = _key(src_dir)
+    analysis = {"style_preset": "pop", "stems": [{"file_name": "bass.wav", "style_preset": "pop"}]}
+    (src_dir / f"analysis_{STEM_CONTRACT_ID}.json").write_text(json.dumps(analysis), encoding="utf-8")
+    stage_cache.store(key, STEM_CONTRACT_ID, src_dir, success=True)
+
+    dst_dir = _make_job(tmp_path / "job_b", style_preset="rock", contract_id=STEM_CONTRACT_ID)
+    assert _key(dst_dir) == key
+    assert stage_cache.restore(key, stage_cache.lookup(key), dst_dir)
+
+    restored = json.loads((dst_dir / f"analysis_{STEM_CONTRACT_ID}.json").read_text(encoding="utf-8"))
+    assert restored["style_preset"] == "rock"
+    assert restored["stems"][0]["style_preset"] == "rock"
+    config = json.loads((dst_dir / "session_config.json").read_text(encoding="utf-8"))
+    assert config["style_preset"] == "rock"
+
+
+def test_key_follows_external_inputs(tmp_path):
+    stage_dir = _make_job(tmp_path / "job")
+    base = _key(stage_dir)
+
+    (tmp_path / "job" / "work" / "session_tempo.json").write_text(json.dumps({"bpm": 96.0}), encoding="utf-8")
+    changed = _key(stage_dir)
+    assert changed != base
+
+    (tmp_path / "job" / "work" / "session_tempo.json").unlink()
+    assert _key(stage_dir) not in (base, changed)
+
+
+def test_key_reads_only_used_fields_of_key_detection(tmp_path):
+    stage_dir = _make_job(tmp_path / "job", contract_id="S1_VOX_TUNING")
+    key_path = tmp_path / "job" / "S1_KEY_DETECTION" / "analysis_S1_KEY_DETECTION.json"
+    key_path.parent.mkdir()
+
+    def _write_key(root_pc: int, job: str, preset: str) -> None:
+        data = {
+            "style_preset": preset,
+            "session": {"key_root_pc": root_pc, "key_mode": "major", "key_name": "C major"},
+            "stems": [{"file_path": f"/jobs/{job}/S1_KEY_DETECTION/bass.wav"}],
+        }
+        key_path.write_text(json.dumps(data), encoding="utf-8")
+
+    _write_key(0, "job_a", "pop")
+    base = _key(stage_dir)
+
+    _write_key(0, "job_b", "rock")
+    assert _key(stage_dir) == base
+
+    _write_key(2, "job_b", "rock")
+    assert _key(stage_dir) != base
+
+
+def test_file_hash_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(stage_cache, "FILE_HASH_CACHE_MAX_ENTRIES", 3)
+    monkeypatch.setattr(stage_cache, "_FILE_HASH_CACHE", stage_cache.OrderedDict())
+    for i in range(5):
+        p = tmp_path / f"f{i}.bin"
+        p.write_bytes(bytes([i]) * 16)
+        stage_cache.file_content_hash(p)
+    assert len(stage_cache._FILE_HASH_CACHE) == 3
+
+
+def test_restore_relocates_job_paths(tmp_path):
+    src_dir = _make_job(tmp_path / "job_a")
+    key = _key(src_dir)
+    analysis = {"stems": [{"file_path": str(src_dir / "bass.wav")}]}
+    (src_dir / f"analysis_{CONTRACT_ID}.json").write_text(json.dumps(analysis), encoding="utf-8")
+    stage_cache.store(key, CONTRACT_ID, src_dir, success=True)
+
+    stored = (stage_cache._entry_dir(key) / f"analysis_{CONTRACT_ID}.json").read_text(encoding="utf-8")
+    assert str(tmp_path / "job_a") not in stored
+    assert stage_cache._JOB_ROOT_MARKER in stored
+
+    dst_dir = _make_job(tmp_path / "job_b")
+    assert _key(dst_dir) == key
+    manifest = stage_cache.lookup(key)
+    assert stage_cache.restore(key, manifest, dst_dir)
+
+    restored = json.loads((dst_dir / f"analysis_{CONTRACT_ID}.json").read_text(encoding="utf-8"))
+    assert restored["stems"][0]["file_path"] == str(dst_dir / "bass.wav")
+
+
+def test_evict_stays_within_budget(tmp_path, cache_dir):
+    stage_dir = _make_job(tmp_path / "job")
+    keys = []
+    for i in range(4):
+        key = f"{i:02d}" + "0" * 38
+        stage_cache.store(key, CONTRACT_ID, stage_dir, success=True)
+        manifest_path = stage_cache._entry_dir(key) / stage_cache.MANIFEST_NAME
+        os.utime(manifest_path, (1_000_000 + i, 1_000_000 + i))
+        keys.append(key)
+    entry_size = stage_cache.lookup(keys[0])["size_bytes"]
+    os.utime(stage_cache._entry_dir(keys[0]) / stage_cache.MANIFEST_NAME, (2_000_000, 2_000_000))
+
+    budget = int(entry_size * 2.5)
+    assert stage_cache.evict(budget) == 2
+
+    remaining = sorted(p.parent.name for p in cache_dir.glob(f"*/*/{stage_cache.MANIFEST_NAME}"))
+    assert remaining == sorted([keys[0], keys[3]])
+    assert entry_size * len(remaining) <= budget
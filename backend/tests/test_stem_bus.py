@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from context import PipelineContext, activate_context  # noqa: E402
+from utils import copy_stems  # noqa: E402
+from utils.stem_bus import StemBus, read_stem, write_stem  # noqa: E402
+
+SR = 44100
+
+
+def _seed(stage_dir: Path, subtype: str = "PCM_24") -> np.ndarray:
+    stage_dir.mkdir(parents=True)
+    x = (np.random.default_rng(0).standard_normal((SR, 2)) * 0.1).astype(np.float32)
+    sf.write(stage_dir / "bass.wav", x, SR, subtype=subtype)
+    return sf.read(stage_dir / "bass.wav", dtype="float32")[0]
+
+
+def _context(job_root: Path, stage_id: str) -> PipelineContext:
+    ctx = PipelineContext(stage_id=stage_id, job_id=job_root.name, temp_root=job_root)
+    ctx.stem_bus = StemBus()
+    ctx.stem_bus.bind(stage_id, job_root / stage_id)
+    return ctx
+
+
+def test_dirty_stem_survives_handoff_without_disk_write(tmp_path):
+    seed = _seed(tmp_path / "A")
+    ctx = _context(tmp_path, "A")
+
+    with activate_context(ctx):
+        write_stem(tmp_path / "A" / "bass.wav", seed * 0.5, SR)
+    copy_stems.process(ctx, "A", "B")
+
+    # Disco con la versión anterior en ambas carpetas; la lectura sale del bus.
+    for folder in ("A", "B"):
+        assert np.array_equal(sf.read(tmp_path / folder / "bass.wav", dtype="float32")[0], seed)
+    with activate_context(ctx):
+        data, sr = read_stem(tmp_path / "B" / "bass.wav", dtype="float32")
+    assert sr == SR
+    assert not np.array_equal(data, seed)
+
+    # El volcado escribe en la carpeta de origen y lo enlaza en la heredera.
+    assert ctx.stem_bus.flush() == 1
+    for folder in ("A", "B"):
+        assert np.array_equal(sf.read(tmp_path / folder / "bass.wav", dtype="float32")[0], data)
+
+
+def test_buffer_matches_pcm_file(tmp_path):
+    seed = _seed(tmp_path / "A", subtype="PCM_16")
+    ctx = _context(tmp_path, "A")
+
+    with activate_context(ctx):
+        write_stem(tmp_path / "A" / "bass.wav", seed * 0.3, SR, subtype="PCM_16")
+        buffered, _ = read_stem(tmp_path / "A" / "bass.wav", dtype="float32")
+    ctx.stem_bus.flush()
+    assert np.array_equal(buffered, sf.read(tmp_path / "A" / "bass.wav", dtype="float32")[0])
+
+
+def test_superseded_version_cancels_deferred_task(tmp_path):
+    seed = _seed(tmp_path / "A")
+    ctx = _context(tmp_path, "A")
+    ran = []
+
+    with activate_context(ctx):
+        write_stem(tmp_path / "A" / "bass.wav", seed * 0.5, SR)
+        ctx.stem_bus.defer(tmp_path / "A", lambda: ran.append("A"))
+        copy_stems.process(ctx, "A", "B")
+        write_stem(tmp_path / "B" / "bass.wav", seed * 0.25, SR)
+        ctx.stem_bus.defer(tmp_path / "B", lambda: ran.append("B"))
+
+    ctx.stem_bus.flush()
+    # A nunca recibe su versión (se sustituyó antes del volcado): su tarea no corre.
+    assert ran == ["B"]
+    assert np.array_equal(sf.read(tmp_path / "A" / "bass.wav", dtype="float32")[0], seed)